@@ -0,0 +1,171 @@
+"""Move latency while polls flood a slowed database, with and without admission control.
+
+Usage: python -m benchmarks.bench_admission [--poll-rate 200] [--pollers 1000] [--pairs 5] [--delay-ms 100] [--duration 15]
+
+The app runs in-process under gevent against a SQLite file whose pool has
+10 connections. Every transaction is slowed by holding its connection for
+``--delay-ms`` before its first statement, like a database that answers
+slowly, so the pool serves 10 / delay transactions a second.
+
+Polls arrive at ``--poll-rate`` a second whether or not earlier ones have
+been answered, as from many pages polling on a timer; each calls
+``/api/recent`` for one of ``--pollers`` players, most of whom are not in
+the player cache and are loaded from the database. (``/api/state`` polls
+are admitted the same way, but while matches are being created they
+queue for the lobby snapshot's lock rather than for the pool.) Meanwhile
+``--pairs`` pairs of players play matches; only their ``/api/move`` calls
+are timed.
+
+Without admission control polls arriving faster than the pool serves them
+pile up as waiting greenlets, and moves wait for connections among them.
+With it, polls beyond the limit get a 503 at once.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+import gevent
+from sqlalchemy import event
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import match_service
+from src.models.database import db
+
+
+def slow_down(engine, delay):
+    """Hold each checked-out connection for ``delay`` seconds before its first statement."""
+    @event.listens_for(engine, 'checkout')
+    def checkout(dbapi_connection, record, proxy):
+        record.info['slow'] = True
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before(conn, cursor, statement, parameters, context, executemany):
+        # Before any statement, so no SQLite lock is held while sleeping
+        if conn.info.pop('slow', False):
+            gevent.sleep(delay)
+
+
+def percentiles(latencies):
+    if not latencies:
+        return 'none'
+    latencies = sorted(latencies)
+    return (f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms  max {latencies[-1] * 1000:7.1f} ms")
+
+
+class Polls:
+    def __init__(self, clients):
+        self.clients = clients
+        self.latencies = {}
+        self.inflight = 0
+        self.peak = 0
+
+    def poll(self, client):
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        start = time.perf_counter()
+        status = client.get('/api/recent').status_code
+        self.latencies.setdefault(status, []).append(time.perf_counter() - start)
+        self.inflight -= 1
+
+    def arrive(self, rate, deadline):
+        greenlets = []
+        due = time.time()
+        i = 0
+        while due < deadline:
+            greenlets.append(gevent.spawn(self.poll, self.clients[i % len(self.clients)]))
+            i += 1
+            due += 1 / rate
+            gevent.sleep(max(0, due - time.time()))
+        gevent.joinall(greenlets)
+
+
+def pair(service, creator, joiner, deadline, latencies, errors):
+    while time.time() < deadline:
+        response = creator.post('/api/create_match', json={'stake': 1})
+        if response.status_code != 200:
+            errors.append(response.status_code)
+            gevent.sleep(0.05)
+            continue
+        match_id = response.get_json()['match_id']
+        if joiner.post('/api/join_match', json={'match_id': match_id}).status_code != 200:
+            errors.append('join')
+            creator.post('/api/cancel_match', json={'match_id': match_id})
+            continue
+        # Readiness arrives over Socket.IO in the game; start the match directly
+        match = service.get_match(match_id)
+        match.creator_ready = match.joiner_ready = True
+        match.start_match()
+        for client, move in ((creator, 'rock'), (joiner, 'paper')):
+            start = time.perf_counter()
+            status = client.post('/api/move', json={'move': move}).status_code
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+
+
+def run(args, admission):
+    tmp = tempfile.mkdtemp()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 10, 'max_overflow': 0, 'pool_timeout': 30}
+        SQL_PROFILING = False
+        RATE_LIMIT_ENABLED = False
+        DEADLINE_SWEEP_INTERVAL = 0
+        TELEGRAM_TICK_INTERVAL = 0
+        BOT_ENABLED = False
+        PLAYER_CACHE_SIZE = max(2 * args.pairs + 1, args.pollers // 4)
+        ADMISSION_ENABLED = admission
+
+    app = create_app(BenchConfig)
+    for name in ('socketio.server', 'engineio.server'):
+        logging.getLogger(name).setLevel(logging.CRITICAL)  # set to INFO by create_app
+    with app.app_context():
+        db.create_all()
+        service = match_service._get_current_object()
+
+    # Sessions are created before the database is slowed down
+    clients = [app.test_client() for _ in range(args.pollers + 2 * args.pairs)]
+    for client in clients:
+        client.get('/')
+    with app.app_context():
+        slow_down(db.engine, args.delay_ms / 1000)
+
+    deadline = time.time() + args.duration
+    polls = Polls(clients[:args.pollers])
+    moves, errors = [], []
+    players = clients[args.pollers:]
+    greenlets = [gevent.spawn(polls.arrive, args.poll_rate, deadline)]
+    greenlets += [gevent.spawn(pair, service, players[2 * i], players[2 * i + 1], deadline, moves, errors)
+                  for i in range(args.pairs)]
+    gevent.joinall(greenlets)
+
+    print('admission control' if admission else 'no admission control')
+    print(f"  moves {len(moves):6}   {percentiles(moves)}   {len(errors)} failed match steps")
+    for status, latencies in sorted(polls.latencies.items()):
+        print(f"  polls {status}: {len(latencies):6}   {percentiles(latencies)}")
+    print(f"  peak polls in flight {polls.peak}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--poll-rate', type=float, default=200)
+    parser.add_argument('--pollers', type=int, default=1000)
+    parser.add_argument('--pairs', type=int, default=5)
+    parser.add_argument('--delay-ms', type=float, default=100)
+    parser.add_argument('--duration', type=float, default=15)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.CRITICAL)
+
+    capacity = 10 / (args.delay_ms / 1000)
+    print(f"{args.poll_rate:g} polls/s against a pool serving {capacity:g} transactions/s, {args.pairs} pairs playing")
+    run(args, admission=False)
+    run(args, admission=True)
@@ -0,0 +1,88 @@
+"""Bot decision latency, memory per bot and load-generator throughput.
+
+Usage: python -m benchmarks.bench_bots [--games 10000] [--rounds 3] [--database-url URL]
+
+Times ``choose`` + ``observe`` for each strategy, measures the memory held
+per in-flight bot game and per remembered opponent, then plays ``--games``
+simultaneous bot-vs-bot matches through the real match and game services
+on one thread. Without ``--database-url`` an in-memory SQLite database is
+used, so the numbers show engine and service overhead rather than commit
+latency.
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import match_service, game_service
+from src.models.database import db
+from src.services.bot_service import BotEngine, STRATEGIES, MOVES
+
+
+def decision_latency(strategy, opponents=1000, moves=200000):
+    start = time.perf_counter()
+    for i in range(moves):
+        opponent = i % opponents
+        strategy.choose(opponent)
+        strategy.observe(opponent, MOVES[(i * 7) % 3])
+    return (time.perf_counter() - start) / moves * 1e9
+
+
+def opponent_state_bytes(strategy_cls, opponents=100000):
+    strategy = strategy_cls()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(opponents):
+        strategy.observe(f'player-{i}', 'rock')
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used / opponents
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    print(f"{'strategy':12}{'ns/decision':>14}{'bytes/opponent':>16}")
+    for name, cls in STRATEGIES.items():
+        print(f"{name:12}{decision_latency(cls()):14.0f}{opponent_state_bytes(cls):16.0f}")
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or 'sqlite:///:memory:'
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        engine = BotEngine(match_service._get_current_object(), game_service._get_current_object(),
+                           strategy='markov', pool_size=0, join_delay=None, move_delay=(0, 0))
+
+        # Warm up the users and players so only the game state is measured
+        engine.start_load(args.games, rounds=1)
+        while engine.schedule:
+            engine.tick()
+        engine.stats['results'] = 0
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.time()
+        engine.start_load(args.games, rounds=args.rounds)
+        setup = time.time() - start
+        per_bot = (tracemalloc.get_traced_memory()[0] - before) / (2 * args.games)
+        tracemalloc.stop()
+
+        start = time.time()
+        while engine.schedule:
+            engine.tick()
+        elapsed = time.time() - start
+
+    print(f"simultaneous games:  {args.games}")
+    print(f"memory per bot:      {per_bot:.0f} bytes (bot game, match and schedule entry)")
+    print(f"setup:               {setup:.1f} s")
+    print(f"games played:        {engine.stats['results']}")
+    print(f"games/sec:           {engine.stats['results'] / (setup + elapsed):.0f}")
@@ -0,0 +1,104 @@
+"""Season reset duration, and settlement latency while it runs.
+
+Usage: python -m benchmarks.bench_bulk [--users 10000000] [--chunk-size 5000] [--pause 0.01] [--database-url URL]
+
+Fills ``users``, then resets the season with ``BulkOperations`` (archive to
+``season_stats`` plus UPDATE, one transaction per chunk). A second thread
+settles matches the way ``GameService`` does (lock both users, update
+both balances, insert a history row, commit) the whole time. Settlement
+latency is reported before and during the reset. Without
+``--database-url`` a SQLite file in a temporary directory is used; there
+every transaction takes the database lock, so settlements queue behind
+whole chunks, where Postgres only makes them wait on the chunk's rows.
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import insert, update
+
+from src.app import create_app
+from src.config import Config
+from src.models.database import db, User, GameHistory, SeasonStats
+from src.services.bulk_service import BulkOperations
+
+
+def fill(users, batch=100000):
+    for lo in range(0, users, batch):
+        db.session.execute(insert(User), [{'session_id': f'u{i}', 'coins': 100 + i % 50, 'wins': i % 7,
+                                           'total_games': i % 11} for i in range(lo, min(lo + batch, users))])
+        db.session.commit()
+
+
+def settle(app, users, stop, latencies):
+    rng = random.Random(3)
+    table = User.__table__
+    with app.app_context():
+        while not stop.is_set():
+            a, b = rng.sample(range(1, users + 1), 2)
+            start = time.perf_counter()
+            db.session.query(User.id).filter(User.id.in_((a, b))).with_for_update().all()
+            db.session.execute(update(table).where(table.c.id == a).values(coins=table.c.coins + 1))
+            db.session.execute(update(table).where(table.c.id == b).values(coins=table.c.coins - 1))
+            db.session.add(GameHistory(player1_id=a, player2_id=b, player1_choice='rock',
+                                       player2_choice='scissors', winner_id=a, bet_amount=1))
+            db.session.commit()
+            db.session.remove()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return (f"{len(latencies):6} settlements  p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.2f} ms  max {latencies[-1] * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--pause', type=float, default=Config.BULK_PAUSE, help='Seconds between chunks.')
+    parser.add_argument('--baseline-seconds', type=float, default=5.0)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = args.database_url or f'sqlite:///{os.path.join(tmp, "bench.db")}'
+            SQL_PROFILING = False
+            DEADLINE_SWEEP_INTERVAL = 0
+            TELEGRAM_TICK_INTERVAL = 0
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            start = time.perf_counter()
+            fill(args.users)
+            print(f"filled {args.users} users in {time.perf_counter() - start:.1f}s")
+
+            stop = threading.Event()
+            latencies = []
+            settler = threading.Thread(target=settle, args=(app, args.users, stop, latencies))
+            settler.start()
+            time.sleep(args.baseline_seconds)
+            before = len(latencies)
+
+            operations = BulkOperations(args.chunk_size, args.pause)
+            start = time.perf_counter()
+            job = operations.run(operations.start('reset', season='bench', coins=100)['name'])
+            elapsed = time.perf_counter() - start
+            during = latencies[before:]
+            stop.set()
+            settler.join()
+
+            print(f"reset:   {job['rows']} users in {elapsed:.1f}s ({job['rows'] / elapsed:,.0f} users/s), "
+                  f"{SeasonStats.query.count()} archived, chunks of {args.chunk_size}, {args.pause * 1000:g} ms pauses")
+            print(f"before:  {summary(latencies[:before])}")
+            print(f"during:  {summary(during)}")
+            db.drop_all()
@@ -0,0 +1,79 @@
+"""Append throughput and replay speed of the binary match event log.
+
+Usage: python -m benchmarks.bench_event_log [--events 2000000] [--matches 100000] [--dir DIR]
+
+Appends ``--events`` match events with the background group-commit flusher
+(one fsync per flush interval), compares a short run that syncs every
+record, then replays the log in full, filtered to one event type and
+filtered to a single match, and rebuilds stats and balances from it.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.services.event_log import EventLog, read_events, rebuild
+
+KINDS = ('create', 'join', 'ready', 'ready', 'move', 'move', 'result')
+
+
+def append_events(log, count, matches):
+    start = time.perf_counter()
+    for i in range(count):
+        match = f'{i % matches:08x}'
+        kind = KINDS[i % len(KINDS)]
+        if kind == 'move':
+            log.append('move', match, f'player-{i % 5000}', move='rock')
+        elif kind == 'result':
+            log.append('result', match, f'player-{i % 5000}', f'player-{(i + 1) % 5000}',
+                       move='draw', amount=10, balance=100, other_balance=100)
+        else:
+            log.append(kind, match, f'player-{i % 5000}', amount=10, balance=90)
+    log.close()
+    return time.perf_counter() - start
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--matches', type=int, default=100000)
+    parser.add_argument('--flush-interval', type=float, default=0.01)
+    parser.add_argument('--dir', default=None, help='Where to write segments (default: a temp dir).')
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp()
+    grouped = os.path.join(root, 'grouped')
+    synced = os.path.join(root, 'synced')
+
+    elapsed = append_events(EventLog(grouped, flush_interval=args.flush_interval).start(),
+                            args.events, args.matches)
+    size = sum(os.path.getsize(os.path.join(grouped, f)) for f in os.listdir(grouped))
+    print(f"group commit:   {args.events / elapsed:12.0f} events/s  ({size / args.events:.0f} bytes/event)")
+
+    per_record = min(args.events, 2000)
+    log = EventLog(synced)
+    start = time.perf_counter()
+    for i in range(per_record):
+        log.append('move', f'{i:08x}', 'player', move='rock')
+        log.flush()
+    log.close()
+    print(f"fsync per event:{per_record / (time.perf_counter() - start):12.0f} events/s")
+
+    seconds, count = timed(lambda: sum(1 for _ in read_events(grouped)))
+    print(f"replay all:     {count / seconds:12.0f} events/s  ({count} events, {seconds:.2f}s)")
+    seconds, count = timed(lambda: sum(1 for _ in read_events(grouped, types=['result'])))
+    print(f"replay results: {seconds:12.2f} s         ({count} events)")
+    seconds, count = timed(lambda: sum(1 for _ in read_events(grouped, match_id=f'{7:08x}')))
+    print(f"one match:      {seconds:12.2f} s         ({count} events)")
+    seconds, state = timed(lambda: rebuild(read_events(grouped)))
+    print(f"rebuild:        {seconds:12.2f} s         ({len(state.stats)} matches)")
+
+    if not args.dir:
+        shutil.rmtree(root)
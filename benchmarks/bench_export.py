@@ -0,0 +1,52 @@
+"""Rows per second and peak RSS of the game_history export.
+
+Usage: python -m benchmarks.bench_export [--rows 50000000] [--format csv] [--database-url URL]
+
+Seeds ``--rows`` history rows (skipped when the table already holds that
+many), then runs ``flask export-history`` in a child process and reports
+its throughput and peak resident memory. Without ``--database-url`` a
+SQLite file in a temporary directory is used; point it at Postgres to
+measure the server-side cursor path.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'arrow'])
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, PYTHONPATH=ROOT, DEBUG='False',
+               DATABASE_URL=args.database_url or f'sqlite:///{tmp}/bench.db')
+
+    start = time.time()
+    subprocess.run([sys.executable, '-m', 'benchmarks.seed', '--rows', str(args.rows)],
+                   env=env, cwd=tmp, check=True)
+    print(f"seeded in {time.time() - start:.1f}s")
+
+    output = os.path.join(tmp, f'history.{args.format}')
+    start = time.time()
+    subprocess.run(
+        [sys.executable, '-m', 'flask', '--app', 'src.app', 'export-history',
+         '--output', output, '--format', args.format, '--chunk-size', str(args.chunk_size)],
+        env=env, cwd=tmp, check=True
+    )
+    elapsed = time.time() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+    print(f"rows:      {args.rows}")
+    print(f"rows/sec:  {args.rows / elapsed:.0f}")
+    print(f"peak RSS:  {peak_rss_mb:.0f} MB (largest child process)")
+    print(f"output:    {os.path.getsize(output) / 1e6:.1f} MB")
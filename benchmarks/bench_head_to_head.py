@@ -0,0 +1,84 @@
+"""Head-to-head lookups from pair_stats versus aggregating game_history.
+
+Usage: python -m benchmarks.bench_head_to_head [--rows 50000000] [--users 1000] [--database-url URL]
+                                                [--workers 4] [--lookups 2000]
+
+Seeds history, times a parallel ``HeadToHead.backfill`` of it, then looks up
+``--lookups`` random pairs both ways: a primary-key read of pair_stats and
+the aggregate over game_history for both seat orders (using the per-seat
+indexes). Each lookup gets its own session, as a request would. On
+SQLite the backfill folds one chunk at a time whatever ``--workers`` says.
+"""
+import argparse
+import logging
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import func, case
+
+from src.app import create_app
+from src.config import Config
+from src.models.database import db, GameHistory
+from src.services.head_to_head import HeadToHead
+from benchmarks.seed import seed_history
+
+
+def direct(user_id, opponent_id):
+    pair = (((GameHistory.player1_id == user_id) & (GameHistory.player2_id == opponent_id))
+            | ((GameHistory.player1_id == opponent_id) & (GameHistory.player2_id == user_id)))
+    return (db.session.query(func.count(),
+                             func.sum(case((GameHistory.winner_id == user_id, 1), else_=0)),
+                             func.sum(case((GameHistory.winner_id == opponent_id, 1), else_=0)),
+                             func.sum(case((GameHistory.winner_id.is_(None), 1), else_=0)),
+                             func.sum(GameHistory.bet_amount),
+                             func.max(GameHistory.played_at))
+            .filter(pair).one())
+
+
+def latencies(pairs, lookup):
+    times = []
+    for user_id, opponent_id in pairs:
+        start = time.perf_counter()
+        lookup(user_id, opponent_id)
+        db.session.remove()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return statistics.median(times), times[int(len(times) * 0.99)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--lookups', type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SQL_PROFILING = False
+        DEADLINE_SWEEP_INTERVAL = 0
+        TELEGRAM_TICK_INTERVAL = 0
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        start = time.time()
+        seed_history(args.rows, users=args.users)
+        print(f"seeded {args.rows} rows in {time.time() - start:.1f}s")
+
+    start = time.time()
+    written = HeadToHead().backfill(app, workers=args.workers,
+                                    chunk_size=max(args.rows // (args.workers * 4), 1000), rebuild=True)
+    print(f"backfill: {time.time() - start:8.1f} s   {written} pair rows written")
+
+    rng = random.Random(3)
+    pairs = [tuple(rng.sample(range(1, args.users + 1), 2)) for _ in range(args.lookups)]
+    with app.app_context():
+        sample = pairs[:max(1, args.lookups // 20)]  # each reads every game of both players; a sample is enough
+        for label, lookup, chosen in (('pair_stats', HeadToHead.lookup, pairs),
+                                      ('game_history aggregate', direct, sample)):
+            p50, p99 = latencies(chosen, lookup)
+            print(f"{label:24} p50 {p50 * 1e6:10.0f} us   p99 {p99 * 1e6:10.0f} us")
@@ -0,0 +1,93 @@
+"""/api/state latency and CPU with many clients polling a large lobby.
+
+Usage: python -m benchmarks.bench_lobby [--clients 20000] [--matches 1000] [--baseline-requests 2000]
+
+Every client polls once, in random order, against a lobby of ``--matches``
+waiting matches. Clients have random balances, so each gets a different
+slice of the lobby. The shared snapshot (``LOBBY_SNAPSHOT_TTL`` 0.5) is
+compared with rebuilding the list on every request (TTL 0), which is the
+per-request cost the snapshot replaces. Only the view runs, under a test
+request context, so WSGI and session-cookie costs are left out.
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+from sqlalchemy import insert
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import lobby, match_service
+from src.models.database import db, User
+
+
+def setup(clients, matches):
+    rng = random.Random(7)
+    db.session.execute(insert(User), [{'session_id': f'client{i}', 'coins': rng.randint(1, 200)}
+                                      for i in range(clients)])
+    db.session.commit()
+    for i in range(matches):
+        creator = f'creator{i}'
+        match_service.get_player(creator)
+        match_service.create_match(creator, rng.randint(1, 50))
+        db.session.remove()
+
+
+def poll(app, session_ids):
+    from flask import session
+    view = app.view_functions['game.get_state']
+    latencies = []
+    cpu = time.process_time()
+    for session_id in session_ids:
+        start = time.perf_counter()
+        with app.test_request_context('/api/state'):
+            session['session_id'] = session_id
+            response = view()
+            db.session.remove()
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return latencies, time.process_time() - cpu
+
+
+def report(label, latencies, cpu, builds):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{label:28} p50 {statistics.median(latencies) * 1e6:7.0f} us   p99 {p99 * 1e6:7.0f} us   "
+          f"cpu {cpu / len(latencies) * 1e6:7.0f} us/request   {builds} builds")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--matches', type=int, default=1000)
+    parser.add_argument('--baseline-requests', type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        SQL_PROFILING = False
+        DEADLINE_SWEEP_INTERVAL = 0
+        TELEGRAM_TICK_INTERVAL = 0
+        BOT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        setup(args.clients, args.matches)
+        clients = [f'client{i}' for i in range(args.clients)]
+        random.Random(11).shuffle(clients)
+        poll(app, clients)  # loads every player once
+
+        print(f"{args.clients} clients, {len(lobby.get())} open matches")
+        lobby.ttl = 0
+        builds = lobby.builds
+        latencies, cpu = poll(app, clients[:args.baseline_requests])
+        report('rebuilt per request', latencies, cpu, lobby.builds - builds)
+
+        lobby.ttl = 0.5
+        builds = lobby.builds
+        latencies, cpu = poll(app, clients)
+        report('shared snapshot (0.5 s)', latencies, cpu, lobby.builds - builds)
+        db.drop_all()
@@ -0,0 +1,65 @@
+"""Settled rounds per second with per-match locks versus one global lock.
+
+Usage: python -m benchmarks.bench_match_locks [--threads 1 4 16 64] [--rounds 2000] [--io-ms 1.0]
+
+Each thread plays rounds on its own match: both moves and the settlement
+run under ``match.lock``, with ``--io-ms`` of sleep standing in for the
+settlement's database round trip. The baseline swaps
+``Match.lock_factory`` for a factory that hands every match the same lock,
+which is what a single service-wide lock would do.
+"""
+import argparse
+import threading
+import time
+
+from src.models.match import Match
+
+
+def play(match, rounds, io):
+    for _ in range(rounds):
+        with match.lock:
+            match.start_match()
+            match.make_move(match.creator, 'rock')
+            match.make_move(match.joiner, 'paper')
+            if match.are_both_moves_made():
+                time.sleep(io)
+                match.result = None
+                match.set_result({'result': 'player2'})
+
+
+def run(threads, rounds, io, shared):
+    previous = Match.lock_factory
+    if shared:
+        lock = threading.RLock()
+        Match.lock_factory = staticmethod(lambda: lock)
+    try:
+        matches = []
+        for i in range(threads):
+            match = Match(f'm{i}', f'c{i}', 1)
+            match.joiner = f'j{i}'
+            matches.append(match)
+    finally:
+        Match.lock_factory = previous
+
+    workers = [threading.Thread(target=play, args=(match, rounds // threads, io)) for match in matches]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (rounds // threads) * threads / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--io-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    io = args.io_ms / 1000
+    print(f"{'threads':>8}{'global/s':>12}{'per-match/s':>14}{'speedup':>10}")
+    for threads in args.threads:
+        shared = run(threads, args.rounds, io, shared=True)
+        per_match = run(threads, args.rounds, io, shared=False)
+        print(f"{threads:8}{shared:12.0f}{per_match:14.0f}{per_match / shared:9.1f}x")
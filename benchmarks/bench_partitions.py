@@ -0,0 +1,162 @@
+"""Recent-history latency, retention and vacuum cost: monthly partitions against one heap.
+
+Usage: python -m benchmarks.bench_partitions --database-url postgresql://... [--rows 20000000] [--months 24]
+                                             [--players 100000] [--queries 2000]
+
+Postgres only. Builds two copies of the game_history layout in the schemas
+``bench_plain`` (one table) and ``bench_partitioned`` (range-partitioned by
+month on played_at, as the history_partitions migration leaves it), each
+with ``--rows`` games spread over ``--months`` months between
+``--players`` players, then measures
+
+- the recent-results query (``RecentResults.load`` without the users
+  join) for ``--queries`` random players;
+- removing the oldest month: DELETE plus VACUUM on the heap, DETACH plus
+  DROP on the partitions, with the WAL each one writes;
+- VACUUM (FREEZE) after a day of new rows: the whole heap, against only
+  the current month's partition, which is all autovacuum has to visit.
+
+Both schemas are dropped at the end. Not yet run: no figures from it are
+quoted anywhere until it has been, on a server sized like production.
+"""
+import argparse
+import random
+import statistics
+import time
+from datetime import date
+from sqlalchemy import create_engine, text
+
+from src.services.retention_service import add_months
+
+SCHEMAS = ('bench_plain', 'bench_partitioned')
+
+COLUMNS = """
+    id integer NOT NULL,
+    player1_id integer NOT NULL,
+    player2_id integer NOT NULL,
+    player1_choice varchar(10) NOT NULL,
+    player2_choice varchar(10) NOT NULL,
+    winner_id integer,
+    played_at timestamp without time zone NOT NULL,
+    bet_amount integer DEFAULT 0
+"""
+
+RECENT = text("""
+    SELECT * FROM (
+        (SELECT id, played_at FROM game_history WHERE player1_id = :player ORDER BY played_at DESC, id DESC LIMIT 20)
+        UNION ALL
+        (SELECT id, played_at FROM game_history WHERE player2_id = :player ORDER BY played_at DESC, id DESC LIMIT 20)
+    ) games ORDER BY played_at DESC, id DESC LIMIT 20
+""")
+
+
+def month(index):
+    return add_months(date(2024, 1, 1), index).isoformat()
+
+
+def create(conn, schema, months, partitioned):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {schema}"))
+    conn.execute(text(f"SET search_path TO {schema}"))
+    if partitioned:
+        conn.execute(text(f"CREATE TABLE game_history ({COLUMNS}, PRIMARY KEY (id, played_at)) "
+                          "PARTITION BY RANGE (played_at)"))
+        for i in range(months + 1):
+            conn.execute(text(f"CREATE TABLE game_history_{i:03} PARTITION OF game_history "
+                              f"FOR VALUES FROM ('{month(i)}') TO ('{month(i + 1)}')"))
+    else:
+        conn.execute(text(f"CREATE TABLE game_history ({COLUMNS}, PRIMARY KEY (id))"))
+
+
+def fill(conn, rows, months, players, start_id=1, start=None, span=None):
+    """``rows`` games with consecutive ids, evenly over ``span`` from ``start``."""
+    start = start or "'2024-01-01'::timestamp"
+    span = span or f"interval '{months} month'"
+    conn.execute(text(f"""
+        INSERT INTO game_history
+        SELECT i, p1, p2, 'rock', 'paper', CASE WHEN i % 3 = 0 THEN NULL ELSE p2 END,
+               {start} + {span} * ((i - {start_id})::float8 / {rows}), 1 + i % 50
+        FROM (SELECT i, 1 + (hashint4(i) & 2147483647) % {players} AS p1,
+                     1 + (hashint4(-i) & 2147483647) % {players} AS p2
+              FROM generate_series({start_id}, {start_id + rows - 1}) i) g
+    """))
+
+
+def index(conn):
+    for name, columns in (('played_at', 'played_at'), ('player1', 'player1_id, played_at'),
+                          ('player2', 'player2_id, played_at')):
+        conn.execute(text(f"CREATE INDEX ix_{name} ON game_history ({columns})"))
+    conn.execute(text("ANALYZE game_history"))
+
+
+def wal_and_time(conn, statements):
+    """(seconds, WAL bytes) for running ``statements`` one after another."""
+    before = conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+    start = time.perf_counter()
+    for statement in statements:
+        conn.execute(text(statement))
+    elapsed = time.perf_counter() - start
+    wal = conn.execute(text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), :lsn)"), {'lsn': before}).scalar()
+    return elapsed, int(wal)
+
+
+def recent_latencies(conn, players, queries):
+    rng = random.Random(7)
+    latencies = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        conn.execute(RECENT, {'player': rng.randint(1, players)}).all()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return statistics.median(latencies) * 1e3, latencies[int(len(latencies) * 0.99)] * 1e3
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', required=True, help='A Postgres database to create scratch schemas in.')
+    parser.add_argument('--rows', type=int, default=20000000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--players', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url, isolation_level='AUTOCOMMIT')
+    if engine.dialect.name != 'postgresql':
+        parser.error('partitioning needs Postgres')
+    day = args.rows // (args.months * 30)
+    results = {}
+    try:
+        for schema in SCHEMAS:
+            partitioned = schema == 'bench_partitioned'
+            with engine.connect() as conn:
+                start = time.time()
+                create(conn, schema, args.months, partitioned)
+                fill(conn, args.rows, args.months, args.players)
+                index(conn)
+                print(f"{schema}: loaded {args.rows} rows in {time.time() - start:.0f}s")
+
+                p50, p99 = recent_latencies(conn, args.players, args.queries)
+
+                if partitioned:
+                    retention = wal_and_time(conn, ["ALTER TABLE game_history DETACH PARTITION game_history_000",
+                                                    "DROP TABLE game_history_000"])
+                else:
+                    retention = wal_and_time(conn, [f"DELETE FROM game_history WHERE played_at < '{month(1)}'",
+                                                    "VACUUM game_history"])
+
+                # A day of new rows at the end of the range, then freeze what autovacuum would visit
+                fill(conn, day, args.months, args.players, start_id=args.rows + 1,
+                     start=f"'{month(args.months)}'::timestamp", span="interval '1 day'")
+                target = f"game_history_{args.months:03}" if partitioned else "game_history"
+                vacuum = wal_and_time(conn, [f"VACUUM (FREEZE) {target}"])
+                results[schema] = (p50, p99, retention, vacuum)
+    finally:
+        with engine.connect() as conn:
+            for schema in SCHEMAS:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+    print(f"{'':20}{'recent p50 ms':>14}{'p99 ms':>9}{'drop month s':>14}{'WAL MB':>9}"
+          f"{'vacuum s':>10}{'WAL MB':>9}")
+    for schema, (p50, p99, (retention_s, retention_wal), (vacuum_s, vacuum_wal)) in results.items():
+        print(f"{schema:20}{p50:14.2f}{p99:9.2f}{retention_s:14.2f}{retention_wal / 2**20:9.1f}"
+              f"{vacuum_s:10.2f}{vacuum_wal / 2**20:9.1f}")
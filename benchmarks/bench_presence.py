@@ -0,0 +1,130 @@
+"""Write amplification of last_seen: batched presence flushes against an UPDATE per request.
+
+Usage: python -m benchmarks.bench_presence [--users 100000] [--active 5000] [--requests 200000]
+                                           [--seconds 600] [--interval 10]
+
+``--requests`` requests from ``--active`` random players out of ``--users``
+arrive evenly over ``--seconds`` of simulated time. The naive way updates
+the player's ``last_seen`` and commits on every request; ``Presence``
+records them in memory and flushes every ``--interval`` simulated seconds.
+Reports the UPDATE statements, rows written and commits each way, the
+time spent, and how far the online and daily-active estimates are from
+the exact counts.
+"""
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert, update
+
+from src.app import create_app
+from src.config import Config
+from src.models.database import db, User
+from src.services.presence import Presence
+
+START = datetime(2026, 10, 19, 12, 0)
+
+
+def traffic(active, requests, seconds):
+    """(user id, time) per request, in time order."""
+    rng = random.Random(3)
+    step = timedelta(seconds=seconds / requests)
+    return [(rng.choice(active), START + step * i) for i in range(requests)]
+
+
+def counting(engine):
+    counts = {'updates': 0, 'rows': 0, 'commits': 0}
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE users'):
+            counts['updates'] += 1
+            counts['rows'] += max(cursor.rowcount, 0)
+
+    def commit(conn):
+        counts['commits'] += 1
+
+    event.listen(engine, 'after_cursor_execute', after)
+    event.listen(engine, 'commit', commit)
+    return counts, lambda: (event.remove(engine, 'after_cursor_execute', after),
+                            event.remove(engine, 'commit', commit))
+
+
+def naive(requests):
+    users = User.__table__
+    for user_id, at in requests:
+        db.session.execute(update(users).where(users.c.id == user_id).values(last_seen=at))
+        db.session.commit()
+
+
+def batched(app, requests, interval):
+    presence = Presence(app)
+    next_flush = START + timedelta(seconds=interval)
+    touching = 0.0
+    for user_id, at in requests:
+        if at >= next_flush:
+            presence.flush(next_flush)
+            next_flush += timedelta(seconds=interval)
+        start = time.perf_counter()
+        presence.touch(user_id, at)
+        touching += time.perf_counter() - start
+    presence.flush(next_flush)
+    return presence, touching
+
+
+def measure(label, run, requests):
+    counts, stop = counting(db.engine)
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    stop()
+    print(f"{label:10}{counts['updates']:>10}{counts['rows']:>10}{counts['commits']:>9}"
+          f"{counts['rows'] / len(requests):>14.3f}{elapsed:>9.2f}")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--active', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--seconds', type=float, default=600)
+    parser.add_argument('--interval', type=float, default=10)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+            SQL_PROFILING = False
+            DEADLINE_SWEEP_INTERVAL = 0
+            TELEGRAM_TICK_INTERVAL = 0
+            PRESENCE_FLUSH_INTERVAL = 0
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [{'session_id': f'u{i}', 'last_seen': START - timedelta(days=1)}
+                                              for i in range(args.users)])
+            db.session.commit()
+            active = random.Random(4).sample(range(1, args.users + 1), args.active)
+            requests = traffic(active, args.requests, args.seconds)
+            print(f"{args.requests} requests from {args.active} of {args.users} users over {args.seconds:.0f}s, "
+                  f"flushed every {args.interval:.0f}s")
+            print(f"{'':10}{'UPDATEs':>10}{'rows':>10}{'commits':>9}{'rows/request':>14}{'time s':>9}")
+
+            measure('naive', lambda: naive(requests), requests)
+            db.session.execute(update(User).values(last_seen=START - timedelta(days=1)))
+            db.session.commit()
+            presence, touching = measure('batched', lambda: batched(app, requests, args.interval), requests)
+            print(f"touch: {touching / len(requests) * 1e6:.2f} us per request")
+
+            end = requests[-1][1]
+            window = end - timedelta(seconds=presence.online_window)
+            online = len({user_id for user_id, at in requests if at >= window.replace(second=0, microsecond=0)})
+            print(f"online now: estimated {presence.online(end)}, exact {online}")
+            print(f"active today: estimated {presence.daily_active(1, end)[0]['users']}, "
+                  f"exact {len({user_id for user_id, _ in requests})}")
+            db.drop_all()
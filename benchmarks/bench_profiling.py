@@ -0,0 +1,76 @@
+"""Cost of SQL profiling: per statement, and per request with and without cProfile sampling.
+
+Usage: python -m benchmarks.bench_profiling [--statements 20000] [--requests 2000]
+
+Statements are ``SELECT 1`` on an in-memory SQLite database, the cheapest
+query there is, so the listener's share is an upper bound. Requests are
+``GET /api/state`` through the Flask test client.
+"""
+import argparse
+import logging
+import time
+from sqlalchemy import text
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import query_profiler
+from src.models.database import db
+
+
+def make_app(profiling):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        SQL_PROFILING = profiling
+        SLOW_QUERY_MS = 1000.0
+        RATE_LIMIT_ENABLED = False
+        DEADLINE_SWEEP_INTERVAL = 0
+        TELEGRAM_TICK_INTERVAL = 0
+        BOT_ENABLED = False
+    return create_app(BenchConfig)
+
+
+def per_statement(app, n):
+    with app.app_context():
+        conn = db.session.connection()
+        query = text('SELECT 1')
+        start = time.perf_counter()
+        for _ in range(n):
+            conn.execute(query)
+        elapsed = time.perf_counter() - start
+        db.session.remove()
+    return elapsed / n
+
+
+def per_request(app, n, sample_rate=None):
+    with app.app_context():
+        db.create_all()
+        if sample_rate is not None:
+            query_profiler.start_sampling(3600, sample_rate)
+        client = app.test_client()
+        client.get('/api/state')  # creates the user
+        start = time.perf_counter()
+        for _ in range(n):
+            client.get('/api/state')
+        elapsed = time.perf_counter() - start
+        db.drop_all()
+    return elapsed / n
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--statements', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    off, on = make_app(False), make_app(True)
+    base = per_statement(off, args.statements)
+    hooked = per_statement(on, args.statements)
+    print(f"statement:  {base * 1e6:.1f} us unprofiled, {hooked * 1e6:.1f} us profiled "
+          f"(+{(hooked - base) * 1e6:.1f} us)")
+
+    base = per_request(off, args.requests)
+    hooked = per_request(on, args.requests)
+    sampled = per_request(make_app(True), args.requests, sample_rate=1.0)
+    print(f"request:    {base * 1e6:.0f} us unprofiled, {hooked * 1e6:.0f} us profiled "
+          f"({(hooked / base - 1) * 100:+.1f}%), {sampled * 1e6:.0f} us with every request under cProfile")
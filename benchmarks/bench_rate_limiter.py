@@ -0,0 +1,60 @@
+"""Rate limiter overhead under a large working set.
+
+Usage: python -m benchmarks.bench_rate_limiter [--keys 1000000] [--checks 1000000]
+
+Fills the in-memory store with ``--keys`` session buckets (plus one IP
+bucket per 100 sessions) and then times ``RateLimiter.check`` for random
+sessions from that working set, next to an empty-loop baseline.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from src.config import Config
+from src.services.rate_limiter import MemoryBucketStore, RateLimiter
+
+
+def run(keys, checks, seed=0):
+    rng = random.Random(seed)
+    store = MemoryBucketStore(max_keys=keys * 2)
+    limiter = RateLimiter(store, Config.RATE_LIMITS)
+
+    tracemalloc.start()
+    for i in range(keys):
+        limiter.check('get_state', f's{i}', f'10.{i // 100 % 256}.{i // 25600 % 256}.1')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sample = [(f's{n}', f'10.{n // 100 % 256}.{n // 25600 % 256}.1')
+              for n in (rng.randrange(keys) for _ in range(checks))]
+
+    start = time.perf_counter()
+    for session_id, ip in sample:
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for session_id, ip in sample:
+        limiter.check('get_state', session_id, ip)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'keys': len(store),
+        'store_mb': peak / 1e6,
+        'ns_per_check': (elapsed - baseline) / checks * 1e9,
+        'checks_per_sec': checks / elapsed,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=1000000)
+    parser.add_argument('--checks', type=int, default=1000000)
+    args = parser.parse_args()
+
+    result = run(args.keys, args.checks)
+    print(f"buckets in store:   {result['keys']}")
+    print(f"store memory:       {result['store_mb']:.1f} MB")
+    print(f"overhead per check: {result['ns_per_check']:.0f} ns")
+    print(f"checks per second:  {result['checks_per_sec']:.0f}")
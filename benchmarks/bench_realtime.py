@@ -0,0 +1,119 @@
+"""Bytes per match lifecycle and CPU per emit for the Socket.IO wire formats.
+
+Usage: python -m benchmarks.bench_realtime [--emits 20000]
+
+Plays one match (create, join, ready, two moves) with Socket.IO test
+clients and records every event the creator receives. Those events are
+then encoded as the server would send them: the previous format (full
+stats dicts, stdlib ``json``) and the compact ``match_result`` payload with
+orjson and with MessagePack. Each is also sent through a wsproto websocket
+with permessage-deflate negotiated, counting frame bytes. CPU per emit is
+the time to encode the ``match_result`` packet and frame it, which is the
+per-client work of an emit.
+"""
+import argparse
+import json
+import logging
+import time
+import orjson
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, BytesMessage, Request, TextMessage
+from wsproto.extensions import PerMessageDeflate
+
+from src.app import create_app
+from src.config import TestConfig
+from src.extensions import socketio, match_service
+from src.models.database import db
+from src.services.realtime import OrjsonModule, match_result_payload
+
+
+class StdlibPacket(packet.Packet):
+    json = json
+
+
+class OrjsonPacket(packet.Packet):
+    json = OrjsonModule(orjson)
+
+
+def play_match():
+    """Events the creator receives in one match, and the full result dict."""
+    class BenchConfig(TestConfig):
+        RATE_LIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        alice, bob = app.test_client(), app.test_client()
+        alice.get('/')
+        bob.get('/')
+        match_id = alice.post('/api/create_match', json={'stake': 10}).get_json()['match_id']
+        sockets = [socketio.test_client(app, flask_test_client=client) for client in (alice, bob)]
+        bob.post('/api/join_match', json={'match_id': match_id})
+        for socket in sockets:
+            socket.emit('join_match_room', {'match_id': match_id})
+            socket.emit('ready_for_match', {'match_id': match_id})
+        alice.post('/api/move', json={'move': 'paper'})
+        bob.post('/api/move', json={'move': 'rock'})
+        events = [(m['name'], m['args'][0] if m['args'] else None) for m in sockets[0].get_received()]
+        full = match_service.get_match(match_id).result
+        match_service.get_match(match_id).cancel_timer()
+        db.drop_all()
+    return events, full
+
+
+def encode(packet_class, event, data):
+    """The websocket message engine.io sends for one event."""
+    encoded = packet_class(packet.EVENT, data=[event, data], namespace='/').encode()
+    return BytesMessage(data=encoded) if isinstance(encoded, bytes) else TextMessage(data='4' + encoded)
+
+
+def websocket(deflate):
+    """A server-side wsproto connection, with permessage-deflate negotiated if ``deflate``."""
+    client = WSConnection(ConnectionType.CLIENT)
+    server = WSConnection(ConnectionType.SERVER)
+    server.receive_data(client.send(Request(host='localhost', target='/socket.io/',
+                                            extensions=[PerMessageDeflate()] if deflate else [])))
+    next(server.events())
+    client.receive_data(server.send(AcceptConnection(extensions=[PerMessageDeflate()])))
+    return server
+
+
+def lifecycle_bytes(packet_class, events, deflate):
+    server = websocket(deflate)
+    return sum(len(server.send(encode(packet_class, event, data))) for event, data in events)
+
+
+def cpu_per_emit(packet_class, data, emits, deflate):
+    server = websocket(deflate)
+    start = time.process_time()
+    for _ in range(emits):
+        server.send(encode(packet_class, 'match_result', data))
+    return (time.process_time() - start) / emits
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emits', type=int, default=20000)
+    args = parser.parse_args()
+    for name in ('rps_game', 'socketio.server', 'engineio.server'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    events, full = play_match()
+    compact = match_result_payload(full)
+    before = [(event, full if event == 'match_result' else data) for event, data in events]
+    after = [(event, compact if event == 'match_result' else data) for event, data in events]
+    print(f"lifecycle: {', '.join(event for event, _ in events)}")
+
+    formats = (
+        ('full stats, json', StdlibPacket, before, full),
+        ('deltas, orjson', OrjsonPacket, after, compact),
+        ('deltas, msgpack', MsgPackPacket, after, compact),
+    )
+    for label, packet_class, lifecycle, result in formats:
+        for deflate in (False, True):
+            print(f"{label:18} {'deflate' if deflate else 'plain':8} "
+                  f"{lifecycle_bytes(packet_class, lifecycle, deflate):5} bytes/lifecycle   "
+                  f"match_result {len(encode(packet_class, 'match_result', result).data):4} bytes   "
+                  f"{cpu_per_emit(packet_class, result, args.emits, deflate) * 1e6:6.1f} us/emit")
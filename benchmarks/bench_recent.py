@@ -0,0 +1,110 @@
+"""Profile-view latency and DB load: recent-results buffers against the direct query.
+
+Usage: python -m benchmarks.bench_recent [--users 100000] [--games 2000000] [--viewers 2000] [--views 5]
+
+Fills ``game_history`` with random games between ``--users`` players,
+then ``--viewers`` players each open their last-20 view ``--views`` times.
+The direct query (``RecentResults.load``, both seats joined to ``users``)
+runs on every view, first without and then with the per-seat indexes;
+the buffers load once per player and answer the other views from memory.
+Each view gets its own session, as a request would.
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, insert
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import match_service, recent_results
+from src.models.database import db, User, GameHistory
+
+
+def fill(users, games, batch=100000):
+    db.session.execute(insert(User), [{'session_id': f'u{i}', 'username': f'player{i}'} for i in range(users)])
+    rng = random.Random(5)
+    start = datetime(2026, 1, 1)
+    moves = ('rock', 'paper', 'scissors')
+    for lo in range(0, games, batch):
+        rows = []
+        for i in range(lo, min(lo + batch, games)):
+            a, b = rng.sample(range(1, users + 1), 2)
+            rows.append({'player1_id': a, 'player2_id': b, 'player1_choice': rng.choice(moves),
+                         'player2_choice': rng.choice(moves), 'winner_id': rng.choice((a, b, None)),
+                         'bet_amount': rng.randint(1, 50), 'played_at': start + timedelta(seconds=i)})
+        db.session.execute(insert(GameHistory), rows)
+    db.session.commit()
+
+
+def views(viewers, count, show):
+    latencies = []
+    statements = [0]
+
+    def record(*args):
+        statements[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    for _ in range(count):
+        for session_id in viewers:
+            start = time.perf_counter()
+            show(session_id)
+            db.session.remove()
+            latencies.append(time.perf_counter() - start)
+    event.remove(db.engine, 'before_cursor_execute', record)
+    return latencies, statements[0]
+
+
+def report(label, latencies, statements):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{label:26} p50 {statistics.median(latencies) * 1e6:8.0f} us   p99 {p99 * 1e6:8.0f} us   "
+          f"{statements / len(latencies):.2f} statements/view")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=2000000)
+    parser.add_argument('--viewers', type=int, default=2000)
+    parser.add_argument('--views', type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+            SQL_PROFILING = False
+            DEADLINE_SWEEP_INTERVAL = 0
+            TELEGRAM_TICK_INTERVAL = 0
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            fill(args.users, args.games)
+            viewers = [f'u{i}' for i in random.Random(9).sample(range(args.users), args.viewers)]
+            for session_id in viewers:
+                match_service.get_player(session_id)
+            db.session.remove()
+            print(f"{args.users} users, {args.games} games, {args.viewers} viewers x {args.views} views")
+
+            def direct(session_id):
+                return recent_results.load(match_service.get_player(session_id).user_id)
+
+            def buffered(session_id):
+                return recent_results.get(match_service.get_player(session_id))
+
+            indexes = [index for index in GameHistory.__table__.indexes if index.name.startswith('ix_game_history_player')]
+            for index in indexes:
+                index.drop(db.engine)
+            few = viewers[:max(1, args.viewers // 20)]  # a full scan per view; a sample is enough
+            report('direct query, no indexes', *views(few, 1, direct))
+            for index in indexes:
+                index.create(db.engine)
+            report('direct query', *views(viewers, args.views, direct))
+            report('buffer', *views(viewers, args.views, buffered))
+            db.drop_all()
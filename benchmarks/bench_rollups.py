@@ -0,0 +1,85 @@
+"""Dashboard query time on the rollups versus scanning game_history.
+
+Usage: python -m benchmarks.bench_rollups [--rows 5000000] [--database-url URL] [--workers 4]
+
+Seeds history, times a parallel backfill and an incremental update of 1%
+new rows, then runs the three dashboard questions (games per day, stake per
+hour, draw rate by stake) against the rollup tables and as raw GROUP BY
+scans of game_history.
+"""
+import argparse
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy import func, case
+
+from src.app import create_app
+from src.config import Config
+from src.models.database import db, GameHistory
+from src.services.rollup_service import RollupService
+from src.utils.sql import truncate_time
+from benchmarks.seed import seed_history
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def raw_daily(since):
+    day = truncate_time(GameHistory.played_at, 'day')
+    return (db.session.query(day, func.count(), func.sum(GameHistory.bet_amount))
+            .filter(GameHistory.played_at >= since).group_by(day).all())
+
+
+def raw_hourly(since):
+    hour = truncate_time(GameHistory.played_at, 'hour')
+    return (db.session.query(hour, func.sum(GameHistory.bet_amount))
+            .filter(GameHistory.played_at >= since).group_by(hour).all())
+
+
+def raw_stakes(since):
+    return (db.session.query(GameHistory.bet_amount, func.count(),
+                             func.sum(case((GameHistory.winner_id.is_(None), 1), else_=0)))
+            .filter(GameHistory.played_at >= since).group_by(GameHistory.bet_amount).all())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000000)
+    parser.add_argument('--database-url', default=None)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+
+    app = create_app(BenchConfig)
+    service = RollupService()
+    with app.app_context():
+        start = time.time()
+        seed_history(args.rows, days=365)
+        print(f"seeded {args.rows} rows in {time.time() - start:.1f}s")
+
+    start = time.time()
+    service.backfill(app, workers=args.workers, chunk_size=max(args.rows // (args.workers * 4), 1000), rebuild=True)
+    print(f"backfill:            {time.time() - start:8.1f} s")
+
+    with app.app_context():
+        seed_history(args.rows + args.rows // 100, days=365)
+        start = time.time()
+        service.update()
+        print(f"update (+1% rows):   {time.time() - start:8.1f} s")
+
+        since = datetime(2024, 1, 1)
+        print(f"{'query':22}{'rollup ms':>12}{'raw scan ms':>14}")
+        for name, rollup, raw in [
+            ('games per day', lambda: service.series('day', since), lambda: raw_daily(since)),
+            ('stake per hour', lambda: service.series('hour', since), lambda: raw_hourly(since)),
+            ('draw rate by stake', lambda: service.draw_rate_by_stake(since), lambda: raw_stakes(since)),
+        ]:
+            print(f"{name:22}{timed(rollup):12.1f}{timed(raw, repeat=2):14.1f}")
@@ -0,0 +1,91 @@
+"""Session overhead per request, and the lookups saved by caching the user id.
+
+Usage: python -m benchmarks.bench_sessions [--clients 2000] [--rounds 5] [--redis-url URL]
+
+Each client keeps its own cookie jar and polls /api/state through the full
+WSGI stack, ``--rounds`` times, with the session in a signed cookie
+(``SESSION_STORE`` cookie), in process memory and, with ``--redis-url``, in
+Redis. Then every client polls once more from a worker that has not seen
+it (``match_service.players`` cleared), with and without ``user_id`` in its
+session, counting the statements run to load the player.
+"""
+import argparse
+import logging
+import statistics
+import time
+from sqlalchemy import event
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import match_service
+from src.models.database import db
+
+
+def poll(clients, rounds):
+    latencies = []
+    for _ in range(rounds):
+        for client in clients:
+            start = time.perf_counter()
+            response = client.get('/api/state')
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+    return latencies
+
+
+def cold_poll(clients, keep_user_id):
+    if not keep_user_id:
+        for client in clients:
+            with client.session_transaction() as session:
+                session.pop('user_id', None)
+    db.session.remove()
+    match_service.players.clear()
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    latencies = poll(clients, 1)
+    event.remove(db.engine, 'before_cursor_execute', listener)
+    return latencies, len(statements)
+
+
+def report(label, latencies, extra=''):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{label:40} p50 {statistics.median(latencies) * 1e6:7.0f} us   p99 {p99 * 1e6:7.0f} us{extra}")
+
+
+def run(store, args):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+        SQL_PROFILING = False
+        RATE_LIMIT_ENABLED = False
+        DEADLINE_SWEEP_INTERVAL = 0
+        TELEGRAM_TICK_INTERVAL = 0
+        BOT_ENABLED = False
+        SESSION_STORE = store
+        REDIS_URL = args.redis_url
+
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        match_service.players.clear()
+        clients = [app.test_client() for _ in range(args.clients)]
+        poll(clients, 1)  # creates the players and their sessions
+        report(f'{store} session, warm', poll(clients, args.rounds))
+
+        for keep_user_id in (True, False):
+            latencies, statements = cold_poll(clients, keep_user_id)
+            report(f'{store} session, cold, user_id {"cached" if keep_user_id else "absent"}', latencies,
+                   f'   {statements / len(clients):.1f} statements/request')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--redis-url', default=None, help='Also measure the Redis store (Redis 6.2 or later).')
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    for store in ('cookie', 'memory') + (('redis',) if args.redis_url else ()):
+        run(store, args)
@@ -0,0 +1,133 @@
+"""Cost of forwarding to another shard, and throughput with 4 and 8 shards.
+
+Usage: python -m benchmarks.bench_shards [--shards 4 8] [--requests 2000] [--duration 10] [--clients-per-shard 2]
+
+For each shard count the script starts ``wsgi.py`` with that many workers,
+sharded, against a throwaway SQLite database. A player then creates a
+match on worker 0 (so shard 0 owns it) and polls ``/api/state``, which
+follows the match to its owner: once on worker 0's own port (local) and
+once on worker 1's (forwarded over worker 0's Unix socket). The difference
+of the medians is the forwarding overhead.
+
+Throughput is then measured on the shared port with client processes each
+looping create, state, cancel: the create stays on whichever worker takes
+it, state and cancel go to the owner, so about (shards - 1) / shards of
+them are forwarded. Scaling is only meaningful up to the number of free
+cores.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_workers import ROOT, wait_for_port, session_cookie
+
+
+class Player:
+    """A keep-alive connection carrying one session cookie, updated from responses."""
+
+    def __init__(self, port, cookie):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.conn.connect()
+        self.conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.cookie = cookie
+
+    def call(self, method, path, payload=None):
+        headers = {'Cookie': self.cookie}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        cookie = response.getheader('Set-Cookie')
+        if cookie and cookie.startswith('session='):
+            self.cookie = cookie.split(';')[0]
+        return response.status, json.loads(data)
+
+
+def latency(player, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        status, _ = player.call('GET', '/api/state')
+        times.append(time.perf_counter() - start)
+        assert status == 200
+    return statistics.median(times)
+
+
+def client(port, duration, results):
+    player = Player(port, session_cookie(port))
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        status, body = player.call('POST', '/api/create_match', {'stake': 1})
+        if status != 200:
+            continue
+        player.call('GET', '/api/state')
+        status, _ = player.call('POST', '/api/cancel_match', {'match_id': body['match_id']})
+        done += 3 if status == 200 else 2
+    results.put(done)
+
+
+def measure(shards, args):
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{tmp}/bench.db',
+               SECRET_KEY='bench',
+               RATE_LIMIT_ENABLED='False',
+               DEBUG='False',
+               PYTHONPATH=ROOT)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'wsgi.py'), '--port', str(args.port), '--workers', str(shards),
+         '--sticky-base-port', str(args.port + 1), '--shard-socket-dir', os.path.join(tmp, 'shards')],
+        env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for port in [args.port] + [args.port + 1 + i for i in range(shards)]:
+            wait_for_port(port)
+        owner = Player(args.port + 1, session_cookie(args.port + 1))
+        status, body = owner.call('POST', '/api/create_match', {'stake': 1})
+        assert status == 200, body
+        forwarder = Player(args.port + 2, owner.cookie)
+        for player in (owner, forwarder):
+            latency(player, 200)  # new workers build their services and connections first
+        local = latency(owner, args.requests)
+        forwarded = latency(forwarder, args.requests)
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=client, args=(args.port, args.duration, results))
+                 for _ in range(shards * args.clients_per_shard)]
+        for proc in procs:
+            proc.start()
+        total = sum(results.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+        return local, forwarded, total / args.duration
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, nargs='+', default=[4, 8])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--clients-per-shard', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5199)
+    args = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}")
+    for shards in args.shards:
+        local, forwarded, rps = measure(shards, args)
+        print(f"shards={shards}  state local {local * 1e6:6.0f} us  forwarded {forwarded * 1e6:6.0f} us  "
+              f"(+{(forwarded - local) * 1e6:.0f} us)   create/state/cancel {rps:7.0f} req/s")
@@ -0,0 +1,31 @@
+"""Simulation throughput (sequences per second) by number of processes.
+
+Usage: python -m benchmarks.bench_simulation [--sequences 2000] [--processes 1 2 4 8]
+
+Each run gives every process one seed of ``--sequences`` match lifecycles,
+so the work grows with the process count and the aggregate rate shows how
+the simulation scales across cores.
+"""
+import argparse
+import time
+
+from src.services.simulation import simulate
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sequences', type=int, default=2000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'processes':>10}{'sequences':>12}{'steps':>12}{'seq/s':>10}{'failed':>8}")
+    for processes in args.processes:
+        start = time.time()
+        reports = list(simulate(range(processes), args.sequences, processes, args.players, args.concurrency))
+        elapsed = time.time() - start
+        sequences = sum(r['sequences'] for r in reports)
+        steps = sum(r['steps'] for r in reports)
+        failed = sum(1 for r in reports if r['error'])
+        print(f"{processes:10}{sequences:12}{steps:12}{sequences / elapsed:10.0f}{failed:8}")
@@ -0,0 +1,90 @@
+"""Startup cost: import time, app construction and time to first request.
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5]
+    python -m benchmarks.bench_startup --save benchmarks/baselines/startup.json
+    python -m benchmarks.bench_startup --baseline benchmarks/baselines/startup.json
+
+Each run measures a fresh interpreter so module caches don't hide import
+cost. With ``--baseline`` the script exits non-zero when any median is more
+than ``--max-regression`` (default 25%) slower than the recorded value.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import src.app
+t1 = time.perf_counter()
+app = src.app.create_app()
+t2 = time.perf_counter()
+client = app.test_client()
+response = client.get('/api/state')
+t3 = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'create_app_ms': (t2 - t1) * 1000,
+    'first_request_ms': (t3 - t2) * 1000,
+    'total_ms': (t3 - t0) * 1000,
+}))
+'''
+
+
+def measure_once(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, DEBUG='False')
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], env=env, check=True,
+        capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs):
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(runs):
+            # A new database file each run so the first request pays for schema creation
+            samples.append(measure_once(f'sqlite:///{tmp}/startup{i}.db'))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def compare(result, baseline, max_regression):
+    failures = []
+    for key, value in result.items():
+        if key in baseline and value > baseline[key] * (1 + max_regression):
+            failures.append(f"{key}: {value:.1f} ms vs baseline {baseline[key]:.1f} ms")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--save', help='write the medians to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    for key, value in result.items():
+        print(f"{key:18} {value:8.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({k: round(v, 1) for k, v in result.items()}, f, indent=2)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(result, json.load(f), args.max_regression)
+        if failures:
+            print('Startup regression:')
+            for line in failures:
+                print(f'  {line}')
+            sys.exit(1)
@@ -0,0 +1,94 @@
+"""Telegram front-end throughput: webhook intake and batched update processing.
+
+Usage: python -m benchmarks.bench_telegram [--pairs 2000] [--batch-size 500] [--database-url URL]
+
+Every pair of Telegram users plays one full match (start, create, join,
+two moves: five updates each) against a local fake Bot API server. Intake
+is timed through the Flask test client; processing is ``TelegramBot.tick``
+including the replies sent to the fake server. Without ``--database-url``
+an in-memory SQLite database is used.
+"""
+import argparse
+import logging
+import time
+
+from src.app import create_app
+from src.config import Config
+from src.extensions import telegram_bot
+from src.models.database import db, GameHistory
+from tests.fake_telegram import FakeTelegramServer, update
+
+
+def script(pairs):
+    updates = []
+    n = 0
+    for i in range(pairs):
+        creator, joiner = 2 * i + 1, 2 * i + 2
+        for user_id, text in ((creator, '/start'), (joiner, '/start'), (creator, '/create 1')):
+            n += 1
+            updates.append(update(n, user_id, text))
+    return updates
+
+
+def play(pairs, match_ids):
+    updates = []
+    n = 10 * pairs
+    for i, match_id in enumerate(match_ids):
+        creator, joiner = 2 * i + 1, 2 * i + 2
+        for user_id, text in ((joiner, f'/join {match_id}'), (creator, '/rock'), (joiner, '/paper')):
+            n += 1
+            updates.append(update(n, user_id, text))
+    return updates
+
+
+def process(bot, client, updates, headers):
+    start = time.perf_counter()
+    for u in updates:
+        client.post('/telegram/webhook', json=u, headers=headers)
+    intake = time.perf_counter() - start
+
+    start = time.perf_counter()
+    while bot.tick():
+        pass
+    return intake, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    logging.getLogger('rps_game').setLevel(logging.WARNING)
+
+    with FakeTelegramServer() as fake:
+        class BenchConfig(Config):
+            SQLALCHEMY_DATABASE_URI = args.database_url or 'sqlite:///:memory:'
+            TELEGRAM_BOT_TOKEN = fake.token
+            TELEGRAM_API_URL = fake.url
+            TELEGRAM_BATCH_SIZE = args.batch_size
+            TELEGRAM_QUEUE_SIZE = 10 * args.pairs
+            TELEGRAM_TICK_INTERVAL = 0
+            RATE_LIMIT_ENABLED = False
+            DEADLINE_SWEEP_INTERVAL = 0
+
+        app = create_app(BenchConfig)
+        with app.app_context():
+            db.create_all()
+            bot = telegram_bot._get_current_object()
+            client = app.test_client()
+            headers = {}
+
+            first = script(args.pairs)
+            intake1, work1 = process(bot, client, first, headers)
+            match_ids = list(bot.watching)  # in creation order, one per pair
+            second = play(args.pairs, match_ids)
+            intake2, work2 = process(bot, client, second, headers)
+
+            updates = len(first) + len(second)
+            print(f"updates:     {updates} ({args.pairs} matches, {GameHistory.query.count()} settled)")
+            print(f"webhook:     {updates / (intake1 + intake2):,.0f} updates/s")
+            print(f"processing:  {len(first) / work1:,.0f} updates/s registering and creating, "
+                  f"{len(second) / work2:,.0f} updates/s joining and playing")
+            print(f"replies:     {bot.stats['sent']} messages to the fake API")
+            db.drop_all()
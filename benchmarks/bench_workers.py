@@ -0,0 +1,99 @@
+"""Throughput of the pre-fork server from 1 to 8 workers.
+
+Usage: python -m benchmarks.bench_workers [--workers 1 2 4 8] [--duration 10] [--clients-per-worker 4]
+
+For each worker count the script starts ``wsgi.py`` against a throwaway
+SQLite database, then runs a local load generator: client processes with
+keep-alive connections requesting ``--path`` with a fixed session cookie
+(so ``/`` renders the page without touching the database). Scaling is only
+meaningful up to the number of free cores; leave some for the clients.
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server did not start on port {port}')
+
+
+def session_cookie(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/')
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def client(port, path, cookie, duration, results):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    done = 0
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        conn.request('GET', path, headers={'Cookie': cookie})
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            done += 1
+    results.put(done)
+
+
+def measure(workers, port, path, duration, clients):
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{tmp}/bench.db',
+               SECRET_KEY='bench',
+               RATE_LIMIT_ENABLED='False',
+               DEBUG='False',
+               PYTHONPATH=ROOT)
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'wsgi.py'), '--port', str(port), '--workers', str(workers)],
+        env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_port(port)
+        cookie = session_cookie(port)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=client, args=(port, path, cookie, duration, results))
+                 for _ in range(clients)]
+        for proc in procs:
+            proc.start()
+        total = sum(results.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--clients-per-worker', type=int, default=4)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    print(f"cores: {os.cpu_count()}")
+    base = None
+    for workers in args.workers:
+        rps = measure(workers, args.port, args.path, args.duration, workers * args.clients_per_worker)
+        base = base or rps / workers
+        print(f"workers={workers:2d}  {rps:8.0f} req/s  scaling efficiency {rps / (base * workers):.0%}")
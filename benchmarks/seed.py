@@ -0,0 +1,62 @@
+"""Seed users and game_history rows for the benchmarks.
+
+Usage: python -m benchmarks.seed --rows 1000000 [--users 1000] [--days 365]
+
+Uses the app's DATABASE_URL. Rows are spread evenly over ``--days`` days
+before 2025-01-01 and inserted in batches; existing rows count toward the
+target, so re-running only tops the table up.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, func
+
+from src.app import create_app
+from src.models.database import db, User, GameHistory
+
+MOVES = ['rock', 'paper', 'scissors']
+
+
+def seed_users(count):
+    existing = db.session.query(func.count(User.id)).scalar()
+    for offset in range(existing, count, 50000):
+        db.session.execute(insert(User), [
+            {'session_id': f'bench{i}', 'username': f'player{i}', 'coins': 100}
+            for i in range(offset, min(offset + 50000, count))
+        ])
+        db.session.commit()
+
+
+def seed_history(rows, users=1000, days=365, seed=0):
+    db.create_all()
+    seed_users(users)
+    existing = db.session.query(func.count(GameHistory.id)).scalar()
+    rng = random.Random(seed + existing)
+    start = datetime(2025, 1, 1) - timedelta(days=days)
+    spacing = days * 86400 / max(rows, 1)
+    batch = 50000
+    for offset in range(existing, rows, batch):
+        values = []
+        for i in range(offset, min(offset + batch, rows)):
+            p1 = rng.randint(1, users)
+            p2 = rng.randint(1, users)
+            values.append({
+                'player1_id': p1, 'player2_id': p2,
+                'player1_choice': rng.choice(MOVES), 'player2_choice': rng.choice(MOVES),
+                'winner_id': rng.choice([None, p1, p2]),
+                'bet_amount': rng.choice([1, 5, 10, 20, 50, 100]),
+                'played_at': start + timedelta(seconds=i * spacing)
+            })
+        db.session.execute(insert(GameHistory), values)
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    with create_app().app_context():
+        seed_history(args.rows, args.users, args.days)
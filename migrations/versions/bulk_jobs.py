@@ -0,0 +1,44 @@
+"""add bulk_jobs and season_stats tables
+
+Revision ID: bulk_jobs
+Revises: telegram_id_index
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'bulk_jobs'
+down_revision = 'telegram_id_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('bulk_jobs',
+        sa.Column('name', sa.String(80), primary_key=True),
+        sa.Column('operation', sa.String(20), nullable=False),
+        sa.Column('params', sa.Text(), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_id', sa.Integer(), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('status', sa.String(10), nullable=False, server_default='running'),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True)
+    )
+    op.create_table('season_stats',
+        sa.Column('season', sa.String(40), primary_key=True),
+        sa.Column('user_id', sa.Integer(), primary_key=True),
+        sa.Column('coins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_games', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('wins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('losses', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('draws', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_coins_won', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_coins_lost', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('archived_at', sa.DateTime(), nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('season_stats')
+    op.drop_table('bulk_jobs')
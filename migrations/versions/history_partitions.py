@@ -0,0 +1,146 @@
+"""partition game_history by month on played_at
+
+Not yet run against a Postgres server (see the README):
+tests/test_partitions.py exercises it when TEST_POSTGRES_URL is set.
+Rehearse it on a restored copy of the database before upgrading production.
+
+Revision ID: history_partitions
+Revises: pair_stats
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from datetime import date, datetime
+from alembic import context, op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'history_partitions'
+down_revision = 'pair_stats'
+branch_labels = None
+depends_on = None
+
+# Rows copied per transaction; `flask db upgrade -x history_batch=N` overrides it
+BATCH = 50000
+# Monthly partitions created past the current month; `flask history partitions` keeps them coming
+MONTHS_AHEAD = 3
+
+COLUMNS = 'id, player1_id, player2_id, player1_choice, player2_choice, winner_id, played_at, bet_amount'
+INDEXES = {
+    # column list -> name once the new table is game_history
+    'played_at': 'ix_game_history_played_at',
+    'player1_id, played_at': 'ix_game_history_player1_played_at',
+    'player2_id, played_at': 'ix_game_history_player2_played_at',
+}
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_table(name, partitioned):
+    # The primary key of a partitioned table must include the partition key
+    key = 'id, played_at' if partitioned else 'id'
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id integer NOT NULL DEFAULT nextval('game_history_id_seq'),
+            player1_id integer NOT NULL REFERENCES users (id),
+            player2_id integer NOT NULL REFERENCES users (id),
+            player1_choice varchar(10) NOT NULL,
+            player2_choice varchar(10) NOT NULL,
+            winner_id integer REFERENCES users (id),
+            played_at timestamp without time zone NOT NULL,
+            bet_amount integer DEFAULT 0,
+            CONSTRAINT {name}_pkey PRIMARY KEY ({key})
+        ){' PARTITION BY RANGE (played_at)' if partitioned else ''}
+    """)
+    for columns, index in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {index.replace('game_history', name)} ON {name} ({columns})")
+
+
+def take_name(name):
+    """Rename ``name``'s primary key and indexes to the ones game_history had."""
+    op.execute(f"ALTER TABLE {name} RENAME TO game_history")
+    op.execute(f"ALTER INDEX {name}_pkey RENAME TO game_history_pkey")
+    for index in INDEXES.values():
+        op.execute(f"ALTER INDEX {index.replace('game_history', name)} RENAME TO {index}")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return  # partitioning is Postgres-only; other databases keep the plain table
+    batch = int(context.get_x_argument(as_dictionary=True).get('history_batch', BATCH))
+
+    # Everything up to the swap commits as it goes, so settlement keeps
+    # running and an interrupted upgrade can simply be run again
+    with op.get_context().autocommit_block():
+        oldest = bind.execute(sa.text("SELECT min(played_at) FROM game_history")).scalar()
+        this_month = datetime.utcnow().date().replace(day=1)
+        first = (oldest.date() if oldest else this_month).replace(day=1)
+
+        create_table('game_history_partitioned', partitioned=True)
+        month = first
+        while month <= add_months(this_month, MONTHS_AHEAD):
+            op.execute(f"CREATE TABLE IF NOT EXISTS game_history_{month:%Y_%m} PARTITION OF game_history_partitioned "
+                       f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')")
+            month = add_months(month, 1)
+        # Catches rows past the last monthly partition, so a settlement never fails for want of one
+        op.execute("CREATE TABLE IF NOT EXISTS game_history_default PARTITION OF game_history_partitioned DEFAULT")
+
+        # New rows are copied as they are inserted. CREATE TRIGGER waits for
+        # inserts in flight, so every row it does not see is committed once it returns
+        op.execute(f"""
+            CREATE OR REPLACE FUNCTION game_history_copy() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO game_history_partitioned ({COLUMNS})
+                VALUES (NEW.id, NEW.player1_id, NEW.player2_id, NEW.player1_choice, NEW.player2_choice,
+                        NEW.winner_id, COALESCE(NEW.played_at, '{first}'), NEW.bet_amount)
+                ON CONFLICT DO NOTHING;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        op.execute("DROP TRIGGER IF EXISTS game_history_copy ON game_history")
+        op.execute("CREATE TRIGGER game_history_copy AFTER INSERT ON game_history "
+                   "FOR EACH ROW EXECUTE FUNCTION game_history_copy()")
+
+        # Existing rows in id ranges, one short transaction each; rerunning
+        # after an interruption skips the rows already copied
+        cutoff = bind.execute(sa.text("SELECT max(id) FROM game_history")).scalar() or 0
+        for low in range(0, cutoff, batch):
+            bind.execute(sa.text(f"""
+                INSERT INTO game_history_partitioned ({COLUMNS})
+                SELECT id, player1_id, player2_id, player1_choice, player2_choice, winner_id,
+                       COALESCE(played_at, '{first}'), bet_amount
+                FROM game_history WHERE id > :low AND id <= :high
+                ON CONFLICT DO NOTHING
+            """), {'low': low, 'high': low + batch})
+
+        copied, total = bind.execute(sa.text("""
+            SELECT (SELECT count(*) FROM game_history_partitioned WHERE id <= :cutoff),
+                   (SELECT count(*) FROM game_history WHERE id <= :cutoff)
+        """), {'cutoff': cutoff}).one()
+        if copied != total:
+            raise RuntimeError(f"Copied {copied} of {total} game_history rows; run the upgrade again")
+
+    # The swap is one short transaction, committed with the revision
+    op.execute("LOCK TABLE game_history IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER game_history_copy ON game_history")
+    op.execute("DROP FUNCTION game_history_copy()")
+    # Dropping the old table would drop the sequence it owns
+    op.execute("ALTER SEQUENCE game_history_id_seq OWNED BY game_history_partitioned.id")
+    op.execute("DROP TABLE game_history")
+    take_name('game_history_partitioned')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    # Archived months are not brought back; restore them from the archive files if needed
+    create_table('game_history_unpartitioned', partitioned=False)
+    op.execute(f"INSERT INTO game_history_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM game_history")
+    op.execute("ALTER SEQUENCE game_history_id_seq OWNED BY game_history_unpartitioned.id")
+    op.execute("DROP TABLE game_history")
+    take_name('game_history_unpartitioned')
@@ -0,0 +1,24 @@
+"""indexes on game_history by player and time
+
+Revision ID: history_player_indexes
+Revises: bulk_jobs
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'history_player_indexes'
+down_revision = 'bulk_jobs'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Loading a player's recent results reads the newest rows of each seat
+    op.create_index('ix_game_history_player1_played_at', 'game_history', ['player1_id', 'played_at'])
+    op.create_index('ix_game_history_player2_played_at', 'game_history', ['player2_id', 'played_at'])
+
+def downgrade():
+    op.drop_index('ix_game_history_player2_played_at', 'game_history')
+    op.drop_index('ix_game_history_player1_played_at', 'game_history')
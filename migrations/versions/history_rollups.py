@@ -0,0 +1,53 @@
+"""add game_history rollup tables
+
+Revision ID: history_rollups
+Revises: merge_heads
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'history_rollups'
+down_revision = 'merge_heads'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Rollups are folded incrementally by id but dashboards and backfills range over time
+    op.create_index('ix_game_history_played_at', 'game_history', ['played_at'])
+
+    op.create_table('history_rollups',
+        sa.Column('period', sa.String(4), primary_key=True),
+        sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+        sa.Column('games', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_stake', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('creator_wins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('joiner_wins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('draws', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('distinct_players', sa.Integer(), nullable=False, server_default='0')
+    )
+    op.create_table('stake_rollups',
+        sa.Column('day', sa.DateTime(), primary_key=True),
+        sa.Column('bet_amount', sa.Integer(), primary_key=True),
+        sa.Column('games', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('draws', sa.Integer(), nullable=False, server_default='0')
+    )
+    op.create_table('rollup_players',
+        sa.Column('period', sa.String(4), primary_key=True),
+        sa.Column('bucket_start', sa.DateTime(), primary_key=True),
+        sa.Column('user_id', sa.Integer(), primary_key=True)
+    )
+    op.create_table('rollup_watermarks',
+        sa.Column('name', sa.String(40), primary_key=True),
+        sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('rollup_watermarks')
+    op.drop_table('rollup_players')
+    op.drop_table('stake_rollups')
+    op.drop_table('history_rollups')
+    op.drop_index('ix_game_history_played_at', 'game_history')
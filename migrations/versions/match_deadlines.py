@@ -0,0 +1,33 @@
+"""add match_deadlines table
+
+Revision ID: match_deadlines
+Revises: history_rollups
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'match_deadlines'
+down_revision = 'history_rollups'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('match_deadlines',
+        sa.Column('match_id', sa.String(16), primary_key=True),
+        sa.Column('creator_id', sa.String(80), nullable=False),
+        sa.Column('joiner_id', sa.String(80), nullable=False),
+        sa.Column('stake', sa.Integer(), nullable=False),
+        sa.Column('deadline', sa.Float(), nullable=False),
+        sa.Column('lease_owner', sa.String(80), nullable=True),
+        sa.Column('lease_until', sa.Float(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0')
+    )
+    # The sweeper scans expired deadlines in deadline order
+    op.create_index('ix_match_deadlines_deadline', 'match_deadlines', ['deadline'])
+
+def downgrade():
+    op.drop_index('ix_match_deadlines_deadline', 'match_deadlines')
+    op.drop_table('match_deadlines')
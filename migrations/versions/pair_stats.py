@@ -0,0 +1,31 @@
+"""add pair_stats table
+
+Revision ID: pair_stats
+Revises: history_player_indexes
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'pair_stats'
+down_revision = 'history_player_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Filled by settlement from now on; run `flask pairs backfill` for older history
+    op.create_table('pair_stats',
+        sa.Column('low_id', sa.Integer(), primary_key=True),
+        sa.Column('high_id', sa.Integer(), primary_key=True),
+        sa.Column('games', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('low_wins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('high_wins', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('draws', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_stake', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('last_played_at', sa.DateTime(), nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('pair_stats')
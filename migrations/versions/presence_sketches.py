@@ -0,0 +1,25 @@
+"""add presence_sketches table
+
+Revision ID: presence_sketches
+Revises: history_partitions
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'presence_sketches'
+down_revision = 'history_partitions'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('presence_sketches',
+        sa.Column('name', sa.String(40), primary_key=True),
+        sa.Column('registers', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True)
+    )
+
+def downgrade():
+    op.drop_table('presence_sketches')
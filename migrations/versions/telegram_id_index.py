@@ -0,0 +1,22 @@
+"""unique index on users.telegram_id
+
+Revision ID: telegram_id_index
+Revises: match_deadlines
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'telegram_id_index'
+down_revision = 'match_deadlines'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # The Telegram bot resolves every incoming update's sender by telegram_id
+    op.create_index('ix_users_telegram_id', 'users', ['telegram_id'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_users_telegram_id', 'users')
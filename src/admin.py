@@ -0,0 +1,176 @@
+import hmac
+import time
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from src.extensions import admission, presence, query_profiler, replicas, socketio
+from src.models.database import db
+from src.services.bulk_service import BulkOperations
+from src.services.export_service import HistoryExporter
+from src.services.profiling import sample_stacks
+from src.services.rollup_service import RollupService, since
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+@admin_bp.before_request
+def require_admin():
+    """Allow admin requests only with ``Authorization: Bearer <ADMIN_TOKEN>``.
+
+    Admin endpoints are disabled entirely while ``ADMIN_TOKEN`` is unset.
+    """
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        return jsonify({'error': 'Not authorized'}), 403
+    return None
+
+@admin_bp.route('/export/history')
+def export_history():
+    try:
+        since_id = int(request.args.get('since_id', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid since_id'}), 400
+
+    exporter = HistoryExporter(current_app.config['EXPORT_CHUNK_SIZE'], replicas.engine_for(),
+                               current_app.config['HISTORY_SETTLE_SECONDS'])
+    return Response(
+        stream_with_context(exporter.iter_csv(since_id)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename=game_history_since_{since_id}.csv'}
+    )
+
+@admin_bp.route('/stats/<period>')
+def rollup_stats(period):
+    """Games, stakes and outcomes per hour or day, read from the rollups only."""
+    if period not in ('hourly', 'daily'):
+        return jsonify({'error': 'Unknown period'}), 404
+    period = 'hour' if period == 'hourly' else 'day'
+    try:
+        count = min(int(request.args.get('count', 48 if period == 'hour' else 30)), 10000)
+    except ValueError:
+        return jsonify({'error': 'Invalid count'}), 400
+
+    with replicas.reading(db.session):
+        buckets = [row.to_dict() for row in RollupService().series(period, since(period, count))]
+    return jsonify({'period': period, 'buckets': buckets})
+
+@admin_bp.route('/stats/stakes')
+def stake_stats():
+    """Draw rate per stake amount over the last ``days`` days."""
+    try:
+        days = min(int(request.args.get('days', 30)), 3650)
+    except ValueError:
+        return jsonify({'error': 'Invalid days'}), 400
+    with replicas.reading(db.session):
+        stakes = RollupService().draw_rate_by_stake(since('day', days))
+    return jsonify({'days': days, 'stakes': stakes})
+
+@admin_bp.route('/profile/queries', methods=['GET', 'DELETE'])
+def query_profile():
+    """Per-endpoint query counts and DB time, plus recent slow queries. DELETE resets them."""
+    if not current_app.config.get('SQL_PROFILING'):
+        return jsonify({'error': 'SQL profiling is disabled'}), 404
+    if request.method == 'DELETE':
+        query_profiler.reset()
+    return jsonify(query_profiler.report())
+
+@admin_bp.route('/admission')
+def admission_stats():
+    """In-flight database work by class, whether the pool is congested, and what was shed."""
+    if not current_app.config.get('ADMISSION_ENABLED'):
+        return jsonify({'error': 'Admission control is disabled'}), 404
+    return jsonify(admission.report())
+
+@admin_bp.route('/replicas')
+def replica_stats():
+    """Whether a replica is configured, its last measured lag, and where routed reads went."""
+    return jsonify(replicas.report())
+
+@admin_bp.route('/presence')
+def presence_stats():
+    """Players online now and distinct active players on each of the last ``days`` days (estimates)."""
+    if not current_app.config.get('PRESENCE_ENABLED'):
+        return jsonify({'error': 'Presence tracking is disabled'}), 404
+    try:
+        days = min(int(request.args.get('days', 7)), 35)
+    except ValueError:
+        return jsonify({'error': 'Invalid days'}), 400
+    return jsonify(presence.report(days))
+
+@admin_bp.route('/profile/cprofile', methods=['POST'])
+def cprofile_requests():
+    """cProfile a ``rate`` fraction of requests for ``seconds``; responds with the pstats table."""
+    if not current_app.config.get('SQL_PROFILING'):
+        return jsonify({'error': 'SQL profiling is disabled'}), 404
+    try:
+        seconds = min(float(request.args.get('seconds', 10)), 300)
+        rate = min(max(float(request.args.get('rate', 0.1)), 0.0), 1.0)
+        limit = min(int(request.args.get('limit', 50)), 1000)
+    except ValueError:
+        return jsonify({'error': 'Invalid seconds, rate or limit'}), 400
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'calls'):
+        return jsonify({'error': 'Unknown sort'}), 400
+
+    query_profiler.start_sampling(seconds, rate)
+    time.sleep(seconds)  # cooperative under gevent
+    return Response(query_profiler.sampling_report(sort, limit), mimetype='text/plain')
+
+@admin_bp.route('/profile/stacks', methods=['POST'])
+def stack_profile():
+    """Sample all threads' stacks for ``seconds``; responds with folded stacks for flame graphs."""
+    try:
+        seconds = min(float(request.args.get('seconds', 5)), 60)
+        interval = max(float(request.args.get('interval', 0.005)), 0.001)
+    except ValueError:
+        return jsonify({'error': 'Invalid seconds or interval'}), 400
+    counts = sample_stacks(seconds, interval)
+    body = ''.join(f'{stack} {n}\n' for stack, n in counts.most_common())
+    return Response(body, mimetype='text/plain')
+
+def run_bulk_job(app, name):
+    with app.app_context():
+        try:
+            BulkOperations.from_config(app.config, sleep=socketio.sleep).run(name)
+        except Exception:
+            logger.exception(f"Bulk job {name} failed; resume it to continue")
+            db.session.rollback()
+
+@admin_bp.route('/bulk', methods=['GET'])
+def bulk_jobs():
+    return jsonify({'jobs': BulkOperations().jobs()})
+
+@admin_bp.route('/bulk/<operation>', methods=['POST'])
+def start_bulk_job(operation):
+    """Start a grant, refill or reset job in the background; poll ``GET /bulk/<name>`` for progress.
+
+    The JSON body holds the operation's parameters and an optional ``name``.
+    """
+    params = dict(request.get_json(silent=True) or {})
+    name = params.pop('name', None)
+    try:
+        job = BulkOperations.from_config(current_app.config).start(operation, name, **params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    socketio.start_background_task(run_bulk_job, current_app._get_current_object(), job['name'])
+    return jsonify(job), 202
+
+@admin_bp.route('/bulk/<name>', methods=['GET'])
+def bulk_job(name):
+    job = BulkOperations().job(name)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job)
+
+@admin_bp.route('/bulk/<name>/resume', methods=['POST'])
+def resume_bulk_job(name):
+    """Continue a job from its last committed chunk, e.g. after the worker running it died."""
+    job = BulkOperations().job(name)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    socketio.start_background_task(run_bulk_job, current_app._get_current_object(), name)
+    return jsonify(job), 202
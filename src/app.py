@@ -1,61 +1,314 @@
-from flask import Flask, render_template, request, jsonify, session
-from flask_socketio import SocketIO, emit, join_room, leave_room
-from flask_migrate import Migrate
+from flask import Flask, Blueprint, current_app, g, render_template, request, jsonify, session
+from flask_socketio import emit, join_room, leave_room
+import math
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime
+from threading import Lock
 
+from sqlalchemy import select
 from src.config import Config
-from src.services.match_service import MatchService
-from src.services.game_service import GameService
+from src.extensions import (socketio, migrate, match_service, game_service, rate_limiter, bot_engine,
+                            query_profiler, lobby, recent_results, shard_router, admission, replicas,
+                            presence)
+from src.services import realtime
+from src.services.head_to_head import HeadToHead
+from src.services.lobby_service import json_with
+from src.services.session_store import ServerSessionInterface
+from src.services.shards import FORWARDED
+from src.admin import admin_bp
+from src.telegram import telegram_bp
+from src.health import health_bp
+from src.cli import register_commands
 from src.utils.logger import setup_logger
 from src.models.database import db, User, GameHistory
 
 # Configure logging
 logger = setup_logger()
 
-# Initialize Flask app
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Configure session interface
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
-app.config['SECRET_KEY'] = Config.SECRET_KEY
-
-# Initialize database and migrations
-db.init_app(app)
-migrate = Migrate(app, db)
-
-# Create database tables
-with app.app_context():
-    db.create_all()
-
-# Configure Flask-SocketIO
-socketio = SocketIO(
-    app,
-    async_mode='gevent',
-    cors_allowed_origins='*',
-    logger=True,
-    engineio_logger=True,
-    ping_timeout=60,
-    ping_interval=25,
-    max_http_buffer_size=1000000,
-    manage_session=False  # Let Flask manage the sessions
-)
-
-# Initialize services
-match_service = MatchService()
-game_service = GameService()
-
-@app.route('/')
+bp = Blueprint('game', __name__)
+
+def create_app(config_class=Config):
+    """Application factory.
+
+    Nothing here talks to the database: services are built on first use
+    (see ``src.extensions``) and the schema is created lazily by the first
+    request when ``AUTO_CREATE_SCHEMA`` is set, or by ``flask init-db``.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    app.extensions['rps'] = {}
+    if app.config['SESSION_STORE'] != 'cookie':
+        app.session_interface = ServerSessionInterface.from_config(app.config)
+
+    # Initialize database and migrations
+    db.init_app(app)
+    migrate.init_app(app, db)
+
+    # Configure Flask-SocketIO
+    socketio.init_app(
+        app,
+        async_mode='gevent',
+        cors_allowed_origins='*',
+        logger=True,
+        engineio_logger=True,
+        ping_timeout=60,
+        ping_interval=25,
+        max_http_buffer_size=1000000,
+        manage_session=False,  # Let Flask manage the sessions
+        message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'),
+        **realtime.socketio_options(app.config)
+    )
+    if app.config['WEBSOCKET_COMPRESSION']:
+        realtime.enable_websocket_compression(socketio.server.eio)
+
+    if app.config.get('SQL_PROFILING'):
+        with app.app_context():
+            query_profiler.install(db.engines.values())
+    if app.config.get('REPLICA_DATABASE_URL'):
+        with app.app_context():
+            replicas.install()
+    if app.config.get('ADMISSION_ENABLED'):
+        with app.app_context():
+            # The replica engine is the router's own, not one of Flask-SQLAlchemy's
+            engines = list(db.engines.values())
+            if app.config.get('REPLICA_DATABASE_URL'):
+                engines.append(replicas.replica)
+            admission.install(engines)
+
+    app.register_blueprint(bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(telegram_bp)
+    app.register_blueprint(health_bp)
+    register_commands(app)
+
+    return app
+
+_schema_lock = Lock()
+
+@bp.before_app_request
+def start_query_profile():
+    # Registered first so the other hooks' queries are counted too
+    if current_app.config.get('SQL_PROFILING'):
+        query_profiler.start_request(request.endpoint)
+
+@bp.after_app_request
+def add_server_timing(response):
+    if current_app.config.get('SQL_PROFILING'):
+        stats = query_profiler.finish_request()
+        if stats is not None:
+            response.headers['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.3f};desc="{stats.queries} queries", '
+                f'db-lock;dur={stats.lock_time * 1000:.3f}')
+    return response
+
+@bp.teardown_app_request
+def end_query_profile(exc):
+    # after_request is skipped when a request fails; finishing twice is harmless
+    if current_app.config.get('SQL_PROFILING'):
+        query_profiler.finish_request()
+
+@bp.before_app_request
+def ensure_schema():
+    """Create tables once per app, on the first request that needs them."""
+    services = current_app.extensions['rps']
+    if services.get('schema_ready') or not current_app.config.get('AUTO_CREATE_SCHEMA'):
+        return
+    with _schema_lock:
+        if not services.get('schema_ready'):
+            db.create_all()
+            services['schema_ready'] = True
+
+def run_bots(app):
+    with app.app_context():
+        bot_engine.run(interval=app.config['BOT_TICK_INTERVAL'], sleep=socketio.sleep)
+
+@bp.before_app_request
+def start_bots():
+    """Start the bot loop in a background greenlet with the first request."""
+    services = current_app.extensions['rps']
+    if services.get('bots_started') or not current_app.config.get('BOT_ENABLED'):
+        return
+    with _schema_lock:
+        if not services.get('bots_started'):
+            services['bots_started'] = True
+            socketio.start_background_task(run_bots, current_app._get_current_object())
+            logger.info("Bot engine started")
+
+def run_deadline_sweeper(app):
+    with app.app_context():
+        match_service.deadlines.run(match_service._get_current_object(),
+                                    app.config['DEADLINE_SWEEP_INTERVAL'], sleep=socketio.sleep)
+
+@bp.before_app_request
+def start_deadline_sweeper():
+    """Sweep overdue durable deadlines in a background greenlet, like the bots."""
+    services = current_app.extensions['rps']
+    if (services.get('sweeper_started') or not current_app.config.get('DURABLE_DEADLINES')
+            or not current_app.config.get('DEADLINE_SWEEP_INTERVAL')):
+        return
+    with _schema_lock:
+        if not services.get('sweeper_started'):
+            services['sweeper_started'] = True
+            socketio.start_background_task(run_deadline_sweeper, current_app._get_current_object())
+            logger.info("Deadline sweeper started")
+
+def run_presence_flusher(app):
+    with app.app_context():
+        presence.run(app.config['PRESENCE_FLUSH_INTERVAL'], sleep=socketio.sleep)
+
+@bp.before_app_request
+def start_presence_flusher():
+    """Write batched last_seen updates and presence sketches in a background greenlet."""
+    services = current_app.extensions['rps']
+    if (services.get('presence_started') or not current_app.config.get('PRESENCE_ENABLED')
+            or not current_app.config.get('PRESENCE_FLUSH_INTERVAL')):
+        return
+    with _schema_lock:
+        if not services.get('presence_started'):
+            services['presence_started'] = True
+            socketio.start_background_task(run_presence_flusher, current_app._get_current_object())
+            logger.info("Presence flusher started")
+
+def session_player(session_id):
+    """The caller's Player; the user id is cached in the session to skip the lookup by session id."""
+    player = match_service.get_player(session_id, session.get('user_id'))
+    if session.get('user_id') != player.user_id:
+        session['user_id'] = player.user_id
+    return player
+
+def client_ip():
+    if current_app.config.get('RATE_LIMIT_TRUST_PROXY') and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+def event_allowed(event):
+    """Rate-limit a Socket.IO event; tells the client when it is rejected."""
+    if not current_app.config.get('RATE_LIMIT_ENABLED'):
+        return True
+    allowed, retry_after = rate_limiter.check(event, session.get('session_id'), client_ip())
+    if not allowed:
+        logger.warning(f"Rate limited {event} for session {session.get('session_id')}")
+        emit('rate_limited', {'event': event, 'retry_after': retry_after})
+    return allowed
+
+@bp.before_app_request
+def enforce_rate_limit():
+    # Only the signed session cookie and the remote address are used here,
+    # so rejected requests never reach the database. Forwarded requests
+    # were counted by the worker that forwarded them.
+    if not current_app.config.get('RATE_LIMIT_ENABLED') or request.environ.get(FORWARDED):
+        return None
+    endpoint = (request.endpoint or '').rpartition('.')[2]
+    allowed, retry_after = rate_limiter.check(endpoint, session.get('session_id'), client_ip())
+    if not allowed:
+        logger.warning(f"Rate limited {endpoint} for session {session.get('session_id')}")
+        response = jsonify({'error': 'Too many requests'})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+    return None
+
+# Endpoints that act on one match, and how to find its id. Moves and state
+# follow the match id kept in the session by create and join.
+MATCH_ENDPOINTS = {
+    'game.join_match': lambda: (request.get_json(silent=True) or {}).get('match_id'),
+    'game.cancel_match': lambda: (request.get_json(silent=True) or {}).get('match_id'),
+    'game.get_head_to_head': lambda: request.args.get('match_id'),
+    'game.make_move': lambda: session.get('match_id'),
+    'game.get_state': lambda: session.get('match_id'),
+}
+
+@bp.before_app_request
+def route_to_owner():
+    """Forward a request for a match held by another shard to its owner."""
+    match_id_of = MATCH_ENDPOINTS.get(request.endpoint)
+    if match_id_of is None or request.environ.get(FORWARDED):
+        return None
+    match_id = match_id_of()
+    if not match_id or shard_router.is_local(match_id):
+        return None
+    try:
+        status, headers, body = shard_router.forward(match_id, request)
+    except Exception as e:
+        logger.exception(f"Could not forward {request.endpoint} for match {match_id}")
+        return jsonify({'error': 'Match unavailable'}), 503
+    return current_app.response_class(body, status=status, headers=headers)
+
+def admission_priority(name):
+    """The admission class of an endpoint or Socket.IO event, or None if it is not controlled."""
+    if not current_app.config.get('ADMISSION_ENABLED'):
+        return None
+    return current_app.config['ADMISSION_PRIORITIES'].get(name)
+
+def busy_response(retry_after):
+    response = jsonify({'error': 'Server busy'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+@bp.before_app_request
+def admit_request():
+    # After route_to_owner: the owner admits the requests forwarded to it,
+    # since it does their database work
+    endpoint = (request.endpoint or '').rpartition('.')[2]
+    if endpoint == 'run_forwarded_event':
+        endpoint = request.view_args['event']
+    priority = admission_priority(endpoint)
+    if priority is None:
+        return None
+    admission.take_pool_timeout()
+    allowed, retry_after = admission.admit(priority)
+    if not allowed:
+        logger.warning(f"Shed {endpoint} for session {session.get('session_id')}")
+        return busy_response(retry_after)
+    g.admitted = priority
+    return None
+
+@bp.after_app_request
+def report_pool_timeout(response):
+    # Handlers turn any exception into a 500; one caused by waiting out the
+    # pool is overload, which the client should retry later
+    if (response.status_code == 500 and current_app.config.get('ADMISSION_ENABLED')
+            and admission.take_pool_timeout()):
+        return busy_response(admission.hold)
+    return response
+
+@bp.teardown_app_request
+def release_admission(exc):
+    priority = g.pop('admitted', None)
+    if priority is not None:
+        admission.release(priority)
+
+@bp.after_app_request
+def remember_writes(response):
+    # Keeps this session's reads on the primary until the replica has its writes
+    if current_app.config.get('REPLICA_DATABASE_URL') and replicas.take_write():
+        session['wrote_at'] = replicas.clock()
+    return response
+
+@bp.teardown_app_request
+def forget_writes(exc):
+    if current_app.config.get('REPLICA_DATABASE_URL'):
+        replicas.take_write()
+
+@bp.after_app_request
+def record_presence(response):
+    # A forwarded request was already recorded by the worker that received it
+    if (current_app.config.get('PRESENCE_ENABLED') and not request.environ.get(FORWARDED)
+            and session.get('user_id') is not None):
+        presence.touch(session['user_id'])
+    return response
+
+@bp.route('/')
 def index():
     if 'session_id' not in session:
         session_id = secrets.token_hex(8)
         session['session_id'] = session_id
-        match_service.get_player(session_id)  # Initialize player
+        session_player(session_id)  # Initialize player
         logger.info(f"Created new session: {session_id}")
-    return render_template('index.html')
+    return render_template('index.html', msgpack=current_app.config['SOCKETIO_SERIALIZER'] == 'msgpack')
 
-@app.route('/api/state')
+@bp.route('/api/state')
 def get_state():
     try:
         session_id = session.get('session_id')
@@ -64,8 +317,14 @@ def get_state():
             session['session_id'] = session_id
             logger.info(f"Created new session: {session_id}")
 
-        player = match_service.get_player(session_id)
-        open_matches = match_service.get_open_matches(session_id)
+        player = session_player(session_id)
+        if 'match_id' in session and not player.current_match:
+            session.pop('match_id')  # later polls stay on this worker
+        coins = player.coins
+        # Shared by every caller; only the slice this player can afford is copied.
+        # Balances for the snapshot may come from the replica: joins recheck them
+        with replicas.reading(db.session, session.get('wrote_at')):
+            open_matches = lobby.open_matches_json(session_id, coins)
 
         # Get current match details if in a match
         current_match = None
@@ -79,17 +338,69 @@ def get_state():
                     'is_creator': session_id == match.creator
                 }
 
-        return jsonify({
-            'coins': player.coins,
+        return current_app.response_class(json_with({
+            'coins': coins,
             'stats': player.stats.to_dict(),
-            'open_matches': open_matches,
             'current_match': current_match
-        })
+        }, open_matches=open_matches), mimetype='application/json')
     except Exception as e:
         logger.exception("Error getting state")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/create_match', methods=['POST'])
+@bp.route('/api/recent')
+def get_recent():
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'results': []})
+        # Served from the player's buffer; only the first call per cached player queries
+        # unless other shards settle matches too
+        return jsonify({'results': recent_results.get(session_player(session_id),
+                                                      shared=shard_router.shards > 1)})
+    except Exception as e:
+        logger.exception("Error getting recent results")
+        return jsonify({'error': 'Internal server error'}), 500
+
+def find_opponent(args):
+    """The user id named by ``opponent_id`` (a user id) or ``opponent`` (a session id), if that user exists."""
+    if args.get('opponent_id'):
+        user_id = args.get('opponent_id', type=int)
+        return user_id if user_id is not None and db.session.get(User, user_id) is not None else None
+    if args.get('opponent'):
+        return db.session.execute(select(User.id).where(User.session_id == args['opponent'])).scalar()
+    return None
+
+@bp.route('/api/head_to_head')
+def get_head_to_head():
+    try:
+        session_id = session.get('session_id')
+        if not session_id:
+            return jsonify({'error': 'Match not found'}), 404
+        finished_at = None
+        if request.args.get('match_id'):
+            # The opponent in a live match, read from memory
+            match = match_service.get_match(request.args['match_id'])
+            if not match or not match.joiner or session_id not in (match.creator, match.joiner):
+                return jsonify({'error': 'Match not found'}), 404
+            opponent = match.joiner if session_id == match.creator else match.creator
+            opponent_id = match_service.get_player(opponent).user_id
+            finished_at = match.finished_at
+        else:
+            # Any past opponent, such as one from /api/recent, after the match is gone
+            opponent_id = find_opponent(request.args)
+        user_id = session_player(session_id).user_id
+        if opponent_id is None or opponent_id == user_id:
+            return jsonify({'error': 'Opponent not found'}), 404
+        # One primary-key read of pair_stats, kept up to date by settlement;
+        # from the primary while this player's writes or the match's last
+        # settlement may not have reached the replica
+        with replicas.reading(db.session, session.get('wrote_at'), finished_at):
+            return jsonify(HeadToHead.lookup(user_id, opponent_id))
+    except Exception as e:
+        logger.exception("Error getting head-to-head record")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/api/create_match', methods=['POST'])
 def create_match():
     try:
         session_id = session.get('session_id')
@@ -102,7 +413,7 @@ def create_match():
             logger.error(f"Invalid stake: {stake}")
             return jsonify({'error': 'Invalid stake'}), 400
 
-        player = match_service.get_player(session_id)
+        player = session_player(session_id)
         if not player.has_enough_coins(stake):
             logger.error(f"Insufficient coins. Has: {player.coins}, Needs: {stake}")
             return jsonify({'error': 'Insufficient coins'}), 400
@@ -112,6 +423,7 @@ def create_match():
             match_service.cleanup_match(player.current_match)
 
         match = match_service.create_match(session_id, stake)
+        session['match_id'] = match.id
         logger.info(f"Match created: {match.id} by {session_id}")
         player = match_service.get_player(session_id)
         return jsonify({
@@ -122,7 +434,7 @@ def create_match():
         logger.exception("Error creating match")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/join_match', methods=['POST'])
+@bp.route('/api/join_match', methods=['POST'])
 def join_match():
     try:
         session_id = session.get('session_id')
@@ -140,7 +452,7 @@ def join_match():
             logger.error(f"Invalid match or not waiting: {match_id}")
             return jsonify({'error': 'Match not available'}), 400
 
-        player = match_service.get_player(session_id)
+        player = session_player(session_id)
         if not player.has_enough_coins(match.stake):
             logger.error(f"Insufficient coins. Has: {player.coins}, Needs: {match.stake}")
             return jsonify({'error': 'Insufficient coins'}), 400
@@ -154,6 +466,7 @@ def join_match():
             logger.error(f"Failed to join match: {match_id}")
             return jsonify({'error': 'Failed to join match'}), 400
 
+        session['match_id'] = match_id
         logger.info(f"Player {session_id} joined match {match_id}")
         player = match_service.get_player(session_id)
         return jsonify({
@@ -164,7 +477,7 @@ def join_match():
         logger.exception("Error joining match")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/cancel_match', methods=['POST'])
+@bp.route('/api/cancel_match', methods=['POST'])
 def cancel_match():
     try:
         session_id = session.get('session_id')
@@ -195,7 +508,8 @@ def cancel_match():
 
         # Get updated player state
         player = match_service.get_player(session_id)
-        
+        session.pop('match_id', None)
+
         # Notify players about match cancellation
         socketio.emit('match_cancelled', {
             'match_id': match_id,
@@ -212,7 +526,7 @@ def cancel_match():
         logger.exception("Error cancelling match")
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/move', methods=['POST'])
+@bp.route('/api/move', methods=['POST'])
 def make_move():
     try:
         session_id = session.get('session_id')
@@ -225,19 +539,31 @@ def make_move():
             logger.error(f"Invalid move: {move}")
             return jsonify({'error': 'Invalid move'}), 400
 
-        player = match_service.get_player(session_id)
+        player = session_player(session_id)
         if not player.current_match:
             logger.error(f"No active match for player {session_id}")
             return jsonify({'error': 'No active match'}), 400
 
         match = match_service.get_match(player.current_match)
-        if not match or match.status != 'playing':
+        if not match:
             logger.error(f"Match not in playing state")
             return jsonify({'error': 'Match not in playing state'}), 400
 
-        if not match.make_move(session_id, move):
-            logger.error(f"Move already made or invalid player")
-            return jsonify({'error': 'Invalid move'}), 400
+        # The move and the settlement it may trigger must not interleave
+        # with the other player's move or the timeout
+        result = None
+        with match.lock:
+            if match.status != 'playing':
+                logger.error(f"Match not in playing state")
+                return jsonify({'error': 'Match not in playing state'}), 400
+
+            if not match.make_move(session_id, move):
+                logger.error(f"Move already made or invalid player")
+                return jsonify({'error': 'Invalid move'}), 400
+            match_service.events.append('move', match.id, session_id, move=move)
+
+            if match.are_both_moves_made():
+                result = game_service.calculate_match_result(match, match_service.players, match_service.events)
 
         # Notify others that a move was made (without revealing the move)
         socketio.emit('move_made', {
@@ -245,9 +571,8 @@ def make_move():
             'auto': False
         }, room=match.id)
 
-        if match.are_both_moves_made():
-            result = game_service.calculate_match_result(match, match_service.players)
-            socketio.emit('match_result', result, room=match.id)
+        if result:
+            socketio.emit('match_result', realtime.match_result_payload(result), room=match.id)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -257,20 +582,102 @@ def make_move():
 @socketio.on('connect')
 def handle_connect(auth=None):
     try:
+        ensure_schema()
         session_id = session.get('session_id')
         if session_id:
             join_room(session_id)
             logger.info(f"Socket connected for session {session_id}")
 
-            player = match_service.get_player(session_id)
+            player = match_service.get_player(session_id, session.get('user_id'))
+            if current_app.config.get('PRESENCE_ENABLED'):
+                presence.connected(request.sid, player.user_id)
             if player.current_match:
                 match = match_service.get_match(player.current_match)
                 if match:
                     join_room(match.id)
                     logger.info(f"Player {session_id} joined match room {match.id}")
+            elif session.get('match_id') and not shard_router.is_local(session['match_id']):
+                # Held by another shard, whose emits reach this room through the message queue
+                join_room(session['match_id'])
     except Exception as e:
         logger.exception("Error in socket connect handler")
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    if current_app.config.get('PRESENCE_ENABLED'):
+        presence.disconnected(request.sid)
+
+def enter_session_room(session_id, room):
+    """Put every socket of ``session_id`` on this worker into ``room``.
+
+    Each socket joins the room named after its session on connect; sockets
+    on other workers join a match room themselves with ``join_match_room``.
+    """
+    for sid, _ in socketio.server.manager.get_participants('/', session_id):
+        socketio.server.enter_room(sid, room, namespace='/')
+
+# Socket.IO events that act on a match, by name; see match_event
+MATCH_EVENTS = {}
+
+def match_event(event, rate_limited=False):
+    """Register a Socket.IO handler for an event naming a match in ``data['match_id']``.
+
+    The handler is called with the caller's session id and the event data.
+    For a match held by another shard it runs on the owner instead, which
+    gets the event through ``/internal/events``. Locally, events listed in
+    ``ADMISSION_PRIORITIES`` are admitted like requests; a refused one is
+    answered with ``server_busy``.
+    """
+    def register(handler):
+        MATCH_EVENTS[event] = handler
+
+        def on_event(data):
+            if rate_limited and not event_allowed(event):
+                return
+            session_id = session.get('session_id')
+            match_id = data.get('match_id') if isinstance(data, dict) else None
+            if session_id and match_id and not shard_router.is_local(match_id):
+                try:
+                    shard_router.send_event(match_id, event, session_id, data)
+                except Exception as e:
+                    logger.exception(f"Could not forward {event} for match {match_id}")
+                return
+            priority = admission_priority(event)
+            if priority is not None:
+                allowed, retry_after = admission.admit(priority)
+                if not allowed:
+                    logger.warning(f"Shed {event} for session {session_id}")
+                    emit('server_busy', {'event': event, 'retry_after': retry_after})
+                    return
+            try:
+                handler(session_id, data)
+            finally:
+                if priority is not None:
+                    admission.release(priority)
+
+        socketio.on_event(event, on_event)
+        return handler
+    return register
+
+@bp.route('/internal/events/<event>', methods=['POST'])
+def run_forwarded_event(event):
+    """Run a match event forwarded by another shard."""
+    if not request.environ.get(FORWARDED) or event not in MATCH_EVENTS:
+        return jsonify({'error': 'Not found'}), 404
+    body = request.get_json()
+    MATCH_EVENTS[event](body['session_id'], body['data'])
+    return jsonify({'success': True})
+
+@bp.route('/internal/lobby')
+def get_shard_lobby():
+    """This shard's open matches, for the other shards' lobbies."""
+    if not request.environ.get(FORWARDED):
+        return jsonify({'error': 'Not found'}), 404
+    with replicas.reading(db.session):
+        matches = lobby.local_matches()
+    return jsonify({'matches': [{'id': match.id, 'stake': match.stake, 'creator': match.creator}
+                                for match in matches]})
+
 @socketio.on('join_match_room')
 def on_join_match_room(data):
     try:
@@ -281,20 +688,21 @@ def on_join_match_room(data):
             logger.error(f"Invalid session or match ID in join_match_room")
             return
 
-        match = match_service.get_match(match_id)
-        if not match or match.status != 'waiting':
-            logger.error(f"Match {match_id} not found or not in waiting state")
-            return
+        # Another shard's match is checked there, by every action on it
+        if shard_router.is_local(match_id):
+            match = match_service.get_match(match_id)
+            if not match or match.status != 'waiting':
+                logger.error(f"Match {match_id} not found or not in waiting state")
+                return
 
         join_room(match_id)
         logger.info(f"Player {session_id} joined match room {match_id} via socket")
     except Exception as e:
         logger.exception("Error in join_match_room handler")
 
-@socketio.on('ready_for_match')
-def on_ready_for_match(data):
+@match_event('ready_for_match', rate_limited=True)
+def on_ready_for_match(session_id, data):
     try:
-        session_id = session.get('session_id')
         match_id = data.get('match_id')
 
         if not session_id or not match_id:
@@ -302,42 +710,48 @@ def on_ready_for_match(data):
             return
 
         match = match_service.get_match(match_id)
-        if not match or match.status != 'waiting':
+        if not match:
             logger.error(f"Match {match_id} not found or not in waiting state")
             return
 
-        # Mark player as ready
-        if session_id == match.creator:
-            match.creator_ready = True
-            logger.info(f"Creator {session_id} ready in match {match_id}")
-        elif session_id == match.joiner:
-            match.joiner_ready = True
-            logger.info(f"Joiner {session_id} ready in match {match_id}")
-        else:
-            logger.error(f"Player {session_id} not part of match {match_id}")
-            return
-
-        # Start match if both players are ready
-        if match.creator_ready and match.joiner_ready:
-            creator = match_service.get_player(match.creator)
-            joiner = match_service.get_player(match.joiner)
+        # Both ready events can arrive together; the match must start once
+        with match.lock:
+            if match.status != 'waiting':
+                logger.error(f"Match {match_id} not found or not in waiting state")
+                return
+
+            # Mark player as ready
+            if session_id == match.creator:
+                match.creator_ready = True
+                logger.info(f"Creator {session_id} ready in match {match_id}")
+            elif session_id == match.joiner:
+                match.joiner_ready = True
+                logger.info(f"Joiner {session_id} ready in match {match_id}")
+            else:
+                logger.error(f"Player {session_id} not part of match {match_id}")
+                return
+            match_service.events.append('ready', match_id, session_id)
+
+            # Start match if both players are ready
+            if match.creator_ready and match.joiner_ready:
+                creator = match_service.get_player(match.creator)
+                joiner = match_service.get_player(match.joiner)
 
-            match.start_match()
-            match.start_timer(Config.MATCH_TIMEOUT, match_service.handle_match_timeout)
+                match.start_match()
+                match_service.schedule_timeout(match)
 
-            socketio.emit('match_started', {
-                'match_id': match_id,
-                'start_time': match.start_time
-            }, room=match_id)
+                socketio.emit('match_started', {
+                    'match_id': match_id,
+                    'start_time': match.start_time
+                }, room=match_id)
 
-            logger.info(f"Match {match_id} started")
+                logger.info(f"Match {match_id} started")
     except Exception as e:
         logger.exception("Error in ready_for_match handler")
 
-@socketio.on('rematch_accepted')
-def on_rematch_accepted(data):
+@match_event('rematch_accepted', rate_limited=True)
+def on_rematch_accepted(session_id, data):
     try:
-        session_id = session.get('session_id')
         match_id = data.get('match_id')
 
         if not session_id or not match_id:
@@ -359,80 +773,85 @@ def on_rematch_accepted(data):
             }, room=match_id)
             return
 
-        # Initialize rematch_ready if not exists
-        if not hasattr(match, 'rematch_ready'):
-            match.rematch_ready = set()
+        # Both players can accept at once; only one of them may start the rematch
+        with match.lock:
+            if match_service.get_match(match_id) is not match:
+                return
 
-        # Add this player to ready set
-        match.rematch_ready.add(session_id)
+            # Initialize rematch_ready if not exists
+            if not hasattr(match, 'rematch_ready'):
+                match.rematch_ready = set()
 
-        # Get player role and notify other player
-        player_role = 'creator' if session_id == match.creator else 'joiner'
-        other_player_id = match.joiner if session_id == match.creator else match.creator
-        
-        socketio.emit('rematch_accepted_by_player', {
-            'player': player_role
-        }, room=other_player_id)
-
-        # Only proceed if both players have accepted
-        if len(match.rematch_ready) == 2:
-            # Create new match with same stake but keep original creator
-            new_match = match_service.create_match(match.creator, match.stake)
-            if new_match:
-                # Update joiner
-                match_service.join_match(new_match.id, match.joiner)
-
-                # Get updated balances
-                creator = match_service.get_player(match.creator)
-                joiner = match_service.get_player(match.joiner)
+            # Add this player to ready set
+            match.rematch_ready.add(session_id)
 
-                # Notify both players with their updated balances
-                socketio.emit('rematch_started', {
-                    'match_id': new_match.id,
-                    'is_creator': True,
-                    'stake': new_match.stake,
-                    'coins': creator.coins,
-                    'is_rematch': True
-                }, room=match.creator)
-
-                socketio.emit('rematch_started', {
-                    'match_id': new_match.id,
-                    'is_creator': False,
-                    'stake': new_match.stake,
-                    'coins': joiner.coins,
-                    'is_rematch': True
-                }, room=match.joiner)
-
-                logger.info(f"Rematch started: {new_match.id} (original: {match_id})")
-
-                # Join both players to the new match room
-                join_room(new_match.id, sid=match.creator)
-                join_room(new_match.id, sid=match.joiner)
-
-                # Signal ready for both players
-                new_match.creator_ready = True
-                new_match.joiner_ready = True
-
-                # Start the match
-                new_match.start_match()
-                new_match.start_timer(Config.MATCH_TIMEOUT, match_service.handle_match_timeout)
-
-                # Notify both players that the match has started
-                socketio.emit('match_started', {
-                    'match_id': new_match.id,
-                    'start_time': new_match.start_time,
-                    'is_rematch': True
-                }, room=new_match.id)
-
-                # Cleanup old match after everything is set up
-                match_service.cleanup_match(match_id)
+            # Get player role and notify other player
+            player_role = 'creator' if session_id == match.creator else 'joiner'
+            other_player_id = match.joiner if session_id == match.creator else match.creator
+        
+            socketio.emit('rematch_accepted_by_player', {
+                'player': player_role
+            }, room=other_player_id)
+
+            # Only proceed if both players have accepted
+            if len(match.rematch_ready) == 2:
+                # Create new match with same stake but keep original creator
+                new_match = match_service.create_match(match.creator, match.stake)
+                if new_match:
+                    # Update joiner
+                    match_service.join_match(new_match.id, match.joiner)
+                    match_service.events.append('rematch', new_match.id, match.creator, match_id)
+
+                    # Get updated balances
+                    creator = match_service.get_player(match.creator)
+                    joiner = match_service.get_player(match.joiner)
+
+                    # Notify both players with their updated balances
+                    socketio.emit('rematch_started', {
+                        'match_id': new_match.id,
+                        'is_creator': True,
+                        'stake': new_match.stake,
+                        'coins': creator.coins,
+                        'is_rematch': True
+                    }, room=match.creator)
+
+                    socketio.emit('rematch_started', {
+                        'match_id': new_match.id,
+                        'is_creator': False,
+                        'stake': new_match.stake,
+                        'coins': joiner.coins,
+                        'is_rematch': True
+                    }, room=match.joiner)
+
+                    logger.info(f"Rematch started: {new_match.id} (original: {match_id})")
+
+                    # Join both players' sockets to the new match room
+                    enter_session_room(match.creator, new_match.id)
+                    enter_session_room(match.joiner, new_match.id)
+
+                    # Signal ready for both players
+                    new_match.creator_ready = True
+                    new_match.joiner_ready = True
+
+                    # Start the match
+                    new_match.start_match()
+                    match_service.schedule_timeout(new_match)
+
+                    # Notify both players that the match has started
+                    socketio.emit('match_started', {
+                        'match_id': new_match.id,
+                        'start_time': new_match.start_time,
+                        'is_rematch': True
+                    }, room=new_match.id)
+
+                    # Cleanup old match after everything is set up
+                    match_service.cleanup_match(match_id)
     except Exception as e:
         logger.exception("Error in rematch_accepted handler")
 
-@socketio.on('move_timeout')
-def on_move_timeout(data):
+@match_event('move_timeout')
+def on_move_timeout(session_id, data):
     try:
-        session_id = session.get('session_id')
         match_id = data.get('match_id')
 
         if not session_id or not match_id:
@@ -456,51 +875,20 @@ def on_move_timeout(data):
                     }, room=match.id)
 
             # Calculate and send result if both moves are now made
-            if match.are_both_moves_made():
-                result_data = game_service.calculate_match_result(match, match_service.players)
-                socketio.emit('match_result', result_data, room=match.id)
+            with match.lock:
+                result_data = None
+                if match.are_both_moves_made():
+                    result_data = game_service.calculate_match_result(match, match_service.players,
+                                                                      match_service.events)
+            if result_data:
+                socketio.emit('match_result', realtime.match_result_payload(result_data), room=match.id)
 
     except Exception as e:
         logger.exception("Error in move_timeout handler")
 
-@socketio.on('move_timeout')
-def on_move_timeout(data):
+@match_event('rematch_declined')
+def on_rematch_declined(session_id, data):
     try:
-        session_id = session.get('session_id')
-        match_id = data.get('match_id')
-
-        if not session_id or not match_id:
-            logger.error(f"Invalid session or match ID in move_timeout")
-            return
-
-        match = match_service.get_match(match_id)
-        if not match or match.status != 'playing':
-            logger.error(f"Match {match_id} not found or not in playing state")
-            return
-
-        # Handle timeout by making random moves for players who haven't moved
-        result = match_service.handle_match_timeout(match_id)
-        if result:
-            # Notify about auto moves
-            for player_id in [match.creator, match.joiner]:
-                if player_id not in match.moves:
-                    socketio.emit('move_made', {
-                        'player': match.get_player_role(player_id),
-                        'auto': True
-                    }, room=match.id)
-
-            # Calculate and send result if both moves are now made
-            if match.are_both_moves_made():
-                result_data = game_service.calculate_match_result(match, match_service.players)
-                socketio.emit('match_result', result_data, room=match.id)
-
-    except Exception as e:
-        logger.exception("Error in move_timeout handler")
-
-@socketio.on('rematch_declined')
-def on_rematch_declined(data):
-    try:
-        session_id = session.get('session_id')
         match_id = data.get('match_id')
 
         if not session_id or not match_id:
@@ -524,10 +912,11 @@ if __name__ == '__main__':
     ssl_context = None
     if Config.SSL_CERT and Config.SSL_KEY:
         ssl_context = (Config.SSL_CERT, Config.SSL_KEY)
-    
-    socketio.run(app, 
+
+    app = create_app()
+    socketio.run(app,
                 host=args.host,
                 port=args.port,
                 debug=Config.DEBUG,
                 allow_unsafe_werkzeug=True,
-                ssl_context=ssl_context)
\ No newline at end of file
+                ssl_context=ssl_context)
@@ -0,0 +1,343 @@
+import json
+import os
+import sys
+import time
+import click
+
+from src.extensions import match_service, game_service, replicas
+from src.models.database import db, User
+from src.services.export_service import HistoryExporter, read_watermark, write_watermark
+from src.services.rollup_service import RollupService
+from src.services.retention_service import HistoryRetention
+from src.services.head_to_head import HeadToHead
+from src.services.bot_service import BotEngine
+from src.services.event_log import EVENT_TYPES, read_events, rebuild
+from src.services.simulation import simulate
+from src.services.telegram_service import TelegramAPI
+from src.services.bulk_service import BulkOperations
+
+def register_commands(app):
+    """Attach the ``flask`` CLI commands to ``app``."""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create all database tables."""
+        db.create_all()
+        print('Database tables created')
+
+    @app.cli.command('export-history')
+    @click.option('--output', '-o', required=True, help='File to write, or - for CSV on stdout.')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet', 'arrow']), default='csv')
+    @click.option('--since-id', type=int, default=None, help='Export rows with a larger id only.')
+    @click.option('--watermark-file', default=None,
+                  help='Read the starting id from this file and store the last exported id in it.')
+    @click.option('--chunk-size', type=int, default=None)
+    def export_history_command(output, fmt, since_id, watermark_file, chunk_size):
+        """Stream game_history with usernames to CSV, Parquet or Arrow IPC."""
+        if since_id is None:
+            since_id = read_watermark(watermark_file)
+        exporter = HistoryExporter(chunk_size or app.config['EXPORT_CHUNK_SIZE'], replicas.engine_for(),
+                                   app.config['HISTORY_SETTLE_SECONDS'])
+
+        start = time.time()
+        if output == '-':
+            if fmt != 'csv':
+                raise click.UsageError('Only CSV can be written to stdout')
+            count = 0
+            for text in exporter.iter_csv(since_id):
+                sys.stdout.write(text)
+                count += text.count('\n')
+            count = max(count - 1, 0)  # header line
+        else:
+            count = exporter.write(output, fmt, since_id)
+
+        if watermark_file and exporter.last_id is not None:
+            write_watermark(watermark_file, exporter.last_id)
+        print(f'Exported {count} rows after id {since_id} up to id {exporter.last_id} '
+              f'in {time.time() - start:.1f}s', file=sys.stderr)
+
+    @app.cli.group('rollups')
+    def rollups_group():
+        """Maintain the hourly/daily game_history rollups."""
+
+    @rollups_group.command('update')
+    def rollups_update_command():
+        """Fold history rows added since the last run (run from cron)."""
+        start = time.time()
+        try:
+            count = RollupService(app.config['ROLLUP_BATCH_SIZE'], app.config['HISTORY_SETTLE_SECONDS']).update()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f'Folded {count} rows in {time.time() - start:.1f}s')
+
+    @rollups_group.command('backfill')
+    @click.option('--workers', type=int, default=4)
+    @click.option('--chunk-size', type=int, default=1000000, help='History ids per parallel chunk.')
+    @click.option('--rebuild', is_flag=True, help='Drop existing rollups and start from the first row.')
+    @click.option('--kept-only', is_flag=True, help='Go ahead although archived months will be missing.')
+    def rollups_backfill_command(workers, chunk_size, rebuild, kept_only):
+        """Fold all history above the watermark in parallel chunks."""
+        start = time.time()
+        service = RollupService(settle_seconds=app.config['HISTORY_SETTLE_SECONDS'])
+        try:
+            count = service.backfill(app, workers=workers, chunk_size=chunk_size, rebuild=rebuild,
+                                     kept_only=kept_only)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f'Backfilled {count} rows in {time.time() - start:.1f}s')
+
+    @app.cli.group('history')
+    def history_group():
+        """Retention and partitions of game_history."""
+
+    @history_group.command('retain')
+    @click.option('--keep-months', type=int, default=None, help='Default: HISTORY_RETENTION_MONTHS.')
+    @click.option('--archive-dir', default=None, help='Default: HISTORY_ARCHIVE_DIR.')
+    @click.option('--dry-run', is_flag=True, help='List the months that would be archived.')
+    def history_retain_command(keep_months, archive_dir, dry_run):
+        """Archive months past retention to gzipped CSV and remove them (run from cron)."""
+        retention = HistoryRetention.from_config(app.config)
+        if keep_months is not None:
+            retention.keep_months = keep_months
+        if archive_dir is not None:
+            retention.archive_dir = archive_dir
+        start = time.time()
+        months = retention.run(dry_run=dry_run)
+        for month in months:
+            print(f"{month['month']}: {month['rows']} rows" + (f" -> {month['path']}" if month['path'] else ''))
+        verb = 'Would archive' if dry_run else 'Archived'
+        print(f"{verb} {len(months)} months before {retention.cutoff():%Y-%m} in {time.time() - start:.1f}s")
+
+    @history_group.command('partitions')
+    def history_partitions_command():
+        """Create the monthly partitions for the coming HISTORY_PARTITIONS_AHEAD months."""
+        retention = HistoryRetention.from_config(app.config)
+        if not retention.partitioned():
+            raise click.UsageError('game_history is not partitioned (run `flask db upgrade` on Postgres)')
+        created = retention.ensure_partitions()
+        print(f"Created {', '.join(created) if created else 'no partitions'}")
+
+    @app.cli.group('pairs')
+    def pairs_group():
+        """Maintain the head-to-head pair_stats table."""
+
+    @pairs_group.command('backfill')
+    @click.option('--workers', type=int, default=4)
+    @click.option('--chunk-size', type=int, default=1000000, help='History ids per parallel chunk.')
+    @click.option('--rebuild', is_flag=True, help='Empty pair_stats and count all history again.')
+    @click.option('--kept-only', is_flag=True, help='Go ahead although archived months will be missing.')
+    def pairs_backfill_command(workers, chunk_size, rebuild, kept_only):
+        """Fold history from before pair_stats existed into it, in parallel chunks."""
+        start = time.time()
+        try:
+            count = HeadToHead().backfill(app, workers=workers, chunk_size=chunk_size, rebuild=rebuild,
+                                          kept_only=kept_only)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        print(f'Wrote {count} pair rows in {time.time() - start:.1f}s')
+
+    @app.cli.group('bots')
+    def bots_group():
+        """Bot opponents."""
+
+    @bots_group.command('load')
+    @click.option('--games', type=int, default=1000, help='Concurrent bot-vs-bot matches.')
+    @click.option('--rounds', type=int, default=10, help='Rounds played by each match.')
+    @click.option('--stake', type=int, default=1)
+    @click.option('--strategy', type=click.Choice(['random', 'frequency', 'markov']), default='random')
+    def bots_load_command(games, rounds, stake, strategy):
+        """Play bot-vs-bot matches through the match and game services."""
+        engine = BotEngine(match_service._get_current_object(), game_service._get_current_object(),
+                           strategy=strategy, pool_size=0, join_delay=None, move_delay=(0, 0),
+                           initial_coins=app.config['BOT_COINS'])
+        start = time.time()
+        engine.start_load(games, stake=stake, rounds=rounds)
+        while engine.schedule:
+            engine.tick()
+        elapsed = time.time() - start
+        results = engine.stats['results']
+        print(f'Played {results} games in {elapsed:.1f}s ({results / elapsed:.0f} games/s)')
+
+    @app.cli.group('deadlines')
+    def deadlines_group():
+        """Durable match deadlines."""
+
+    @deadlines_group.command('sweep')
+    def deadlines_sweep_command():
+        """Time out every match whose deadline is overdue (e.g. after a worker crash)."""
+        deadlines = match_service.deadlines
+        start = time.time()
+        settled = deadlines.sweep(match_service._get_current_object())
+        elapsed = time.time() - start
+        print(f'Settled {settled} overdue matches in {elapsed:.1f}s')
+
+    @app.cli.group('bulk')
+    def bulk_group():
+        """Coin grants, refills and season resets over many users."""
+
+    def segment_options(command):
+        for option in reversed([
+            click.option('--min-coins', type=int, default=None),
+            click.option('--max-coins', type=int, default=None),
+            click.option('--min-games', type=int, default=None),
+            click.option('--active-since', default=None, help='ISO date; users seen since then.'),
+            click.option('--telegram/--no-telegram', default=None, help='Only users with (or without) Telegram.'),
+        ]):
+            command = option(command)
+        return command
+
+    def run_bulk_job(operation, name, chunk_size, **params):
+        operations = BulkOperations(chunk_size or app.config['BULK_CHUNK_SIZE'], app.config['BULK_PAUSE'])
+        params = {key: value for key, value in params.items() if value is not None}
+        try:
+            job = operations.start(operation, name, **params)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        resume_bulk_job(operations, job['name'])
+
+    def resume_bulk_job(operations, name):
+        start = time.time()
+
+        def progress(job):
+            print(f"{job['name']}: {job['progress']:.1%} (user id {job['last_id']} of {job['max_id']}), "
+                  f"{job['rows']} changed, {time.time() - start:.0f}s", file=sys.stderr)
+
+        try:
+            job = operations.run(name, progress)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        print(f"{job['name']} done: {job['rows']} users changed in {time.time() - start:.1f}s")
+
+    @bulk_group.command('grant')
+    @click.option('--amount', type=int, required=True)
+    @click.option('--name', default=None, help='Job name (default: grant-<timestamp>).')
+    @click.option('--chunk-size', type=int, default=None)
+    @segment_options
+    def bulk_grant_command(amount, name, chunk_size, **segment):
+        """Add AMOUNT coins to every user in the segment."""
+        run_bulk_job('grant', name, chunk_size, amount=amount, **segment)
+
+    @bulk_group.command('refill')
+    @click.option('--to', 'to', type=int, default=None, help='Balance to top up to (default: INITIAL_COINS).')
+    @click.option('--name', default=None, help='Job name (default: refill-<timestamp>).')
+    @click.option('--chunk-size', type=int, default=None)
+    @segment_options
+    def bulk_refill_command(to, name, chunk_size, **segment):
+        """Raise every user in the segment below --to coins to --to."""
+        run_bulk_job('refill', name, chunk_size, to=to or app.config['INITIAL_COINS'], **segment)
+
+    @bulk_group.command('reset-season')
+    @click.argument('season')
+    @click.option('--coins', type=int, default=None, help='New balance (default: INITIAL_COINS).')
+    @click.option('--chunk-size', type=int, default=None)
+    def bulk_reset_command(season, coins, chunk_size):
+        """Archive balances and stats to season_stats as SEASON, then reset everyone."""
+        coins = app.config['INITIAL_COINS'] if coins is None else coins
+        run_bulk_job('reset', None, chunk_size, season=season, coins=coins)
+
+    @bulk_group.command('resume')
+    @click.argument('name')
+    @click.option('--chunk-size', type=int, default=None)
+    def bulk_resume_command(name, chunk_size):
+        """Continue an interrupted job from its last committed chunk."""
+        resume_bulk_job(BulkOperations(chunk_size or app.config['BULK_CHUNK_SIZE'], app.config['BULK_PAUSE']),
+                        name)
+
+    @bulk_group.command('status')
+    def bulk_status_command():
+        """List recent jobs and their progress."""
+        for job in BulkOperations().jobs():
+            print(f"{job['name']:32} {job['operation']:7} {job['status']:8} {job['progress']:7.1%} "
+                  f"{job['rows']:>10} changed  {json.dumps(job['params'])}")
+
+    @app.cli.group('telegram')
+    def telegram_group():
+        """Telegram bot front-end."""
+
+    @telegram_group.command('set-webhook')
+    @click.argument('url')
+    def telegram_set_webhook_command(url):
+        """Point the bot's webhook at URL (e.g. https://example.com/telegram/webhook)."""
+        if not app.config['TELEGRAM_BOT_TOKEN']:
+            raise click.UsageError('TELEGRAM_BOT_TOKEN is not set')
+        api = TelegramAPI(app.config['TELEGRAM_BOT_TOKEN'], app.config['TELEGRAM_API_URL'])
+        params = {'url': url, 'allowed_updates': ['message']}
+        if app.config['TELEGRAM_WEBHOOK_SECRET']:
+            params['secret_token'] = app.config['TELEGRAM_WEBHOOK_SECRET']
+        api.call('setWebhook', **params)
+        print(f'Webhook set to {url}')
+
+    @app.cli.group('events')
+    def events_group():
+        """Read the binary match event log."""
+
+    def event_log_dir(directory):
+        directory = directory or app.config.get('EVENT_LOG_DIR')
+        if not directory:
+            raise click.UsageError('Set EVENT_LOG_DIR or pass --dir')
+        return directory
+
+    @events_group.command('replay')
+    @click.option('--dir', 'directory', default=None, help='Log directory (default: EVENT_LOG_DIR).')
+    @click.option('--match', 'match_id', default=None, help='Only events of this match.')
+    @click.option('--type', 'types', multiple=True, type=click.Choice(EVENT_TYPES))
+    @click.option('--since', type=float, default=None, help='Unix timestamp.')
+    def events_replay_command(directory, match_id, types, since):
+        """Print events in timestamp order, one per line."""
+        for event in read_events(event_log_dir(directory), types or None, match_id, since):
+            print(f'{event.ts:.6f} {event.type:9} {event.match_id} {event.actor} {event.other or "-"} '
+                  f'{event.move or "-"} amount={event.amount} balance={event.balance} '
+                  f'other_balance={event.other_balance}')
+
+    @events_group.command('rebuild')
+    @click.option('--dir', 'directory', default=None, help='Log directory (default: EVENT_LOG_DIR).')
+    @click.option('--check-db', is_flag=True, help='Compare rebuilt balances with the users table.')
+    def events_rebuild_command(directory, check_db):
+        """Rebuild match stats and balances from the log and report inconsistencies."""
+        start = time.time()
+        state = rebuild(read_events(event_log_dir(directory)))
+        print(f'Replayed {state.events} events in {time.time() - start:.1f}s: '
+              f'{len(state.stats)} matches, {len(state.series_stats())} series, {len(state.balances)} players')
+        for event, session_id, expected, logged in state.mismatches:
+            print(f'MISMATCH {event.type} {event.match_id} {session_id}: expected {expected}, logged {logged}')
+
+        if check_db:
+            differences = 0
+            session_ids = list(state.balances)
+            for i in range(0, len(session_ids), 1000):
+                chunk = session_ids[i:i + 1000]
+                for user in User.query.filter(User.session_id.in_(chunk)):
+                    if user.coins != state.balances[user.session_id]:
+                        differences += 1
+                        print(f'DB {user.session_id}: log {state.balances[user.session_id]}, db {user.coins}')
+            print(f'{differences} balances differ from the database')
+        if state.mismatches:
+            sys.exit(1)
+
+    @app.cli.command('simulate')
+    @click.option('--seeds', type=int, default=8, help='Number of seeds (shards) to run.')
+    @click.option('--first-seed', type=int, default=0)
+    @click.option('--sequences', type=int, default=10000, help='Match lifecycles per seed.')
+    @click.option('--processes', type=int, default=None, help='Worker processes (default: CPU count).')
+    @click.option('--players', type=int, default=200)
+    @click.option('--concurrency', type=int, default=20, help='Interleaved lifecycles per seed.')
+    def simulate_command(seeds, first_seed, sequences, processes, players, concurrency):
+        """Drive seeded match lifecycles through the services and check invariants."""
+        start = time.time()
+        failed = 0
+        total = 0
+        for report in simulate(range(first_seed, first_seed + seeds), sequences,
+                               processes or os.cpu_count(), players, concurrency):
+            total += report['sequences']
+            rate = report['sequences'] / report['elapsed'] if report['elapsed'] else 0
+            print(f"seed {report['seed']}: {report['sequences']} sequences, {report['steps']} steps, "
+                  f"{rate:.0f} sequences/s")
+            if report['error']:
+                failed += 1
+                print(f"  FAILED {report['error']}")
+                for step, action, pair in report['trace']:
+                    print(f"    {step} {action} {' '.join(pair)}")
+        elapsed = time.time() - start
+        print(f'{total} sequences in {elapsed:.1f}s ({total / elapsed:.0f} sequences/s), {failed} seeds failed')
+        if failed:
+            sys.exit(1)
@@ -0,0 +1,100 @@
+from flask import current_app
+from flask_migrate import Migrate
+from flask_socketio import SocketIO
+from werkzeug.local import LocalProxy
+
+from .services.match_service import MatchService
+from .services.game_service import GameService
+from .services.rate_limiter import RateLimiter
+from .services.bot_service import BotEngine
+from .services.event_log import EventLog
+from .services.deadline_service import DeadlineStore
+from .services.telegram_service import TelegramAPI, TelegramBot
+from .services.profiling import QueryProfiler
+from .services.lobby_service import LobbySnapshot
+from .services.recent_results import RecentResults
+from .services.shards import ShardRouter
+from .services.admission import AdmissionController
+from .services.health import HealthMonitor
+from .services.replicas import ReplicaRouter
+from .services.presence import Presence
+from .models.database import db
+
+# Extensions are created unbound and attached to an app in create_app()
+socketio = SocketIO()
+migrate = Migrate()
+
+
+def lazy_service(name, factory):
+    """Proxy to a per-app service that is built on first use.
+
+    ``factory`` receives the app; the instance is cached in
+    ``app.extensions['rps']`` so each app (and each test) gets its own.
+    """
+    def load():
+        services = current_app.extensions['rps']
+        if name not in services:
+            services[name] = factory(current_app._get_current_object())
+        return services[name]
+    return LocalProxy(load)
+
+
+def build_event_log(app):
+    if not app.config.get('EVENT_LOG_DIR'):
+        return None
+    return EventLog(
+        app.config['EVENT_LOG_DIR'],
+        segment_size=app.config['EVENT_LOG_SEGMENT_MB'] << 20,
+        flush_interval=app.config['EVENT_LOG_FLUSH_INTERVAL'],
+        fsync=app.config['EVENT_LOG_FSYNC']
+    ).start()
+
+
+shard_router = lazy_service('shard_router', lambda app: ShardRouter.from_config(
+    app.config, app.extensions['rps'].get('worker')))
+match_service = lazy_service('match_service', lambda app: MatchService(
+    build_event_log(app), app, DeadlineStore.from_config(app.config), max_players=app.config['PLAYER_CACHE_SIZE'],
+    shards=shard_router._get_current_object()))
+game_service = lazy_service('game_service', lambda app: GameService())
+lobby = lazy_service('lobby', lambda app: LobbySnapshot.from_config(
+    match_service._get_current_object(), app.config, shard_router._get_current_object()))
+recent_results = lazy_service('recent_results', lambda app: RecentResults.from_config(app.config))
+rate_limiter = lazy_service('rate_limiter', lambda app: RateLimiter.from_config(app.config))
+query_profiler = lazy_service('query_profiler', lambda app: QueryProfiler.from_config(app.config))
+admission = lazy_service('admission', lambda app: AdmissionController.from_config(app.config))
+health = lazy_service('health', lambda app: HealthMonitor.from_config(app.config))
+replicas = lazy_service('replicas', lambda app: ReplicaRouter.from_config(app.config, db.engine))
+presence = lazy_service('presence', Presence.from_config)
+
+
+def build_bot_engine(app):
+    return BotEngine(
+        match_service._get_current_object(),
+        game_service._get_current_object(),
+        strategy=app.config['BOT_STRATEGY'],
+        pool_size=app.config['BOT_POOL_SIZE'],
+        join_delay=app.config['BOT_JOIN_DELAY'],
+        move_delay=app.config['BOT_MOVE_DELAY'],
+        stake_limit=app.config['BOT_MAX_STAKE'],
+        initial_coins=app.config['BOT_COINS'],
+        emit=socketio.emit,
+        match_timeout=app.config['MATCH_TIMEOUT']
+    )
+
+
+bot_engine = lazy_service('bot_engine', build_bot_engine)
+
+
+def build_telegram_bot(app):
+    return TelegramBot(
+        match_service._get_current_object(),
+        game_service._get_current_object(),
+        TelegramAPI(app.config['TELEGRAM_BOT_TOKEN'], app.config['TELEGRAM_API_URL']),
+        queue_size=app.config['TELEGRAM_QUEUE_SIZE'],
+        batch_size=app.config['TELEGRAM_BATCH_SIZE'],
+        emit=socketio.emit,
+        match_timeout=app.config['MATCH_TIMEOUT']
+    )
+
+
+telegram_bot = lazy_service('telegram_bot', build_telegram_bot)
@@ -0,0 +1,46 @@
+from threading import Lock
+from flask import Blueprint, current_app, jsonify
+
+from src.extensions import admission, health, match_service, socketio
+from src.models.database import db
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+health_bp = Blueprint('health', __name__)
+
+_start_lock = Lock()
+
+def run_lag_monitor(app):
+    with app.app_context():
+        health.watch_loop(sleep=socketio.sleep)
+
+def start_lag_monitor():
+    """Measure event-loop lag in a background greenlet from the first probe on."""
+    services = current_app.extensions['rps']
+    if services.get('lag_monitor_started') or not current_app.config.get('HEALTH_LAG_INTERVAL'):
+        return
+    with _start_lock:
+        if not services.get('lag_monitor_started'):
+            services['lag_monitor_started'] = True
+            socketio.start_background_task(run_lag_monitor, current_app._get_current_object())
+
+def draining():
+    worker = current_app.extensions['rps'].get('worker')
+    return bool(worker and worker['stop'].is_set())
+
+@health_bp.route('/healthz')
+def healthz():
+    """Liveness: the worker is serving and its event loop is not stalled."""
+    start_lag_monitor()
+    alive, body = health.liveness()
+    return jsonify(body), 200 if alive else 503
+
+@health_bp.route('/readyz')
+def readyz():
+    """Readiness: the database answers and the worker is not draining."""
+    start_lag_monitor()
+    ready, body = health.readiness(
+        db.engine, match_service, draining(),
+        admission._get_current_object() if current_app.config.get('ADMISSION_ENABLED') else None)
+    return jsonify(body), 200 if ready else 503
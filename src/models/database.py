@@ -1,8 +1,25 @@
 from datetime import datetime
+import json
 import uuid
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    """Sends reads to ``info['read_engine']`` while it is set (see ``ReplicaRouter.reading``).
+
+    Writes, ``SELECT ... FOR UPDATE`` and flushes still go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = self.info.get('read_engine')
+        if (engine is not None and bind is None and not self._flushing and clause is not None
+                and not getattr(clause, 'is_dml', False) and getattr(clause, '_for_update_arg', None) is None):
+            return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -19,6 +36,11 @@ class User(db.Model):
     draws = db.Column(db.Integer, default=0)
     total_coins_won = db.Column(db.Integer, default=0)
     total_coins_lost = db.Column(db.Integer, default=0)
+    # Set for players who come in through the Telegram bot
+    telegram_id = db.Column(db.BigInteger, unique=True, index=True, nullable=True)
+    telegram_username = db.Column(db.String(80), nullable=True)
+    telegram_first_name = db.Column(db.String(80), nullable=True)
+    telegram_last_name = db.Column(db.String(80), nullable=True)
 
     def to_dict(self):
         return {
@@ -34,6 +56,9 @@ class User(db.Model):
         }
 
 class GameHistory(db.Model):
+    # On Postgres the history_partitions migration makes this a table
+    # partitioned by month on played_at, with primary key (id, played_at);
+    # see HistoryRetention
     __tablename__ = 'game_history'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -42,9 +67,187 @@ class GameHistory(db.Model):
     player1_choice = db.Column(db.String(10), nullable=False)
     player2_choice = db.Column(db.String(10), nullable=False)
     winner_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    played_at = db.Column(db.DateTime, default=datetime.utcnow)
+    played_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     bet_amount = db.Column(db.Integer, default=0)
 
     player1 = db.relationship('User', foreign_keys=[player1_id])
     player2 = db.relationship('User', foreign_keys=[player2_id])
-    winner = db.relationship('User', foreign_keys=[winner_id])
\ No newline at end of file
+    winner = db.relationship('User', foreign_keys=[winner_id])
+
+    # A player's newest games, from either seat (RecentResults.load)
+    __table_args__ = (
+        db.Index('ix_game_history_player1_played_at', 'player1_id', 'played_at'),
+        db.Index('ix_game_history_player2_played_at', 'player2_id', 'played_at'),
+    )
+
+class HistoryRollup(db.Model):
+    """Aggregates of game_history per hour or per day, kept by RollupService."""
+    __tablename__ = 'history_rollups'
+
+    period = db.Column(db.String(4), primary_key=True)  # hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    total_stake = db.Column(db.BigInteger, nullable=False, default=0)
+    creator_wins = db.Column(db.Integer, nullable=False, default=0)
+    joiner_wins = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+    distinct_players = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat(),
+            'games': self.games,
+            'total_stake': self.total_stake,
+            'creator_wins': self.creator_wins,
+            'joiner_wins': self.joiner_wins,
+            'draws': self.draws,
+            'distinct_players': self.distinct_players
+        }
+
+
+class StakeRollup(db.Model):
+    """Per-day outcome counts for each stake amount."""
+    __tablename__ = 'stake_rollups'
+
+    day = db.Column(db.DateTime, primary_key=True)
+    bet_amount = db.Column(db.Integer, primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'bet_amount': self.bet_amount,
+            'games': self.games,
+            'draws': self.draws
+        }
+
+
+class RollupWatermark(db.Model):
+    """Highest game_history id already folded into the rollups."""
+    __tablename__ = 'rollup_watermarks'
+
+    name = db.Column(db.String(40), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class RollupPlayer(db.Model):
+    """Players seen in a rollup bucket, so distinct counts can be kept incrementally."""
+    __tablename__ = 'rollup_players'
+
+    period = db.Column(db.String(4), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+
+class PairStats(db.Model):
+    """Lifetime head-to-head record of two users; see ``HeadToHead``.
+
+    Keyed by (lower user id, higher user id), so each pair has one row
+    whichever seat each of them took.
+    """
+    __tablename__ = 'pair_stats'
+
+    low_id = db.Column(db.Integer, primary_key=True)
+    high_id = db.Column(db.Integer, primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    low_wins = db.Column(db.Integer, nullable=False, default=0)
+    high_wins = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+    total_stake = db.Column(db.BigInteger, nullable=False, default=0)
+    last_played_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self, user_id):
+        """The record as seen by ``user_id``, one of the pair."""
+        mine, theirs = (self.low_wins, self.high_wins) if user_id == self.low_id else (self.high_wins, self.low_wins)
+        return {
+            'games': self.games,
+            'wins': mine,
+            'losses': theirs,
+            'draws': self.draws,
+            'total_stake': self.total_stake,
+            'last_played_at': self.last_played_at.isoformat() if self.last_played_at else None
+        }
+
+
+class MatchDeadline(db.Model):
+    """Timeout of a playing match, kept until the match is settled.
+
+    Lets any worker time out a match whose own worker (and its in-memory
+    timer) is gone; see ``DeadlineStore``.
+    """
+    __tablename__ = 'match_deadlines'
+
+    match_id = db.Column(db.String(16), primary_key=True)
+    creator_id = db.Column(db.String(80), nullable=False)
+    joiner_id = db.Column(db.String(80), nullable=False)
+    stake = db.Column(db.Integer, nullable=False)
+    deadline = db.Column(db.Float, nullable=False, index=True)  # unix time
+    lease_owner = db.Column(db.String(80), nullable=True)
+    lease_until = db.Column(db.Float, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+
+class BulkJob(db.Model):
+    """Progress of a chunked admin operation over ``users``; see ``BulkOperations``.
+
+    ``last_id`` advances in the same transaction as each chunk, so a job
+    resumed after an interruption neither skips nor repeats users.
+    """
+    __tablename__ = 'bulk_jobs'
+
+    name = db.Column(db.String(80), primary_key=True)
+    operation = db.Column(db.String(20), nullable=False)  # grant, refill, reset
+    params = db.Column(db.Text, nullable=False)  # JSON
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    max_id = db.Column(db.Integer, nullable=False)  # users created later are left alone
+    rows = db.Column(db.Integer, nullable=False, default=0)  # users changed so far
+    status = db.Column(db.String(10), nullable=False, default='running')  # running, done
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'operation': self.operation,
+            'params': json.loads(self.params),
+            'last_id': self.last_id,
+            'max_id': self.max_id,
+            'rows': self.rows,
+            'status': self.status,
+            'progress': round(self.last_id / self.max_id, 4) if self.max_id else 1.0,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class SeasonStats(db.Model):
+    """A user's balance and stats as they stood when ``season`` was reset."""
+    __tablename__ = 'season_stats'
+
+    season = db.Column(db.String(40), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    coins = db.Column(db.Integer, nullable=False, default=0)
+    total_games = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+    total_coins_won = db.Column(db.Integer, nullable=False, default=0)
+    total_coins_lost = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PresenceSketch(db.Model):
+    """HyperLogLog registers of the users active in a minute or a day; see ``Presence``.
+
+    ``name`` is ``minute:YYYY-MM-DDTHH:MM`` or ``day:YYYY-MM-DD``. Every
+    worker merges its own sketches in (the register-wise maximum), so a
+    row counts each user once however many workers saw them.
+    """
+    __tablename__ = 'presence_sketches'
+
+    name = db.Column(db.String(40), primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
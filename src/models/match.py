@@ -1,5 +1,5 @@
 import time
-from threading import Timer
+from threading import Timer, RLock
 
 class MatchStats:
     def __init__(self):
@@ -17,6 +17,10 @@ class MatchStats:
         }
 
 class Match:
+    # Swapped for a virtual clock by the offline simulation
+    timer_factory = Timer
+    lock_factory = staticmethod(RLock)  # a plain function once gevent has patched threading
+
     def __init__(self, match_id, creator_id, stake):
         self.id = match_id
         self.creator = creator_id
@@ -25,12 +29,18 @@ class Match:
         self.moves = {}
         self.status = 'waiting'  # waiting, playing, finished
         self.timer = None
+        self.deadline = None  # set when the deadline is stored durably
         self.start_time = None
+        self.created_at = time.time()
         self.creator_ready = True  # Creator is automatically ready
         self.joiner_ready = False
         self.stats = MatchStats()
         self.result = None
+        self.finished_at = None  # when the last result was settled
         self.rematch_ready = set()
+        # Held by anything that reads-then-mutates this match: moves,
+        # timeouts, settlement, rematches, join/cancel
+        self.lock = self.lock_factory()
 
     def to_dict(self):
         return {
@@ -56,7 +66,7 @@ class Match:
     def start_timer(self, timeout, callback):
         if self.timer:
             self.timer.cancel()
-        self.timer = Timer(timeout, callback, args=[self.id])
+        self.timer = self.timer_factory(timeout, callback, args=[self.id])
         self.timer.start()
 
     def cancel_timer(self):
@@ -85,6 +95,7 @@ class Match:
             return False  # Already processed
         self.result = result_data
         self.status = 'finished'
+        self.finished_at = time.time()
         self.rematch_ready = set()  # Reset rematch_ready when match finishes
         return True
 
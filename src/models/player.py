@@ -1,14 +1,20 @@
+from sqlalchemy import inspect
 from .database import db, User
 
 class Player:
-    def __init__(self, session_id, initial_coins=100):
+    def __init__(self, session_id, initial_coins=100, user=None):
         self.session_id = session_id
         self.current_match = None
-        self._user = None
+        self._user = user  # already loaded by the caller, if given
+        self.recent = None  # recent results, newest first; loaded by RecentResults
+        self.recent_games = None  # total_games the buffer accounts for, when other shards settle too
         self._ensure_user_exists(initial_coins)
 
     def _ensure_user_exists(self, initial_coins):
         """Ensure user exists in database and create if not"""
+        if self._user is not None and self._user not in db.session:
+            # Loaded by an earlier request's session; fetch it into this one
+            self._user = db.session.get(User, inspect(self._user).identity)
         if not self._user:
             self._user = User.query.filter_by(session_id=self.session_id).first()
             if not self._user:
@@ -16,6 +22,13 @@ class Player:
                 db.session.add(self._user)
                 db.session.commit()
 
+    @property
+    def user_id(self):
+        # The identity survives the session that loaded it, so this needs no query
+        if self._user is None:
+            self._ensure_user_exists(100)
+        return inspect(self._user).identity[0]
+
     @property
     def coins(self):
         self._ensure_user_exists(100)
@@ -24,8 +37,10 @@ class Player:
     @coins.setter
     def coins(self, value):
         self._ensure_user_exists(100)
-        self._user.coins = value
-        db.session.commit()
+        # Services usually assign the balance they just committed through the same row
+        if self._user.coins != value:
+            self._user.coins = value
+            db.session.commit()
 
     @property
     def stats(self):
@@ -40,6 +55,13 @@ class Player:
             'stats': self.stats.to_dict()
         }
 
+    def remember_result(self, entry):
+        # Only into a loaded buffer; loading it later finds this result in the database
+        if self.recent is not None:
+            self.recent.appendleft(entry)
+            if self.recent_games is not None:
+                self.recent_games += 1
+
     def has_enough_coins(self, amount):
         self._ensure_user_exists(100)
         return self._user.coins >= amount
@@ -0,0 +1,290 @@
+import os
+import random
+import signal
+import socket
+import time
+import logging
+
+logger = logging.getLogger('rps_game')
+
+
+class PreforkServer:
+    """Pre-forked gevent workers sharing one listening socket.
+
+    The master binds the sockets and forks ``workers`` children; it never
+    builds the app or opens a database connection, so nothing unsafe is
+    inherited across the fork. Each worker calls ``app_factory`` and serves
+    the shared socket with a gevent ``WSGIServer``.
+
+    Socket.IO sessions must stay on the worker that created them. When
+    ``sticky_base_port`` is set, worker slot ``i`` also serves
+    ``sticky_base_port + i`` and nginx hashes clients onto those ports for
+    ``/socket.io/`` (see ``nginx/rockpaperscissors.fun.conf``). The slot
+    sockets belong to the master, so a replacement worker takes over the
+    same port without a gap.
+
+    When ``shard_socket_dir`` is set, matches are sharded across the
+    workers (see ``ShardRouter``): slot ``i`` owns the matches whose id
+    hashes to ``i`` and also serves ``shard_socket_dir/shard-{i}.sock``,
+    where the other workers forward requests and events for them. Those
+    sockets belong to the master too.
+
+    Signals to the master:
+      SIGHUP          start a new generation of workers, then drain the old one
+      SIGTERM/SIGINT  drain all workers and exit
+
+    A draining worker fails ``/readyz`` and keeps serving for
+    ``drain_delay`` seconds before it closes its listeners, then gets
+    ``graceful_timeout`` seconds to finish in-flight requests. It cancels
+    and refunds its waiting matches before closing its listeners and again
+    once its requests are done.
+
+    Workers exit on their own after ``max_requests`` (with jitter) and are
+    replaced, which bounds the damage of slow leaks.
+    """
+
+    def __init__(self, app_factory, host, port, workers=1, max_requests=0,
+                 max_requests_jitter=0, graceful_timeout=30.0, drain_delay=0.0,
+                 sticky_base_port=None, shard_socket_dir=None, backlog=2048):
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.drain_delay = drain_delay
+        self.sticky_base_port = sticky_base_port
+        self.shard_socket_dir = shard_socket_dir
+        self.backlog = backlog
+
+        self.listener = None
+        self.sticky_listeners = []
+        self.shard_listeners = []
+        self.workers = {}      # pid -> slot index
+        self.retiring = set()  # pids draining after a reload
+        self.reload_requested = False
+        self.stopping = False
+
+    # Master
+
+    def bind(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Inherited by accepted connections: pywsgi writes headers and body
+        # separately, and Nagle would hold the body for the client's delayed ACK
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.bind((self.host, port))
+        sock.listen(self.backlog)
+        sock.setblocking(False)
+        return sock
+
+    def bind_unix(self, path):
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a master that did not exit cleanly
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created 0600: whoever can connect is trusted with forwarded requests
+        umask = os.umask(0o177)
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+        sock.listen(self.backlog)
+        sock.setblocking(False)
+        return sock
+
+    def run(self):
+        self.listener = self.bind(self.port)
+        if self.sticky_base_port:
+            self.sticky_listeners = [
+                self.bind(self.sticky_base_port + i) for i in range(self.num_workers)
+            ]
+        if self.shard_socket_dir:
+            from .services.shards import socket_path
+            os.makedirs(self.shard_socket_dir, mode=0o700, exist_ok=True)
+            self.shard_listeners = [
+                self.bind_unix(socket_path(self.shard_socket_dir, i)) for i in range(self.num_workers)
+            ]
+
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+
+        logger.info(f"Master {os.getpid()} listening on {self.host}:{self.port} with {self.num_workers} workers")
+        for index in range(self.num_workers):
+            self.spawn(index)
+
+        while self.workers:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            time.sleep(0.2)
+
+        for listener in self.shard_listeners:
+            os.unlink(listener.getsockname())
+        logger.info(f"Master {os.getpid()} exiting")
+
+    def _on_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _on_stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        for pid in list(self.workers):
+            self.kill(pid, signal.SIGTERM)
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker(index)
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = index
+        logger.info(f"Spawned worker {pid} in slot {index}")
+        return pid
+
+    def reload(self):
+        """Replace every worker: start the new one, then drain the old one."""
+        old = [(pid, index) for pid, index in self.workers.items() if pid not in self.retiring]
+        for pid, index in old:
+            self.spawn(index)
+            self.retiring.add(pid)
+            self.kill(pid, signal.SIGTERM)
+
+    def kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self.workers.pop(pid, None)
+            if index is None:
+                continue
+            retired = pid in self.retiring
+            self.retiring.discard(pid)
+            if self.stopping or retired:
+                continue
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                logger.info(f"Worker {pid} recycled, replacing it")
+            else:
+                logger.error(f"Worker {pid} died with status {status}, replacing it")
+                time.sleep(1)  # Avoid a tight crash loop
+            self.spawn(index)
+
+    # Worker
+
+    def run_worker(self, index):
+        import gevent
+        from gevent.event import Event
+        from gevent.pywsgi import WSGIServer
+
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, signal.SIG_DFL)
+
+        app = self.app_factory()
+        stop = Event()
+        gevent.signal_handler(signal.SIGTERM, stop.set)
+        gevent.signal_handler(signal.SIGINT, stop.set)
+        app.extensions['rps']['worker'] = {
+            'slot': index, 'stop': stop,
+            'shards': self.num_workers if self.shard_listeners else 1,
+            'shard_socket_dir': self.shard_socket_dir
+        }
+
+        limit = 0
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        served = [0]
+
+        def counted_app(environ, start_response):
+            served[0] += 1
+            if limit and served[0] >= limit:
+                stop.set()
+            return app(environ, start_response)
+
+        listeners = [self.listener]
+        if self.sticky_listeners:
+            listeners.append(self.sticky_listeners[index])
+        servers = [
+            WSGIServer(listener, counted_app, handler_class=handler_class(app), log=None)
+            for listener in listeners
+        ]
+        if self.shard_listeners:
+            from gevent.pywsgi import WSGIHandler
+            from .services.shards import FORWARDED
+
+            def shard_app(environ, start_response):
+                environ[FORWARDED] = True  # only reachable through the shard socket
+                return app(environ, start_response)
+
+            servers.append(WSGIServer(self.shard_listeners[index], shard_app, handler_class=WSGIHandler, log=None))
+        for server in servers:
+            server.start()
+
+        stop.wait()
+        logger.info(f"Worker {os.getpid()} draining after {served[0]} requests")
+        if self.drain_delay:
+            # /readyz fails from here on; keep serving until load balancers notice
+            gevent.sleep(self.drain_delay)
+        release_matches(app)
+        for server in servers:
+            server.stop(timeout=self.graceful_timeout)
+        # Matches created by requests still in flight above
+        release_matches(app)
+        # os._exit skips atexit, so let services flush their buffers here
+        for service in list(app.extensions['rps'].values()):
+            close = getattr(service, 'close', None)
+            if callable(close):
+                close()
+
+
+def release_matches(app):
+    """Cancel and refund the waiting matches held in this process and tell
+    their players, who would otherwise lose their stakes when it exits."""
+    from .extensions import match_service, socketio
+    with app.app_context():
+        for match_id in match_service.cancel_waiting():
+            logger.info(f"Cancelled waiting match {match_id} of draining worker {os.getpid()}")
+            socketio.emit('match_cancelled', {
+                'match_id': match_id,
+                'message': 'Match cancelled: server restarting'
+            }, room=match_id)
+
+
+def handler_class(app):
+    """The pywsgi handler for ``app``: gevent-websocket's, unless engine.io
+    handles websocket upgrades itself to negotiate compression."""
+    if app.config.get('WEBSOCKET_COMPRESSION'):
+        from gevent.pywsgi import WSGIHandler
+        return WSGIHandler
+    from geventwebsocket.handler import WebSocketHandler
+    return WebSocketHandler
+
+
+def serve(app_factory, host, port, workers=1, **options):
+    """Run ``workers`` pre-forked workers, or a single in-process server for one."""
+    if workers > 1 and not options.get('shard_socket_dir'):
+        # Each worker holds its own matches in memory; without shards the
+        # shared socket hands their requests to workers that do not have them
+        raise ValueError('more than one worker needs a shard socket directory (SHARD_SOCKET_DIR)')
+    if workers <= 1 and not options.get('sticky_base_port'):
+        from gevent.pywsgi import WSGIServer
+        app = app_factory()
+        WSGIServer((host, port), app, handler_class=handler_class(app)).serve_forever()
+        return
+    PreforkServer(app_factory, host, port, workers=workers, **options).run()
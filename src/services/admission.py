@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+logger = logging.getLogger('rps_game')
+
+# Classes of work, most important first (see Config.ADMISSION_PRIORITIES)
+PLAY = 'play'    # moves, timeouts and readiness in a running match
+MATCH = 'match'  # creating or joining a match: locks and debits users rows
+POLL = 'poll'    # state and lobby polling, shed first
+
+
+class AdmissionController:
+    """Sheds work before a slow database exhausts the connection pool.
+
+    Every admitted request or event counts as in-flight database work until
+    it is released. ``install`` times each pool checkout; one that waits
+    longer than ``max_pool_wait`` seconds, or times out, marks the pool
+    congested for the next ``hold`` seconds. Admission then depends on the
+    class of work:
+
+    - ``poll`` is refused while the pool is congested or ``poll_limit``
+      polls are in flight, so polling backs off first;
+    - ``match`` is refused past ``match_limit`` concurrent match-creating
+      transactions;
+    - ``play`` is refused only past ``max_inflight``, which bounds the
+      greenlets (and memory) a stalled database can pile up.
+
+    A refusal comes with the seconds to wait before retrying.
+    """
+
+    def __init__(self, max_inflight=500, poll_limit=10, match_limit=8, max_pool_wait=0.05, hold=1.0,
+                 clock=time.monotonic):
+        self.max_inflight = max_inflight
+        self.poll_limit = poll_limit
+        self.match_limit = match_limit
+        self.max_pool_wait = max_pool_wait
+        self.hold = hold
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.inflight = {PLAY: 0, MATCH: 0, POLL: 0}
+        self.total = 0
+        self.congested_until = 0.0
+        self.slow_checkouts = 0
+        self.shed = {PLAY: 0, MATCH: 0, POLL: 0}
+        self.local = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['ADMISSION_MAX_INFLIGHT'], config['ADMISSION_POLL_LIMIT'],
+                   config['ADMISSION_MATCH_LIMIT'], config['ADMISSION_MAX_POOL_WAIT_MS'] / 1000,
+                   config['ADMISSION_HOLD'])
+
+    # Pool checkouts
+
+    def install(self, engines):
+        # The pool has no event before a checkout starts waiting, so its
+        # connect() is wrapped; Engine.raw_connection() goes through it
+        for engine in engines:
+            engine.pool.connect = self.timed_checkout(engine.pool.connect)
+
+    def timed_checkout(self, connect):
+        def checkout():
+            start = self.clock()
+            try:
+                return connect()
+            except PoolTimeout:
+                self.local.pool_timeout = True
+                raise
+            finally:
+                waited = self.clock() - start
+                if waited > self.max_pool_wait:
+                    self.congested(waited)
+        return checkout
+
+    def congested(self, waited):
+        with self.lock:
+            self.slow_checkouts += 1
+            if self.clock() >= self.congested_until:
+                logger.warning(f"Database pool congested ({waited * 1000:.0f} ms checkout), shedding polls")
+            self.congested_until = self.clock() + self.hold
+
+    def take_pool_timeout(self):
+        """Whether a checkout on this thread (greenlet) timed out since the last call."""
+        timed_out = getattr(self.local, 'pool_timeout', False)
+        self.local.pool_timeout = False
+        return timed_out
+
+    # Admission
+
+    def admit(self, priority):
+        """Take one unit of ``priority`` work. Returns (allowed, retry_after)."""
+        now = self.clock()
+        with self.lock:
+            if self.total >= self.max_inflight:
+                allowed = False
+            elif priority == POLL:
+                allowed = now >= self.congested_until and self.inflight[POLL] < self.poll_limit
+            elif priority == MATCH:
+                allowed = self.inflight[MATCH] < self.match_limit
+            else:
+                allowed = True
+            if not allowed:
+                self.shed[priority] += 1
+                return False, max(self.congested_until - now, self.hold)
+            self.inflight[priority] += 1
+            self.total += 1
+            return True, 0.0
+
+    def release(self, priority):
+        with self.lock:
+            self.inflight[priority] -= 1
+            self.total -= 1
+
+    def report(self):
+        with self.lock:
+            return {
+                'inflight': dict(self.inflight),
+                'congested': self.clock() < self.congested_until,
+                'slow_checkouts': self.slow_checkouts,
+                'shed': dict(self.shed),
+            }
@@ -0,0 +1,368 @@
+import heapq
+import itertools
+import logging
+import random
+import time
+from .game_service import GameService
+from .realtime import match_result_payload
+from ..models.database import db, User
+from ..utils.sql import dialect_insert
+
+logger = logging.getLogger('rps_game')
+
+MOVES = ('rock', 'paper', 'scissors')
+MOVE_INDEX = {move: i for i, move in enumerate(MOVES)}
+BOT_PREFIX = 'bot-'
+# The users row that bot top-ups are paid from; its balance goes negative as bots lose
+HOUSE_ID = 'house'
+
+
+def counter_move(index):
+    """The move that beats ``MOVES[index]`` (paper > rock > scissors > paper)."""
+    return MOVES[(index + 1) % 3]
+
+
+def is_bot(session_id):
+    return bool(session_id) and session_id.startswith(BOT_PREFIX)
+
+
+class RandomStrategy:
+    """Uniform random moves, the same as a timeout auto-move."""
+    name = 'random'
+
+    def choose(self, opponent_id):
+        return GameService.random_move()
+
+    def observe(self, opponent_id, move):
+        pass
+
+
+class OpponentModel:
+    """Bounded per-opponent state shared by every bot using one strategy.
+
+    State is a small ``bytearray`` per opponent; the oldest opponents are
+    forgotten once ``max_opponents`` is reached.
+    """
+
+    STATE_SIZE = 3
+
+    def __init__(self, max_opponents=100000):
+        self.max_opponents = max_opponents
+        self.states = {}
+
+    def state(self, opponent_id):
+        state = self.states.get(opponent_id)
+        if state is None:
+            if len(self.states) >= self.max_opponents:
+                del self.states[next(iter(self.states))]
+            state = self.states[opponent_id] = bytearray(self.STATE_SIZE)
+        return state
+
+
+def bump(counts, offset, index):
+    """Increment a byte counter, halving its row of three on overflow."""
+    if counts[offset + index] == 255:
+        for i in range(offset, offset + 3):
+            counts[i] >>= 1
+    counts[offset + index] += 1
+
+
+def predict(counts, offset):
+    """Index of the most frequent of three counters, or None when all are zero."""
+    r, p, s = counts[offset], counts[offset + 1], counts[offset + 2]
+    if r == p == s == 0:
+        return None
+    if r >= p and r >= s:
+        return 0
+    return 1 if p >= s else 2
+
+
+class FrequencyStrategy(OpponentModel):
+    """Counter the opponent's most frequent move."""
+    name = 'frequency'
+
+    def choose(self, opponent_id):
+        state = self.states.get(opponent_id)
+        guess = predict(state, 0) if state else None
+        return GameService.random_move() if guess is None else counter_move(guess)
+
+    def observe(self, opponent_id, move):
+        bump(self.state(opponent_id), 0, MOVE_INDEX[move])
+
+
+class MarkovStrategy(OpponentModel):
+    """Counter the opponent's most likely move given their previous move.
+
+    State layout: byte 0 holds the last move + 1 (0 = none yet), then a
+    3x3 table of transition counts.
+    """
+    name = 'markov'
+    STATE_SIZE = 10
+
+    def choose(self, opponent_id):
+        state = self.states.get(opponent_id)
+        if not state or not state[0]:
+            return GameService.random_move()
+        guess = predict(state, 1 + (state[0] - 1) * 3)
+        return GameService.random_move() if guess is None else counter_move(guess)
+
+    def observe(self, opponent_id, move):
+        state = self.state(opponent_id)
+        index = MOVE_INDEX[move]
+        if state[0]:
+            bump(state, 1 + (state[0] - 1) * 3, index)
+        state[0] = index + 1
+
+
+STRATEGIES = {
+    'random': RandomStrategy,
+    'frequency': FrequencyStrategy,
+    'markov': MarkovStrategy,
+}
+
+
+class BotGame:
+    __slots__ = ('bot_id', 'match_id', 'opponent_id', 'rounds_left')
+
+    def __init__(self, bot_id, match_id, opponent_id, rounds_left=0):
+        self.bot_id = bot_id
+        self.match_id = match_id
+        self.opponent_id = opponent_id
+        self.rounds_left = rounds_left
+
+
+class BotEngine:
+    """Bot opponents driven by one scheduler loop instead of threads.
+
+    Bots join waiting matches through ``MatchService.join_match`` and move
+    through ``Match.make_move``; every pending bot action sits in a heap
+    ordered by due time, so a ``tick`` only touches what is due. Human
+    matches keep the normal timeout timer. ``start_load`` pairs bots
+    against each other, which makes the engine a load generator for the
+    real services.
+    """
+
+    def __init__(self, match_service, game_service, strategy='markov', pool_size=100,
+                 join_delay=10.0, move_delay=(1.0, 3.0), stake_limit=None,
+                 initial_coins=1000, emit=None, match_timeout=30.0, rng=None):
+        self.match_service = match_service
+        self.game_service = game_service
+        self.strategy = STRATEGIES[strategy]()
+        self.join_delay = join_delay
+        self.move_delay = move_delay
+        self.stake_limit = stake_limit
+        self.initial_coins = initial_coins
+        self.emit = emit
+        self.match_timeout = match_timeout
+        self.rng = rng or random.Random()
+
+        self.free_bots = [f'{BOT_PREFIX}{i}' for i in range(pool_size)]
+        self.next_bot = pool_size
+        self.games = {}     # bot_id -> BotGame
+        self.schedule = []  # (due, seq, bot_id)
+        self.seq = itertools.count()
+        self.stats = {'joined': 0, 'moves': 0, 'results': 0}
+
+    # Scheduling
+
+    def push(self, due, bot_id):
+        heapq.heappush(self.schedule, (due, next(self.seq), bot_id))
+
+    def tick(self, now=None):
+        """Join stale waiting matches and run every bot action that is due."""
+        now = time.time() if now is None else now
+        if self.join_delay is not None:
+            self.fill_lobby(now)
+        while self.schedule and self.schedule[0][0] <= now:
+            _, _, bot_id = heapq.heappop(self.schedule)
+            game = self.games.get(bot_id)
+            if game:
+                self.play(game, now)
+                self.end_session()
+
+    def end_session(self):
+        """One session per bot action, as with requests.
+
+        A session kept open across thousands of games holds every bot's
+        user row, and each commit then expires all of them.
+        """
+        db.session.remove()
+
+    def run(self, interval=0.1, sleep=time.sleep):
+        while True:
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Bot engine tick failed")
+                db.session.rollback()
+            sleep(interval)
+
+    # Bots
+
+    def take_bot(self):
+        if self.free_bots:
+            return self.free_bots.pop()
+        bot_id = f'{BOT_PREFIX}{self.next_bot}'
+        self.next_bot += 1
+        return bot_id
+
+    def fund(self, bot_id, stake):
+        """Bots are the house: top their balance up instead of letting them go broke.
+
+        The coins move from the ``house`` user in the same transaction, so
+        the total held across ``users`` never changes.
+        """
+        player = self.match_service.get_player(bot_id)
+        if not player.has_enough_coins(stake):
+            users = User.__table__
+            db.session.execute(dialect_insert(users).values(session_id=HOUSE_ID, coins=0).on_conflict_do_nothing())
+            bot = User.query.filter_by(session_id=bot_id).with_for_update().populate_existing().one()
+            top_up = self.initial_coins - (bot.coins or 0)
+            bot.coins = self.initial_coins
+            db.session.execute(users.update().where(users.c.session_id == HOUSE_ID)
+                               .values(coins=users.c.coins - top_up))
+            db.session.commit()
+            player.coins = self.initial_coins
+            logger.info(f"Refilled bot {bot_id} to {self.initial_coins} coins from the house")
+        return player
+
+    def release(self, bot_id):
+        self.games.pop(bot_id, None)
+        player = self.match_service.players.get(bot_id)
+        if player:
+            player.current_match = None
+        self.free_bots.append(bot_id)
+
+    def delay(self):
+        low, high = self.move_delay
+        return self.rng.uniform(low, high) if high > low else low
+
+    # Human matches
+
+    def fill_lobby(self, now):
+        for match in list(self.match_service.matches.values()):
+            if (match.status == 'waiting' and match.joiner is None
+                    and not is_bot(match.creator)
+                    and now - match.created_at >= self.join_delay
+                    and (self.stake_limit is None or match.stake <= self.stake_limit)):
+                self.join(match, now)
+                self.end_session()
+
+    def join(self, match, now):
+        bot_id = self.take_bot()
+        self.fund(bot_id, match.stake)
+        with match.lock:
+            if not self.match_service.join_match(match.id, bot_id):
+                self.free_bots.append(bot_id)
+                return None
+
+            match.joiner_ready = True
+            self.match_service.events.append('ready', match.id, bot_id)
+            match.start_match()
+            self.match_service.schedule_timeout(match, self.match_timeout)
+        self.games[bot_id] = BotGame(bot_id, match.id, match.creator)
+        self.push(now + self.delay(), bot_id)
+        self.stats['joined'] += 1
+        self.notify('match_started', {'match_id': match.id, 'start_time': match.start_time}, match.id)
+        logger.info(f"Bot {bot_id} joined match {match.id}")
+        return bot_id
+
+    # Moves
+
+    def play(self, game, now):
+        match = self.match_service.get_match(game.match_id)
+        if not match:
+            self.release(game.bot_id)
+            return
+
+        moved = result = None
+        with match.lock:
+            if match.status == 'playing' and game.bot_id not in match.moves:
+                move = self.strategy.choose(game.opponent_id)
+                if match.make_move(game.bot_id, move):
+                    moved = move
+                    self.stats['moves'] += 1
+                    self.match_service.events.append('move', match.id, game.bot_id, move=move)
+
+            if match.status == 'playing' and match.are_both_moves_made():
+                result = self.game_service.calculate_match_result(match, self.match_service.players,
+                                                                  self.match_service.events)
+                match.cancel_timer()
+                self.stats['results'] += 1
+
+        if moved:
+            self.notify('move_made', {'player': match.get_player_role(game.bot_id), 'auto': False}, match.id)
+        if result:
+            self.notify('match_result', match_result_payload(result), match.id)
+
+        if match.status == 'finished':
+            opponent_move = match.moves.get(game.opponent_id)
+            if opponent_move and not is_bot(game.opponent_id):
+                self.strategy.observe(game.opponent_id, opponent_move)
+            if not is_bot(game.opponent_id):
+                # Bots don't take rematches; the player goes back to the lobby
+                self.notify('rematch_declined', {}, match.id)
+                self.release(game.bot_id)
+                self.match_service.cleanup_match(match.id)
+                return
+            # Bot-vs-bot: whichever bot moved last wraps up for both
+            creator_game = self.games[match.creator]
+            if creator_game.rounds_left > 0:
+                self.next_round(creator_game, match, now)
+            else:
+                self.release(match.creator)
+                self.release(match.joiner)
+                self.match_service.cleanup_match(match.id)
+            return
+
+        if not is_bot(game.opponent_id):
+            # Waiting for the human; check again shortly
+            self.push(now + 1.0, game.bot_id)
+
+    # Load generation
+
+    def start_load(self, games, stake=1, rounds=1, now=None):
+        """Start ``games`` bot-vs-bot matches of ``rounds`` rounds each."""
+        now = time.time() if now is None else now
+        started = 0
+        for _ in range(games):
+            if self.start_bot_match(self.take_bot(), self.take_bot(), stake, rounds, now):
+                started += 1
+            self.end_session()
+        return started
+
+    def start_bot_match(self, creator_id, joiner_id, stake, rounds, now):
+        self.fund(creator_id, stake)
+        self.fund(joiner_id, stake)
+        match = self.match_service.create_match(creator_id, stake)
+        if not match or not self.match_service.join_match(match.id, joiner_id):
+            if match:
+                self.match_service.cancel_match(match.id)
+            self.free_bots.extend([creator_id, joiner_id])
+            return None
+        match.joiner_ready = True
+        match.start_match()
+        # No timer: the engine itself guarantees both bots move
+        self.games[creator_id] = BotGame(creator_id, match.id, joiner_id, rounds - 1)
+        self.games[joiner_id] = BotGame(joiner_id, match.id, creator_id)
+        self.push(now + self.delay(), creator_id)
+        self.push(now + self.delay(), joiner_id)
+        return match
+
+    def next_round(self, game, match, now):
+        joiner_id = game.opponent_id
+        self.match_service.cleanup_match(match.id)
+        self.games.pop(game.bot_id, None)
+        self.games.pop(joiner_id, None)
+        new_match = self.start_bot_match(game.bot_id, joiner_id, match.stake, game.rounds_left, now)
+        if new_match:
+            self.match_service.events.append('rematch', new_match.id, game.bot_id, match.id)
+        else:
+            logger.error(f"Bot round could not start for {game.bot_id}")
+
+    def notify(self, event, data, room):
+        if self.emit:
+            self.emit(event, data, room=room)
+
+    def active_games(self):
+        return len(self.games)
@@ -0,0 +1,181 @@
+import json
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import func, literal, select, update
+from ..models.database import db, User, BulkJob, SeasonStats
+from ..utils.sql import dialect_insert
+from .bot_service import HOUSE_ID
+
+logger = logging.getLogger('rps_game')
+
+OPERATIONS = ('grant', 'refill', 'reset')
+STAT_COLUMNS = ('total_games', 'wins', 'losses', 'draws', 'total_coins_won', 'total_coins_lost')
+SEGMENT_FILTERS = ('min_coins', 'max_coins', 'min_games', 'active_since', 'telegram')
+
+
+def validate(operation, params):
+    """Check ``params`` for ``operation``; raises ValueError with a message for the caller."""
+    if operation not in OPERATIONS:
+        raise ValueError(f'Unknown operation {operation!r}')
+    required = {'grant': ('amount',), 'refill': ('to',), 'reset': ('season', 'coins')}[operation]
+    allowed = required + (SEGMENT_FILTERS if operation != 'reset' else ())
+    unknown = set(params) - set(allowed)
+    if unknown:
+        raise ValueError(f'Unknown parameters for {operation}: {", ".join(sorted(unknown))}')
+    missing = [name for name in required if params.get(name) is None]
+    if missing:
+        raise ValueError(f'Missing parameters for {operation}: {", ".join(missing)}')
+
+    for name in ('amount', 'to', 'coins', 'min_coins', 'max_coins', 'min_games'):
+        if name in params and (not isinstance(params[name], int) or isinstance(params[name], bool)):
+            raise ValueError(f'{name} must be an integer')
+    if operation == 'grant' and params['amount'] <= 0:
+        raise ValueError('amount must be positive')
+    if operation == 'refill' and params['to'] <= 0:
+        raise ValueError('to must be positive')
+    if operation == 'reset':
+        if params['coins'] < 0:
+            raise ValueError('coins must not be negative')
+        if not isinstance(params['season'], str) or not 0 < len(params['season']) <= 40:
+            raise ValueError('season must be a name of at most 40 characters')
+    if 'active_since' in params:
+        try:
+            datetime.fromisoformat(params['active_since'])
+        except (TypeError, ValueError):
+            raise ValueError('active_since must be an ISO date')
+    if 'telegram' in params and not isinstance(params['telegram'], bool):
+        raise ValueError('telegram must be true or false')
+
+
+def segment(params):
+    """WHERE conditions selecting the users an operation applies to."""
+    users = User.__table__
+    conditions = []
+    if 'min_coins' in params:
+        conditions.append(users.c.coins >= params['min_coins'])
+    if 'max_coins' in params:
+        conditions.append(users.c.coins <= params['max_coins'])
+    if 'min_games' in params:
+        conditions.append(users.c.total_games >= params['min_games'])
+    if 'active_since' in params:
+        conditions.append(users.c.last_seen >= datetime.fromisoformat(params['active_since']))
+    if 'telegram' in params:
+        conditions.append(users.c.telegram_id.isnot(None) if params['telegram'] else users.c.telegram_id.is_(None))
+    return conditions
+
+
+class BulkOperations:
+    """Coin and stat changes for many users at once, as set-based SQL.
+
+    A job walks ``users`` in id ranges of ``chunk_size``, one short
+    transaction per range: the chunk's UPDATE (after copying the rows to
+    ``season_stats`` for a reset) and the advance of the job's ``last_id``
+    commit together. Row locks are held for one chunk only, so settlements
+    touching those users wait at most that long, and an interrupted job is
+    resumed with ``run`` without applying any chunk twice. ``pause``
+    seconds between chunks leave room for other writers.
+
+    Operations:
+
+    - ``grant``: add ``amount`` coins to every user in the segment
+    - ``refill``: raise users in the segment below ``to`` coins to ``to``
+    - ``reset``: archive everyone's balance and stats as ``season``, then
+      set coins to ``coins`` and the stats to zero
+    """
+
+    def __init__(self, chunk_size=5000, pause=0.0, sleep=time.sleep):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.sleep = sleep
+
+    @classmethod
+    def from_config(cls, config, sleep=time.sleep):
+        return cls(config['BULK_CHUNK_SIZE'], config['BULK_PAUSE'], sleep)
+
+    def start(self, operation, name=None, **params):
+        """Record a new job over every current user and return its dict; ``run`` does the work."""
+        validate(operation, params)
+        if name is None:
+            name = f"season-{params['season']}" if operation == 'reset' else \
+                f'{operation}-{datetime.utcnow():%Y%m%d%H%M%S}'
+        if db.session.get(BulkJob, name):
+            raise ValueError(f'Job {name} already exists')
+        job = BulkJob(
+            name=name,
+            operation=operation,
+            params=json.dumps(params, sort_keys=True),
+            last_id=0,
+            max_id=db.session.query(func.max(User.id)).scalar() or 0,
+            rows=0,
+            status='running'
+        )
+        db.session.add(job)
+        db.session.commit()
+        logger.info(f"Bulk job {name} created: {operation} {job.params} over user ids up to {job.max_id}")
+        return job.to_dict()
+
+    def run(self, name, progress=None):
+        """Process the rest of job ``name``; ``progress`` gets the job's dict after every chunk."""
+        while True:
+            # The job row is locked for the chunk, so two runners of one job take turns
+            job = BulkJob.query.filter_by(name=name).with_for_update().first()
+            if job is None:
+                db.session.rollback()
+                raise ValueError(f'No job named {name}')
+            if job.last_id >= job.max_id:
+                if job.status != 'done':
+                    job.status = 'done'
+                    logger.info(f"Bulk job {name} done: {job.rows} users changed")
+                report = job.to_dict()
+                db.session.commit()
+                return report
+
+            hi = min(job.last_id + self.chunk_size, job.max_id)
+            job.rows += self.apply(job.operation, json.loads(job.params), job.last_id, hi)
+            job.last_id = hi
+            report = job.to_dict()
+            db.session.commit()
+            # One session per chunk, as with requests
+            db.session.remove()
+            if progress:
+                progress(report)
+            if self.pause:
+                self.sleep(self.pause)
+
+    def apply(self, operation, params, lo, hi):
+        """Apply ``operation`` to users with ``lo < id <= hi``; returns users changed. Does not commit."""
+        users = User.__table__
+        # The house balance only moves with the bots it funds
+        in_chunk = (users.c.id > lo) & (users.c.id <= hi) & (users.c.session_id != HOUSE_ID)
+        if operation == 'grant':
+            stmt = (update(users).where(in_chunk, *segment(params))
+                    .values(coins=func.coalesce(users.c.coins, 0) + params['amount']))
+        elif operation == 'refill':
+            stmt = (update(users).where(in_chunk, func.coalesce(users.c.coins, 0) < params['to'], *segment(params))
+                    .values(coins=params['to']))
+        else:
+            self.archive(params['season'], in_chunk)
+            stmt = update(users).where(in_chunk).values(coins=params['coins'], **{c: 0 for c in STAT_COLUMNS})
+        return db.session.execute(stmt).rowcount
+
+    def archive(self, season, condition):
+        users = User.__table__
+        columns = ('coins',) + STAT_COLUMNS
+        rows = select(literal(season), users.c.id,
+                      *[func.coalesce(users.c[c], 0) for c in columns],
+                      literal(datetime.utcnow())).where(condition)
+        db.session.execute(
+            dialect_insert(SeasonStats.__table__)
+            .from_select(['season', 'user_id', *columns, 'archived_at'], rows)
+            .on_conflict_do_nothing()
+        )
+
+    # Reading jobs
+
+    def jobs(self, limit=50):
+        return [job.to_dict() for job in BulkJob.query.order_by(BulkJob.created_at.desc()).limit(limit)]
+
+    def job(self, name):
+        job = db.session.get(BulkJob, name)
+        return job.to_dict() if job else None
@@ -0,0 +1,167 @@
+import logging
+import os
+import socket
+import time
+from sqlalchemy import or_
+from ..models.database import db, MatchDeadline, User
+
+logger = logging.getLogger('rps_game')
+
+
+class NullDeadlineStore:
+    """Stands in for the deadline store when ``DURABLE_DEADLINES`` is off."""
+
+    def add(self, match, timeout, now=None):
+        return False
+
+    def sweep(self, match_service, now=None):
+        return 0
+
+
+class DeadlineStore:
+    """Match deadlines in the ``match_deadlines`` table.
+
+    A playing match's deadline is inserted when its timer starts and
+    deleted by the transaction that settles it; because that delete must
+    find the row, a match can only be settled once across all workers.
+
+    Any worker can ``sweep``: deadlines more than ``grace`` seconds overdue
+    are leased in batches of ``batch_size`` for ``lease`` seconds, then
+    resolved through ``MatchService.handle_match_timeout``. A sweeper that
+    dies mid-batch only delays its rows until the lease runs out. A match
+    still unsettled after ``max_attempts`` leases is refunded instead.
+    """
+
+    def __init__(self, grace=10.0, lease=30.0, batch_size=500, max_attempts=5, worker=None):
+        self.grace = grace
+        self.lease = lease
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.worker = worker or f'{socket.gethostname()}-{os.getpid()}'
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.get('DURABLE_DEADLINES'):
+            return NullDeadlineStore()
+        return cls(config['DEADLINE_GRACE'], config['DEADLINE_LEASE'], config['DEADLINE_BATCH_SIZE'])
+
+    def add(self, match, timeout, now=None):
+        """Record ``match``'s deadline in the current transaction; the caller commits."""
+        match.deadline = (time.time() if now is None else now) + timeout
+        db.session.merge(MatchDeadline(
+            match_id=match.id,
+            creator_id=match.creator,
+            joiner_id=match.joiner,
+            stake=match.stake,
+            deadline=match.deadline,
+            attempts=0
+        ))
+        return True
+
+    # Sweeping
+
+    def claim(self, now=None):
+        """Lease up to ``batch_size`` overdue deadlines; returns the leased rows, oldest first."""
+        now = time.time() if now is None else now
+        candidates = (db.session.query(MatchDeadline.match_id)
+                      .filter(MatchDeadline.deadline <= now - self.grace,
+                              or_(MatchDeadline.lease_until.is_(None), MatchDeadline.lease_until < now))
+                      .order_by(MatchDeadline.deadline)
+                      .limit(self.batch_size)
+                      .with_for_update(skip_locked=True))
+        ids = [match_id for match_id, in candidates]
+        if not ids:
+            db.session.rollback()
+            return []
+        # Re-check the lease in the update: another sweeper may have won the row
+        # on databases without SKIP LOCKED
+        (MatchDeadline.query
+         .filter(MatchDeadline.match_id.in_(ids),
+                 or_(MatchDeadline.lease_until.is_(None), MatchDeadline.lease_until < now))
+         .update({'lease_owner': self.worker, 'lease_until': now + self.lease,
+                  'attempts': MatchDeadline.attempts + 1}, synchronize_session=False))
+        db.session.commit()
+        # Plain rows, not entities: a batch of tracked objects would be
+        # expired by every commit made while resolving it
+        rows = (db.session.query(MatchDeadline.match_id, MatchDeadline.creator_id, MatchDeadline.joiner_id,
+                                 MatchDeadline.stake, MatchDeadline.deadline, MatchDeadline.attempts)
+                .filter(MatchDeadline.match_id.in_(ids), MatchDeadline.lease_owner == self.worker,
+                        MatchDeadline.lease_until == now + self.lease)
+                .order_by(MatchDeadline.deadline)
+                .all())
+        db.session.commit()
+        return rows
+
+    def sweep(self, match_service, now=None):
+        """Resolve every claimable overdue deadline. Returns how many were settled."""
+        settled = 0
+        while True:
+            rows = self.claim(now)
+            if not rows:
+                return settled
+            for row in rows:
+                if self.resolve(match_service, row):
+                    settled += 1
+                # One session per match, as with requests
+                db.session.remove()
+            if len(rows) < self.batch_size:
+                return settled
+
+    def resolve(self, match_service, row):
+        if row.attempts > self.max_attempts:
+            logger.error(f"Giving up on deadline of match {row.match_id} after {row.attempts - 1} attempts; "
+                         f"refunding both stakes")
+            self.refund(match_service, row)
+            return False
+
+        # Still live in this worker: its timer failed to fire. Otherwise the
+        # worker that ran the match is gone and the match is rebuilt here.
+        adopted = row.match_id not in match_service.matches
+        if adopted:
+            match_service.adopt(row.match_id, row.creator_id, row.joiner_id, row.stake, row.deadline)
+        try:
+            match = match_service.handle_match_timeout(row.match_id)
+        finally:
+            if adopted:
+                match_service.cleanup_match(row.match_id)
+        if match is None or match.result is None:
+            logger.warning(f"Deadline of match {row.match_id} could not be settled; will retry")
+            return False
+        logger.info(f"Timed out match {row.match_id} from its durable deadline")
+        return True
+
+    def refund(self, match_service, row):
+        """Return both escrowed stakes of a match that cannot be settled.
+
+        The deadline row is deleted in the same transaction, so a settlement
+        racing with the refund finds it gone and pays nothing. Returns False
+        when the match was settled first.
+        """
+        if not MatchDeadline.query.filter_by(match_id=row.match_id).delete(synchronize_session=False):
+            db.session.rollback()
+            return False
+        balances = {}
+        for session_id in sorted((row.creator_id, row.joiner_id)):
+            user = (User.query.filter_by(session_id=session_id)
+                    .with_for_update().populate_existing().first())
+            if user:
+                user.coins += row.stake
+                balances[session_id] = user.coins
+        db.session.commit()
+        for session_id, balance in balances.items():
+            match_service.record_event('cancel', row.match_id, session_id, amount=row.stake, balance=balance)
+            player = match_service.players.get(session_id)
+            if player:
+                player.coins = balance
+        match_service.cleanup_match(row.match_id)
+        return True
+
+    def run(self, match_service, interval, sleep=time.sleep):
+        while True:
+            try:
+                self.sweep(match_service)
+            except Exception:
+                logger.exception("Deadline sweep failed")
+                db.session.rollback()
+            db.session.remove()
+            sleep(interval)
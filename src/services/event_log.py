@@ -0,0 +1,324 @@
+import atexit
+import heapq
+import itertools
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import namedtuple
+from ..models.match import MatchStats
+
+logger = logging.getLogger('rps_game')
+
+EVENT_TYPES = ('create', 'join', 'ready', 'move', 'auto_move', 'result', 'rematch', 'cancel')
+EVENT_CODES = {name: code for code, name in enumerate(EVENT_TYPES)}
+MOVES = ('rock', 'paper', 'scissors')
+MOVE_CODES = {move: code for code, move in enumerate(MOVES)}
+NO_MOVE = 255
+# Result events store the outcome in the move byte
+OUTCOMES = ('draw', 'player1', 'player2')
+# Multiples of the stake paid back to (creator, joiner) for each outcome
+PAYOUTS = ((1, 1), (2, 0), (0, 2))
+
+# Record: body length and CRC32 of the body, then the body itself.
+# Body: timestamp, type, move, amount, balance, other_balance, followed by
+# match_id, actor and other as one-byte-length UTF-8 strings.
+HEADER = struct.Struct('<II')
+MAX_TEXT = 255
+FIXED = struct.Struct('<dBBqqq')
+MATCH_ID_OFFSET = FIXED.size
+
+SEGMENT_RE = re.compile(r'^events-(?P<writer>[\w.]+)-(?P<seq>\d{8})\.seg$')
+
+Event = namedtuple('Event', 'ts type match_id actor other move amount balance other_balance')
+
+
+def encode(event, match_id, actor='', other='', move=None, amount=0, balance=-1, other_balance=-1, ts=None):
+    code = MOVE_CODES[move] if move in MOVE_CODES else OUTCOMES.index(move) if move in OUTCOMES else NO_MOVE
+    parts = [FIXED.pack(time.time() if ts is None else ts, EVENT_CODES[event], code,
+                        amount, -1 if balance is None else balance,
+                        -1 if other_balance is None else other_balance)]
+    for name, text in (('match_id', match_id), ('actor', actor), ('other', other)):
+        data = (text or '').encode()
+        if len(data) > MAX_TEXT:
+            raise ValueError(f"Event {name} is {len(data)} bytes; the event log stores at most {MAX_TEXT}")
+        parts.append(bytes((len(data),)))
+        parts.append(data)
+    body = b''.join(parts)
+    return HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def decode(body):
+    ts, code, move, amount, balance, other_balance = FIXED.unpack_from(body)
+    pos = FIXED.size
+    texts = []
+    for _ in range(3):
+        length = body[pos]
+        texts.append(body[pos + 1:pos + 1 + length].decode())
+        pos += 1 + length
+    event = EVENT_TYPES[code]
+    if move == NO_MOVE:
+        move = None
+    elif event == 'result':
+        move = OUTCOMES[move]
+    else:
+        move = MOVES[move]
+    return Event(ts, event, texts[0], texts[1], texts[2], move, amount, balance, other_balance)
+
+
+def off_hub(function, *args):
+    """Call ``function`` in a real OS thread when gevent has patched threading.
+
+    Under monkey-patching the flusher "thread" is a greenlet, and a blocking
+    ``fsync`` in it would stall every request on the worker until the disk
+    answers. Elsewhere ``function`` is simply called.
+    """
+    if 'gevent' in sys.modules:
+        from gevent import get_hub, monkey
+        if monkey.is_module_patched('threading'):
+            return get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+
+class NullEventLog:
+    """Stands in for the event log when ``EVENT_LOG_DIR`` is unset."""
+
+    def append(self, *args, **kwargs):
+        pass
+
+    def flush(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class EventLog:
+    """Append-only, length-prefixed binary log of match events.
+
+    ``append`` only encodes the record and queues it; a flusher thread
+    writes everything queued since the last flush with one ``write`` and
+    one ``fsync`` (group commit), in an OS thread from gevent's pool when
+    running under gevent (see ``off_hub``). Events reach disk within
+    ``flush_interval`` seconds. Each process writes its own segment files,
+    rolled over at ``segment_size`` bytes.
+    """
+
+    def __init__(self, directory, segment_size=64 << 20, flush_interval=0.01, fsync=True,
+                 max_pending=1 << 20, writer=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self.writer = writer or str(os.getpid())
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()        # guards the pending queue
+        self.write_lock = threading.Lock()  # one flush at a time
+        self.pending = []
+        self.pending_bytes = 0
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = None
+
+        existing = [seq for writer, seq, _ in list_segments(directory) if writer == self.writer]
+        # Never append to an old segment: it may end in a torn record
+        self.seq = max(existing, default=0)
+        self.file = None
+        self._rotate()
+
+    def _rotate(self):
+        if self.file:
+            self.file.close()
+        self.seq += 1
+        path = os.path.join(self.directory, f'events-{self.writer}-{self.seq:08d}.seg')
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+
+    def append(self, event, match_id, actor='', other='', move=None, amount=0,
+               balance=-1, other_balance=-1, ts=None):
+        record = encode(event, match_id, actor, other, move, amount, balance, other_balance, ts)
+        with self.lock:
+            self.pending.append(record)
+            self.pending_bytes += len(record)
+            if self.pending_bytes >= self.max_pending:
+                self.wakeup.set()
+
+    def flush(self):
+        """Write and sync everything queued so far. Returns the records written."""
+        with self.write_lock:
+            with self.lock:
+                batch, self.pending, self.pending_bytes = self.pending, [], 0
+            if not batch or self.file is None:
+                return 0
+            data = b''.join(batch)
+            off_hub(self._write, data)
+            self.size += len(data)
+            if self.size >= self.segment_size:
+                self._rotate()
+            return len(batch)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def start(self):
+        """Flush in the background every ``flush_interval`` seconds."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='event-log-flusher', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        return self
+
+    def _run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Event log flush failed")
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+        with self.write_lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+# Reading
+
+def list_segments(directory):
+    """(writer, seq, path) for every segment file, in write order per writer."""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        match = SEGMENT_RE.match(name)
+        if match:
+            segments.append((match['writer'], int(match['seq']), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def read_segment(path, types=None, match_id=None):
+    """Yield the events in one segment, stopping at a torn or corrupt tail.
+
+    ``types`` and ``match_id`` are checked against the raw bytes, so skipped
+    records are never decoded.
+    """
+    codes = None if types is None else {EVENT_CODES[t] for t in types}
+    wanted = None if match_id is None else bytes((len(match_id.encode()),)) + match_id.encode()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos + HEADER.size <= size:
+                length, crc = HEADER.unpack_from(mm, pos)
+                start = pos + HEADER.size
+                end = start + length
+                if end > size:
+                    logger.warning(f"Torn record at {path}:{pos}")
+                    return
+                body = mm[start:end]
+                if zlib.crc32(body) != crc:
+                    logger.warning(f"Corrupt record at {path}:{pos}")
+                    return
+                pos = end
+                if codes is not None and body[8] not in codes:
+                    continue
+                if wanted is not None and body[MATCH_ID_OFFSET:MATCH_ID_OFFSET + len(wanted)] != wanted:
+                    continue
+                yield decode(body)
+
+
+def read_events(directory, types=None, match_id=None, since=None):
+    """Yield events from every writer's segments, merged in timestamp order."""
+    writers = [
+        [path for _, _, path in group]
+        for _, group in itertools.groupby(list_segments(directory), key=lambda s: s[0])
+    ]
+    streams = [
+        itertools.chain.from_iterable(read_segment(path, types, match_id) for path in paths)
+        for paths in writers
+    ]
+    for event in heapq.merge(*streams, key=lambda e: e.ts):
+        if since is None or event.ts >= since:
+            yield event
+
+
+# Rebuilding state
+
+class Rebuild:
+    def __init__(self):
+        self.stats = {}      # match_id -> MatchStats
+        self.series = {}     # match_id -> first match of its rematch chain
+        self.balances = {}   # session_id -> coins after its last logged change
+        self.mismatches = [] # (event, session_id, expected, logged)
+        self.events = 0
+
+    def series_stats(self):
+        """MatchStats summed over each chain of rematches."""
+        totals = {}
+        for match_id, stats in self.stats.items():
+            total = totals.setdefault(self.series.get(match_id, match_id), MatchStats())
+            total.rounds += stats.rounds
+            total.creator_wins += stats.creator_wins
+            total.joiner_wins += stats.joiner_wins
+            total.draws += stats.draws
+        return totals
+
+
+def rebuild(events):
+    """Replay events into per-match stats and player balances.
+
+    Every balance-changing event carries the balance it produced; when the
+    previous balance is known the change is checked against the stake rules
+    and any disagreement is reported in ``mismatches``.
+    """
+    state = Rebuild()
+
+    def settle(event, session_id, delta, logged):
+        if logged < 0 or not session_id:
+            return
+        previous = state.balances.get(session_id)
+        if previous is not None and previous + delta != logged:
+            state.mismatches.append((event, session_id, previous + delta, logged))
+        state.balances[session_id] = logged
+
+    for event in events:
+        state.events += 1
+        if event.type == 'create':
+            state.stats.setdefault(event.match_id, MatchStats())
+            settle(event, event.actor, -event.amount, event.balance)
+        elif event.type == 'join':
+            settle(event, event.actor, -event.amount, event.balance)
+        elif event.type == 'cancel':
+            settle(event, event.actor, event.amount, event.balance)
+        elif event.type == 'rematch':
+            state.series[event.match_id] = state.series.get(event.other, event.other)
+        elif event.type == 'result':
+            stats = state.stats.setdefault(event.match_id, MatchStats())
+            stats.rounds += 1
+            if event.move == 'draw':
+                stats.draws += 1
+            elif event.move == 'player1':
+                stats.creator_wins += 1
+            else:
+                stats.joiner_wins += 1
+            creator_share, joiner_share = PAYOUTS[OUTCOMES.index(event.move)]
+            settle(event, event.actor, creator_share * event.amount, event.balance)
+            settle(event, event.other, joiner_share * event.amount, event.other_balance)
+    return state
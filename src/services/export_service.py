@@ -0,0 +1,164 @@
+import csv
+import io
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from ..models.database import db, User, GameHistory
+
+COLUMNS = [
+    'id', 'played_at', 'bet_amount',
+    'player1_id', 'player1_username', 'player1_choice',
+    'player2_id', 'player2_username', 'player2_choice',
+    'winner_id', 'winner_username',
+]
+
+
+def settled_id(conn, settle_seconds, now=None):
+    """The newest ``game_history`` id below which every row has committed, or None.
+
+    Ids are taken when a settlement inserts its row, but rows become
+    visible when their transactions commit, so a lower id can appear after
+    a higher one. Reading only up to the newest row played at least
+    ``settle_seconds`` ago leaves every transaction that could still commit
+    a lower id that long to finish (plus the replica lag, when ``conn``
+    reads a replica).
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=settle_seconds)
+    return conn.execute(
+        select(GameHistory.id)
+        .where(GameHistory.played_at <= cutoff)
+        .order_by(GameHistory.played_at.desc(), GameHistory.id.desc())
+        .limit(1)
+    ).scalar()
+
+
+class HistoryExporter:
+    """Streams ``game_history`` joined with usernames in fixed-size chunks.
+
+    Rows are read through a server-side cursor (``stream_results``) and the
+    user join happens in SQL, so memory stays bounded by ``chunk_size`` no
+    matter how large the table is. ``id`` is the watermark: an export
+    covers ``since_id < id <= settled_id(...)``, and ``last_id`` is that
+    upper bound, so rows younger than ``settle_seconds`` wait for the next
+    export rather than being skipped by it.
+
+    Rows are read from ``engine``, the primary by default.
+    """
+
+    def __init__(self, chunk_size=10000, engine=None, settle_seconds=60):
+        self.chunk_size = chunk_size
+        self.engine = engine
+        self.settle_seconds = settle_seconds
+        self.last_id = None
+
+    def query(self, since_id, until_id):
+        player1 = aliased(User)
+        player2 = aliased(User)
+        winner = aliased(User)
+        return (
+            select(
+                GameHistory.id, GameHistory.played_at, GameHistory.bet_amount,
+                GameHistory.player1_id, player1.username, GameHistory.player1_choice,
+                GameHistory.player2_id, player2.username, GameHistory.player2_choice,
+                GameHistory.winner_id, winner.username,
+            )
+            .join(player1, player1.id == GameHistory.player1_id)
+            .join(player2, player2.id == GameHistory.player2_id)
+            .outerjoin(winner, winner.id == GameHistory.winner_id)
+            .where(GameHistory.id > since_id, GameHistory.id <= until_id)
+            .order_by(GameHistory.id)
+        )
+
+    def iter_chunks(self, since_id=0):
+        """Yield lists of row tuples in ``COLUMNS`` order."""
+        self.last_id = since_id
+        with (self.engine or db.engine).connect() as conn:
+            until_id = settled_id(conn, self.settle_seconds)
+            if until_id is None or until_id <= since_id:
+                return
+            result = conn.execution_options(
+                stream_results=True, max_row_buffer=self.chunk_size
+            ).execute(self.query(since_id, until_id))
+            for rows in result.partitions(self.chunk_size):
+                yield rows
+            self.last_id = until_id
+
+    def iter_csv(self, since_id=0):
+        """Yield CSV text, one chunk of rows at a time, header first."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for rows in self.iter_chunks(since_id):
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def write(self, path, fmt='csv', since_id=0):
+        """Export to ``path`` as csv, parquet or arrow (IPC file). Returns row count."""
+        if fmt == 'csv':
+            return self._write_csv(path, since_id)
+        if fmt in ('parquet', 'arrow'):
+            return self._write_arrow(path, fmt, since_id)
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    def _write_csv(self, path, since_id):
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for rows in self.iter_chunks(since_id):
+                writer.writerows(rows)
+                count += len(rows)
+        return count
+
+    def _write_arrow(self, path, fmt, since_id):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+
+        schema = pa.schema([
+            ('id', pa.int64()), ('played_at', pa.timestamp('us')), ('bet_amount', pa.int64()),
+            ('player1_id', pa.int64()), ('player1_username', pa.string()), ('player1_choice', pa.string()),
+            ('player2_id', pa.int64()), ('player2_username', pa.string()), ('player2_choice', pa.string()),
+            ('winner_id', pa.int64()), ('winner_username', pa.string()),
+        ])
+        if fmt == 'parquet':
+            writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            writer = pa.ipc.new_file(path, schema)
+
+        count = 0
+        try:
+            for rows in self.iter_chunks(since_id):
+                columns = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                    schema=schema
+                )
+                writer.write_batch(batch)
+                count += len(rows)
+        finally:
+            writer.close()
+        return count
+
+
+def read_watermark(path):
+    """Last exported id stored in ``path``, or 0 when there is none yet."""
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(f.read().strip() or 0)
+
+
+def write_watermark(path, last_id):
+    # Write then rename so an interrupted export never leaves a torn watermark
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(f'{last_id}\n')
+    os.replace(tmp, path)
@@ -1,5 +1,7 @@
 import random
-from src.models.database import db, User, GameHistory
+from src.models.database import db, User, GameHistory, MatchDeadline
+from src.services.recent_results import result_entries
+from src.services.head_to_head import HeadToHead
 from datetime import datetime
 
 class GameService:
@@ -35,7 +37,7 @@ class GameService:
         return GameService.calculate_match_result(match, players)
 
     @staticmethod
-    def calculate_match_result(match, players):
+    def calculate_match_result(match, players, events=None):
         from ..utils.logger import setup_logger
         logger = setup_logger()
 
@@ -61,13 +63,22 @@ class GameService:
                 db.session.rollback()
                 return None
 
+            # Settling consumes the durable deadline; if it is already gone,
+            # another worker's sweeper has settled this match
+            if getattr(match, 'deadline', None) is not None:
+                if not MatchDeadline.query.filter_by(match_id=match.id).delete():
+                    logger.warning(f"Match {match.id} was already settled by the deadline sweeper")
+                    db.session.rollback()
+                    return None
+
             # Create game history record
             game_history = GameHistory(
                 player1_id=creator_user.id,
                 player2_id=joiner_user.id,
                 player1_choice=creator_move,
                 player2_choice=joiner_move,
-                bet_amount=match.stake
+                bet_amount=match.stake,
+                played_at=datetime.utcnow()
             )
             
             if result == 'draw':
@@ -148,6 +159,9 @@ class GameService:
             players[match.joiner].stats.total_games = joiner_user.total_games
             players[match.joiner].stats.total_coins_won = joiner_user.total_coins_won
             players[match.joiner].stats.total_coins_lost = joiner_user.total_coins_lost
+            balances = creator_user.coins, joiner_user.coins
+            entries = result_entries(creator_user, joiner_user, creator_move, joiner_move,
+                                     result, match.stake, game_history.played_at)
 
             # Update player stats in database
             db.session.commit()
@@ -171,9 +185,21 @@ class GameService:
 
             # Set result and save to database
             if match.set_result(result_data):
+                # Before the history row: see HeadToHead.backfill
+                HeadToHead.record(creator_user.id, joiner_user.id, game_history.winner_id, match.stake,
+                                  game_history.played_at)
                 db.session.add(game_history)
                 db.session.commit()
                 logger.info("Match result saved to database")
+                players[match.creator].remember_result(entries[0])
+                players[match.joiner].remember_result(entries[1])
+                if events:
+                    try:
+                        events.append('result', match.id, match.creator, match.joiner, move=result,
+                                      amount=match.stake, balance=balances[0], other_balance=balances[1])
+                    except Exception:
+                        # The result is committed; only its log record is lost
+                        logger.exception(f"Could not log result event of match {match.id}")
                 return result_data
             else:
                 logger.info("Match result already processed, rolling back")
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import case, func, select, text
+from ..models.database import db, GameHistory, PairStats, RollupWatermark
+from ..utils.sql import dialect_insert, dialect_name
+from .rollup_service import lock_marker, refuse_archived
+
+COUNTS = ('games', 'low_wins', 'high_wins', 'draws', 'total_stake')
+WATERMARK = 'pair_stats'
+BACKFILL_PREFIX = 'pair_stats:'
+
+
+def pair_key(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+def add_games(stmt):
+    """``stmt``, an insert into pair_stats, adding its counts to existing pairs."""
+    table = PairStats.__table__
+    newer = stmt.excluded.last_played_at
+    return stmt.on_conflict_do_update(
+        index_elements=['low_id', 'high_id'],
+        set_=dict({column: table.c[column] + stmt.excluded[column] for column in COUNTS},
+                  last_played_at=case((table.c.last_played_at.is_(None) | (newer > table.c.last_played_at), newer),
+                                      else_=table.c.last_played_at))
+    )
+
+
+class HeadToHead:
+    """Head-to-head records of user pairs, kept in ``pair_stats``.
+
+    Settlement adds each game to its pair in the transaction that writes
+    the history row, so a lookup is one primary-key read. History from
+    before the table existed is folded in by ``backfill``: its first run
+    empties the table and takes the highest history id as the cutoff in
+    one transaction, so every game is counted once, either by the
+    backfill or by settlement.
+    """
+
+    @staticmethod
+    def record(creator_id, joiner_id, winner_id, stake, played_at):
+        """Add one settled game. Run before the history row is written; does not commit."""
+        low, high = pair_key(creator_id, joiner_id)
+        db.session.execute(add_games(dialect_insert(PairStats.__table__)).values(
+            low_id=low, high_id=high, games=1,
+            low_wins=int(winner_id == low), high_wins=int(winner_id == high), draws=int(winner_id is None),
+            total_stake=stake or 0, last_played_at=played_at
+        ))
+
+    @staticmethod
+    def lookup(user_id, opponent_id):
+        """``user_id``'s record against ``opponent_id``."""
+        pair = db.session.get(PairStats, pair_key(user_id, opponent_id))
+        if pair is None:
+            return {'games': 0, 'wins': 0, 'losses': 0, 'draws': 0, 'total_stake': 0, 'last_played_at': None}
+        return pair.to_dict(user_id)
+
+    # Backfill
+
+    def fold(self, lo_id, hi_id):
+        """Add history rows with ``lo_id < id <= hi_id`` to their pairs. Does not commit."""
+        history = GameHistory.__table__
+        low = case((history.c.player1_id < history.c.player2_id, history.c.player1_id), else_=history.c.player2_id)
+        high = case((history.c.player1_id < history.c.player2_id, history.c.player2_id), else_=history.c.player1_id)
+        rows = (select(low, high, func.count(),
+                       func.sum(case((history.c.winner_id == low, 1), else_=0)),
+                       func.sum(case((history.c.winner_id == high, 1), else_=0)),
+                       func.sum(case((history.c.winner_id.is_(None), 1), else_=0)),
+                       func.coalesce(func.sum(history.c.bet_amount), 0),
+                       func.max(history.c.played_at))
+                .where(history.c.id > lo_id, history.c.id <= hi_id)
+                .group_by(low, high)
+                # Parallel chunks then lock shared pairs in the same order and cannot deadlock
+                .order_by(low, high))
+        stmt = dialect_insert(PairStats.__table__).from_select(
+            ['low_id', 'high_id', *COUNTS, 'last_played_at'], rows)
+        return db.session.execute(add_games(stmt)).rowcount
+
+    def reset(self):
+        """Empty pair_stats and start a backfill up to the current last history id."""
+        if dialect_name() == 'postgresql':
+            # Waits for settlements already counted in the table to commit, and
+            # holds back new ones until the cutoff below is taken
+            db.session.execute(text('TRUNCATE pair_stats'))
+        else:
+            PairStats.query.delete()
+        RollupWatermark.query.filter(RollupWatermark.name.startswith(BACKFILL_PREFIX)).delete(
+            synchronize_session=False)
+        cutoff = db.session.query(func.max(GameHistory.id)).scalar() or 0
+        watermark = db.session.get(RollupWatermark, WATERMARK) or RollupWatermark(name=WATERMARK)
+        watermark.last_id = cutoff
+        db.session.add(watermark)
+        db.session.commit()
+        return cutoff
+
+    def backfill(self, app, workers=4, chunk_size=1000000, rebuild=False, kept_only=False):
+        """Fold history up to the cutoff into pair_stats in parallel id chunks.
+
+        Each chunk commits together with a marker row; a rerun skips
+        finished chunks, so it resumes an interrupted backfill and does
+        nothing after a complete one. A chunk's marker is locked while it
+        is folded, so backfills run side by side fold each chunk once.
+        ``rebuild`` starts over. Returns pairs written (a pair spanning
+        chunks counts once per chunk).
+
+        Chunks left to fold below what retention has archived raise
+        RuntimeError before anything is changed, unless ``kept_only``
+        accepts counting the kept months only.
+        """
+        return self.run_backfill(app, self.plan_backfill(app, chunk_size, rebuild, kept_only), workers)
+
+    def plan_backfill(self, app, chunk_size=1000000, rebuild=False, kept_only=False):
+        """Start (or resume) a backfill; returns the (lo, hi) id chunks left for ``run_backfill``."""
+        with app.app_context():
+            watermark = db.session.get(RollupWatermark, WATERMARK)
+            if rebuild or watermark is None:
+                refuse_archived('the backfill', 0, kept_only)
+                cutoff = self.reset()
+            else:
+                cutoff = watermark.last_id
+            done = {
+                int(row.name[len(BACKFILL_PREFIX):]): row.last_id
+                for row in RollupWatermark.query.filter(RollupWatermark.name.startswith(BACKFILL_PREFIX))
+            }
+            chunks = [(lo, min(lo + chunk_size, cutoff)) for lo in range(0, cutoff, chunk_size)
+                      if done.get(lo, lo) < min(lo + chunk_size, cutoff)]
+            if chunks:
+                refuse_archived('the backfill', chunks[0][0], kept_only)
+            db.session.commit()
+        return chunks
+
+    def run_backfill(self, app, chunks, workers=4):
+        with app.app_context():
+            if dialect_name() == 'sqlite':
+                workers = 1  # one writer at a time; parallel chunks would only wait on each other
+
+        def run(chunk):
+            lo, hi = chunk
+            with app.app_context():
+                marker = lock_marker(f'{BACKFILL_PREFIX}{lo}', lo)
+                if marker.last_id >= hi:
+                    db.session.commit()  # folded by another backfill since the plan
+                    return 0
+                pairs = self.fold(lo, hi)
+                marker.last_id = hi
+                db.session.commit()
+                return pairs
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return sum(pool.map(run, chunks))
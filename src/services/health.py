@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from sqlalchemy import text
+
+logger = logging.getLogger('rps_game')
+
+
+def pool_usage(pool):
+    """Checked-out connections and capacity of a QueuePool, or None for pools without a limit."""
+    checkedout = getattr(pool, 'checkedout', None)
+    if checkedout is None:
+        return None
+    capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+    return {'checked_out': checkedout(), 'capacity': capacity}
+
+
+def pending(timer):
+    return timer is not None and (not hasattr(timer, 'is_alive') or timer.is_alive())
+
+
+class HealthMonitor:
+    """Cached checks behind ``/healthz`` and ``/readyz``.
+
+    Probes never touch the session or write anything. The database check
+    (``SELECT 1`` on a pooled connection) and the in-memory counts run at
+    most once per ``cache_ttl`` seconds however often the worker is
+    probed; whether the worker is draining is read on every probe.
+
+    ``watch_loop`` runs in a background greenlet and measures how late its
+    own ``interval`` sleeps wake up, which is how long a ready greenlet
+    waits for the CPU. Liveness fails once that lag passes ``max_lag``.
+    """
+
+    def __init__(self, cache_ttl=1.0, interval=0.5, max_lag=5.0, clock=time.monotonic):
+        self.cache_ttl = cache_ttl
+        self.interval = interval
+        self.max_lag = max_lag
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.loop_lag = 0.0
+        self.checks = None
+        self.checked_at = None
+        self.checks_run = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['HEALTH_CACHE_TTL'], config['HEALTH_LAG_INTERVAL'], config['HEALTH_MAX_LOOP_LAG'])
+
+    def watch_loop(self, sleep):
+        while True:
+            start = self.clock()
+            sleep(self.interval)
+            self.loop_lag = max(0.0, self.clock() - start - self.interval)
+
+    def liveness(self):
+        """(alive, body)"""
+        lag_ms = round(self.loop_lag * 1000, 1)
+        if self.loop_lag > self.max_lag:
+            return False, {'status': 'stalled', 'loop_lag_ms': lag_ms}
+        return True, {'status': 'ok', 'loop_lag_ms': lag_ms}
+
+    def readiness(self, engine, match_service, draining=False, admission=None):
+        """(ready, body): ready when the database answers and the worker is not draining."""
+        with self.lock:
+            if self.checks is None or self.clock() - self.checked_at >= self.cache_ttl:
+                self.checks = self.run_checks(engine, match_service, admission)
+                self.checked_at = self.clock()
+                self.checks_run += 1
+            checks = dict(self.checks, loop_lag_ms=round(self.loop_lag * 1000, 1))
+        if draining:
+            return False, {'status': 'draining', 'checks': checks}
+        if not checks['database']['ok']:
+            return False, {'status': 'unavailable', 'checks': checks}
+        return True, {'status': 'ready', 'checks': checks}
+
+    def run_checks(self, engine, match_service, admission=None):
+        start = self.clock()
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            database = {'ok': True, 'ms': round((self.clock() - start) * 1000, 1)}
+        except Exception as e:
+            logger.warning(f"Readiness check could not reach the database: {e}")
+            database = {'ok': False, 'error': type(e).__name__}
+
+        matches = list(match_service.matches.values())
+        checks = {
+            'database': database,
+            'pool': pool_usage(engine.pool),
+            'matches': {
+                'live': len(matches),
+                'waiting': sum(1 for match in matches if match.status == 'waiting'),
+                'playing': sum(1 for match in matches if match.status == 'playing'),
+            },
+            'timers': sum(1 for match in matches if pending(match.timer)),
+        }
+        if admission is not None:
+            checks['admission'] = admission.report()
+        return checks
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+from .shards import NullShardRouter
+
+# An open match held by another shard
+RemoteMatch = namedtuple('RemoteMatch', 'id stake creator')
+
+
+def json_with(data, **fragments):
+    """``json.dumps(data)`` with each of ``fragments`` (already JSON text) added under its key."""
+    body = json.dumps(data, separators=(',', ':'))
+    extra = ','.join(f'{json.dumps(key)}:{fragment}' for key, fragment in fragments.items())
+    return body[:-1] + (',' if data and extra else '') + extra + '}'
+
+
+class Lobby:
+    """One build of the lobby: open matches sorted by stake, serialized once.
+
+    ``body`` is every match's JSON object joined with commas; ``starts`` and
+    ``ends`` are each object's offsets in it, so any run of matches is a
+    slice of ``body``.
+    """
+
+    def __init__(self, matches, version, built_at):
+        matches = sorted(matches, key=lambda match: match.stake)
+        self.version = version
+        self.built_at = built_at
+        self.stakes = [match.stake for match in matches]
+        self.by_creator = {}
+        parts = []
+        for i, match in enumerate(matches):
+            self.by_creator.setdefault(match.creator, []).append(i)
+            parts.append(json.dumps({'id': match.id, 'stake': match.stake}, separators=(',', ':')))
+        self.starts, self.ends = [], []
+        offset = 0
+        for part in parts:
+            self.starts.append(offset)
+            offset += len(part)
+            self.ends.append(offset)
+            offset += 1
+        self.body = ','.join(parts)
+
+    def __len__(self):
+        return len(self.stakes)
+
+    def open_matches_json(self, coins, exclude=None):
+        """JSON array of the matches staking at most ``coins``, leaving out ``exclude``'s own."""
+        affordable = bisect_right(self.stakes, coins)
+        pieces = []
+        start = 0
+        for stop in [i for i in self.by_creator.get(exclude, ()) if i < affordable] + [affordable]:
+            if stop > start:
+                pieces.append(self.body[self.starts[start]:self.ends[stop - 1]])
+            start = stop + 1
+        return '[' + ','.join(pieces) + ']'
+
+
+class LobbySnapshot:
+    """The open-match list shared by every ``/api/state`` caller.
+
+    It is rebuilt at most once per ``ttl`` seconds, and on the next read
+    after ``MatchService`` creates, joins or removes a match (tracked by its
+    ``lobby_version``). A creator's balance is checked when the lobby is
+    built, so a creator who runs short stays listed for up to ``ttl``;
+    joining re-checks under the match lock.
+
+    With sharded workers each build also asks the other shards for their
+    open matches, so their changes show up within ``ttl``.
+    """
+
+    def __init__(self, match_service, ttl=0.5, clock=time.monotonic, shards=None):
+        self.match_service = match_service
+        self.ttl = ttl
+        self.clock = clock
+        self.shards = shards or NullShardRouter()
+        self.lock = threading.Lock()
+        self.lobby = None
+        self.builds = 0
+
+    @classmethod
+    def from_config(cls, match_service, config, shards=None):
+        return cls(match_service, config['LOBBY_SNAPSHOT_TTL'], shards=shards)
+
+    def fresh(self, lobby):
+        return (lobby is not None and lobby.version == self.match_service.lobby_version
+                and self.clock() - lobby.built_at < self.ttl)
+
+    def get(self):
+        lobby = self.lobby
+        if self.fresh(lobby):
+            return lobby
+        with self.lock:
+            if not self.fresh(self.lobby):
+                self.lobby = self.build()
+            return self.lobby
+
+    def build(self):
+        # Read the version first: a change made while building leaves the
+        # lobby stale and the next read rebuilds it
+        version = self.match_service.lobby_version
+        built_at = self.clock()
+        matches = self.local_matches() + [RemoteMatch(**match) for match in self.shards.open_matches()]
+        self.builds += 1
+        return Lobby(matches, version, built_at)
+
+    def local_matches(self):
+        """This process's waiting matches whose creators can still cover the stake."""
+        waiting = [match for match in list(self.match_service.matches.values())
+                   if match.status == 'waiting' and match.joiner is None]
+        balances = self.match_service.get_balances({match.creator for match in waiting}) if waiting else {}
+        return [match for match in waiting if balances.get(match.creator, 0) >= match.stake]
+
+    def open_matches_json(self, player_id, coins):
+        return self.get().open_matches_json(coins, exclude=player_id)
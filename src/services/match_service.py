@@ -1,33 +1,76 @@
+import itertools
 import random
-import secrets
+from collections import OrderedDict
+from flask import has_app_context
 from ..models.match import Match
 from ..models.player import Player
 from ..models.database import db, User, GameHistory
 from ..config import Config
+from .event_log import NullEventLog
+from .deadline_service import NullDeadlineStore
+from .shards import NullShardRouter
 from datetime import datetime
+import logging
+
+logger = logging.getLogger('rps_game')
 
 class MatchService:
-    def __init__(self):
+    def __init__(self, events=None, app=None, deadlines=None, max_players=100000, shards=None):
         self.matches = {}
-        self.players = {}
-
-    def get_player(self, session_id):
+        self.players = OrderedDict()  # least recently used first
+        self.max_players = max_players
+        self.events = events or NullEventLog()
+        self.app = app
+        self.deadlines = deadlines or NullDeadlineStore()
+        self.shards = shards or NullShardRouter()  # match ids name the worker that owns them
+        self.lobby_version = 0  # bumped when a match enters or leaves the lobby
+
+    def close(self):
+        self.events.close()
+
+    def get_player(self, session_id, user_id=None):
         if session_id not in self.players:
-            # Check if user exists in database
-            user = User.query.filter_by(session_id=session_id).first()
+            # A user id cached in the caller's session is a primary key lookup
+            user = db.session.get(User, user_id) if user_id is not None else None
+            if user is None or user.session_id != session_id:
+                user = User.query.filter_by(session_id=session_id).first()
             if not user:
                 user = User(session_id=session_id, coins=Config.INITIAL_COINS)
                 db.session.add(user)
                 db.session.commit()
             
             # Create in-memory player
-            self.players[session_id] = Player(session_id, user.coins)
+            self.players[session_id] = Player(session_id, user.coins, user=user)
             self.players[session_id].stats.wins = user.wins
             self.players[session_id].stats.losses = user.losses
             self.players[session_id].stats.draws = user.draws
             self.players[session_id].stats.total_games = user.total_games
+            if len(self.players) > self.max_players:
+                self.evict_players()
+        else:
+            self.players.move_to_end(session_id)
         return self.players[session_id]
 
+    def evict_players(self):
+        """Forget the least recently used tenth of the cached players.
+
+        Players in a match are kept. Whatever else hangs off a ``Player``,
+        such as its recent results, goes with it; ``get_player`` loads the
+        player again on its next request.
+        """
+        count = max(1, self.max_players // 10)
+        for session_id in list(itertools.islice(self.players, count)):
+            player = self.players.get(session_id)
+            if player is not None and player.current_match is None:
+                del self.players[session_id]
+
+    def record_event(self, *args, **kwargs):
+        """Append to the event log; a failure is logged, never raised, as the change is already committed."""
+        try:
+            self.events.append(*args, **kwargs)
+        except Exception:
+            logger.exception(f"Could not log {args[0]} event of match {args[1]}")
+
     def create_match(self, creator_id, stake):
         try:
             # Start transaction
@@ -43,167 +86,230 @@ class MatchService:
             creator_user.coins -= stake
 
             # Create match
-            match_id = secrets.token_hex(4)
+            match_id = self.shards.new_match_id()
             match = Match(match_id, creator_id, stake)
             self.matches[match_id] = match
             self.players[creator_id].current_match = match_id
+            self.lobby_version += 1
             
             # Update in-memory state
             self.players[creator_id].coins = creator_user.coins
+            balance = creator_user.coins
 
             # Commit transaction
             db.session.commit()
-            return match
 
         except Exception as e:
             db.session.rollback()
             return None
 
+        self.record_event('create', match_id, creator_id, amount=stake, balance=balance)
+        return match
+
     def join_match(self, match_id, joiner_id):
         if match_id not in self.matches:
             return None
 
         match = self.matches[match_id]
-        if match.status != 'waiting' or match.joiner is not None:
-            return None
+        with match.lock:
+            if match.status != 'waiting' or match.joiner is not None:
+                return None
 
-        try:
-            # Start transaction
-            db.session.begin_nested()
+            try:
+                # Start transaction
+                db.session.begin_nested()
 
-            # Get joiner from database with row locking
-            joiner_user = User.query.filter_by(session_id=joiner_id).with_for_update().first()
-            if not joiner_user or joiner_user.coins < match.stake:
-                db.session.rollback()
-                return None
+                # Get joiner from database with row locking
+                joiner_user = User.query.filter_by(session_id=joiner_id).with_for_update().first()
+                if not joiner_user or joiner_user.coins < match.stake:
+                    db.session.rollback()
+                    return None
 
-            # Deduct stake from joiner
-            joiner_user.coins -= match.stake
+                # Deduct stake from joiner
+                joiner_user.coins -= match.stake
 
-            # Update match state
-            match.joiner = joiner_id
-            self.players[joiner_id].current_match = match_id
+                # Update match state
+                match.joiner = joiner_id
+                self.players[joiner_id].current_match = match_id
+                self.lobby_version += 1
             
-            # Update in-memory state
-            self.players[joiner_id].coins = joiner_user.coins
+                # Update in-memory state
+                self.players[joiner_id].coins = joiner_user.coins
+                balance = joiner_user.coins
 
-            # Commit transaction
-            db.session.commit()
-            return match
+                # Commit transaction
+                db.session.commit()
 
-        except Exception as e:
-            db.session.rollback()
-            return None
+            except Exception as e:
+                db.session.rollback()
+                return None
+
+            self.record_event('join', match_id, joiner_id, match.creator, amount=match.stake, balance=balance)
+            return match
 
     def get_match(self, match_id):
         return self.matches.get(match_id)
 
     def get_open_matches(self, player_id):
-        open_matches = []
-        for mid, match in self.matches.items():
-            if (match.status == 'waiting' and 
-                match.creator != player_id and 
-                self.players[match.creator].has_enough_coins(match.stake) and
-                self.players[player_id].has_enough_coins(match.stake)):
-                open_matches.append({
-                    'id': mid,
-                    'stake': match.stake
-                })
-        return open_matches
+        waiting = [match for match in self.matches.values()
+                   if match.status == 'waiting' and match.joiner is None and match.creator != player_id]
+        if not waiting:
+            return []
+        coins = self.players[player_id].coins
+        waiting = [match for match in waiting if match.stake <= coins]
+        # One query for all creators' balances, not one per waiting match
+        balances = self.get_balances({match.creator for match in waiting})
+        return [{'id': match.id, 'stake': match.stake}
+                for match in waiting if balances.get(match.creator, 0) >= match.stake]
+
+    def get_balances(self, session_ids, chunk_size=500):
+        """Coins of each of ``session_ids``, read in chunks of ``chunk_size``."""
+        session_ids = list(session_ids)
+        balances = {}
+        for i in range(0, len(session_ids), chunk_size):
+            balances.update(db.session.query(User.session_id, User.coins)
+                            .filter(User.session_id.in_(session_ids[i:i + chunk_size])))
+        return balances
+
+    def schedule_timeout(self, match, timeout=None):
+        """Start the match timer and store its deadline for the sweeper."""
+        timeout = Config.MATCH_TIMEOUT if timeout is None else timeout
+        try:
+            if self.deadlines.add(match, timeout):
+                db.session.commit()
+        except Exception:
+            # The local timer still runs; only crash recovery is lost
+            logger.exception(f"Could not store deadline of match {match.id}")
+            db.session.rollback()
+            match.deadline = None
+        match.start_timer(timeout, self.handle_match_timeout)
+
+    def adopt(self, match_id, creator_id, joiner_id, stake, deadline):
+        """Rebuild a playing match whose worker is gone so its timeout can be handled here."""
+        self.get_player(creator_id)
+        self.get_player(joiner_id)
+        match = Match(match_id, creator_id, stake)
+        match.joiner = joiner_id
+        match.joiner_ready = True
+        match.start_match()
+        match.deadline = deadline
+        self.matches[match_id] = match
+        return match
 
     def handle_match_timeout(self, match_id):
+        if self.app is not None and not has_app_context():
+            # Timer callbacks run on their own thread/greenlet
+            with self.app.app_context():
+                return self.handle_match_timeout(match_id)
+
         match = self.matches.get(match_id)
-        if not match or match.status != 'playing':
+        if not match:
             return
-
-        try:
-            # Start transaction
-            db.session.begin_nested()
-
-            # Get both players from database with row locking
-            creator_user = User.query.filter_by(session_id=match.creator).with_for_update().first()
-            joiner_user = User.query.filter_by(session_id=match.joiner).with_for_update().first()
-
-            if not creator_user or not joiner_user:
-                db.session.rollback()
-                return None
-
-            # Assign random moves to players who haven't made a move
-            if match.creator not in match.moves:
-                match.moves[match.creator] = random.choice(['rock', 'paper', 'scissors'])
-
-            if match.joiner not in match.moves:
-                match.moves[match.joiner] = random.choice(['rock', 'paper', 'scissors'])
-
-            # Calculate and set match result since both moves are now made
-            from .game_service import GameService
-            result_data = GameService.calculate_match_result(match, self.players)
+        with match.lock:
+            if match.status != 'playing':
+                return
+
+            try:
+                # Start transaction
+                db.session.begin_nested()
+
+                # Get both players from database with row locking
+                creator_user = User.query.filter_by(session_id=match.creator).with_for_update().first()
+                joiner_user = User.query.filter_by(session_id=match.joiner).with_for_update().first()
+
+                if not creator_user or not joiner_user:
+                    db.session.rollback()
+                    return None
+
+                # Assign random moves to players who haven't made a move
+                for player_id in (match.creator, match.joiner):
+                    if player_id not in match.moves:
+                        match.moves[player_id] = random.choice(['rock', 'paper', 'scissors'])
+                        self.record_event('auto_move', match_id, player_id, move=match.moves[player_id])
+
+                # Calculate and set match result since both moves are now made
+                from .game_service import GameService
+                result_data = GameService.calculate_match_result(match, self.players, self.events)
             
-            # Cancel the timer since we've handled the timeout
-            match.cancel_timer()
+                # Cancel the timer since we've handled the timeout
+                match.cancel_timer()
 
-            # Commit transaction
-            db.session.commit()
+                # Commit transaction
+                db.session.commit()
             
-            return match
+                return match
 
-        except Exception as e:
-            db.session.rollback()
-            return None
+            except Exception as e:
+                db.session.rollback()
+                return None
 
     def create_rematch(self, old_match_id):
         old_match = self.matches.get(old_match_id)
         if not old_match:
             return None
 
-        # Check if both players have enough coins
-        if not old_match.can_rematch(self.players):
-            return None
-
-        # Check if both players have accepted rematch
-        if not old_match.is_rematch_ready():
-            return None
-
-        try:
-            # Start transaction
-            db.session.begin_nested()
-
-            # Get users from database with row locking
-            creator_user = User.query.filter_by(session_id=old_match.creator).with_for_update().first()
-            joiner_user = User.query.filter_by(session_id=old_match.joiner).with_for_update().first()
-
-            if not creator_user or not joiner_user:
-                db.session.rollback()
+        with old_match.lock:
+            # Check if both players have enough coins
+            if not old_match.can_rematch(self.players):
                 return None
 
-            # Verify coins again within transaction
-            if creator_user.coins < old_match.stake or joiner_user.coins < old_match.stake:
-                db.session.rollback()
+            # Check if both players have accepted rematch
+            if not old_match.is_rematch_ready():
                 return None
 
-            # Deduct stakes from both players
-            creator_user.coins -= old_match.stake
-            joiner_user.coins -= old_match.stake
-
-            # Create new match
-            match_id = secrets.token_hex(4)
-            new_match = Match(match_id, old_match.creator, old_match.stake)
-            new_match.joiner = old_match.joiner
-            new_match.status = 'playing'  # Start in playing state
-            new_match.creator_ready = True
-            new_match.joiner_ready = True
-
-            # Update match and player states
-            self.matches[match_id] = new_match
-            self.players[old_match.creator].current_match = match_id
-            self.players[old_match.joiner].current_match = match_id
+            try:
+                # Start transaction
+                db.session.begin_nested()
+
+                # Get users from database with row locking
+                creator_user = User.query.filter_by(session_id=old_match.creator).with_for_update().first()
+                joiner_user = User.query.filter_by(session_id=old_match.joiner).with_for_update().first()
+
+                if not creator_user or not joiner_user:
+                    db.session.rollback()
+                    return None
+
+                # Verify coins again within transaction
+                if creator_user.coins < old_match.stake or joiner_user.coins < old_match.stake:
+                    db.session.rollback()
+                    return None
+
+                # Deduct stakes from both players
+                creator_user.coins -= old_match.stake
+                joiner_user.coins -= old_match.stake
+
+                # Create new match
+                match_id = self.shards.new_match_id()
+                new_match = Match(match_id, old_match.creator, old_match.stake)
+                new_match.joiner = old_match.joiner
+                new_match.status = 'playing'  # Start in playing state
+                new_match.creator_ready = True
+                new_match.joiner_ready = True
+
+                # Update match and player states
+                self.matches[match_id] = new_match
+                self.players[old_match.creator].current_match = match_id
+                self.players[old_match.joiner].current_match = match_id
+
+                # Update in-memory state
+                self.players[old_match.creator].coins = creator_user.coins
+                self.players[old_match.joiner].coins = joiner_user.coins
+                balances = creator_user.coins, joiner_user.coins
+
+                # The deadline is stored with the stakes so a crash cannot strand them
+                self.deadlines.add(new_match, Config.MATCH_TIMEOUT)
+
+                # Commit transaction
+                db.session.commit()
 
-            # Update in-memory state
-            self.players[old_match.creator].coins = creator_user.coins
-            self.players[old_match.joiner].coins = joiner_user.coins
+            except Exception as e:
+                db.session.rollback()
+                return None
 
-            # Commit transaction
-            db.session.commit()
+            self.record_event('create', match_id, old_match.creator, amount=old_match.stake, balance=balances[0])
+            self.record_event('join', match_id, old_match.joiner, old_match.creator,
+                              amount=old_match.stake, balance=balances[1])
+            self.record_event('rematch', match_id, old_match.creator, old_match_id)
 
             # Start the match timer
             new_match.start_match()
@@ -211,53 +317,72 @@ class MatchService:
 
             return new_match
 
-        except Exception as e:
-            db.session.rollback()
-            return None
-
     def cancel_match(self, match_id):
-        """Cancel a match and refund the stake to the creator."""
-        try:
-            match = self.matches.get(match_id)
-            if not match or match.status != 'waiting':
+        """Cancel a waiting match and refund the stakes of the creator and, if set, the joiner."""
+        match = self.matches.get(match_id)
+        if not match:
+            return None
+        with match.lock:
+            if match.status != 'waiting':
                 return None
+            try:
+                # Start transaction
+                db.session.begin_nested()
+
+                # Get creator and joiner from database with row locking
+                balances = {}
+                for player_id in (match.creator, match.joiner):
+                    if player_id is None:
+                        continue
+                    user = User.query.filter_by(session_id=player_id).with_for_update().first()
+                    if not user:
+                        db.session.rollback()
+                        return None
+
+                    # Refund stake
+                    user.coins += match.stake
+                    balances[player_id] = user.coins
+
+                # Commit transaction
+                db.session.commit()
 
-            # Start transaction
-            db.session.begin_nested()
-
-            # Get creator from database with row locking
-            creator_user = User.query.filter_by(session_id=match.creator).with_for_update().first()
-            if not creator_user:
+            except Exception as e:
                 db.session.rollback()
                 return None
 
-            # Refund stake to creator
-            creator_user.coins += match.stake
-            
             # Update in-memory state
-            self.players[match.creator].coins = creator_user.coins
-
-            # Commit transaction
-            db.session.commit()
+            for player_id, balance in balances.items():
+                player = self.players.get(player_id)
+                if player:
+                    player.coins = balance
+                self.record_event('cancel', match_id, player_id, amount=match.stake, balance=balance)
 
             # Clean up the match
             self.cleanup_match(match_id)
             return True
 
-        except Exception as e:
-            db.session.rollback()
-            return None
+    def cancel_waiting(self):
+        """Cancel every waiting match, refunding its stakes. Returns the ids cancelled.
+
+        Waiting matches have no stored deadline, so a worker that drains
+        calls this; nothing else would refund them once it has exited.
+        """
+        return [match_id for match_id, match in list(self.matches.items())
+                if match.status == 'waiting' and self.cancel_match(match_id)]
 
     def cleanup_match(self, match_id):
         """Clean up match resources without handling refunds."""
-        if match_id in self.matches:
-            match = self.matches[match_id]
-            match.cancel_timer()
-            
-            # Clear current match reference from players
-            if match.creator in self.players:
-                self.players[match.creator].current_match = None
-            if match.joiner in self.players:
-                self.players[match.joiner].current_match = None
-            
-            del self.matches[match_id]
\ No newline at end of file
+        match = self.matches.get(match_id)
+        if match:
+            with match.lock:
+                match.cancel_timer()
+
+                # Clear current match reference from players, unless they have
+                # already moved on (a rematch is created before the old match is cleaned up)
+                for player_id in (match.creator, match.joiner):
+                    player = self.players.get(player_id)
+                    if player and player.current_match == match_id:
+                        player.current_match = None
+
+                self.matches.pop(match_id, None)
+                self.lobby_version += 1
\ No newline at end of file
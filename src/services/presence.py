@@ -0,0 +1,284 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import case, or_, select
+from ..models.database import db, User, PresenceSketch
+from ..utils.sql import dialect_insert
+
+logger = logging.getLogger('rps_game')
+
+
+def minute_name(now):
+    return f'minute:{now:%Y-%m-%dT%H:%M}'
+
+
+def day_name(now):
+    return f'day:{now:%Y-%m-%d}'
+
+
+class HyperLogLog:
+    """Approximate count of distinct values in ``2 ** precision`` one-byte registers.
+
+    The standard error is about ``1.04 / sqrt(2 ** precision)``: 1.6% in
+    4 KiB at the default precision, and small counts are close to exact.
+    ``merge`` turns a sketch into the sketch of the union of both sets.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers if registers is not None else self.size)
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode(), digest_size=8).digest()
+        value_hash = int.from_bytes(digest, 'big')
+        bits = 64 - self.precision
+        index = value_hash >> bits
+        # Position of the first 1 bit in the rest of the hash
+        rank = bits - (value_hash & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.size != self.size:
+            raise ValueError(f"Cannot merge a sketch of {other.size} registers into one of {self.size}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        empty = self.registers.count(0)
+        if empty and estimate <= 2.5 * size:
+            # Linear counting is the better estimate while registers are still empty
+            estimate = size * math.log(size / empty)
+        return round(estimate)
+
+
+class Presence:
+    """Who is around: ``users.last_seen`` plus online and daily-active counts.
+
+    ``touch`` records that a user did something, and ``connected`` /
+    ``disconnected`` follow their open sockets, all in memory. ``flush``
+    (every few seconds from ``run``, and on ``close``) then
+
+    - writes ``last_seen`` for every user touched since the last flush,
+      one UPDATE per ``batch_size`` users instead of one per request. A
+      row is only written when its ``last_seen`` moves forward;
+    - merges this worker's sketches of the users active each minute and
+      each UTC day into ``presence_sketches``, which all workers share.
+
+    A user is online while they were active in the last ``online_window``
+    seconds (rounded up to whole minutes) or have a socket open. ``online``
+    and ``daily_active`` estimate the counts over every worker from the
+    stored sketches and this worker's unflushed ones: exact counts would
+    mean keeping every user id seen today. Minute sketches are kept for an
+    hour and day sketches for ``keep_days``.
+    """
+
+    def __init__(self, app, batch_size=500, online_window=300, keep_days=35, precision=12,
+                 now=datetime.utcnow):
+        self.app = app
+        self.batch_size = batch_size
+        self.online_window = online_window
+        self.keep_days = keep_days
+        self.precision = precision
+        self.now = now
+        self.lock = threading.Lock()
+        self.seen = {}  # user id -> last activity not yet written
+        self.sketches = {}  # sketch name -> HyperLogLog not yet merged
+        self.marked = {}  # user id -> minute already in self.sketches
+        self.socket_users = {}  # Socket.IO sid -> user id
+        self.sockets = Counter()  # user id -> sockets open on this worker
+        self.sockets_marked = None  # minute the open sockets were last added for
+        self.pruned = None
+        self.stats = {'touches': 0, 'flushes': 0, 'statements': 0, 'rows': 0}
+
+    @classmethod
+    def from_config(cls, app):
+        config = app.config
+        return cls(app, config['PRESENCE_BATCH_SIZE'], config['PRESENCE_ONLINE_WINDOW'],
+                   config['PRESENCE_KEEP_DAYS'], config['PRESENCE_PRECISION'])
+
+    # Recording
+
+    def sketch(self, sketches, name):
+        if name not in sketches:
+            sketches[name] = HyperLogLog(self.precision)
+        return sketches[name]
+
+    def mark(self, sketches, user_id, now):
+        self.sketch(sketches, minute_name(now)).add(user_id)
+        self.sketch(sketches, day_name(now)).add(user_id)
+
+    def touch(self, user_id, now=None):
+        now = now or self.now()
+        minute = minute_name(now)
+        with self.lock:
+            self.stats['touches'] += 1
+            self.seen[user_id] = now
+            # Hashed once per user and minute, however many requests they make
+            if self.marked.get(user_id) != minute:
+                self.marked[user_id] = minute
+                self.mark(self.sketches, user_id, now)
+
+    def connected(self, sid, user_id, now=None):
+        self.touch(user_id, now)
+        with self.lock:
+            self.socket_users[sid] = user_id
+            self.sockets[user_id] += 1
+
+    def disconnected(self, sid, now=None):
+        with self.lock:
+            user_id = self.socket_users.pop(sid, None)
+            if user_id is None:
+                return
+            self.sockets[user_id] -= 1
+            if self.sockets[user_id] <= 0:
+                del self.sockets[user_id]
+        self.touch(user_id, now)
+
+    # Flushing
+
+    def flush(self, now=None):
+        """Write what was recorded since the last flush; returns the users whose ``last_seen`` moved."""
+        now = now or self.now()
+        with self.lock:
+            seen, self.seen = self.seen, {}
+            sketches, self.sketches = self.sketches, {}
+            self.marked = {}
+            # Open sockets keep their users online without any requests
+            if self.sockets_marked != minute_name(now):
+                self.sockets_marked = minute_name(now)
+                for user_id in self.sockets:
+                    self.mark(sketches, user_id, now)
+        try:
+            written = self.write_last_seen(seen)
+            self.merge_sketches(sketches, now)
+            self.prune(now)
+        except Exception:
+            db.session.rollback()
+            self.requeue(seen, sketches)
+            raise
+        self.stats['flushes'] += 1
+        return written
+
+    def requeue(self, seen, sketches):
+        """Put back what a failed flush took, to go out with the next one."""
+        with self.lock:
+            for user_id, at in seen.items():
+                self.seen[user_id] = max(at, self.seen.get(user_id, at))
+            for name, sketch in sketches.items():
+                self.sketch(self.sketches, name).merge(sketch)
+            self.sockets_marked = None
+
+    def write_last_seen(self, seen):
+        users = User.__table__
+        written = 0
+        # In id order, so two workers' batches lock rows in the same order
+        items = sorted(seen.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = dict(items[start:start + self.batch_size])
+            seen_at = case(batch, value=users.c.id)
+            result = db.session.execute(
+                users.update()
+                .where(users.c.id.in_(batch), or_(users.c.last_seen.is_(None), users.c.last_seen < seen_at))
+                .values(last_seen=seen_at))
+            db.session.commit()
+            written += result.rowcount
+            self.stats['statements'] += 1
+        self.stats['rows'] += written
+        return written
+
+    def merge_sketches(self, sketches, now):
+        table = PresenceSketch.__table__
+        # In name order, so concurrent flushes lock rows in the same order
+        for name in sorted(sketches):
+            sketch = sketches[name]
+            db.session.execute(dialect_insert(table).values(
+                name=name, registers=bytes(sketch.size), updated_at=now).on_conflict_do_nothing())
+            stored = db.session.execute(
+                select(table.c.registers).where(table.c.name == name).with_for_update()).scalar_one()
+            if len(stored) == sketch.size:  # else PRESENCE_PRECISION changed; start over
+                sketch.merge(HyperLogLog(self.precision, stored))
+            db.session.execute(table.update().where(table.c.name == name).values(
+                registers=bytes(sketch.registers), updated_at=now))
+            self.stats['statements'] += 3
+        db.session.commit()
+
+    def prune(self, now):
+        """Drop minute sketches over an hour old and day sketches past ``keep_days``, once a minute."""
+        if self.pruned == minute_name(now):
+            return
+        table = PresenceSketch.__table__
+        db.session.execute(table.delete().where(
+            or_(table.c.name.like('minute:%') & (table.c.name < minute_name(now - timedelta(hours=1))),
+                table.c.name.like('day:%') & (table.c.name < day_name(now - timedelta(days=self.keep_days))))))
+        db.session.commit()
+        self.pruned = minute_name(now)
+        self.stats['statements'] += 1
+
+    def run(self, interval, sleep=time.sleep):
+        while True:
+            sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Presence flush failed")
+            db.session.remove()
+
+    def close(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Final presence flush failed")
+            db.session.remove()
+
+    # Counting
+
+    def union(self, names, sockets=False):
+        """The sketch of everyone in the named sketches, stored or not yet flushed."""
+        union = HyperLogLog(self.precision)
+        table = PresenceSketch.__table__
+        for registers in db.session.execute(select(table.c.registers).where(table.c.name.in_(names))).scalars():
+            if len(registers) == union.size:
+                union.merge(HyperLogLog(self.precision, registers))
+        with self.lock:
+            for name in names:
+                if name in self.sketches:
+                    union.merge(self.sketches[name])
+            if sockets:
+                for user_id in self.sockets:
+                    union.add(user_id)
+        return union
+
+    def online(self, now=None):
+        now = now or self.now()
+        minutes = math.ceil(self.online_window / 60)
+        return self.union([minute_name(now - timedelta(minutes=i)) for i in range(minutes + 1)],
+                          sockets=True).count()
+
+    def daily_active(self, days=7, now=None):
+        """Estimated distinct active users per UTC day, newest first."""
+        now = now or self.now()
+        counts = []
+        for i in range(days):
+            day = now - timedelta(days=i)
+            counts.append({'day': f'{day:%Y-%m-%d}', 'users': self.union([day_name(day)]).count()})
+        return counts
+
+    def report(self, days=7):
+        with self.lock:
+            local = {'connected': len(self.sockets), 'pending': len(self.seen), **self.stats}
+        return {
+            'online': self.online(),
+            'online_window': self.online_window,
+            'daily_active': self.daily_active(days),
+            'worker': local,
+        }
@@ -0,0 +1,229 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from sqlalchemy import event
+
+logger = logging.getLogger('rps_game')
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+
+class QueryStats:
+    __slots__ = ('queries', 'db_time', 'lock_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.lock_time = 0.0  # in SELECT ... FOR UPDATE, i.e. waiting for row locks
+
+
+def call_site(frame):
+    """First frame in our own code, skipping SQLAlchemy and this module."""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SRC_DIR) and filename != __file__:
+            return f'{os.path.relpath(filename, ROOT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryProfiler:
+    """Per-request SQL statistics from SQLAlchemy engine events.
+
+    ``install`` hooks ``before/after_cursor_execute`` on the app's engines.
+    Between ``start_request`` and ``finish_request`` every statement on
+    the current thread (greenlet, under gevent) is counted and timed;
+    totals are kept per endpoint. Statements slower than
+    ``slow_query_ms`` are logged with the line of our code that ran them,
+    whether or not a request is being tracked.
+
+    ``start_sampling`` profiles a random ``rate`` of requests with cProfile
+    for a while; outside such a window a request pays one comparison.
+    """
+
+    def __init__(self, slow_query_ms=100.0, max_slow=200):
+        self.slow_query = slow_query_ms / 1000
+        self.local = threading.local()
+        self.endpoints = {}  # endpoint -> [requests, queries, db_time, lock_time, max_queries]
+        self.slow = deque(maxlen=max_slow)
+
+        self.sample_until = 0.0
+        self.sample_rate = 0.0
+        self.sample_lock = threading.Lock()  # one cProfile at a time
+        self.sampled = None
+        self.sampled_requests = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['SLOW_QUERY_MS'])
+
+    # Engine events
+
+    def install(self, engines):
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before)
+            event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._profiler_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._profiler_start
+        stats = getattr(self.local, 'stats', None)
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+            if ' FOR UPDATE' in statement:
+                stats.lock_time += elapsed
+        if elapsed >= self.slow_query:
+            self.record_slow(statement, elapsed, sys._getframe(1))
+
+    def record_slow(self, statement, elapsed, frame):
+        site = call_site(frame)
+        endpoint = getattr(self.local, 'endpoint', None)
+        self.slow.append({
+            'at': time.time(),
+            'ms': round(elapsed * 1000, 3),
+            'statement': statement[:2000],
+            'site': site,
+            'endpoint': endpoint,
+        })
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms) at {site}"
+                       f"{f' for {endpoint}' if endpoint else ''}: {' '.join(statement.split())[:500]}")
+
+    # Requests
+
+    def start_request(self, endpoint=None):
+        self.local.stats = QueryStats()
+        self.local.endpoint = endpoint
+        if self.sample_until and time.time() < self.sample_until and random.random() < self.sample_rate:
+            if self.sample_lock.acquire(blocking=False):
+                profile = cProfile.Profile()
+                self.local.profile = profile
+                profile.enable()
+
+    def finish_request(self):
+        """Stop tracking the current request and return its QueryStats."""
+        profile = getattr(self.local, 'profile', None)
+        if profile is not None:
+            profile.disable()
+            self.local.profile = None
+            self.sampled = pstats.Stats(profile) if self.sampled is None else self.sampled.add(profile)
+            self.sampled_requests += 1
+            self.sample_lock.release()
+
+        stats = getattr(self.local, 'stats', None)
+        endpoint = getattr(self.local, 'endpoint', None)
+        self.local.stats = self.local.endpoint = None
+        if stats is not None and endpoint:
+            totals = self.endpoints.get(endpoint)
+            if totals is None:
+                totals = self.endpoints[endpoint] = [0, 0, 0.0, 0.0, 0]
+            totals[0] += 1
+            totals[1] += stats.queries
+            totals[2] += stats.db_time
+            totals[3] += stats.lock_time
+            totals[4] = max(totals[4], stats.queries)
+        return stats
+
+    def report(self):
+        endpoints = {
+            name: {
+                'requests': requests,
+                'queries_per_request': round(queries / requests, 2),
+                'max_queries': max_queries,
+                'db_ms_per_request': round(db_time / requests * 1000, 3),
+                'lock_wait_ms_per_request': round(lock_time / requests * 1000, 3),
+            }
+            for name, (requests, queries, db_time, lock_time, max_queries) in self.endpoints.items()
+        }
+        return {'endpoints': endpoints, 'slow_queries': list(self.slow)}
+
+    def reset(self):
+        self.endpoints = {}
+        self.slow.clear()
+
+    # Sampled cProfile
+
+    def start_sampling(self, seconds, rate):
+        self.sampled = None
+        self.sampled_requests = 0
+        self.sample_rate = rate
+        self.sample_until = time.time() + seconds
+
+    def sampling_report(self, sort='cumulative', limit=50):
+        self.sample_until = 0.0
+        if self.sampled is None:
+            return 'No requests were sampled\n'
+        out = io.StringIO()
+        self.sampled.stream = out
+        out.write(f'{self.sampled_requests} sampled requests\n')
+        self.sampled.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+# Stack sampling
+
+def fold(frame):
+    names = []
+    while frame is not None:
+        names.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample(seconds, interval):
+    me = _native_ident()
+    counts = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident != me:
+                counts[fold(frame)] += 1
+        _native_sleep(interval)
+    return counts
+
+
+def _native_ident():
+    try:
+        from gevent import monkey
+        return monkey.get_original('_thread', 'get_ident')()
+    except ImportError:
+        return threading.get_ident()
+
+
+def _native_sleep(seconds):
+    try:
+        from gevent import monkey
+        return monkey.get_original('time', 'sleep')(seconds)
+    except ImportError:
+        return time.sleep(seconds)
+
+
+def sample_stacks(seconds=5.0, interval=0.005):
+    """Sample every thread's stack for ``seconds``; returns ``{folded_stack: samples}``.
+
+    The sampler runs on a native thread, so under gevent it sees whichever
+    greenlet holds the main thread. Output keys use the folded format
+    (``outer;inner``) understood by flamegraph tools.
+    """
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            import gevent
+            return gevent.get_hub().threadpool.apply(_sample, (seconds, interval))
+    except ImportError:
+        pass
+    result = []
+    thread = threading.Thread(target=lambda: result.append(_sample(seconds, interval)), daemon=True)
+    thread.start()
+    thread.join()
+    return result[0]
@@ -0,0 +1,155 @@
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+logger = logging.getLogger('rps_game')
+
+
+class MemoryBucketStore:
+    """Token buckets kept in process memory.
+
+    Buckets live in an ``OrderedDict`` of ``key -> (tokens, updated_at)``
+    tuples, least recently updated first. When the store grows past
+    ``max_keys`` the buckets idle the longest are dropped; a dropped bucket
+    comes back full, which is only wrong for a key that has not waited
+    ``burst / rate`` seconds since it was last used.
+    """
+
+    def __init__(self, max_keys=1000000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = Lock()
+
+    def consume(self, key, rate, burst, now, cost=1):
+        """Take ``cost`` tokens from a bucket. Returns (allowed, retry_after)."""
+        with self.lock:
+            state = self.buckets.get(key)
+            if state is None:
+                tokens = burst
+                if len(self.buckets) >= self.max_keys:
+                    self._evict()
+            else:
+                self.buckets.move_to_end(key)
+                tokens = state[0] + (now - state[1]) * rate
+                if tokens > burst:
+                    tokens = burst
+
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return True, 0.0
+
+            self.buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+    def _evict(self):
+        # Drop the least recently used tenth in one pass so eviction cost is amortized
+        for _ in range(min(len(self.buckets), max(1, self.max_keys // 10))):
+            self.buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+class RedisBucketStore:
+    """Token buckets shared between workers through Redis.
+
+    The refill-and-take step runs as a Lua script so concurrent workers see
+    a consistent bucket. Keys expire once a bucket would be full again.
+    """
+
+    SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local cost = tonumber(ARGV[4])
+    local tokens = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if tokens == nil then
+        tokens = burst
+    else
+        tokens = math.min(burst, tokens + (now - ts) * rate)
+    end
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry_after = (cost - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, client, prefix='rl:'):
+        self.client = client
+        self.prefix = prefix
+        self.script = client.register_script(self.SCRIPT)
+
+    @classmethod
+    def from_url(cls, url, prefix='rl:'):
+        import redis
+        return cls(redis.Redis.from_url(url), prefix)
+
+    def consume(self, key, rate, burst, now, cost=1):
+        allowed, retry_after = self.script(
+            keys=[self.prefix + key], args=[rate, burst, now, cost]
+        )
+        return bool(allowed), float(retry_after)
+
+
+class RateLimiter:
+    """Per-route token buckets keyed by session and by client IP.
+
+    ``limits`` maps a route or event name to a budget dict with
+    ``session_rate``/``session_burst`` and ``ip_rate``/``ip_burst``
+    (tokens per second and bucket size). Names without a budget are never
+    limited. Checks only look at the store, never at the database.
+    """
+
+    def __init__(self, store, limits, clock=time.monotonic):
+        self.store = store
+        self.limits = limits
+        self.clock = clock
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a limiter from an app config mapping."""
+        if config['RATE_LIMIT_STORE'] == 'redis':
+            store = RedisBucketStore.from_url(config['REDIS_URL'])
+            # Redis buckets are shared between processes, so they need wall time
+            clock = time.time
+        else:
+            store = MemoryBucketStore(config['RATE_LIMIT_MAX_KEYS'])
+            clock = time.monotonic
+        return cls(store, config['RATE_LIMITS'], clock)
+
+    def check(self, name, session_id=None, ip=None):
+        """Return (allowed, retry_after_seconds) for one hit on ``name``."""
+        budget = self.limits.get(name)
+        if budget is None:
+            return True, 0.0
+
+        now = self.clock()
+        try:
+            # IP first: a flood from one address is rejected before its
+            # sessions are even looked at
+            if ip:
+                allowed, retry_after = self.store.consume(
+                    f'{name}:ip:{ip}', budget['ip_rate'], budget['ip_burst'], now
+                )
+                if not allowed:
+                    return False, retry_after
+            if session_id:
+                allowed, retry_after = self.store.consume(
+                    f'{name}:s:{session_id}', budget['session_rate'], budget['session_burst'], now
+                )
+                if not allowed:
+                    return False, retry_after
+        except Exception:
+            # Never take the game down because the limiter store is unavailable
+            logger.exception(f"Rate limiter store failed for {name}, allowing request")
+        return True, 0.0
@@ -0,0 +1,84 @@
+import json
+
+MOVE_CODES = {'rock': 'r', 'paper': 'p', 'scissors': 's'}
+
+
+def stat_deltas(winner, stake):
+    """Changes one settled match makes to the creator's and joiner's stats.
+
+    ``total_games`` always grows by one and is left out; it is sent as the
+    version instead.
+    """
+    if winner == 'draw':
+        return {'draws': 1}, {'draws': 1}
+    won = {'wins': 1, 'total_coins_won': stake}
+    lost = {'losses': 1, 'total_coins_lost': stake}
+    return (won, lost) if winner == 'player1' else (lost, won)
+
+
+def match_result_payload(result):
+    """The ``match_result`` event for a result from ``GameService.calculate_match_result``.
+
+    Moves are one letter each (creator first), and each player's stats are
+    sent as a delta with ``v``, their ``total_games`` after the match. A
+    client whose own ``total_games`` is not ``v - 1`` has missed an update
+    and reloads /api/state instead of applying the delta.
+    """
+    creator, joiner = stat_deltas(result['winner'], result['stake'])
+    return {
+        'winner': result['winner'],
+        'moves': MOVE_CODES[result['creator_move']] + MOVE_CODES[result['joiner_move']],
+        'stake': result['stake'],
+        'can_rematch': result['can_rematch'],
+        'creator': dict(creator, v=result['creator_stats']['total_games']),
+        'joiner': dict(joiner, v=result['joiner_stats']['total_games'])
+    }
+
+
+class OrjsonModule:
+    """orjson behind the ``dumps``/``loads`` interface Socket.IO expects of a json module."""
+
+    def __init__(self, orjson):
+        self.orjson = orjson
+        self.loads = orjson.loads
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is already compact; stdlib options such as separators do not apply
+        return self.orjson.dumps(obj, option=self.orjson.OPT_NON_STR_KEYS).decode()
+
+
+def json_module():
+    """The JSON codec for Socket.IO packets: orjson when installed, the stdlib otherwise."""
+    try:
+        import orjson
+    except ImportError:
+        return json
+    return OrjsonModule(orjson)
+
+
+def socketio_options(config):
+    """Serializer options for ``SocketIO.init_app`` from ``SOCKETIO_SERIALIZER``."""
+    # Always explicit: Flask-SocketIO keeps options from earlier init_app calls.
+    # msgpack sends binary frames; python-socketio imports it when the server is built
+    serializer = 'msgpack' if config['SOCKETIO_SERIALIZER'] == 'msgpack' else 'default'
+    return {'serializer': serializer, 'json': json_module()}
+
+
+def enable_websocket_compression(eio):
+    """Serve ``eio``'s websockets with simple-websocket, which accepts permessage-deflate.
+
+    gevent-websocket, engine.io's default under gevent, cannot negotiate
+    compression. The server must then run without its ``WebSocketHandler``
+    (see ``src.server``), so the upgrade reaches engine.io untouched.
+    """
+    import gevent.event
+    import gevent.selectors
+    from engineio.async_drivers._websocket_wsgi import SimpleWebSocketWSGI
+    from engineio.async_drivers.gevent import Thread
+
+    class DeflateWebSocketWSGI(SimpleWebSocketWSGI):
+        def __init__(self, handler, server):
+            super().__init__(handler, server, thread_class=Thread, event_class=gevent.event.Event,
+                             selector_class=gevent.selectors.DefaultSelector)
+
+    eio._async = dict(eio._async, websocket=DeflateWebSocketWSGI)
@@ -0,0 +1,85 @@
+from collections import deque
+from sqlalchemy import func, select, union_all
+from ..models.database import db, User, GameHistory
+
+
+def display_name(user):
+    return user.username or user.telegram_username or user.telegram_first_name
+
+
+def result_entries(creator_user, joiner_user, creator_move, joiner_move, winner, stake, played_at):
+    """The creator's and the joiner's entries for one settled match."""
+    outcomes = {'draw': ('draw', 'draw'), 'player1': ('win', 'loss'), 'player2': ('loss', 'win')}[winner]
+    played_at = played_at.isoformat()
+    return (
+        {'played_at': played_at, 'stake': stake, 'move': creator_move, 'opponent_move': joiner_move,
+         'outcome': outcomes[0], 'opponent': display_name(joiner_user), 'opponent_id': joiner_user.id},
+        {'played_at': played_at, 'stake': stake, 'move': joiner_move, 'opponent_move': creator_move,
+         'outcome': outcomes[1], 'opponent': display_name(creator_user), 'opponent_id': creator_user.id}
+    )
+
+
+class RecentResults:
+    """The last ``size`` results of each cached player, newest first.
+
+    The buffer is a bounded deque on the ``Player`` (``player.recent``), so
+    it goes when the player is evicted from ``MatchService.players``. It is
+    loaded from ``game_history`` the first time it is read; after that
+    settlement pushes new results into it and reads never query.
+
+    With ``shared``, other workers also settle this player's matches (see
+    ``ShardRouter``) and cannot push into this buffer. The buffer then
+    records the player's ``total_games`` and is loaded again once the
+    ``users`` row shows games it has missed; that costs a read of the row.
+    """
+
+    def __init__(self, size=20):
+        self.size = size
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['RECENT_RESULTS'])
+
+    def get(self, player, shared=False):
+        if shared and player.recent is not None and player.recent_games != player.stats.total_games:
+            player.recent = None
+        if player.recent is None:
+            # Counted first: a game settled during the load only causes another load
+            games = player.stats.total_games if shared else None
+            player.recent = deque(self.load(player.user_id), maxlen=self.size)
+            player.recent_games = games
+        return list(player.recent)
+
+    def load(self, user_id):
+        """The newest ``size`` entries for ``user_id`` from the database, newest first."""
+        history = GameHistory.__table__
+        users = User.__table__
+
+        def seat(mine, theirs, my_move, their_move):
+            # One index range scan per seat, on (player1_id, played_at) or (player2_id, played_at)
+            return (select(history.c.id, history.c.played_at, history.c.bet_amount, history.c.winner_id,
+                           my_move.label('move'), their_move.label('opponent_move'), theirs.label('opponent_id'))
+                    .where(mine == user_id)
+                    .order_by(history.c.played_at.desc(), history.c.id.desc())
+                    .limit(self.size)
+                    .subquery())
+
+        seats = [seat(history.c.player1_id, history.c.player2_id, history.c.player1_choice, history.c.player2_choice),
+                 seat(history.c.player2_id, history.c.player1_id, history.c.player2_choice, history.c.player1_choice)]
+        games = union_all(*(select(s) for s in seats)).subquery()
+        rows = db.session.execute(
+            select(games, func.coalesce(users.c.username, users.c.telegram_username,
+                                        users.c.telegram_first_name).label('opponent'))
+            .join(users, users.c.id == games.c.opponent_id)
+            .order_by(games.c.played_at.desc(), games.c.id.desc())
+            .limit(self.size)
+        )
+        return [{
+            'played_at': row.played_at.isoformat() if row.played_at else None,
+            'stake': row.bet_amount,
+            'move': row.move,
+            'opponent_move': row.opponent_move,
+            'outcome': 'draw' if row.winner_id is None else 'win' if row.winner_id == user_id else 'loss',
+            'opponent': row.opponent,
+            'opponent_id': row.opponent_id
+        } for row in rows]
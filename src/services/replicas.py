@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
+
+logger = logging.getLogger('rps_game')
+
+# The lag is zero while the standby has replayed everything it received, so
+# an idle primary does not read as lag. That only holds while it is still
+# receiving: a standby whose WAL receiver stopped has replayed all it got and
+# would read as current however far behind it falls.
+PG_LAG_QUERY = text(
+    "SELECT pg_is_in_recovery() AS standby, "
+    "EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') AS streaming, "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END AS lag"
+)
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class ReplicaRouter:
+    """Sends read-only queries to a replica engine when it is fresh enough.
+
+    ``reading`` routes the session's reads to the engine chosen by
+    ``engine_for``: the replica, unless
+
+    - there is no replica, or its lag is unknown or over ``max_lag`` seconds;
+    - the caller wrote less than ``max(sticky, lag)`` seconds ago, so a
+      player reads their own writes back from the primary.
+
+    Lag is measured on the replica at most every ``lag_check_interval``
+    seconds (Postgres standbys only; other databases report none). A
+    standby that is not streaming from the primary has unknown lag. ``install``
+    watches the primary for writes; ``take_write`` tells the request that
+    made one, which keeps the time in its session.
+
+    Only reads whose results are not written back should be routed; the
+    rows they load may be up to ``max_lag`` seconds old.
+
+    The replica engine is the router's own rather than a Flask-SQLAlchemy
+    bind, so ``create_all`` and migrations never touch it.
+    """
+
+    def __init__(self, primary, replica=None, sticky=5.0, max_lag=10.0, lag_check_interval=1.0,
+                 clock=time.time):
+        self.primary = primary
+        self.replica = replica
+        self.sticky = sticky
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.clock = clock  # wall clock: write times travel in the session to other workers
+        self.lock = threading.Lock()
+        self.replica_lag = None
+        self.lag_checked_at = None
+        self.routed = {'replica': 0, 'primary': 0}
+        self.local = threading.local()
+
+    @classmethod
+    def from_config(cls, config, primary):
+        replica = None
+        if config.get('REPLICA_DATABASE_URL'):
+            replica = create_engine(config['REPLICA_DATABASE_URL'], **config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        return cls(primary, replica, config['REPLICA_STICKY_SECONDS'],
+                   config['REPLICA_MAX_LAG'], config['REPLICA_LAG_CHECK_INTERVAL'])
+
+    # Writes
+
+    def install(self):
+        @event.listens_for(self.primary, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip()[:6].upper() in WRITE_STATEMENTS:
+                self.local.wrote = True
+
+    def take_write(self):
+        """Whether this greenlet wrote to the primary since the last call."""
+        wrote = getattr(self.local, 'wrote', False)
+        self.local.wrote = False
+        return wrote
+
+    # Lag
+
+    def lag(self):
+        """Seconds the replica is behind, or None when it cannot be measured."""
+        with self.lock:
+            now = self.clock()
+            if self.lag_checked_at is not None and now - self.lag_checked_at < self.lag_check_interval:
+                return self.replica_lag
+            self.lag_checked_at = now
+        lag = self.measure_lag()
+        self.replica_lag = lag
+        return lag
+
+    def measure_lag(self):
+        if self.replica.dialect.name != 'postgresql':
+            return 0.0
+        try:
+            with self.replica.connect() as connection:
+                row = connection.execute(PG_LAG_QUERY).one()
+        except Exception as e:
+            logger.warning(f"Could not measure replica lag, reading from the primary: {e}")
+            return None
+        if not row.standby:
+            return 0.0
+        if not row.streaming:
+            logger.warning("Replica is not streaming WAL from the primary, reading from the primary")
+            return None
+        return max(float(row.lag or 0), 0.0)
+
+    # Routing
+
+    def engine_for(self, *wrote_at):
+        """The engine for reads by a caller that last wrote at the latest of ``wrote_at``."""
+        engine = self.primary
+        if self.replica is not None:
+            lag = self.lag()
+            last_write = max((t for t in wrote_at if t is not None), default=None)
+            if lag is not None and lag <= self.max_lag and (
+                    last_write is None or self.clock() - last_write >= max(self.sticky, lag)):
+                engine = self.replica
+        self.routed['replica' if engine is self.replica else 'primary'] += 1
+        return engine
+
+    @contextmanager
+    def reading(self, session, *wrote_at):
+        """Route ``session``'s reads to ``engine_for(*wrote_at)`` inside the block."""
+        engine = self.engine_for(*wrote_at)
+        if engine is self.primary:
+            yield engine
+            return
+        previous = session.info.get('read_engine')
+        session.info['read_engine'] = engine
+        try:
+            yield engine
+        finally:
+            session.info['read_engine'] = previous
+
+    def close(self):
+        if self.replica is not None:
+            self.replica.dispose()
+
+    def report(self):
+        return {
+            'replica': self.replica is not None,
+            'lag': self.replica_lag,
+            'routed': dict(self.routed),
+        }
@@ -0,0 +1,281 @@
+import csv
+import gzip
+import logging
+import os
+import re
+from datetime import datetime
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from ..models.database import db, GameHistory, RollupWatermark
+from .rollup_service import WATERMARK, ARCHIVED
+
+logger = logging.getLogger('rps_game')
+
+ARCHIVE_COLUMNS = ['id', 'player1_id', 'player2_id', 'player1_choice', 'player2_choice',
+                   'winner_id', 'played_at', 'bet_amount']
+PARTITION_NAME = re.compile(r'^game_history_(\d{4})_(\d{2})$')
+
+
+def add_months(month, months):
+    """The first of the month ``months`` after ``month`` (a date or datetime)."""
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1, day=1)
+
+
+def partition_name(month):
+    return f'game_history_{month:%Y_%m}'
+
+
+class HistoryRetention:
+    """Archives ``game_history`` months older than ``keep_months`` and removes them.
+
+    Each month goes to ``archive_dir/game_history_YYYY_MM.csv.gz`` (the raw
+    columns, header first) before any of its rows are removed. Months not
+    yet folded into the rollups are left alone until ``flask rollups update``
+    has seen them. The highest id archived is kept as the ``history_archived``
+    watermark, so the rollup and pair backfills know they would miss rows.
+
+    On Postgres with the table partitioned by month (migration
+    ``history_partitions``), an old month's partition is detached, archived
+    and dropped: nothing is deleted row by row, so vacuum has no dead
+    tuples to clean up and the WAL barely grows. A partition detached by a
+    run that was interrupted is finished by the next one. ``ensure_partitions``
+    creates the partitions up to ``months_ahead`` past the current month;
+    rows for a month that had none wait in ``game_history_default`` and
+    move into its partition when it is created. DDL waits at most
+    ``lock_timeout`` seconds for its lock, and a month that times out is
+    retried on the next run.
+
+    Elsewhere (SQLite, or Postgres before the migration) a month's rows
+    are archived and then deleted in batches of ``batch_size`` ids, one
+    transaction each. If a run is interrupted, the next one archives the
+    rows still left to a new part file.
+    """
+
+    def __init__(self, archive_dir, keep_months=12, months_ahead=3, batch_size=10000, lock_timeout=2.0,
+                 now=datetime.utcnow):
+        self.archive_dir = archive_dir
+        self.keep_months = keep_months
+        self.months_ahead = months_ahead
+        self.batch_size = batch_size
+        self.lock_timeout = lock_timeout
+        self.now = now
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['HISTORY_ARCHIVE_DIR'], config['HISTORY_RETENTION_MONTHS'],
+                   config['HISTORY_PARTITIONS_AHEAD'], config['HISTORY_RETENTION_BATCH'])
+
+    def this_month(self):
+        return self.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    def cutoff(self):
+        """Months before this one are archived."""
+        return add_months(self.this_month(), -self.keep_months)
+
+    def run(self, dry_run=False):
+        """Archive and remove every month before the cutoff; returns a dict per month."""
+        if not dry_run:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        if self.partitioned():
+            if not dry_run:
+                self.ensure_partitions()
+            return self.drop_partitions(dry_run)
+        return self.delete_months(dry_run)
+
+    def folded_through(self):
+        """The highest id folded into the rollups, or None when they are not kept."""
+        watermark = db.session.get(RollupWatermark, WATERMARK)
+        return watermark.last_id if watermark else None
+
+    def not_folded(self, max_id):
+        folded = self.folded_through()
+        return folded is not None and max_id is not None and max_id > folded
+
+    def record_archived(self, last_id):
+        """Note the highest id archived so far; backfills starting below it refuse to run."""
+        if last_id is None:
+            return
+        watermark = db.session.get(RollupWatermark, ARCHIVED) or RollupWatermark(name=ARCHIVED, last_id=0)
+        watermark.last_id = max(watermark.last_id or 0, last_id)
+        db.session.add(watermark)
+
+    # Partitions (Postgres)
+
+    def partitioned(self):
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        kind = db.session.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass('game_history')")).scalar()
+        return kind == 'p'
+
+    def partition_tables(self):
+        """{month: attached} for every game_history_YYYY_MM table, attached or left detached."""
+        rows = db.session.execute(text(r"""
+            SELECT c.relname, i.inhrelid IS NOT NULL
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'game_history'::regclass
+            WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace
+              AND c.relname ~ '^game_history_\d{4}_\d{2}$'
+        """))
+        tables = {}
+        for name, attached in rows:
+            year, month = PARTITION_NAME.match(name).groups()
+            tables[datetime(int(year), int(month), 1)] = attached
+        return tables
+
+    def set_lock_timeout(self):
+        db.session.execute(text(f"SET LOCAL lock_timeout = '{int(self.lock_timeout * 1000)}ms'"))
+
+    def ensure_partitions(self):
+        """Create the monthly partitions up to ``months_ahead`` past this one; returns their names."""
+        existing = self.partition_tables()
+        created = []
+        for ahead in range(self.months_ahead + 1):
+            month = add_months(self.this_month(), ahead)
+            if month in existing:
+                continue
+            name, end = partition_name(month), add_months(month, 1)
+            try:
+                self.set_lock_timeout()
+                db.session.execute(text(
+                    f"CREATE TABLE {name} (LIKE game_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+                db.session.execute(text(f"""
+                    WITH moved AS (
+                        DELETE FROM game_history_default WHERE played_at >= :start AND played_at < :end
+                        RETURNING *
+                    )
+                    INSERT INTO {name} SELECT * FROM moved
+                """), {'start': month, 'end': end})
+                db.session.execute(text(
+                    f"ALTER TABLE game_history ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{end}')"))
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                logger.warning(f"Could not create partition {name}, will retry: {e}")
+                continue
+            logger.info(f"Created partition {name}")
+            created.append(name)
+        return created
+
+    def drop_partitions(self, dry_run):
+        done = []
+        for month, attached in sorted(self.partition_tables().items()):
+            if month >= self.cutoff():
+                break
+            name = partition_name(month)
+            max_id = db.session.execute(text(f"SELECT max(id) FROM {name}")).scalar()
+            if self.not_folded(max_id):
+                logger.warning(f"Keeping {name}: rows up to id {max_id} are not in the rollups yet")
+                continue
+            if dry_run:
+                rows = db.session.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+                done.append({'month': f'{month:%Y-%m}', 'rows': rows, 'path': None})
+                continue
+            db.session.commit()
+
+            if attached:
+                try:
+                    # Takes a brief exclusive lock on game_history (CONCURRENTLY
+                    # is not allowed while it has a default partition)
+                    self.set_lock_timeout()
+                    db.session.execute(text(f"ALTER TABLE game_history DETACH PARTITION {name}"))
+                    db.session.commit()
+                except OperationalError as e:
+                    db.session.rollback()
+                    logger.warning(f"Could not detach {name}, will retry: {e}")
+                    continue
+
+            path = self.archive_path(month)
+            rows, last_id = self.archive(path, text(f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {name} ORDER BY id"))
+            self.record_archived(last_id)
+            db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+            logger.info(f"Archived {rows} rows of {name} to {path} and dropped it")
+            done.append({'month': f'{month:%Y-%m}', 'rows': rows, 'path': path})
+        db.session.commit()
+        return done
+
+    # Plain table
+
+    def delete_months(self, dry_run):
+        history = GameHistory.__table__
+        oldest = db.session.query(func.min(history.c.played_at)).scalar()
+        months = []
+        if oldest is not None:
+            month = oldest.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            while month < self.cutoff():
+                months.append(month)
+                month = add_months(month, 1)
+
+        done = []
+        for month in months:
+            in_month = (history.c.played_at >= month) & (history.c.played_at < add_months(month, 1))
+            rows, max_id = db.session.execute(
+                select(func.count(), func.max(history.c.id)).where(in_month)).one()
+            month_name = f'{month:%Y-%m}'
+            if not rows:
+                continue
+            if self.not_folded(max_id):
+                logger.warning(f"Keeping game_history for {month_name}: rows up to id {max_id} "
+                               f"are not in the rollups yet")
+                continue
+            if dry_run:
+                done.append({'month': month_name, 'rows': rows, 'path': None})
+                continue
+            db.session.commit()
+
+            path = self.archive_path(month, new_part=True)
+            query = select(*(history.c[column] for column in ARCHIVE_COLUMNS)).where(in_month).order_by(history.c.id)
+            rows, last_id = self.archive(path, query)
+            self.record_archived(last_id)
+            db.session.commit()
+            # Only what was archived, should a late row have arrived meanwhile
+            deleted = self.delete_batches(in_month & (history.c.id <= last_id))
+            logger.info(f"Archived {rows} game_history rows of {month_name} to {path} and deleted {deleted}")
+            done.append({'month': month_name, 'rows': rows, 'path': path})
+        db.session.commit()
+        return done
+
+    def delete_batches(self, condition):
+        history = GameHistory.__table__
+        deleted = 0
+        while True:
+            batch = select(history.c.id).where(condition).order_by(history.c.id).limit(self.batch_size)
+            count = db.session.execute(history.delete().where(history.c.id.in_(batch))).rowcount
+            db.session.commit()
+            deleted += count
+            if count < self.batch_size:
+                return deleted
+
+    # Archive files
+
+    def archive_path(self, month, new_part=False):
+        """``game_history_YYYY_MM.csv.gz``, or with ``new_part`` the first of ``.1``, ``.2``... not taken."""
+        base = os.path.join(self.archive_dir, partition_name(month))
+        path, part = f'{base}.csv.gz', 0
+        while new_part and os.path.exists(path):
+            part += 1
+            path = f'{base}.{part}.csv.gz'
+        return path
+
+    def archive(self, path, query):
+        """Write the rows of ``query`` to ``path`` as gzipped CSV; returns (rows, last id).
+
+        Written to a temporary file, synced and renamed, so ``path`` is
+        complete once it exists.
+        """
+        rows, last_id = 0, None
+        partial = f'{path}.partial'
+        with db.engine.connect() as conn, gzip.open(partial, 'wt', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(ARCHIVE_COLUMNS)
+            result = conn.execution_options(stream_results=True, max_row_buffer=self.batch_size).execute(query)
+            for chunk in result.partitions(self.batch_size):
+                writer.writerows(chunk)
+                rows += len(chunk)
+                last_id = chunk[-1][0]
+        with open(partial, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+        return rows, last_id
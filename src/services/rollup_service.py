@@ -0,0 +1,315 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, union, update, bindparam
+from ..models.database import (
+    db, GameHistory, HistoryRollup, StakeRollup, RollupWatermark, RollupPlayer
+)
+from ..utils.sql import dialect_insert, truncate_time, as_datetime
+from .export_service import settled_id
+
+PERIODS = ('hour', 'day')
+WATERMARK = 'game_history'
+BACKFILL_PREFIX = 'backfill:'
+# Present from the start of a backfill until it has finished, even if it was interrupted
+BACKFILL_RUNNING = 'backfill_running'
+# Highest history id archived and removed by HistoryRetention
+ARCHIVED = 'history_archived'
+
+
+def archived_through():
+    """The highest game_history id retention has archived, or None if it never has."""
+    watermark = db.session.get(RollupWatermark, ARCHIVED)
+    return watermark.last_id if watermark else None
+
+
+def lock_marker(name, start):
+    """Backfill chunk marker ``name``, created at ``start`` if missing, locked until the transaction ends.
+
+    A second backfill folding the same chunk waits here, then finds how far the first one got.
+    """
+    db.session.execute(dialect_insert(RollupWatermark.__table__).values(name=name, last_id=start)
+                       .on_conflict_do_nothing())
+    return RollupWatermark.query.filter_by(name=name).with_for_update().populate_existing().one()
+
+
+def refuse_archived(what, start, kept_only):
+    """Raise RuntimeError if ``what``, counting history above ``start``, would miss archived rows."""
+    archived = archived_through()
+    if not kept_only and archived is not None and start < archived:
+        db.session.rollback()
+        raise RuntimeError(f"game_history up to id {archived} has been archived, so {what} would only "
+                           f"count the months still kept; pass --kept-only to go ahead")
+
+
+class RollupService:
+    """Keeps hourly/daily aggregates of game_history up to date.
+
+    New history rows are folded in additively: each batch of ids above the
+    watermark is grouped in SQL and added to the rollup rows with an upsert,
+    in the same transaction that advances the watermark. Distinct players
+    are tracked through ``rollup_players`` so they stay exact without
+    rescanning a bucket. Dashboards read only the rollup tables.
+
+    The watermark only moves up to ``settled_id``, so a settlement that
+    commits a lower id after a fold is not skipped; ``HistoryRetention``
+    relies on that before it removes a month. ``update`` and ``backfill``
+    both take the watermark row lock, and ``update`` refuses to run from
+    the start of a backfill until it has finished.
+    """
+
+    def __init__(self, batch_size=100000, settle_seconds=60):
+        self.batch_size = batch_size
+        self.settle_seconds = settle_seconds
+
+    # Folding
+
+    def fold(self, lo_id, hi_id):
+        """Add history rows with ``lo_id < id <= hi_id`` to the rollups.
+
+        Returns (rows folded, {(period, bucket_start)} touched). Does not commit.
+        """
+        history = GameHistory.__table__
+        in_range = (history.c.id > lo_id) & (history.c.id <= hi_id)
+        touched = set()
+        folded = 0
+
+        for period in PERIODS:
+            bucket = truncate_time(history.c.played_at, period).label('bucket')
+            rows = db.session.execute(
+                select(
+                    bucket,
+                    func.count(),
+                    func.coalesce(func.sum(history.c.bet_amount), 0),
+                    func.sum(case((history.c.winner_id == history.c.player1_id, 1), else_=0)),
+                    func.sum(case((history.c.winner_id == history.c.player2_id, 1), else_=0)),
+                    func.sum(case((history.c.winner_id.is_(None), 1), else_=0)),
+                ).where(in_range).group_by(bucket)
+            ).all()
+            if not rows:
+                return 0, touched
+
+            self._add_counts([{
+                'period': period,
+                'bucket_start': as_datetime(row[0]),
+                'games': row[1],
+                'total_stake': row[2],
+                'creator_wins': row[3],
+                'joiner_wins': row[4],
+                'draws': row[5],
+                'distinct_players': 0
+            } for row in rows])
+            touched.update((period, as_datetime(row[0])) for row in rows)
+            if period == 'hour':
+                folded = sum(row[1] for row in rows)
+
+            players = union(
+                select(bucket, history.c.player1_id).where(in_range),
+                select(bucket, history.c.player2_id).where(in_range),
+            )
+            pairs = [
+                {'period': period, 'bucket_start': as_datetime(b), 'user_id': user_id}
+                for b, user_id in db.session.execute(players)
+            ]
+            db.session.execute(dialect_insert(RollupPlayer.__table__).on_conflict_do_nothing(), pairs)
+
+        day = truncate_time(history.c.played_at, 'day').label('day')
+        stake_rows = db.session.execute(
+            select(
+                day,
+                history.c.bet_amount,
+                func.count(),
+                func.sum(case((history.c.winner_id.is_(None), 1), else_=0)),
+            ).where(in_range).group_by(day, history.c.bet_amount)
+        ).all()
+        table = StakeRollup.__table__
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['day', 'bet_amount'],
+            set_={'games': table.c.games + stmt.excluded.games,
+                  'draws': table.c.draws + stmt.excluded.draws}
+        )
+        db.session.execute(stmt, [
+            {'day': as_datetime(row[0]), 'bet_amount': row[1] or 0, 'games': row[2], 'draws': row[3]}
+            for row in stake_rows
+        ])
+        return folded, touched
+
+    def _add_counts(self, rows):
+        table = HistoryRollup.__table__
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['period', 'bucket_start'],
+            set_={column: table.c[column] + stmt.excluded[column]
+                  for column in ('games', 'total_stake', 'creator_wins', 'joiner_wins', 'draws')}
+        )
+        db.session.execute(stmt, rows)
+
+    def refresh_distinct(self, touched):
+        """Recount distinct players for the given (period, bucket_start) keys."""
+        for period in PERIODS:
+            buckets = sorted(b for p, b in touched if p == period)
+            for i in range(0, len(buckets), 500):
+                chunk = buckets[i:i + 500]
+                counts = db.session.execute(
+                    select(RollupPlayer.bucket_start, func.count())
+                    .where(RollupPlayer.period == period, RollupPlayer.bucket_start.in_(chunk))
+                    .group_by(RollupPlayer.bucket_start)
+                ).all()
+                table = HistoryRollup.__table__
+                db.session.execute(
+                    update(table)
+                    .where(table.c.period == bindparam('p'), table.c.bucket_start == bindparam('b'))
+                    .values(distinct_players=bindparam('n')),
+                    [{'p': period, 'b': as_datetime(b), 'n': n} for b, n in counts]
+                )
+
+    # Incremental updates and backfill
+
+    def get_watermark(self, lock=False):
+        query = RollupWatermark.query.filter_by(name=WATERMARK)
+        if lock:
+            query = query.with_for_update()
+        watermark = query.first()
+        if not watermark:
+            watermark = RollupWatermark(name=WATERMARK, last_id=0)
+            db.session.add(watermark)
+            db.session.flush()
+        return watermark
+
+    def settled_id(self):
+        return settled_id(db.session, self.settle_seconds) or 0
+
+    def backfilling(self):
+        return db.session.get(RollupWatermark, BACKFILL_RUNNING) is not None
+
+    def update(self):
+        """Fold every settled history row above the watermark, one id batch per transaction."""
+        total = 0
+        while True:
+            watermark = self.get_watermark(lock=True)
+            if self.backfilling():
+                db.session.commit()
+                raise RuntimeError("A rollup backfill is running or was interrupted; "
+                                   "let `flask rollups backfill` finish first")
+            end = min(self.settled_id(), watermark.last_id + self.batch_size)
+            if end <= watermark.last_id:
+                db.session.commit()
+                return total
+            folded, touched = self.fold(watermark.last_id, end)
+            self.refresh_distinct(touched)
+            watermark.last_id = end
+            db.session.commit()
+            total += folded
+
+    def backfill(self, app, workers=4, chunk_size=1000000, rebuild=False, kept_only=False):
+        """Fold everything above the watermark in parallel id chunks.
+
+        Each chunk commits together with a marker row, so an interrupted
+        backfill resumes by skipping finished chunks; it folds up to where
+        the interrupted run meant to. A chunk's marker is locked while it is
+        folded, so backfills run side by side fold each chunk once. Returns
+        rows folded.
+
+        A rebuild after retention archived part of the history raises
+        RuntimeError, unless ``kept_only`` accepts rollups of the kept
+        months only.
+        """
+        return self.run_backfill(app, self.plan_backfill(app, chunk_size, rebuild, kept_only), workers)
+
+    def plan_backfill(self, app, chunk_size=1000000, rebuild=False, kept_only=False):
+        """Start (or resume) a backfill; returns (start, max_id, chunks) for ``run_backfill``."""
+        with app.app_context():
+            # Waits for an update batch in flight; later ones see the running marker
+            watermark = self.get_watermark(lock=True)
+            refuse_archived('the backfill', 0 if rebuild else watermark.last_id, kept_only)
+            if rebuild:
+                self.clear(commit=False)
+            start = watermark.last_id
+            running = db.session.get(RollupWatermark, BACKFILL_RUNNING)
+            if running is None:
+                running = RollupWatermark(name=BACKFILL_RUNNING, last_id=self.settled_id())
+                db.session.add(running)
+            max_id = running.last_id
+            # Marker name holds the chunk start, last_id how far it got
+            done = {
+                int(row.name[len(BACKFILL_PREFIX):]): row.last_id
+                for row in RollupWatermark.query.filter(RollupWatermark.name.startswith(BACKFILL_PREFIX))
+            }
+            db.session.commit()
+
+        chunks = [(lo, min(lo + chunk_size, max_id)) for lo in range(start, max_id, chunk_size)
+                  if done.get(lo, lo) < min(lo + chunk_size, max_id)]
+        return start, max_id, chunks
+
+    def run_backfill(self, app, plan, workers=4):
+        start, max_id, chunks = plan
+
+        def run(chunk):
+            lo, hi = chunk
+            with app.app_context():
+                marker = lock_marker(f'{BACKFILL_PREFIX}{lo}', lo)
+                # Folded by another backfill since the plan, or that one finished and moved the watermark
+                if marker.last_id >= hi or self.get_watermark().last_id >= hi:
+                    db.session.commit()
+                    return 0
+                folded, _ = self.fold(marker.last_id, hi)
+                marker.last_id = hi
+                db.session.commit()
+                return folded
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            total = sum(pool.map(run, chunks))
+
+        with app.app_context():
+            # Chunks from an interrupted earlier run count too, so recount every bucket
+            self.refresh_distinct({(r.period, r.bucket_start) for r in HistoryRollup.query.all()})
+            self.get_watermark(lock=True).last_id = max(start, max_id)
+            RollupWatermark.query.filter(RollupWatermark.name.startswith(BACKFILL_PREFIX)
+                                         | (RollupWatermark.name == BACKFILL_RUNNING)).delete(
+                synchronize_session=False)
+            db.session.commit()
+        return total
+
+    def clear(self, commit=True):
+        for model in (HistoryRollup, StakeRollup, RollupPlayer):
+            model.query.delete()
+        # Other history consumers keep their watermarks in the same table
+        RollupWatermark.query.filter(RollupWatermark.name.startswith(BACKFILL_PREFIX)
+                                     | (RollupWatermark.name == BACKFILL_RUNNING)).delete(
+            synchronize_session=False)
+        self.get_watermark().last_id = 0
+        if commit:
+            db.session.commit()
+
+    # Dashboard queries (rollup tables only)
+
+    def series(self, period, since):
+        return (HistoryRollup.query
+                .filter(HistoryRollup.period == period, HistoryRollup.bucket_start >= since)
+                .order_by(HistoryRollup.bucket_start)
+                .all())
+
+    def draw_rate_by_stake(self, since):
+        rows = (db.session.query(StakeRollup.bet_amount, func.sum(StakeRollup.games), func.sum(StakeRollup.draws))
+                .filter(StakeRollup.day >= since)
+                .group_by(StakeRollup.bet_amount)
+                .order_by(StakeRollup.bet_amount)
+                .all())
+        return [{
+            'bet_amount': stake,
+            'games': games,
+            'draws': draws,
+            'draw_rate': draws / games if games else 0.0
+        } for stake, games, draws in rows]
+
+
+def floor_time(value, period):
+    if period == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def since(period, count, now=None):
+    """Start of the bucket ``count - 1`` periods before the current one."""
+    step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+    return floor_time(now or datetime.utcnow(), period) - step * (count - 1)
@@ -0,0 +1,140 @@
+import json
+import secrets
+import time
+from collections import OrderedDict
+from threading import Lock
+from flask.sessions import SecureCookieSession, SessionInterface
+
+
+class MemorySessionStore:
+    """Session data in process memory, for a single worker.
+
+    Entries expire ``ttl`` seconds after their last use. Past
+    ``max_entries`` the least recently used sessions are dropped, so the
+    store is bounded however many clients come and go.
+    """
+
+    def __init__(self, ttl, max_entries=100000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()  # sid -> (data, expires_at), least recently used first
+        self.lock = Lock()
+
+    def get(self, sid):
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is None:
+                return None
+            now = self.clock()
+            if entry[1] <= now:
+                del self.entries[sid]
+                return None
+            self.entries[sid] = (entry[0], now + self.ttl)
+            self.entries.move_to_end(sid)
+            return dict(entry[0])
+
+    def set(self, sid, data):
+        with self.lock:
+            self.entries[sid] = (dict(data), self.clock() + self.ttl)
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class RedisSessionStore:
+    """Session data shared between workers through Redis, as JSON.
+
+    Reads use GETEX so every use pushes the expiry back by ``ttl``; Redis
+    evicts whatever is left over.
+    """
+
+    def __init__(self, client, ttl, prefix='session:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, ttl, prefix='session:'):
+        import redis
+        return cls(redis.Redis.from_url(url), ttl, prefix)
+
+    def get(self, sid):
+        raw = self.client.getex(self.prefix + sid, ex=int(self.ttl))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, sid, data):
+        self.client.set(self.prefix + sid, json.dumps(data, separators=(',', ':')), ex=int(self.ttl))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSession(SecureCookieSession):
+    """A session whose data lives in a store; the cookie only holds ``sid``."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        super().__init__(initial)
+        self.sid = sid
+        self.new = new
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data server-side in ``store``, keyed by a random cookie value.
+
+    The cookie is an unguessable 256-bit id, so it needs no signature. The
+    store is written only when the session changed; reading it already
+    extends its lifetime.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @classmethod
+    def from_config(cls, config):
+        ttl = config['PERMANENT_SESSION_LIFETIME'].total_seconds()
+        if config['SESSION_STORE'] == 'redis':
+            store = RedisSessionStore.from_url(config['REDIS_URL'], ttl)
+        else:
+            store = MemorySessionStore(ttl, config['SESSION_MAX_ENTRIES'])
+        return cls(store)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+        return ServerSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            self.store.set(session.sid, dict(session))
+        if session.new or session.modified:
+            response.set_cookie(
+                name, session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
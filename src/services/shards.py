@@ -0,0 +1,161 @@
+import http.client
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+import zlib
+
+logger = logging.getLogger('rps_game')
+
+# Set in the WSGI environ of requests that arrived over a shard socket
+FORWARDED = 'rps.forwarded'
+
+# Not copied between the client's connection and the shard socket's
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'host', 'upgrade'}
+
+
+def shard_of(match_id, shards):
+    return zlib.crc32(str(match_id).encode()) % shards
+
+
+def socket_path(socket_dir, shard):
+    return os.path.join(socket_dir, f'shard-{shard}.sock')
+
+
+class NullShardRouter:
+    """Stands in for the router when one process holds every match."""
+
+    shard = 0
+    shards = 1
+
+    def new_match_id(self):
+        return secrets.token_hex(4)
+
+    def is_local(self, match_id):
+        return True
+
+    def open_matches(self):
+        return []
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class ShardRouter:
+    """Routes match traffic to the worker that owns the match.
+
+    With ``shards`` workers, worker ``shard`` owns the matches whose id
+    hashes to it (``shard_of``), and creates only such ids, so any worker
+    finds a match's owner from its id alone. The owner keeps the match in
+    memory; other workers pass requests and Socket.IO events for it on as
+    plain HTTP over the owner's Unix socket in ``socket_dir``, which the
+    owner serves with the same app. Connections are kept open and reused,
+    at most ``pool_size`` idle ones per shard.
+    """
+
+    def __init__(self, shard, shards, socket_dir, timeout=10.0, pool_size=16):
+        self.shard = shard
+        self.shards = shards
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.idle = {owner: [] for owner in range(shards)}
+        self.lock = threading.Lock()
+        self.forwarded = 0
+
+    @classmethod
+    def from_config(cls, config, worker=None):
+        """The router for a pre-forked ``worker`` (see ``PreforkServer``), if it shards."""
+        if not worker or worker.get('shards', 1) <= 1:
+            return NullShardRouter()
+        return cls(worker['slot'], worker['shards'], worker['shard_socket_dir'], config['SHARD_TIMEOUT'])
+
+    def new_match_id(self):
+        # About ``shards`` draws; the id then names this worker as the owner
+        while True:
+            match_id = secrets.token_hex(4)
+            if shard_of(match_id, self.shards) == self.shard:
+                return match_id
+
+    def owner(self, match_id):
+        return shard_of(match_id, self.shards)
+
+    def is_local(self, match_id):
+        return self.owner(match_id) == self.shard
+
+    # Forwarding
+
+    def request(self, owner, method, path, body=None, headers=None):
+        """Send one request to ``owner``'s socket; returns (status, headers, body)."""
+        for attempt in (0, 1):
+            with self.lock:
+                connection = self.idle[owner].pop() if self.idle[owner] else None
+            reused = connection is not None
+            if connection is None:
+                connection = UnixHTTPConnection(socket_path(self.socket_dir, owner), self.timeout)
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if reused and attempt == 0:
+                    continue  # the owner closed an idle connection; try a new one
+                raise
+            with self.lock:
+                if len(self.idle[owner]) < self.pool_size and not response.will_close:
+                    self.idle[owner].append(connection)
+                else:
+                    connection.close()
+            self.forwarded += 1
+            return response.status, response.getheaders(), data
+
+    def forward(self, match_id, request):
+        """Replay a Flask ``request`` on the owner of ``match_id``; returns (status, headers, body)."""
+        headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_HEADERS}
+        status, headers, body = self.request(self.owner(match_id), request.method, request.full_path,
+                                             request.get_data(), headers)
+        return status, [(key, value) for key, value in headers if key.lower() not in HOP_HEADERS], body
+
+    def send_event(self, match_id, event, session_id, data):
+        """Run Socket.IO ``event`` from ``session_id`` on the owner of ``match_id``."""
+        status, _, body = self.request(self.owner(match_id), 'POST', f'/internal/events/{event}',
+                                       json.dumps({'session_id': session_id, 'data': data}),
+                                       {'Content-Type': 'application/json'})
+        if status != 200:
+            logger.error(f"Shard {self.owner(match_id)} failed {event} for match {match_id}: {status}")
+
+    def open_matches(self):
+        """Open matches held by the other shards, as {'id', 'stake', 'creator'} dicts.
+
+        A shard that does not answer is left out of this build of the lobby.
+        """
+        matches = []
+        for owner in range(self.shards):
+            if owner == self.shard:
+                continue
+            try:
+                status, _, body = self.request(owner, 'GET', '/internal/lobby')
+            except (OSError, http.client.HTTPException):
+                logger.warning(f"Shard {owner} did not answer for the lobby")
+                continue
+            if status == 200:
+                matches.extend(json.loads(body)['matches'])
+        return matches
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+                connections.clear()
@@ -0,0 +1,276 @@
+import logging
+import random
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import func
+from ..config import Config
+from ..models.database import db, User
+from ..models.match import Match
+from .game_service import GameService
+from .match_service import MatchService
+
+logger = logging.getLogger('rps_game')
+
+MOVES = ('rock', 'paper', 'scissors')
+
+
+class SimulationConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    AUTO_CREATE_SCHEMA = False
+    RATE_LIMIT_ENABLED = False
+    EVENT_LOG_DIR = None
+    BOT_ENABLED = False
+
+
+class VirtualTimer:
+    """``Match`` timer that only fires when the simulation says so."""
+
+    def __init__(self, timeout, callback, args=()):
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        if not self.cancelled:
+            self.cancelled = True
+            return self.callback(*self.args)
+
+
+class InvariantViolation(Exception):
+    pass
+
+
+class Simulation:
+    """Seeded, deterministic driver for ``MatchService`` and ``GameService``.
+
+    Up to ``concurrency`` match lifecycles (create, join or cancel, moves or
+    timeouts, results, rematches) run interleaved; each step is picked from
+    the seeded RNG and followed by invariant checks. The same seed always
+    produces the same sequence of steps, so a violation can be replayed.
+    Needs an app context with the schema created.
+    """
+
+    def __init__(self, seed, players=200, concurrency=20, initial_coins=100, max_stake=10,
+                 cancel_rate=0.1, move_rate=0.9, rematch_rate=0.3, trace=50):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.concurrency = concurrency
+        self.max_stake = max_stake
+        self.cancel_rate = cancel_rate
+        self.move_rate = move_rate
+        self.rematch_rate = rematch_rate
+
+        self.match_service = MatchService()
+        self.game_service = GameService()
+        self.player_ids = [f'sim-{seed}-{i}' for i in range(players)]
+        for session_id in self.player_ids:
+            self.match_service.get_player(session_id).coins = initial_coins
+        self.total_coins = self.db_total()
+
+        self.idle = list(self.player_ids)
+        self.active = []
+        self.steps = 0
+        self.sequences = 0
+        self.actions = Counter()
+        self.trace = deque(maxlen=trace)
+
+    # Driving
+
+    def run(self, sequences):
+        """Run until ``sequences`` lifecycles have completed."""
+        previous_factory = Match.timer_factory
+        previous_state = random.getstate()
+        # Timeout auto-moves use the module-level RNG
+        random.seed(self.seed)
+        Match.timer_factory = VirtualTimer
+        try:
+            while self.sequences < sequences:
+                while len(self.active) < self.concurrency and self.sequences + len(self.active) < sequences:
+                    if not self.start_sequence():
+                        break
+                if not self.active:
+                    raise InvariantViolation('No players can afford a match')
+                index = self.rng.randrange(len(self.active))
+                sequence, players = self.active[index]
+                try:
+                    action = next(sequence)
+                except StopIteration:
+                    self.active.pop(index)
+                    self.idle.extend(players)
+                    self.sequences += 1
+                    continue
+                self.steps += 1
+                self.actions[action] += 1
+                self.trace.append((self.steps, action, players))
+                self.check()
+                # Each step gets a fresh session, like a request
+                db.session.remove()
+        finally:
+            Match.timer_factory = previous_factory
+            random.setstate(previous_state)
+        return self
+
+    def start_sequence(self):
+        self.idle.sort()
+        self.rng.shuffle(self.idle)
+        funded = []
+        for player_id in self.idle:
+            if self.match_service.players[player_id].coins > 0:
+                funded.append(player_id)
+                if len(funded) == 2:
+                    break
+        if len(funded) < 2:
+            return False
+        creator, joiner = funded
+        self.idle.remove(creator)
+        self.idle.remove(joiner)
+        self.active.append((self.lifecycle(creator, joiner), (creator, joiner)))
+        return True
+
+    def lifecycle(self, creator, joiner):
+        ms, players = self.match_service, self.match_service.players
+        stake = self.rng.randint(1, min(self.max_stake, players[creator].coins, players[joiner].coins))
+
+        match = ms.create_match(creator, stake)
+        if match is None:
+            raise InvariantViolation(f'create_match failed for {creator} with stake {stake}')
+        yield 'create'
+
+        if self.rng.random() < self.cancel_rate:
+            if not ms.cancel_match(match.id):
+                raise InvariantViolation(f'cancel_match failed for {match.id}')
+            yield 'cancel'
+            return
+
+        if not ms.join_match(match.id, joiner):
+            raise InvariantViolation(f'join_match failed for {joiner} in {match.id}')
+        yield 'join'
+
+        match.joiner_ready = True
+        match.start_match()
+        match.start_timer(Config.MATCH_TIMEOUT, ms.handle_match_timeout)
+        yield 'start'
+
+        while True:
+            for player_id in (creator, joiner):
+                if self.rng.random() < self.move_rate:
+                    match.make_move(player_id, self.rng.choice(MOVES))
+                    yield 'move'
+
+            if match.are_both_moves_made():
+                if self.game_service.calculate_match_result(match, players) is None:
+                    raise InvariantViolation(f'calculate_match_result failed for {match.id}')
+                match.cancel_timer()
+                yield 'result'
+            else:
+                match.timer.fire()
+                if match.status != 'finished':
+                    raise InvariantViolation(f'timeout did not finish {match.id}')
+                yield 'timeout'
+
+            if (self.rng.random() < self.rematch_rate and match.can_rematch(players)):
+                match.add_rematch_ready(creator)
+                match.add_rematch_ready(joiner)
+                new_match = ms.create_rematch(match.id)
+                if new_match is None:
+                    raise InvariantViolation(f'create_rematch failed for {match.id}')
+                ms.cleanup_match(match.id)
+                match = new_match
+                yield 'rematch'
+                continue
+
+            ms.cleanup_match(match.id)
+            yield 'leave'
+            return
+
+    # Invariants
+
+    def db_total(self):
+        return self.db_coins()[0]
+
+    def db_coins(self):
+        # The simulation database holds only this run's players
+        total, lowest = db.session.query(func.sum(User.coins), func.min(User.coins)).one()
+        return total or 0, lowest or 0
+
+    def check(self):
+        escrow = 0
+        seen = {}
+        for match in self.match_service.matches.values():
+            if match.status in ('waiting', 'playing'):
+                # Stakes are taken on create and join and paid out on the result
+                escrow += match.stake * (2 if match.joiner else 1)
+                for player_id in (match.creator, match.joiner):
+                    if player_id is None:
+                        continue
+                    if player_id in seen:
+                        self.fail(f'{player_id} is in matches {seen[player_id]} and {match.id}')
+                    seen[player_id] = match.id
+                    if self.match_service.players[player_id].current_match != match.id:
+                        self.fail(f'{player_id} is in {match.id} but current_match is '
+                                  f'{self.match_service.players[player_id].current_match}')
+
+        total, lowest = self.db_coins()
+        if total + escrow != self.total_coins:
+            self.fail(f'coins not conserved: {total} held + {escrow} staked != {self.total_coins}')
+        if lowest < 0:
+            self.fail(f'a player has {lowest} coins')
+
+    def fail(self, message):
+        raise InvariantViolation(f'seed {self.seed}, step {self.steps}: {message}')
+
+    def report(self):
+        return {
+            'seed': self.seed,
+            'sequences': self.sequences,
+            'steps': self.steps,
+            'actions': dict(self.actions),
+            'total_coins': self.total_coins,
+        }
+
+
+def run_shard(seed, sequences, players=200, concurrency=20):
+    """Run one seed in a fresh in-memory database. Safe to call in a child process."""
+    from ..app import create_app
+    from ..utils.logger import setup_logger
+    # Per-step INFO logging would dominate the run
+    game_logger = setup_logger()
+    level = game_logger.level
+    game_logger.setLevel(logging.WARNING)
+
+    app = create_app(SimulationConfig)
+    with app.app_context():
+        db.create_all()
+        simulation = Simulation(seed, players=players, concurrency=concurrency)
+        start = time.time()
+        try:
+            simulation.run(sequences)
+            error = None
+        except InvariantViolation as e:
+            error = str(e)
+        report = simulation.report()
+        report['elapsed'] = time.time() - start
+        report['error'] = error
+        report['trace'] = list(simulation.trace) if error else []
+        db.session.remove()
+    game_logger.setLevel(level)
+    return report
+
+
+def simulate(seeds, sequences, processes=1, players=200, concurrency=20):
+    """Run every seed, sharded across ``processes``; yields shard reports as they finish."""
+    if processes <= 1:
+        for seed in seeds:
+            yield run_shard(seed, sequences, players, concurrency)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_shard, seed, sequences, players, concurrency) for seed in seeds]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,389 @@
+import http.client
+import json
+import logging
+import queue
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from ..config import Config
+from ..models.database import db, User
+from .realtime import match_result_payload
+
+logger = logging.getLogger('rps_game')
+
+TELEGRAM_PREFIX = 'tg-'
+MOVES = ('rock', 'paper', 'scissors')
+
+HELP = (
+    "Rock Paper Scissors\n"
+    "/create <stake> - open a match\n"
+    "/open - list open matches\n"
+    "/join <id> - join a match\n"
+    "/rock, /paper, /scissors - play your move\n"
+    "/cancel - cancel your waiting match\n"
+    "/balance - show your coins"
+)
+
+
+def telegram_session_id(telegram_id):
+    return f'{TELEGRAM_PREFIX}{telegram_id}'
+
+
+def telegram_chat_id(session_id):
+    """Private chat id of a Telegram player, or None for web players and bots."""
+    if session_id and session_id.startswith(TELEGRAM_PREFIX):
+        return int(session_id[len(TELEGRAM_PREFIX):])
+    return None
+
+
+class TelegramAPIError(Exception):
+    pass
+
+
+class TelegramAPI:
+    """Minimal Bot API client over one keep-alive connection."""
+
+    def __init__(self, token, base_url='https://api.telegram.org', timeout=10.0):
+        self.token = token
+        url = urlsplit(base_url)
+        self.https = url.scheme == 'https'
+        self.host = url.netloc
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            self.conn = cls(self.host, timeout=self.timeout)
+        return self.conn
+
+    def call(self, method, **params):
+        body = json.dumps(params).encode()
+        path = f'{self.prefix}/bot{self.token}/{method}'
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request('POST', path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                data = json.loads(response.read() or b'{}')
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed the idle connection; reconnect once
+                self.close()
+                if attempt:
+                    raise
+        if not data.get('ok'):
+            raise TelegramAPIError(f"{method} failed: {data.get('description', response.status)}")
+        return data.get('result')
+
+    def send_message(self, chat_id, text):
+        return self.call('sendMessage', chat_id=chat_id, text=text)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class TelegramBot:
+    """Telegram front-end to the match services.
+
+    The webhook only queues updates (``enqueue``); ``tick`` takes them off
+    the bounded queue in batches of ``batch_size``, resolves every sender
+    of the batch with one ``telegram_id IN (...)`` query and runs the
+    commands through ``MatchService``. Telegram players learn about starts,
+    results and timeouts by ``tick`` polling the matches they are in, so
+    matches against web players work in both directions. Replies for the
+    same chat within a batch go out as one message.
+    """
+
+    def __init__(self, match_service, game_service, api, queue_size=10000, batch_size=500,
+                 emit=None, match_timeout=None, max_known=100000):
+        self.match_service = match_service
+        self.game_service = game_service
+        self.api = api
+        self.updates = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.emit = emit
+        self.match_timeout = match_timeout
+        self.known = OrderedDict()  # telegram ids with a users row, least recently seen first
+        self.max_known = max_known
+        self.watching = {}    # match_id -> status last announced
+        self.outbox = {}      # chat_id -> [text]
+        self.stats = {'updates': 0, 'dropped': 0, 'sent': 0}
+
+    # Intake
+
+    def enqueue(self, update):
+        """Queue a webhook update; False when the queue is full and Telegram should retry."""
+        try:
+            self.updates.put_nowait(update)
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+
+    def drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.updates.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # Processing
+
+    def tick(self):
+        """Process one batch of updates, announce match changes and send replies."""
+        batch = self.drain()
+        messages = [update['message'] for update in batch
+                    if isinstance(update.get('message'), dict) and update['message'].get('text')
+                    and update['message'].get('from')]
+        if messages:
+            self.resolve_users([message['from'] for message in messages])
+        for message in messages:
+            try:
+                self.handle(message)
+            except Exception:
+                logger.exception(f"Telegram update failed: {message.get('text')!r}")
+                db.session.rollback()
+            self.end_session()
+        self.stats['updates'] += len(batch)
+        self.poll_matches()
+        self.end_session()
+        self.flush()
+        return len(batch)
+
+    def end_session(self):
+        # One session per update, as with requests (see BotEngine.end_session)
+        db.session.remove()
+
+    def run(self, interval=0.05, sleep=time.sleep):
+        while True:
+            try:
+                if not self.tick():
+                    sleep(interval)
+            except Exception:
+                logger.exception("Telegram tick failed")
+                db.session.rollback()
+                sleep(interval)
+
+    def resolve_users(self, senders):
+        """Create users rows for first-time senders of this batch."""
+        new = {}
+        for sender in senders:
+            if sender['id'] in self.known:
+                self.known.move_to_end(sender['id'])
+            else:
+                new[sender['id']] = sender
+        if not new:
+            return
+        existing = {telegram_id for telegram_id, in
+                    db.session.query(User.telegram_id).filter(User.telegram_id.in_(list(new)))}
+        rows = [{
+            'session_id': telegram_session_id(telegram_id),
+            'coins': Config.INITIAL_COINS,
+            'telegram_id': telegram_id,
+            'telegram_username': sender.get('username'),
+            'telegram_first_name': sender.get('first_name'),
+            'telegram_last_name': sender.get('last_name'),
+        } for telegram_id, sender in new.items() if telegram_id not in existing]
+        if rows:
+            try:
+                db.session.execute(insert(User), rows)
+                db.session.commit()
+            except IntegrityError:
+                # Another worker registered some of them first
+                db.session.rollback()
+                for row in rows:
+                    try:
+                        db.session.execute(insert(User), [row])
+                        db.session.commit()
+                    except IntegrityError:
+                        db.session.rollback()
+        self.known.update(dict.fromkeys(new))
+        # A forgotten sender costs one lookup by telegram_id the next time
+        while len(self.known) > self.max_known:
+            self.known.popitem(last=False)
+
+    def handle(self, message):
+        chat_id = message['chat']['id']
+        session_id = telegram_session_id(message['from']['id'])
+        parts = message['text'].split()
+        command = parts[0].split('@')[0].lower()
+        args = parts[1:]
+
+        if command in ('/start', '/help'):
+            player = self.match_service.get_player(session_id)
+            self.reply(chat_id, f"{HELP}\n\nYou have {player.coins} coins.")
+        elif command == '/balance':
+            self.reply(chat_id, f"You have {self.match_service.get_player(session_id).coins} coins.")
+        elif command == '/create':
+            self.create(chat_id, session_id, args)
+        elif command == '/open':
+            self.list_open(chat_id, session_id)
+        elif command == '/join':
+            self.join(chat_id, session_id, args)
+        elif command.lstrip('/') in MOVES:
+            self.move(chat_id, session_id, command.lstrip('/'))
+        elif command == '/cancel':
+            self.cancel(chat_id, session_id)
+        else:
+            self.reply(chat_id, HELP)
+
+    def live_match(self, player):
+        match = self.match_service.get_match(player.current_match) if player.current_match else None
+        if match and match.status in ('waiting', 'playing'):
+            return match
+        return None
+
+    def create(self, chat_id, session_id, args):
+        try:
+            stake = int(args[0])
+        except (IndexError, ValueError):
+            return self.reply(chat_id, "Usage: /create <stake>")
+        player = self.match_service.get_player(session_id)
+        if stake <= 0 or not player.has_enough_coins(stake):
+            return self.reply(chat_id, f"Stake must be between 1 and your {player.coins} coins.")
+        if self.live_match(player):
+            return self.reply(chat_id, f"You are already in match {player.current_match}.")
+
+        match = self.match_service.create_match(session_id, stake)
+        if not match:
+            return self.reply(chat_id, "Could not create the match.")
+        self.watching[match.id] = match.status
+        logger.info(f"Telegram match created: {match.id} by {session_id}")
+        self.reply(chat_id, f"Match {match.id} created with stake {stake}. Waiting for an opponent "
+                            f"(they can /join {match.id}).")
+
+    def list_open(self, chat_id, session_id):
+        self.match_service.get_player(session_id)
+        matches = self.match_service.get_open_matches(session_id)[:10]
+        if not matches:
+            return self.reply(chat_id, "No open matches. Start one with /create <stake>.")
+        lines = [f"/join {m['id']} - stake {m['stake']}" for m in matches]
+        self.reply(chat_id, "Open matches:\n" + "\n".join(lines))
+
+    def join(self, chat_id, session_id, args):
+        if not args:
+            return self.reply(chat_id, "Usage: /join <id>")
+        match_id = args[0]
+        player = self.match_service.get_player(session_id)
+        if self.live_match(player):
+            return self.reply(chat_id, f"You are already in match {player.current_match}.")
+        match = self.match_service.get_match(match_id)
+        if not match or match.status != 'waiting' or match.creator == session_id:
+            return self.reply(chat_id, f"Match {match_id} is not open.")
+
+        with match.lock:
+            if not self.match_service.join_match(match_id, session_id):
+                return self.reply(chat_id, f"Could not join match {match_id}.")
+            # Telegram players are ready as soon as they join
+            match.joiner_ready = True
+            self.match_service.events.append('ready', match_id, session_id)
+            if match.creator_ready:
+                match.start_match()
+                self.match_service.schedule_timeout(match, self.match_timeout)
+        self.watching[match_id] = 'waiting'
+        self.notify('match_started', {'match_id': match_id, 'start_time': match.start_time}, match_id)
+        logger.info(f"Telegram player {session_id} joined match {match_id}")
+
+    def move(self, chat_id, session_id, move):
+        player = self.match_service.get_player(session_id)
+        match = self.match_service.get_match(player.current_match) if player.current_match else None
+        if not match:
+            return self.reply(chat_id, "You are not in a match.")
+
+        result = None
+        with match.lock:
+            if match.status != 'playing':
+                return self.reply(chat_id, "The match has not started.")
+            if not match.make_move(session_id, move):
+                return self.reply(chat_id, "You have already moved.")
+            self.match_service.events.append('move', match.id, session_id, move=move)
+            if match.are_both_moves_made():
+                result = self.game_service.calculate_match_result(match, self.match_service.players,
+                                                                  self.match_service.events)
+                match.cancel_timer()
+
+        self.notify('move_made', {'player': match.get_player_role(session_id), 'auto': False}, match.id)
+        if result:
+            self.notify('match_result', match_result_payload(result), match.id)
+        else:
+            self.reply(chat_id, f"You played {move}. Waiting for your opponent.")
+
+    def cancel(self, chat_id, session_id):
+        player = self.match_service.get_player(session_id)
+        match = self.live_match(player)
+        if not match or match.status != 'waiting' or match.creator != session_id:
+            return self.reply(chat_id, "You have no waiting match to cancel.")
+        if not self.match_service.cancel_match(match.id):
+            return self.reply(chat_id, "Could not cancel the match.")
+        self.watching.pop(match.id, None)
+        self.reply(chat_id, f"Match {match.id} cancelled; your {match.stake} coins are back.")
+
+    # Match changes
+
+    def poll_matches(self):
+        for match_id, seen in list(self.watching.items()):
+            match = self.match_service.get_match(match_id)
+            if not match:
+                del self.watching[match_id]
+                continue
+            if match.status == seen:
+                continue
+            self.watching[match_id] = match.status
+            if match.status == 'playing':
+                for player_id in (match.creator, match.joiner):
+                    self.tell(player_id, f"Match {match_id} started, stake {match.stake}. "
+                                         f"Choose /rock, /paper or /scissors.")
+            elif match.status == 'finished':
+                self.announce_result(match)
+
+    def announce_result(self, match):
+        result = match.result or {}
+        winner = result.get('winner')
+        moves = f"{result.get('creator_move')} vs {result.get('joiner_move')}"
+        for player_id, role in ((match.creator, 'player1'), (match.joiner, 'player2')):
+            if telegram_chat_id(player_id) is None:
+                continue
+            if winner == 'draw':
+                outcome = "Draw, your stake is returned"
+            elif winner == role:
+                outcome = f"You won {match.stake} coins"
+            else:
+                outcome = f"You lost {match.stake} coins"
+            coins = self.match_service.get_player(player_id).coins
+            self.tell(player_id, f"{moves}: {outcome}. You have {coins} coins. /create to play again.")
+
+        # No rematches over Telegram; a web opponent goes back to the lobby
+        self.notify('rematch_declined', {}, match.id)
+        self.match_service.cleanup_match(match.id)
+        del self.watching[match.id]
+
+    # Output
+
+    def tell(self, session_id, text):
+        chat_id = telegram_chat_id(session_id)
+        if chat_id is not None:
+            self.reply(chat_id, text)
+
+    def reply(self, chat_id, text):
+        self.outbox.setdefault(chat_id, []).append(text)
+
+    def flush(self):
+        outbox, self.outbox = self.outbox, {}
+        for chat_id, texts in outbox.items():
+            try:
+                self.api.send_message(chat_id, '\n\n'.join(texts))
+                self.stats['sent'] += 1
+            except Exception:
+                logger.exception(f"Could not send Telegram message to {chat_id}")
+
+    def notify(self, event, data, room):
+        if self.emit:
+            self.emit(event, data, room=room)
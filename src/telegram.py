@@ -0,0 +1,59 @@
+import hmac
+from threading import Lock
+from flask import Blueprint, current_app, jsonify, request
+
+from src.extensions import socketio, telegram_bot
+from src.utils.logger import setup_logger
+
+logger = setup_logger()
+
+telegram_bp = Blueprint('telegram', __name__, url_prefix='/telegram')
+
+_start_lock = Lock()
+
+def run_telegram(app):
+    with app.app_context():
+        telegram_bot.run(interval=app.config['TELEGRAM_TICK_INTERVAL'], sleep=socketio.sleep)
+
+def start_telegram():
+    """Start the update loop in a background greenlet with the first webhook call."""
+    services = current_app.extensions['rps']
+    if services.get('telegram_started'):
+        return
+    with _start_lock:
+        if not services.get('telegram_started'):
+            services['telegram_started'] = True
+            socketio.start_background_task(run_telegram, current_app._get_current_object())
+            logger.info("Telegram bot started")
+
+@telegram_bp.route('/webhook', methods=['POST'])
+def webhook():
+    """Queue a Bot API update; it is processed in the next batch.
+
+    Updates name their sender, so without the secret anyone could play as
+    any Telegram user: the webhook is off until both the token and
+    ``TELEGRAM_WEBHOOK_SECRET`` are set.
+    """
+    secret = current_app.config.get('TELEGRAM_WEBHOOK_SECRET')
+    if not current_app.config.get('TELEGRAM_BOT_TOKEN') or not secret:
+        if current_app.config.get('TELEGRAM_BOT_TOKEN'):
+            logger.warning("Refusing Telegram webhook call: TELEGRAM_WEBHOOK_SECRET is not set")
+        return jsonify({'error': 'Not found'}), 404
+    supplied = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(supplied.encode(), secret.encode()):
+        return jsonify({'error': 'Not authorized'}), 403
+
+    update = request.get_json(silent=True)
+    if not isinstance(update, dict):
+        return jsonify({'error': 'Invalid update'}), 400
+
+    if current_app.config.get('TELEGRAM_TICK_INTERVAL'):
+        start_telegram()
+    if not telegram_bot.enqueue(update):
+        # Telegram redelivers updates that were not acknowledged
+        logger.warning("Telegram update queue full")
+        response = jsonify({'error': 'Busy'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    return jsonify({'ok': True})
@@ -2,6 +2,9 @@ import logging
 
 def setup_logger():
     logger = logging.getLogger('rps_game')
+    if logger.handlers:
+        # Already configured; called again on every match result
+        return logger
     logger.setLevel(logging.DEBUG)
 
     # Create console handler
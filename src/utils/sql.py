@@ -0,0 +1,31 @@
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..models.database import db
+
+
+def dialect_name():
+    return db.engine.dialect.name
+
+
+def dialect_insert(table):
+    """``INSERT`` construct that supports ``on_conflict_*`` on Postgres and SQLite."""
+    if dialect_name() == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def truncate_time(column, period):
+    """SQL expression flooring a timestamp column to the hour or day."""
+    if dialect_name() == 'postgresql':
+        return func.date_trunc(period, column)
+    fmt = '%Y-%m-%d %H:00:00' if period == 'hour' else '%Y-%m-%d 00:00:00'
+    return func.strftime(fmt, column)
+
+
+def as_datetime(value):
+    """SQLite returns ``truncate_time`` buckets as strings; normalise them."""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
@@ -1,37 +1,36 @@
 import pytest
-from src.app import app, db, socketio
-from src.services.match_service import MatchService
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import socketio, match_service as app_match_service
 from src.services.game_service import GameService
 
 @pytest.fixture
-def test_app():
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['SECRET_KEY'] = 'test_key'
-    
-    with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
-            yield client
-            db.session.remove()
-            db.drop_all()
+def flask_app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def test_app(flask_app):
+    with flask_app.test_client() as client:
+        yield client
 
 @pytest.fixture
-def socket_client(test_app):
-    return socketio.test_client(app)
+def socket_client(flask_app, test_app):
+    return socketio.test_client(flask_app, flask_test_client=test_app)
 
 @pytest.fixture
-def match_service():
-    return MatchService()
+def match_service(flask_app):
+    # The app's own service, so tests see matches created through the API
+    return app_match_service._get_current_object()
 
 @pytest.fixture
 def game_service():
     return GameService()
 
 @pytest.fixture
-def db_session():
-    with app.app_context():
-        db.create_all()
-        yield db.session
-        db.session.remove()
-        db.drop_all()
\ No newline at end of file
+def db_session(flask_app):
+    yield db.session
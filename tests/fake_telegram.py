@@ -0,0 +1,70 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegramServer:
+    """Local stand-in for the Bot API: records every call and answers ok."""
+
+    def __init__(self, token='test-token'):
+        self.token = token
+        self.calls = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately; don't let Nagle hold the body
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                prefix = f'/bot{server.token}/'
+                if not self.path.startswith(prefix):
+                    return self.respond(404, {'ok': False, 'description': 'Not Found'})
+                method = self.path[len(prefix):]
+                server.calls.append((method, json.loads(body or b'{}')))
+                self.respond(200, {'ok': True, 'result': True})
+
+            def respond(self, status, data):
+                payload = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def messages(self, chat_id=None):
+        return [params['text'] for method, params in self.calls
+                if method == 'sendMessage' and chat_id in (None, params['chat_id'])]
+
+
+def update(update_id, user_id, text, username=None):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'username': username},
+            'chat': {'id': user_id, 'type': 'private'},
+            'date': 0,
+            'text': text,
+        },
+    }
@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from src.extensions import socketio
+from src.services.admission import AdmissionController, PLAY, MATCH, POLL
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def slow_checkout(clock, seconds):
+    def connect():
+        clock.now += seconds
+        return 'connection'
+    return connect
+
+def test_polls_are_shed_before_matches_and_play():
+    clock = FakeClock()
+    admission = AdmissionController(max_inflight=6, poll_limit=2, match_limit=2, clock=clock)
+
+    assert admission.admit(POLL) == (True, 0.0)
+    assert admission.admit(MATCH) == (True, 0.0)
+    assert admission.admit(POLL) == (True, 0.0)  # other work does not count against polls
+    assert admission.admit(POLL)[0] is False  # two polls in flight
+    assert admission.admit(MATCH) == (True, 0.0)
+    assert admission.admit(MATCH)[0] is False  # two match-creating transactions
+    for _ in range(2):
+        assert admission.admit(PLAY) == (True, 0.0)
+    allowed, retry_after = admission.admit(PLAY)
+    assert not allowed and retry_after == 1.0
+    assert admission.report()['shed'] == {PLAY: 1, MATCH: 1, POLL: 1}
+
+    for priority in (POLL, POLL, MATCH, MATCH, PLAY, PLAY):
+        admission.release(priority)
+    assert admission.report()['inflight'] == {PLAY: 0, MATCH: 0, POLL: 0}
+    assert admission.admit(POLL)[0]
+
+def test_slow_checkouts_shed_polls_for_a_while():
+    clock = FakeClock()
+    admission = AdmissionController(max_pool_wait=0.05, hold=2.0, clock=clock)
+
+    assert admission.timed_checkout(slow_checkout(clock, 0.01))() == 'connection'
+    assert admission.admit(POLL)[0]
+    admission.timed_checkout(slow_checkout(clock, 0.2))()
+    allowed, retry_after = admission.admit(POLL)
+    assert not allowed and retry_after == pytest.approx(2.0)
+    assert admission.admit(PLAY)[0] and admission.admit(MATCH)[0]
+
+    clock.now += 2.0
+    assert admission.admit(POLL)[0]
+    assert admission.report()['slow_checkouts'] == 1
+
+def test_pool_timeouts_are_remembered_for_the_request():
+    clock = FakeClock()
+    admission = AdmissionController(clock=clock)
+
+    def timeout():
+        clock.now += 30
+        raise PoolTimeout('QueuePool limit reached')
+
+    with pytest.raises(PoolTimeout):
+        admission.timed_checkout(timeout)()
+    assert admission.take_pool_timeout()
+    assert not admission.take_pool_timeout()
+    assert not admission.admit(POLL)[0]
+
+def test_congested_server_refuses_polls_but_not_moves(flask_app, test_app):
+    clock = FakeClock()
+    admission = AdmissionController(hold=3.0, clock=clock)
+    flask_app.extensions['rps']['admission'] = admission
+    test_app.get('/')
+    assert test_app.get('/api/state').status_code == 200
+
+    admission.timed_checkout(slow_checkout(clock, 1.0))()
+    response = test_app.get('/api/state')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert test_app.post('/api/move', json={'move': 'rock'}).get_json() == {'error': 'No active match'}
+    assert admission.report()['inflight'] == {PLAY: 0, MATCH: 0, POLL: 0}
+
+    # Socket.IO events are admitted too
+    admission.max_inflight = 0
+    client = socketio.test_client(flask_app, flask_test_client=test_app)
+    client.emit('ready_for_match', {'match_id': 'm1'})
+    assert client.get_received()[-1]['name'] == 'server_busy'
+
+def test_pool_timeout_in_a_handler_is_a_503(flask_app, test_app, monkeypatch):
+    admission = AdmissionController()
+    flask_app.extensions['rps']['admission'] = admission
+    test_app.get('/')
+
+    def timeout():
+        raise PoolTimeout('QueuePool limit reached')
+
+    monkeypatch.setattr(type(flask_app.extensions['rps']['match_service']), 'get_player',
+                        lambda *args: admission.timed_checkout(timeout)())
+    response = test_app.get('/api/recent')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from src.app import create_app
+from src.config import TestConfig
+from src.models.database import db, User
+
+def test_import_does_not_touch_database():
+    # Nothing listens on port 1, so any connection attempt would fail
+    env = dict(os.environ, DATABASE_URL='postgresql://nobody@127.0.0.1:1/none')
+    subprocess.run(
+        [sys.executable, '-c', 'from src.app import create_app; create_app()'],
+        env=env, check=True, timeout=60
+    )
+
+def test_first_request_creates_schema():
+    app = create_app(TestConfig)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['session_id'] = 'player1'
+        response = client.get('/api/state')
+        assert response.status_code == 200
+        assert response.get_json()['coins'] == 100
+
+    with app.app_context():
+        assert User.query.filter_by(session_id='player1').count() == 1
+        db.drop_all()
+
+def test_apps_do_not_share_services():
+    from src.extensions import match_service
+    first = create_app(TestConfig)
+    second = create_app(TestConfig)
+    with first.app_context():
+        first_service = match_service._get_current_object()
+    with second.app_context():
+        assert match_service._get_current_object() is not first_service
@@ -0,0 +1,87 @@
+from src.models.database import User, GameHistory
+from src.services.bot_service import BotEngine, FrequencyStrategy, MarkovStrategy, is_bot
+
+def make_engine(match_service, game_service, **options):
+    events = []
+    options.setdefault('join_delay', 5)
+    options.setdefault('move_delay', (1, 1))
+    engine = BotEngine(match_service, game_service, pool_size=2,
+                       emit=lambda event, data, room: events.append((event, room)), **options)
+    return engine, events
+
+def test_frequency_strategy_counters_favourite_move():
+    strategy = FrequencyStrategy()
+    for move in ['rock', 'rock', 'paper', 'rock']:
+        strategy.observe('human', move)
+    assert strategy.choose('human') == 'paper'
+
+def test_markov_strategy_learns_cycles():
+    strategy = MarkovStrategy()
+    for move in ['rock', 'paper', 'scissors'] * 20:
+        strategy.observe('human', move)
+    # After scissors the opponent plays rock, so the bot plays paper
+    assert strategy.choose('human') == 'paper'
+
+def test_counters_stay_in_one_byte():
+    strategy = MarkovStrategy(max_opponents=2)
+    for i in range(1000):
+        strategy.observe('human', 'rock')
+    assert max(strategy.states['human']) <= 255
+    strategy.observe('a', 'rock')
+    strategy.observe('b', 'rock')
+    assert 'human' not in strategy.states
+
+def test_bot_joins_waiting_match_and_plays(match_service, game_service, db_session):
+    human = match_service.get_player('human')
+    match = match_service.create_match('human', 10)
+    engine, events = make_engine(match_service, game_service)
+
+    engine.tick(now=match.created_at + 1)
+    assert match.joiner is None
+
+    engine.tick(now=match.created_at + 5)
+    assert is_bot(match.joiner)
+    assert match.status == 'playing'
+    assert ('match_started', match.id) in events
+
+    engine.tick(now=match.created_at + 6)
+    assert match.joiner in match.moves
+    match.cancel_timer()
+
+    match.make_move('human', 'rock')
+    game_service.calculate_match_result(match, match_service.players)
+    engine.tick(now=match.created_at + 7)
+
+    assert match.id not in match_service.matches
+    assert engine.strategy.states['human'][0] == 1
+    assert ('rematch_declined', match.id) in events
+    assert GameHistory.query.count() == 1
+    assert human.current_match is None
+
+def test_bot_refills_coins(match_service, game_service, db_session):
+    match_service.get_player('human')
+    match = match_service.create_match('human', 50)
+    engine, _ = make_engine(match_service, game_service, join_delay=0, initial_coins=500)
+    engine.fund('bot-1', 10)
+    User.query.filter_by(session_id='bot-1').update({'coins': 0})
+    match_service.players['bot-1'].coins = 0
+
+    engine.tick(now=match.created_at)
+    match.cancel_timer()
+    assert match.joiner == 'bot-1'
+    assert User.query.filter_by(session_id='bot-1').one().coins == 450
+    # The top-up came out of the house
+    assert User.query.filter_by(session_id='house').one().coins == -500
+
+def test_load_generator_plays_all_rounds(match_service, game_service, db_session):
+    engine, _ = make_engine(match_service, game_service, join_delay=None, move_delay=(0, 0))
+    assert engine.start_load(20, stake=1, rounds=3, now=0) == 20
+    assert engine.active_games() == 40
+    while engine.schedule:
+        engine.tick(now=0)
+
+    assert engine.stats['results'] == 60
+    assert GameHistory.query.count() == 60
+    assert engine.active_games() == 0
+    assert not match_service.matches
+    assert len(engine.free_bots) == 40
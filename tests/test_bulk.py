@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import insert
+from src.models.database import db, User, BulkJob, SeasonStats
+from src.services.bulk_service import BulkOperations
+
+@pytest.fixture
+def users(db_session):
+    db_session.execute(insert(User), [
+        {'session_id': f'user{i}', 'coins': i, 'wins': i % 3, 'total_games': i,
+         'telegram_id': 5000 + i if i % 2 else None}
+        for i in range(1, 26)
+    ])
+    db_session.commit()
+
+def coins():
+    return {user.session_id: user.coins for user in User.query}
+
+def test_grant_to_segment_in_chunks(users):
+    progress = []
+    operations = BulkOperations(chunk_size=7)
+    job = operations.start('grant', 'g1', amount=50, max_coins=10, telegram=True)
+    result = operations.run(job['name'], progress.append)
+
+    assert [p['last_id'] for p in progress] == [7, 14, 21, 25]
+    assert result['status'] == 'done' and result['rows'] == 5
+    balances = coins()
+    assert [balances[f'user{i}'] for i in (1, 2, 9, 10, 11)] == [51, 2, 59, 10, 11]
+
+def test_refill_and_validation(users):
+    operations = BulkOperations()
+    result = operations.run(operations.start('refill', to=20)['name'])
+    assert result['rows'] == 19
+    assert min(coins().values()) == 20
+    with pytest.raises(ValueError):
+        operations.start('grant', amount=-5)
+    with pytest.raises(ValueError):
+        operations.start('reset', season='s1', coins=100, min_coins=3)
+
+def test_interrupted_reset_resumes_without_repeating_chunks(users, monkeypatch):
+    operations = BulkOperations(chunk_size=10)
+    job = operations.start('reset', season='2026-q3', coins=100)
+    applied = []
+    original = operations.apply
+
+    def crash_on_second_chunk(operation, params, lo, hi):
+        applied.append(lo)
+        if len(applied) == 2:
+            raise RuntimeError('worker died')
+        return original(operation, params, lo, hi)
+
+    monkeypatch.setattr(operations, 'apply', crash_on_second_chunk)
+    with pytest.raises(RuntimeError):
+        operations.run(job['name'])
+    db.session.rollback()
+    assert db.session.get(BulkJob, 'season-2026-q3').last_id == 10
+    assert SeasonStats.query.count() == 10
+
+    monkeypatch.setattr(operations, 'apply', original)
+    assert operations.run(job['name'])['rows'] == 25
+    assert SeasonStats.query.count() == 25
+    archived = db.session.get(SeasonStats, ('2026-q3', User.query.filter_by(session_id='user17').one().id))
+    assert (archived.coins, archived.wins, archived.total_games) == (17, 2, 17)
+    assert set(coins().values()) == {100}
+    assert {user.wins for user in User.query} == {0}
+
+def test_bulk_admin_api(flask_app, test_app, users):
+    flask_app.config['ADMIN_TOKEN'] = 'secret'
+    headers = {'Authorization': 'Bearer secret'}
+    assert test_app.post('/api/admin/bulk/grant', json={'amount': 'lots'}, headers=headers).status_code == 400
+
+    response = test_app.post('/api/admin/bulk/grant', json={'name': 'bonus', 'amount': 5, 'min_coins': 20},
+                             headers=headers)
+    assert response.status_code == 202
+    assert response.get_json()['max_id'] == 25
+    BulkOperations().run('bonus')  # the background task, run inline
+
+    job = test_app.get('/api/admin/bulk/bonus', headers=headers).get_json()
+    assert (job['status'], job['rows'], job['progress']) == ('done', 6, 1.0)
+    assert test_app.get('/api/admin/bulk', headers=headers).get_json()['jobs'][0]['name'] == 'bonus'
+    assert test_app.get('/api/admin/bulk/nope', headers=headers).status_code == 404
@@ -0,0 +1,80 @@
+from src.models.database import User, GameHistory, MatchDeadline
+from src.services.deadline_service import DeadlineStore
+from src.services.match_service import MatchService
+from src.services.game_service import GameService
+
+def playing_match(service, creator='alice', joiner='bob', stake=10, timeout=30):
+    service.get_player(creator)
+    service.get_player(joiner)
+    match = service.create_match(creator, stake)
+    service.join_match(match.id, joiner)
+    match.joiner_ready = True
+    match.start_match()
+    service.schedule_timeout(match, timeout)
+    match.cancel_timer()  # the tests drive time themselves
+    return match
+
+def coins():
+    return sum(coins for coins, in User.query.with_entities(User.coins))
+
+def test_settling_removes_deadline(flask_app, db_session):
+    service = MatchService(deadlines=DeadlineStore(grace=0))
+    match = playing_match(service)
+    assert db_session.get(MatchDeadline, match.id).deadline == match.deadline
+
+    match.make_move('alice', 'rock')
+    match.make_move('bob', 'scissors')
+    assert GameService.calculate_match_result(match, service.players)['winner'] == 'player1'
+    assert MatchDeadline.query.count() == 0
+
+def test_sweeper_settles_matches_of_dead_worker(flask_app, db_session):
+    dead = MatchService(deadlines=DeadlineStore(grace=5, worker='dead'))
+    matches = [playing_match(dead, f'c{i}', f'j{i}') for i in range(5)]
+    total = coins() + 2 * 10 * len(matches)
+
+    survivor = MatchService(deadlines=DeadlineStore(grace=5, batch_size=2, worker='survivor'))
+    # Not yet past the grace period: the owner's timer should handle it
+    assert survivor.deadlines.sweep(survivor, now=matches[-1].deadline + 1) == 0
+
+    assert survivor.deadlines.sweep(survivor, now=matches[-1].deadline + 6) == 5
+    assert GameHistory.query.count() == 5
+    assert MatchDeadline.query.count() == 0
+    assert coins() == total
+    assert not survivor.matches
+
+    # The original worker waking up late cannot pay out a second time
+    match = matches[0]
+    match.make_move(match.creator, 'rock')
+    match.make_move(match.joiner, 'rock')
+    assert GameService.calculate_match_result(match, dead.players) is None
+    assert GameHistory.query.count() == 5
+    assert coins() == total
+
+def test_leases_keep_sweepers_apart(flask_app, db_session):
+    service = MatchService(deadlines=DeadlineStore(grace=0))
+    match = playing_match(service)
+    first = DeadlineStore(grace=0, lease=30, worker='first')
+    second = DeadlineStore(grace=0, lease=30, worker='second')
+
+    now = match.deadline + 1
+    assert [row.match_id for row in first.claim(now)] == [match.id]
+    assert second.claim(now + 10) == []
+    # The first sweeper died holding the lease; it is taken over once it lapses
+    assert [row.match_id for row in second.claim(now + 31)] == [match.id]
+    assert db_session.get(MatchDeadline, match.id).attempts == 2
+
+def test_unsettleable_match_is_refunded(flask_app, db_session):
+    service = MatchService(deadlines=DeadlineStore(grace=0, max_attempts=1))
+    match = playing_match(service)
+    total = coins() + 2 * 10
+    # Settling keeps failing, e.g. on a corrupt match
+    service.handle_match_timeout = lambda match_id: None
+
+    now = match.deadline + 1
+    assert service.deadlines.sweep(service, now=now) == 0
+    assert db_session.get(MatchDeadline, match.id).attempts == 1
+    assert service.deadlines.sweep(service, now=now + 60) == 0
+    assert MatchDeadline.query.count() == 0
+    assert coins() == total
+    assert service.players['alice'].coins == service.players['bob'].coins == 100
+    assert match.id not in service.matches
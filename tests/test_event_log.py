@@ -0,0 +1,112 @@
+import pytest
+from src.models.database import User
+from src.services.event_log import EventLog, encode, list_segments, read_events, rebuild
+from src.services.match_service import MatchService
+
+def test_round_trip_and_filters(tmp_path):
+    log = EventLog(str(tmp_path), fsync=False)
+    log.append('create', 'm1', 'alice', amount=10, balance=90, ts=1.0)
+    log.append('move', 'm1', 'alice', move='rock', ts=2.0)
+    log.append('create', 'm2', 'bob', amount=5, balance=95, ts=3.0)
+    log.append('result', 'm1', 'alice', 'bob', move='player1', amount=10, balance=110, other_balance=90, ts=4.0)
+    assert log.flush() == 4
+    log.close()
+
+    events = list(read_events(str(tmp_path)))
+    assert [e.type for e in events] == ['create', 'move', 'create', 'result']
+    assert events[1].move == 'rock'
+    assert events[3].move == 'player1' and events[3].other == 'bob' and events[3].other_balance == 90
+
+    assert [e.ts for e in read_events(str(tmp_path), match_id='m1')] == [1.0, 2.0, 4.0]
+    assert [e.match_id for e in read_events(str(tmp_path), types=['create'])] == ['m1', 'm2']
+    assert [e.ts for e in read_events(str(tmp_path), since=3.0)] == [3.0, 4.0]
+
+def test_torn_tail_and_rotation(tmp_path):
+    log = EventLog(str(tmp_path), segment_size=200, fsync=False)
+    for i in range(10):
+        log.append('ready', f'm{i}', 'alice', ts=float(i))
+        log.flush()
+    log.close()
+    segments = list_segments(str(tmp_path))
+    assert len(segments) > 1
+
+    # A crash mid-write leaves a partial record at the end of the last segment
+    path = segments[-1][2]
+    with open(path, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00garbage')
+    assert [e.ts for e in read_events(str(tmp_path))] == [float(i) for i in range(10)]
+
+    # Restarting never appends behind the torn record
+    EventLog(str(tmp_path), fsync=False).close()
+    assert len(list_segments(str(tmp_path))) == len(segments) + 1
+
+def test_writers_are_merged_by_time(tmp_path):
+    for writer, times in (('1', [1.0, 4.0]), ('2', [2.0, 3.0])):
+        log = EventLog(str(tmp_path), fsync=False, writer=writer)
+        for ts in times:
+            log.append('ready', 'm', writer, ts=ts)
+        log.close()
+    assert [e.actor for e in read_events(str(tmp_path))] == ['1', '2', '2', '1']
+
+def test_rebuild_matches_database(flask_app, game_service, db_session, tmp_path):
+    log = EventLog(str(tmp_path), fsync=False)
+    service = MatchService(events=log)
+    service.get_player('alice')
+    service.get_player('bob')
+
+    match = service.create_match('alice', 10)
+    service.join_match(match.id, 'bob')
+    match.start_match()
+    match.make_move('alice', 'rock')
+    match.make_move('bob', 'scissors')
+    game_service.calculate_match_result(match, service.players, service.events)
+
+    other = service.create_match('bob', 5)
+    service.cancel_match(other.id)
+    log.close()
+
+    state = rebuild(read_events(str(tmp_path)))
+    assert not state.mismatches
+    assert state.stats[match.id].creator_wins == 1
+    assert state.stats[match.id].rounds == 1
+    for user in User.query.filter(User.session_id.in_(['alice', 'bob'])):
+        assert state.balances[user.session_id] == user.coins
+
+class BrokenLog:
+    def append(self, *args, **kwargs):
+        raise ValueError('record too long')
+
+def test_failed_append_does_not_undo_committed_change(flask_app, game_service, db_session):
+    service = MatchService(events=BrokenLog())
+    service.get_player('alice')
+    service.get_player('bob')
+
+    match = service.create_match('alice', 10)
+    assert match is not None
+    assert User.query.filter_by(session_id='alice').one().coins == 90
+    assert service.join_match(match.id, 'bob') is match
+    match.start_match()
+    match.make_move('alice', 'rock')
+    match.make_move('bob', 'scissors')
+    assert game_service.calculate_match_result(match, service.players, service.events) is not None
+
+    other = service.create_match('bob', 5)
+    assert service.cancel_match(other.id) is True
+    assert User.query.filter_by(session_id='bob').one().coins == 90
+
+def test_rebuild_reports_inconsistent_balances(tmp_path):
+    log = EventLog(str(tmp_path), fsync=False)
+    log.append('create', 'm1', 'alice', amount=10, balance=90, ts=1.0)
+    log.append('join', 'm1', 'bob', 'alice', amount=10, balance=90, ts=2.0)
+    log.append('result', 'm1', 'alice', 'bob', move='draw', amount=10, balance=120, other_balance=100, ts=3.0)
+    log.close()
+
+    state = rebuild(read_events(str(tmp_path)))
+    assert len(state.mismatches) == 1
+    event, session_id, expected, logged = state.mismatches[0]
+    assert (session_id, expected, logged) == ('alice', 100, 120)
+
+def test_long_strings_are_refused():
+    assert encode('join', 'm1', 'x' * 255)
+    with pytest.raises(ValueError, match='actor is 256 bytes'):
+        encode('join', 'm1', 'x' * 256)
@@ -0,0 +1,85 @@
+import csv
+import io
+from datetime import datetime, timedelta
+import pytest
+from src.models.database import User, GameHistory
+from src.services.export_service import HistoryExporter, COLUMNS, read_watermark, write_watermark
+
+@pytest.fixture
+def history(db_session):
+    alice = User(session_id='alice', username='alice')
+    bob = User(session_id='bob', username='bob')
+    db_session.add_all([alice, bob])
+    db_session.commit()
+    for i in range(25):
+        db_session.add(GameHistory(
+            player1_id=alice.id, player2_id=bob.id,
+            player1_choice='rock', player2_choice='scissors' if i % 2 else 'rock',
+            winner_id=alice.id if i % 2 else None, bet_amount=i
+        ))
+    db_session.commit()
+    return alice, bob
+
+def test_csv_export_joins_usernames(history):
+    exporter = HistoryExporter(chunk_size=10, settle_seconds=0)
+    rows = list(csv.reader(io.StringIO(''.join(exporter.iter_csv()))))
+
+    assert rows[0] == COLUMNS
+    assert len(rows) == 26
+    first = dict(zip(COLUMNS, rows[1]))
+    assert first['player1_username'] == 'alice'
+    assert first['player2_username'] == 'bob'
+    assert first['winner_username'] == ''
+    assert dict(zip(COLUMNS, rows[2]))['winner_username'] == 'alice'
+    assert exporter.last_id == 25
+
+def test_incremental_export_from_watermark(history, tmp_path):
+    watermark = tmp_path / 'watermark'
+    assert read_watermark(str(watermark)) == 0
+
+    exporter = HistoryExporter(chunk_size=7, settle_seconds=0)
+    chunks = list(exporter.iter_chunks(since_id=20))
+    assert [row[0] for chunk in chunks for row in chunk] == [21, 22, 23, 24, 25]
+
+    write_watermark(str(watermark), exporter.last_id)
+    assert read_watermark(str(watermark)) == 25
+    assert list(HistoryExporter(settle_seconds=0).iter_chunks(since_id=25)) == []
+
+def test_export_stops_before_unsettled_rows(history, db_session):
+    alice, bob = history
+    now = datetime.utcnow()
+    for game in GameHistory.query:
+        game.played_at = now - timedelta(seconds=5 if game.id > 20 else 120)
+    # Just played: a settlement with a lower id could still commit behind it
+    db_session.add(GameHistory(player1_id=alice.id, player2_id=bob.id, player1_choice='rock',
+                               player2_choice='rock', bet_amount=1, played_at=now))
+    db_session.commit()
+
+    exporter = HistoryExporter(settle_seconds=60)
+    assert list(exporter.iter_chunks(since_id=0))[0][-1][0] == 20
+    assert exporter.last_id == 20
+    exporter = HistoryExporter(settle_seconds=1)
+    assert [row[0] for chunk in exporter.iter_chunks(since_id=20) for row in chunk] == [21, 22, 23, 24, 25]
+    assert exporter.last_id == 25
+
+    assert list(HistoryExporter(settle_seconds=60).iter_chunks(since_id=30)) == []
+
+def test_parquet_export(history, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'history.parquet'
+    assert HistoryExporter(chunk_size=10, settle_seconds=0).write(str(path), 'parquet') == 25
+    table = pq.read_table(path)
+    assert table.num_rows == 25
+    assert table.column('player2_username').to_pylist()[0] == 'bob'
+
+def test_export_endpoint_requires_token(flask_app, test_app, history):
+    assert test_app.get('/api/admin/export/history').status_code == 404
+
+    flask_app.config['ADMIN_TOKEN'] = 'secret'
+    assert test_app.get('/api/admin/export/history').status_code == 403
+
+    response = test_app.get('/api/admin/export/history?since_id=23',
+                            headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert [row[0] for row in rows[1:]] == ['24', '25']
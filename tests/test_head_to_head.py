@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from src.extensions import socketio, match_service
+from src.models.database import User, GameHistory, PairStats
+from src.services.head_to_head import HeadToHead
+
+START = datetime(2024, 3, 1, 10, 0)
+
+def make_users(session):
+    users = [User(session_id=name, username=name) for name in ('alice', 'bob', 'carol')]
+    session.add_all(users)
+    session.commit()
+    return users
+
+def add_games(session, users, count, offset=0):
+    alice, bob, carol = users
+    for i in range(offset, offset + count):
+        # Both seat orders, so each pair is stored under one key either way
+        p1, p2 = (alice, bob) if i % 2 else (carol, alice)
+        session.add(GameHistory(
+            player1_id=p1.id, player2_id=p2.id,
+            player1_choice='rock', player2_choice='paper',
+            winner_id=[p1.id, p2.id, None][i % 3], bet_amount=10 if i % 4 else 20,
+            played_at=START + timedelta(minutes=i)
+        ))
+    session.commit()
+
+def direct(user_id, opponent_id):
+    """The record computed from game_history."""
+    games = GameHistory.query.filter(
+        ((GameHistory.player1_id == user_id) & (GameHistory.player2_id == opponent_id))
+        | ((GameHistory.player1_id == opponent_id) & (GameHistory.player2_id == user_id))).all()
+    return {
+        'games': len(games),
+        'wins': sum(g.winner_id == user_id for g in games),
+        'losses': sum(g.winner_id == opponent_id for g in games),
+        'draws': sum(g.winner_id is None for g in games),
+        'total_stake': sum(g.bet_amount for g in games),
+        'last_played_at': max(g.played_at for g in games).isoformat() if games else None
+    }
+
+def test_backfill_matches_history_and_is_resumable(flask_app, db_session):
+    alice, bob, carol = users = make_users(db_session)
+    add_games(db_session, users, 50)
+
+    service = HeadToHead()
+    assert service.backfill(flask_app, workers=1, chunk_size=7) > 0
+    for user, opponent in ((alice, bob), (bob, alice), (alice, carol), (carol, alice), (bob, carol)):
+        assert HeadToHead.lookup(user.id, opponent.id) == direct(user.id, opponent.id)
+
+    # Settled after the cutoff: counted live, not again by a rerun or a resumed run
+    HeadToHead.record(alice.id, bob.id, alice.id, 10, START + timedelta(minutes=51))
+    add_games(db_session, users, 1, offset=51)
+    before = HeadToHead.lookup(alice.id, bob.id)
+    assert before == direct(alice.id, bob.id)
+    assert service.backfill(flask_app, workers=1, chunk_size=7) == 0
+    assert HeadToHead.lookup(alice.id, bob.id) == before
+
+    assert service.backfill(flask_app, workers=1, chunk_size=7, rebuild=True) > 0
+    assert HeadToHead.lookup(alice.id, bob.id) == before
+    assert HeadToHead.lookup(alice.id, carol.id) == direct(alice.id, carol.id)
+
+def test_backfills_planned_together_fold_each_chunk_once(flask_app, db_session):
+    alice, bob, carol = users = make_users(db_session)
+    add_games(db_session, users, 50)
+
+    service = HeadToHead()
+    chunks = service.plan_backfill(flask_app, chunk_size=7)
+    assert service.plan_backfill(flask_app, chunk_size=7) == chunks
+    assert service.run_backfill(flask_app, chunks, workers=1) > 0
+    assert service.run_backfill(flask_app, chunks, workers=1) == 0
+    assert HeadToHead.lookup(alice.id, bob.id) == direct(alice.id, bob.id)
+
+def test_settlement_updates_pair_and_endpoint(flask_app, db_session):
+    alice, bob = flask_app.test_client(), flask_app.test_client()
+    alice.get('/')
+    bob.get('/')
+    HeadToHead().backfill(flask_app)  # nothing to fold; sets the cutoff as a deploy would
+
+    for alice_move in ('rock', 'paper'):
+        match_id = alice.post('/api/create_match', json={'stake': 5}).get_json()['match_id']
+        bob.post('/api/join_match', json={'match_id': match_id})
+        for client in (alice, bob):
+            socketio.test_client(flask_app, flask_test_client=client).emit('ready_for_match', {'match_id': match_id})
+        alice.post('/api/move', json={'move': alice_move})
+        bob.post('/api/move', json={'move': 'rock'})
+
+    record = alice.get(f'/api/head_to_head?match_id={match_id}').get_json()
+    assert (record['games'], record['wins'], record['losses'], record['draws'], record['total_stake']) == \
+        (2, 1, 0, 1, 10)
+    assert bob.get(f'/api/head_to_head?match_id={match_id}').get_json()['losses'] == 1
+    assert PairStats.query.count() == 1
+    match_service.cleanup_match(match_id)
+
+    outsider = flask_app.test_client()
+    outsider.get('/')
+    assert outsider.get(f'/api/head_to_head?match_id={match_id}').status_code == 404
+
+    # Once the match is gone, by the opponent's user id (as /api/recent lists it) or session id
+    assert alice.get(f'/api/head_to_head?match_id={match_id}').status_code == 404
+    bob_id = alice.get('/api/recent').get_json()['results'][0]['opponent_id']
+    assert alice.get(f'/api/head_to_head?opponent_id={bob_id}').get_json() == record
+    with bob.session_transaction() as sess:
+        bob_session = sess['session_id']
+    assert alice.get(f'/api/head_to_head?opponent={bob_session}').get_json() == record
+    assert alice.get('/api/head_to_head?opponent_id=999').status_code == 404
+    assert alice.get('/api/head_to_head').status_code == 404
+
+def test_unplayed_pair_is_empty(db_session):
+    assert HeadToHead.lookup(1, 2) == {'games': 0, 'wins': 0, 'losses': 0, 'draws': 0,
+                                       'total_stake': 0, 'last_played_at': None}
@@ -0,0 +1,74 @@
+import threading
+from sqlalchemy import text
+from src.models.database import User
+from src.services.health import HealthMonitor
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_probes_create_no_sessions_or_users(test_app):
+    for path in ('/healthz', '/readyz', '/healthz', '/readyz'):
+        response = test_app.get(path)
+        assert response.status_code == 200
+        assert 'Set-Cookie' not in response.headers
+    assert User.query.count() == 0
+    assert test_app.get('/healthz').get_json() == {'status': 'ok', 'loop_lag_ms': 0.0}
+
+def test_readiness_checks_are_cached(flask_app, test_app, match_service):
+    clock = FakeClock()
+    monitor = HealthMonitor(cache_ttl=1.0, clock=clock)
+    flask_app.extensions['rps']['health'] = monitor
+    test_app.get('/')
+    test_app.post('/api/create_match', json={'stake': 5})
+
+    checks = test_app.get('/readyz').get_json()['checks']
+    assert checks['database']['ok']
+    assert checks['matches'] == {'live': 1, 'waiting': 1, 'playing': 0}
+    assert checks['timers'] == 0
+    assert 'admission' in checks
+    test_app.get('/readyz')
+    assert monitor.checks_run == 1
+
+    clock.now += 1.0
+    test_app.get('/readyz')
+    assert monitor.checks_run == 2
+
+def test_not_ready_without_the_database_or_while_draining(flask_app, test_app, monkeypatch):
+    # A statement the database rejects stands in for one it cannot answer
+    monkeypatch.setattr('src.services.health.text', lambda sql: text('SELECT * FROM missing'))
+    response = test_app.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'unavailable'
+    assert response.get_json()['checks']['database'] == {'ok': False, 'error': 'OperationalError'}
+    monkeypatch.undo()
+
+    stop = threading.Event()
+    flask_app.extensions['rps']['health'] = HealthMonitor(cache_ttl=0)
+    flask_app.extensions['rps']['worker'] = {'slot': 0, 'stop': stop}
+    assert test_app.get('/readyz').status_code == 200
+    stop.set()
+    response = test_app.get('/readyz')
+    assert response.status_code == 503 and response.get_json()['status'] == 'draining'
+    assert test_app.get('/healthz').status_code == 200
+
+def test_liveness_fails_when_the_event_loop_stalls():
+    clock = FakeClock()
+    monitor = HealthMonitor(interval=0.5, max_lag=5.0, clock=clock)
+
+    sleeps = []
+
+    def sleep(seconds):
+        if sleeps:
+            raise StopIteration  # end the loop after one sample
+        sleeps.append(seconds)
+        clock.now += seconds + 7.0
+
+    try:
+        monitor.watch_loop(sleep)
+    except StopIteration:
+        pass
+    assert monitor.liveness() == (False, {'status': 'stalled', 'loop_lag_ms': 7000.0})
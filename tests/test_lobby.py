@@ -0,0 +1,48 @@
+import json
+from types import SimpleNamespace
+from src.extensions import lobby
+from src.services.lobby_service import Lobby, json_with
+
+def waiting(id, creator, stake):
+    return SimpleNamespace(id=id, creator=creator, stake=stake)
+
+def test_lobby_slices_by_balance_and_skips_own_matches():
+    built = Lobby([waiting('c', 'carol', 30), waiting('a', 'alice', 10), waiting('b', 'bob', 20),
+                   waiting('d', 'alice', 20), waiting('e', 'erin', 50)], version=0, built_at=0)
+
+    def ids(coins, exclude=None):
+        return [m['id'] for m in json.loads(built.open_matches_json(coins, exclude))]
+
+    assert ids(100) == ['a', 'b', 'd', 'c', 'e']
+    assert ids(20) == ['a', 'b', 'd']
+    assert ids(5) == []
+    assert ids(30, exclude='alice') == ['b', 'c']
+    assert ids(100, exclude='erin') == ['a', 'b', 'd', 'c']
+    assert json.loads(json_with({'coins': 5}, open_matches=built.open_matches_json(10))) == {
+        'coins': 5, 'open_matches': [{'id': 'a', 'stake': 10}]}
+
+def login(client, session_id):
+    with client.session_transaction() as sess:
+        sess['session_id'] = session_id
+
+def open_ids(client, session_id):
+    login(client, session_id)
+    return [m['id'] for m in client.get('/api/state').get_json()['open_matches']]
+
+def test_state_lobby_is_shared_and_follows_changes(flask_app, test_app):
+    lobby.ttl = 3600
+    for name in ('alice', 'bob', 'carol'):
+        open_ids(test_app, name)
+
+    login(test_app, 'alice')
+    match_id = test_app.post('/api/create_match', json={'stake': 10}).get_json()['match_id']
+    builds = lobby.builds
+    assert open_ids(test_app, 'bob') == [match_id]
+    assert open_ids(test_app, 'carol') == [match_id]
+    assert open_ids(test_app, 'alice') == []
+    assert lobby.builds == builds + 1
+
+    login(test_app, 'bob')
+    assert test_app.post('/api/join_match', json={'match_id': match_id}).status_code == 200
+    assert open_ids(test_app, 'carol') == []
+    assert lobby.builds == builds + 2
@@ -0,0 +1,103 @@
+import threading
+import pytest
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import match_service as app_match_service
+from src.models.database import User, GameHistory
+from sqlalchemy import func
+
+MATCHES = 20
+STAKE = 10
+
+@pytest.fixture
+def threaded_app(tmp_path):
+    # An in-memory database is one connection; each thread needs its own
+    class ThreadedConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'race.db'}"
+        RATE_LIMIT_ENABLED = False
+        BOT_ENABLED = False
+
+    app = create_app(ThreadedConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def started_matches(service, count):
+    matches = []
+    for i in range(count):
+        creator, joiner = f'c{i}', f'j{i}'
+        service.get_player(creator)
+        service.get_player(joiner)
+        match = service.create_match(creator, STAKE)
+        service.join_match(match.id, joiner)
+        match.joiner_ready = True
+        match.start_match()
+        matches.append(match)
+    return matches
+
+def race(app, actions):
+    barrier = threading.Barrier(len(actions))
+    errors = []
+
+    def run(action):
+        barrier.wait()
+        try:
+            action()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(action,)) for action in actions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not errors
+
+def test_racing_moves_and_timeouts_settle_once(threaded_app):
+    service = app_match_service._get_current_object()
+    matches = started_matches(service, MATCHES)
+    total = db.session.query(func.sum(User.coins)).scalar() + 2 * STAKE * MATCHES
+    db.session.remove()
+
+    def move(session_id):
+        def action():
+            with threaded_app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['session_id'] = session_id
+                client.post('/api/move', json={'move': 'rock'})
+        return action
+
+    def timeout(match_id):
+        # Timer threads have no app context; the service pushes its own
+        return lambda: service.handle_match_timeout(match_id)
+
+    # SQLite has one writer, so only the threads of one match race at a time
+    for match in matches:
+        race(threaded_app, [move(match.creator), move(match.joiner), timeout(match.id), timeout(match.id)])
+
+    assert all(match.status == 'finished' for match in matches)
+    assert GameHistory.query.count() == MATCHES
+    assert db.session.query(func.sum(User.coins)).scalar() == total
+
+def test_concurrent_joins_take_one_stake(threaded_app):
+    service = app_match_service._get_current_object()
+    service.get_player('creator')
+    match = service.create_match('creator', STAKE)
+    joiners = [f'joiner{i}' for i in range(8)]
+    for joiner in joiners:
+        service.get_player(joiner)
+    db.session.remove()
+
+    def join(joiner):
+        def action():
+            with threaded_app.app_context():
+                service.join_match(match.id, joiner)
+        return action
+
+    race(threaded_app, [join(joiner) for joiner in joiners])
+
+    balances = {u.session_id: u.coins for u in User.query.filter(User.session_id.in_(joiners))}
+    charged = [joiner for joiner, coins in balances.items() if coins < TestConfig.INITIAL_COINS]
+    assert charged == [match.joiner]
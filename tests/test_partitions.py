@@ -0,0 +1,101 @@
+"""The history_partitions migration on a real Postgres server.
+
+Set TEST_POSTGRES_URL to a throwaway database to run it; its public schema
+is dropped and recreated. Skipped otherwise, as on SQLite the migration
+does nothing.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+import pytest
+import sqlalchemy as sa
+import flask_migrate
+from src.app import create_app, db
+from src.config import TestConfig
+
+POSTGRES_URL = os.getenv('TEST_POSTGRES_URL')
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MONTHS = [datetime(2025, 11, 15), datetime(2026, 2, 1), datetime(2026, 9, 30, 23, 59)]
+
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+
+@pytest.fixture
+def pg_app():
+    class PostgresConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = POSTGRES_URL
+
+    app = create_app(PostgresConfig)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(sa.text('DROP SCHEMA public CASCADE'))
+            conn.execute(sa.text('CREATE SCHEMA public'))
+        # The schema as of the revision before the partitions
+        db.create_all()
+        flask_migrate.stamp(MIGRATIONS, revision='pair_stats')
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def seed(conn, rows):
+    conn.execute(sa.text("INSERT INTO users (session_id, username, coins) VALUES ('a', 'a', 100), ('b', 'b', 100)"))
+    conn.execute(sa.text("""
+        INSERT INTO game_history (player1_id, player2_id, player1_choice, player2_choice, winner_id,
+                                  played_at, bet_amount)
+        SELECT (SELECT id FROM users WHERE session_id = 'a'), (SELECT id FROM users WHERE session_id = 'b'),
+               'rock', 'paper', NULL, (CAST(:months AS timestamp[]))[1 + n % 3], 10
+        FROM generate_series(1, :rows) AS n
+    """), {'rows': rows, 'months': MONTHS})
+
+def settle(engine, stop, settled):
+    """Insert games one per transaction, as settlement does, until ``stop`` is set."""
+    while not stop.is_set():
+        try:
+            with engine.begin() as conn:
+                conn.execute(sa.text("""
+                    INSERT INTO game_history (player1_id, player2_id, player1_choice, player2_choice,
+                                              played_at, bet_amount)
+                    SELECT a.id, b.id, 'rock', 'rock', now() AT TIME ZONE 'utc', 5
+                    FROM users a, users b WHERE a.session_id = 'a' AND b.session_id = 'b'
+                """))
+            settled[0] += 1
+        except sa.exc.DBAPIError:
+            pass  # caught by the swap; the caller would retry it
+
+def partitions(conn):
+    return set(conn.execute(sa.text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'game_history'::regclass
+    """)).scalars())
+
+def test_upgrade_partitions_history_while_games_settle(pg_app):
+    with db.engine.begin() as conn:
+        seed(conn, 3000)
+
+    stop, settled = threading.Event(), [0]
+    settler = threading.Thread(target=settle, args=(db.engine, stop, settled))
+    settler.start()
+    try:
+        while not settled[0]:
+            time.sleep(0.01)  # settlement is under way before the copy starts
+        flask_migrate.upgrade(MIGRATIONS, revision='history_partitions', x_arg=['history_batch=250'])
+    finally:
+        stop.set()
+        settler.join()
+
+    with db.engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT relkind FROM pg_class WHERE relname = 'game_history'")).scalar() == 'p'
+        names = partitions(conn)
+        assert {f'game_history_{month:%Y_%m}' for month in MONTHS} | {'game_history_default'} <= names
+        assert conn.execute(sa.text('SELECT count(*) FROM game_history')).scalar() == 3000 + settled[0]
+        for month in MONTHS:
+            assert conn.execute(sa.text(f'SELECT count(*) FROM game_history_{month:%Y_%m}')).scalar() == 1000
+        # New ids keep coming from the same sequence
+        ids = conn.execute(sa.text('SELECT count(DISTINCT id), count(*) FROM game_history')).one()
+        assert ids[0] == ids[1]
+
+    flask_migrate.downgrade(MIGRATIONS, revision='pair_stats')
+    with db.engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT relkind FROM pg_class WHERE relname = 'game_history'")).scalar() == 'r'
+        assert conn.execute(sa.text('SELECT count(*) FROM game_history')).scalar() == 3000 + settled[0]
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from src.app import create_app
+from src.config import TestConfig
+from src.extensions import presence, socketio
+from src.models.database import db, User, PresenceSketch
+from src.services.presence import HyperLogLog, Presence
+
+NOW = datetime(2026, 10, 19, 12, 0, 30)
+
+@pytest.fixture
+def users(db_session):
+    users = [User(session_id=f's{i}', last_seen=datetime(2026, 1, 1)) for i in range(30)]
+    db_session.add_all(users)
+    db_session.commit()
+    return [user.id for user in users]
+
+def count_updates(engine):
+    statements = []
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE users'):
+            statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before)
+    return statements
+
+def test_sketch_estimates_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    for i in range(20000):
+        first.add(i)
+        second.add(i + 10000)
+    assert abs(first.count() - 20000) < 20000 * 0.05
+    assert abs(first.merge(second).count() - 30000) < 30000 * 0.05
+
+    small = HyperLogLog()
+    for i in range(50):
+        small.add(i)
+        small.add(i)
+    assert small.count() == 50
+
+def test_last_seen_is_written_in_batches(flask_app, users):
+    tracker = Presence(flask_app, batch_size=20, now=lambda: NOW)
+    for _ in range(5):
+        for user_id in users:
+            tracker.touch(user_id)
+    tracker.touch(users[0], NOW + timedelta(seconds=20))
+
+    updates = count_updates(db.engine)
+    assert tracker.flush() == 30
+    assert len(updates) == 2  # 150 touches, 30 users, batches of 20
+    db.session.expire_all()
+    assert db.session.get(User, users[0]).last_seen == NOW + timedelta(seconds=20)
+    assert db.session.get(User, users[1]).last_seen == NOW
+
+    # last_seen never moves back, e.g. after another worker wrote a later time
+    tracker.touch(users[0], NOW)
+    assert tracker.flush() == 0
+    assert tracker.flush() == 0 and tracker.seen == {}
+
+def test_counts_merge_across_workers(flask_app, users):
+    first = Presence(flask_app, now=lambda: NOW)
+    second = Presence(flask_app, now=lambda: NOW)
+    for user_id in users[:20]:
+        first.touch(user_id)
+    for user_id in users[10:]:
+        second.touch(user_id)
+    second.connected('sid-1', users[0])
+    first.flush()
+    second.flush()
+    assert PresenceSketch.query.count() == 2  # this minute and today
+
+    assert first.online() == 30
+    # An hour later only the open socket is online; the day still counts everyone
+    later = NOW + timedelta(hours=1)
+    assert second.online(later) == 1 and first.online(later) == 0
+    assert first.daily_active(2, later) == [{'day': '2026-10-19', 'users': 30}, {'day': '2026-10-18', 'users': 0}]
+
+    second.disconnected('sid-1')
+    assert second.online(later) == 0
+
+def test_requests_and_sockets_are_recorded(flask_app, test_app):
+    test_app.get('/')
+    user_id = User.query.one().id
+    assert list(presence.seen) == [user_id]
+
+    client = socketio.test_client(flask_app, flask_test_client=test_app)
+    assert presence.sockets == {user_id: 1}
+    client.disconnect()
+    assert not presence.sockets
+
+    presence.flush()
+    assert presence.online() == 1
+
+def test_admin_reports_presence():
+    class AdminConfig(TestConfig):
+        ADMIN_TOKEN = 'secret'
+
+    app = create_app(AdminConfig)
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        client.get('/')
+        stats = client.get('/api/admin/presence?days=3', headers={'Authorization': 'Bearer secret'}).get_json()
+        assert stats['online'] == 1
+        assert [day['users'] for day in stats['daily_active']] == [1, 0, 0]
+        assert stats['worker']['pending'] == 1
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,53 @@
+import threading
+import time
+from src.extensions import query_profiler
+from src.services.profiling import sample_stacks
+
+ADMIN = {'Authorization': 'Bearer secret'}
+
+def test_requests_report_query_counts(flask_app, test_app):
+    flask_app.config['ADMIN_TOKEN'] = 'secret'
+    response = test_app.get('/api/state')
+    assert response.status_code == 200
+    assert 'queries' in response.headers['Server-Timing']
+
+    report = test_app.get('/api/admin/profile/queries', headers=ADMIN).get_json()
+    state = report['endpoints']['game.get_state']
+    assert state['requests'] == 1
+    assert state['max_queries'] >= 1
+
+    assert test_app.delete('/api/admin/profile/queries', headers=ADMIN).get_json()['endpoints'] == {}
+
+def test_slow_queries_name_their_call_site(flask_app, test_app):
+    query_profiler.slow_query = 0
+    test_app.get('/api/state')
+    slow = query_profiler.report()['slow_queries']
+    assert slow
+    assert all(entry['endpoint'] == 'game.get_state' for entry in slow)
+    assert any(entry['site'].startswith('src/') for entry in slow)
+
+def test_sampled_requests_are_profiled(flask_app, test_app):
+    query_profiler.start_sampling(seconds=60, rate=1.0)
+    test_app.get('/api/state')
+    test_app.get('/api/state')
+    report = query_profiler.sampling_report()
+    assert report.startswith('2 sampled requests')
+    assert 'get_state' in report
+
+    test_app.get('/api/state')
+    assert query_profiler.sampled_requests == 2  # sampling ended with the report
+
+def spin_in_marker(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+def test_stack_sampler_sees_other_threads():
+    stop = threading.Event()
+    thread = threading.Thread(target=spin_in_marker, args=(stop,))
+    thread.start()
+    try:
+        counts = sample_stacks(seconds=0.1, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+    assert any('test_profiling.py:spin_in_marker' in stack for stack in counts)
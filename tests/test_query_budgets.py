@@ -0,0 +1,164 @@
+"""SQL statements per route and socket event, at several data sizes.
+
+Every action is measured with a fresh session, as in production where
+each request gets its own. A count over its budget, or one that changes
+with the size of the lobby and the history, fails the test; lower a
+budget when a change makes an action cheaper.
+"""
+import random
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import socketio, match_service
+from src.models.database import GameHistory
+
+SIZES = (0, 10, 100)  # waiting matches in the lobby, and rows of history
+
+BUDGETS = {
+    'GET /api/state': 2,
+    'POST /api/create_match': 6,
+    'POST /api/join_match': 6,
+    'socket connect': 0,
+    'socket join_match_room': 0,
+    'socket ready_for_match': 2,
+    'POST /api/move': 0,
+    'POST /api/move (settles)': 11,
+    'GET /api/head_to_head': 1,
+    'socket rematch_accepted': 2,
+    'socket rematch_accepted (starts)': 14,
+    'socket move_timeout': 15,
+    'socket rematch_declined': 0,
+    'POST /api/cancel_match': 5,
+    'GET /api/recent': 1,
+    'GET /api/recent (loaded)': 0,
+}
+
+
+@contextmanager
+def statements():
+    """Statements run by this thread; match timers on other threads are ignored."""
+    issued = []
+    me = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == me:
+            issued.append(statement)
+
+    db.session.remove()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield issued
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+class Player:
+    def __init__(self, app, session_id):
+        self.http = app.test_client()
+        with self.http.session_transaction() as sess:
+            sess['session_id'] = session_id
+        self.http.get('/api/state')
+        self.socket = None
+
+    def connect(self, app):
+        self.socket = socketio.test_client(app, flask_test_client=self.http)
+
+
+def seed(size):
+    for i in range(size):
+        creator = f'lobby{i}'
+        match_service.get_player(creator)
+        match_service.create_match(creator, 1)
+    db.session.add_all(GameHistory(player1_id=1, player2_id=2, player1_choice='rock',
+                                   player2_choice='paper', winner_id=2, bet_amount=1)
+                       for _ in range(size))
+    db.session.commit()
+
+
+def measure(size):
+    app = create_app(TestConfig)
+    counts = {}
+    with app.app_context():
+        db.create_all()
+        try:
+            seed(size)
+            alice, bob, carol = (Player(app, name) for name in ('alice', 'bob', 'carol'))
+
+            def run(name, action):
+                with statements() as issued:
+                    response = action()
+                counts[name] = issued
+                if response is not None:
+                    assert response.status_code == 200, (name, response.get_json())
+                return response
+
+            run('GET /api/state', lambda: alice.http.get('/api/state'))
+            match_id = run('POST /api/create_match',
+                           lambda: alice.http.post('/api/create_match', json={'stake': 10})).get_json()['match_id']
+            run('POST /api/join_match', lambda: bob.http.post('/api/join_match', json={'match_id': match_id}))
+
+            alice.connect(app)  # in a match, so also joins its room
+            bob.connect(app)
+            with statements() as issued:
+                carol.connect(app)
+            counts['socket connect'] = issued
+
+            if size:
+                lobby_match = next(m.id for m in match_service.matches.values() if m.creator == 'lobby0')
+                run('socket join_match_room',
+                    lambda: carol.socket.emit('join_match_room', {'match_id': lobby_match}))
+            else:
+                counts['socket join_match_room'] = []
+
+            alice.socket.emit('ready_for_match', {'match_id': match_id})
+            run('socket ready_for_match', lambda: bob.socket.emit('ready_for_match', {'match_id': match_id}))
+
+            run('POST /api/move', lambda: alice.http.post('/api/move', json={'move': 'rock'}))
+            run('POST /api/move (settles)', lambda: bob.http.post('/api/move', json={'move': 'scissors'}))
+            run('GET /api/head_to_head', lambda: alice.http.get(f'/api/head_to_head?match_id={match_id}'))
+
+            run('socket rematch_accepted', lambda: alice.socket.emit('rematch_accepted', {'match_id': match_id}))
+            for player in (alice, bob):
+                player.socket.get_received()
+            run('socket rematch_accepted (starts)',
+                lambda: bob.socket.emit('rematch_accepted', {'match_id': match_id}))
+            for player in (alice, bob):  # both sockets are in the new match's room
+                assert 'match_started' in [message['name'] for message in player.socket.get_received()]
+            run('socket rematch_declined', lambda: bob.socket.emit('rematch_declined', {'match_id': match_id}))
+
+            match_id = alice.http.post('/api/create_match', json={'stake': 10}).get_json()['match_id']
+            bob.http.post('/api/join_match', json={'match_id': match_id})
+            alice.socket.emit('ready_for_match', {'match_id': match_id})
+            bob.socket.emit('ready_for_match', {'match_id': match_id})
+            random.seed(1)  # the auto moves decide between a win and a draw, which differ by a statement
+            run('socket move_timeout', lambda: alice.socket.emit('move_timeout', {'match_id': match_id}))
+
+            match_id = alice.http.post('/api/create_match', json={'stake': 10}).get_json()['match_id']
+            run('POST /api/cancel_match', lambda: alice.http.post('/api/cancel_match', json={'match_id': match_id}))
+
+            run('GET /api/recent', lambda: alice.http.get('/api/recent'))
+            run('GET /api/recent (loaded)', lambda: alice.http.get('/api/recent'))
+        finally:
+            for match in match_service.matches.values():
+                match.cancel_timer()
+            db.session.remove()
+            db.drop_all()
+    return counts
+
+
+def test_query_budgets():
+    by_size = {size: measure(size) for size in SIZES}
+    table = '\n'.join(f'{name:36}' + ''.join(f'{len(by_size[size][name]):6}' for size in SIZES)
+                      for name in BUDGETS)
+
+    for name, budget in BUDGETS.items():
+        for size in SIZES:
+            issued = by_size[size][name]
+            assert len(issued) <= budget, (
+                f'{name} ran {len(issued)} statements with {size} rows, budget {budget}:\n'
+                + '\n'.join(issued) + f'\n\n{table}')
+        # The smallest size may skip work (an empty lobby needs no balances)
+        assert len(by_size[SIZES[-1]][name]) <= len(by_size[SIZES[1]][name]), (
+            f'{name} grows with data size:\n{table}')
@@ -0,0 +1,72 @@
+import pytest
+from src.services.rate_limiter import MemoryBucketStore, RateLimiter
+
+LIMITS = {
+    'make_move': {'session_rate': 1, 'session_burst': 2, 'ip_rate': 10, 'ip_burst': 3}
+}
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_bucket_allows_burst_then_rejects():
+    clock = FakeClock()
+    limiter = RateLimiter(MemoryBucketStore(), LIMITS, clock)
+
+    assert limiter.check('make_move', 'player1', '10.0.0.1') == (True, 0.0)
+    assert limiter.check('make_move', 'player1', '10.0.0.1') == (True, 0.0)
+
+    allowed, retry_after = limiter.check('make_move', 'player1', '10.0.0.1')
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+    # One token refills after a second
+    clock.now += 1.0
+    assert limiter.check('make_move', 'player1', '10.0.0.1')[0]
+
+def test_ip_bucket_shared_between_sessions():
+    clock = FakeClock()
+    limiter = RateLimiter(MemoryBucketStore(), LIMITS, clock)
+
+    for session_id in ['a', 'b', 'c']:
+        assert limiter.check('make_move', session_id, '10.0.0.1')[0]
+    assert not limiter.check('make_move', 'd', '10.0.0.1')[0]
+    assert limiter.check('make_move', 'd', '10.0.0.2')[0]
+
+def test_unlimited_route():
+    limiter = RateLimiter(MemoryBucketStore(), LIMITS, FakeClock())
+    for _ in range(100):
+        assert limiter.check('join_match', 'player1', '10.0.0.1')[0]
+
+def test_store_evicts_oldest_keys():
+    store = MemoryBucketStore(max_keys=10)
+    for i in range(25):
+        store.consume(f'key{i}', 1, 5, 0.0)
+    assert len(store) <= 10
+    assert 'key24' in store.buckets
+    assert 'key0' not in store.buckets
+
+def test_store_evicts_least_recently_used_keys():
+    store = MemoryBucketStore(max_keys=10)
+    for i in range(10):
+        store.consume(f'key{i}', 1, 5, float(i))
+    store.consume('key0', 1, 5, 10.0)  # the oldest key is busy again
+    store.consume('key10', 1, 5, 11.0)
+    assert 'key0' in store.buckets
+    assert 'key1' not in store.buckets
+
+def test_route_returns_429(test_app, monkeypatch):
+    from src.extensions import rate_limiter
+    monkeypatch.setitem(rate_limiter.limits, 'get_state', {
+        'session_rate': 0.001, 'session_burst': 1, 'ip_rate': 100, 'ip_burst': 100
+    })
+    with test_app.session_transaction() as sess:
+        sess['session_id'] = 'limited_player'
+
+    assert test_app.get('/api/state').status_code == 200
+    response = test_app.get('/api/state')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
@@ -0,0 +1,79 @@
+import pytest
+from socketio import packet
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import socketio
+from src.services.realtime import match_result_payload
+
+def result(winner, creator_move, joiner_move, creator_games=4, joiner_games=9):
+    stats = lambda games: {'wins': 1, 'losses': 1, 'draws': 1, 'total_games': games,
+                           'total_coins_won': 50, 'total_coins_lost': 30}
+    return {
+        'winner': winner,
+        'creator_move': creator_move,
+        'joiner_move': joiner_move,
+        'match_stats': {'rounds': 1, 'creator_wins': 0, 'joiner_wins': 1, 'draws': 0},
+        'creator_stats': stats(creator_games),
+        'joiner_stats': stats(joiner_games),
+        'stake': 10,
+        'can_rematch': True
+    }
+
+def test_match_result_payload_sends_versioned_deltas():
+    assert match_result_payload(result('player2', 'rock', 'paper')) == {
+        'winner': 'player2',
+        'moves': 'rp',
+        'stake': 10,
+        'can_rematch': True,
+        'creator': {'losses': 1, 'total_coins_lost': 10, 'v': 4},
+        'joiner': {'wins': 1, 'total_coins_won': 10, 'v': 9}
+    }
+    draw = match_result_payload(result('draw', 'scissors', 'scissors'))
+    assert draw['moves'] == 'ss'
+    assert draw['creator'] == {'draws': 1, 'v': 4}
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_players_receive_compact_result(app):
+    alice, bob = app.test_client(), app.test_client()
+    alice.get('/')
+    bob.get('/')
+    match_id = alice.post('/api/create_match', json={'stake': 10}).get_json()['match_id']
+    bob.post('/api/join_match', json={'match_id': match_id})
+    sockets = [socketio.test_client(app, flask_test_client=client) for client in (alice, bob)]
+    for socket in sockets:
+        socket.emit('ready_for_match', {'match_id': match_id})
+        socket.get_received()
+
+    alice.post('/api/move', json={'move': 'paper'})
+    bob.post('/api/move', json={'move': 'rock'})
+
+    received = [[m['args'][0] for m in socket.get_received() if m['name'] == 'match_result']
+                for socket in sockets]
+    assert received[0] == received[1]
+    payload = received[0][0]
+    assert payload['moves'] == 'pr' and payload['winner'] == 'player1'
+    stats = alice.get('/api/state').get_json()['stats']
+    assert payload['creator'] == {'wins': 1, 'total_coins_won': 10, 'v': stats['total_games']}
+
+def test_msgpack_serializer_round_trips_events():
+    class MsgpackConfig(TestConfig):
+        SOCKETIO_SERIALIZER = 'msgpack'
+
+    app = create_app(MsgpackConfig)
+    packet_class = socketio.server.packet_class
+    payload = match_result_payload(result('player1', 'rock', 'scissors'))
+    encoded = packet_class(packet.EVENT, data=['match_result', payload], namespace='/').encode()
+    assert isinstance(encoded, bytes)
+    assert packet_class(encoded_packet=encoded).data == ['match_result', payload]
+    with app.app_context():
+        db.create_all()
+        assert b'socket.io.msgpack.min.js' in app.test_client().get('/').data
+        db.drop_all()
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import socketio, match_service
+from src.models.database import User, GameHistory
+from src.services.match_service import MatchService
+from src.services.recent_results import RecentResults
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def play(app, creator, joiner, creator_move, joiner_move):
+    match_id = creator.post('/api/create_match', json={'stake': 5}).get_json()['match_id']
+    joiner.post('/api/join_match', json={'match_id': match_id})
+    for client in (creator, joiner):
+        socketio.test_client(app, flask_test_client=client).emit('ready_for_match', {'match_id': match_id})
+    creator.post('/api/move', json={'move': creator_move})
+    joiner.post('/api/move', json={'move': joiner_move})
+    match_service.cleanup_match(match_id)
+
+def test_recent_results_are_loaded_once_then_kept_by_settlement(app):
+    alice, bob = app.test_client(), app.test_client()
+    alice.get('/')
+    bob.get('/')
+    play(app, alice, bob, 'rock', 'scissors')
+
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    first = alice.get('/api/recent').get_json()['results']
+    assert len(statements) == 1
+    assert [(r['outcome'], r['move'], r['opponent_move'], r['stake']) for r in first] == \
+        [('win', 'rock', 'scissors', 5)]
+
+    play(app, bob, alice, 'paper', 'paper')
+    del statements[:]
+    results = alice.get('/api/recent').get_json()['results']
+    assert statements == []
+    assert [r['outcome'] for r in results] == ['draw', 'win']
+    assert results[0]['move'] == 'paper'
+
+def test_load_reads_both_seats_newest_first(app):
+    me = User(session_id='me')
+    rival = User(session_id='rival', username='rival')
+    db.session.add_all([me, rival])
+    db.session.flush()
+    start = datetime(2026, 1, 1)
+    for i in range(5):
+        first, second = (me, rival) if i % 2 else (rival, me)
+        db.session.add(GameHistory(player1_id=first.id, player2_id=second.id, player1_choice='rock',
+                                   player2_choice='paper', winner_id=second.id, bet_amount=i,
+                                   played_at=start + timedelta(minutes=i)))
+    db.session.commit()
+
+    results = RecentResults(size=3).load(me.id)
+    assert [(r['stake'], r['outcome'], r['move']) for r in results] == \
+        [(4, 'win', 'paper'), (3, 'loss', 'rock'), (2, 'win', 'paper')]
+    assert {r['opponent'] for r in results} == {'rival'}
+
+def test_evicted_players_take_their_results_with_them(app):
+    service = MatchService(max_players=10)
+    for i in range(10):
+        service.get_player(f'p{i}')
+    service.players['p0'].recent = []
+    service.players['p1'].current_match = 'm1'
+    service.get_player('p2')  # used again, so no longer among the oldest
+
+    service.get_player('p10')
+    assert 'p0' not in service.players
+    assert {'p1', 'p2', 'p10'} <= set(service.players)
+    assert service.get_player('p0').recent is None
+
+def test_results_settled_on_another_shard_are_loaded(app):
+    alice, bob = app.test_client(), app.test_client()
+    alice.get('/')
+    bob.get('/')
+    with alice.session_transaction() as sess:
+        session_id = sess['session_id']
+    other = MatchService()  # another shard, which settles none of alice's matches
+    recent = RecentResults()
+    assert recent.get(other.get_player(session_id), shared=True) == []
+
+    play(app, alice, bob, 'rock', 'scissors')
+    db.session.remove()
+    player = other.get_player(session_id)
+    # Each request reads the player's row again, so the balance and stats are current
+    assert (player.coins, player.stats.wins) == (User.query.filter_by(session_id=session_id).one().coins, 1)
+    results = recent.get(player, shared=True)
+    assert [(r['outcome'], r['move']) for r in results] == [('win', 'rock')]
+
+    # Nothing settled since: the row is read, the results are not
+    db.session.remove()
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    assert recent.get(other.get_player(session_id), shared=True) == results
+    assert len(statements) == 1 and statements[0].startswith('SELECT users.')
@@ -0,0 +1,124 @@
+from collections import namedtuple
+from contextlib import nullcontext
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine, select
+from src.app import create_app
+from src.config import TestConfig
+from src.extensions import match_service, replicas
+from src.models.database import db, User, PairStats
+from src.services.replicas import ReplicaRouter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def replica_app(tmp_path):
+    # Two database files; the "replica" never hears of the primary's writes
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "primary.db"}'
+        REPLICA_DATABASE_URL = f'sqlite:///{tmp_path / "replica.db"}'
+        ADMIN_TOKEN = 'secret'
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(replicas.replica)
+        yield app
+        db.session.remove()
+        replicas.close()
+
+def use_router(app, clock, **options):
+    router = ReplicaRouter(db.engine, replicas.replica, clock=clock, **options)
+    router.install()
+    app.extensions['rps']['replicas'] = router
+    return router
+
+def test_reads_after_own_writes_stay_on_the_primary(replica_app):
+    clock = FakeClock()
+    router = use_router(replica_app, clock, sticky=5.0)
+    alice, bob = replica_app.test_client(), replica_app.test_client()
+    alice.get('/')
+    bob.get('/')
+    match_id = alice.post('/api/create_match', json={'stake': 5}).get_json()['match_id']
+    assert bob.post('/api/join_match', json={'match_id': match_id}).status_code == 200
+
+    ids = sorted(user.id for user in User.query.all())
+    db.session.add(PairStats(low_id=ids[0], high_id=ids[1], games=3))
+    db.session.commit()
+    with router.replica.begin() as connection:
+        connection.execute(PairStats.__table__.insert().values(low_id=ids[0], high_id=ids[1], games=1))
+
+    def games(client):
+        return client.get(f'/api/head_to_head?match_id={match_id}').get_json()['games']
+
+    # Bob's join wrote to the primary (and cleared the write flag for the next request)
+    assert games(bob) == 3
+    assert router.routed == {'replica': 0, 'primary': 1}
+    clock.now += 5.0
+    assert games(bob) == 1
+    assert games(alice) == 1
+
+    # A settled result keeps both players on the primary
+    match_service.get_match(match_id).finished_at = clock.now
+    assert games(alice) == 3
+    clock.now += 5.0
+    assert games(alice) == 1
+
+    stats = replica_app.test_client().get('/api/admin/replicas', headers={'Authorization': 'Bearer secret'})
+    assert stats.get_json()['routed'] == {'replica': 3, 'primary': 2}
+
+def test_writes_and_locking_reads_go_to_the_primary(replica_app):
+    router = use_router(replica_app, FakeClock())
+    with router.reading(db.session) as engine:
+        assert engine is router.replica
+        db.session.add(User(session_id='carol', username='carol'))
+        db.session.commit()
+        assert db.session.execute(select(User.id).where(User.session_id == 'carol')).first() is None
+        locked = db.session.execute(select(User.id).where(User.session_id == 'carol').with_for_update())
+        assert locked.first() is not None
+    assert db.session.execute(select(User.id).where(User.session_id == 'carol')).first() is not None
+    assert router.take_write()
+    assert not router.take_write()
+
+def test_lag_is_cached_and_gates_the_replica():
+    primary, replica = create_engine('sqlite://'), create_engine('sqlite://')
+    clock = FakeClock()
+    router = ReplicaRouter(primary, replica, sticky=5.0, max_lag=10.0, lag_check_interval=1.0, clock=clock)
+    lags = iter([8.0, 30.0, None])
+    router.measure_lag = lambda: next(lags)
+
+    assert router.engine_for() is replica
+    # A write 6 s ago is past the sticky window but not yet replayed
+    assert router.engine_for(clock.now - 6) is primary
+    assert router.engine_for(clock.now - 9, None) is replica
+    clock.now += 1.0
+    assert router.engine_for() is primary  # too far behind
+    clock.now += 1.0
+    assert router.engine_for() is primary  # lag unknown
+    assert router.report() == {'replica': True, 'lag': None, 'routed': {'replica': 2, 'primary': 3}}
+
+    without = ReplicaRouter(primary, None)
+    assert without.engine_for() is primary
+    with without.reading(db.session) as engine:
+        assert engine is primary
+
+def test_replica_checkouts_are_timed_by_admission(replica_app):
+    assert replicas.replica.pool.connect.__qualname__.startswith('AdmissionController.timed_checkout')
+    replicas.replica.connect().close()
+
+def test_standby_that_stopped_streaming_has_unknown_lag():
+    Lag = namedtuple('Lag', 'standby streaming lag')
+    rows = iter([Lag(True, True, 2.5), Lag(True, True, None), Lag(True, False, 0), Lag(False, False, None)])
+    connection = SimpleNamespace(execute=lambda query: SimpleNamespace(one=lambda: next(rows)))
+    standby = SimpleNamespace(dialect=SimpleNamespace(name='postgresql'), connect=lambda: nullcontext(connection))
+    router = ReplicaRouter(create_engine('sqlite://'), standby)
+
+    assert router.measure_lag() == 2.5
+    assert router.measure_lag() == 0.0  # streaming, with everything replayed
+    assert router.measure_lag() is None  # replayed all it got, but gets nothing
+    assert router.measure_lag() == 0.0  # not a standby
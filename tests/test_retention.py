@@ -0,0 +1,83 @@
+import csv
+import gzip
+from datetime import datetime
+import pytest
+from src.models.database import User, GameHistory, RollupWatermark
+from src.services.retention_service import ARCHIVE_COLUMNS, HistoryRetention, add_months
+from src.services.head_to_head import HeadToHead
+from src.services.rollup_service import RollupService, archived_through
+
+NOW = datetime(2026, 10, 19, 12, 0)
+
+@pytest.fixture
+def history(db_session):
+    alice = User(session_id='alice', username='alice')
+    bob = User(session_id='bob', username='bob')
+    db_session.add_all([alice, bob])
+    db_session.commit()
+    # Five games in each of Jan and Mar 2025, and five this month
+    for played_at in [datetime(2025, 1, 31, 23, 59)] * 5 + [datetime(2025, 3, 1)] * 5 + [datetime(2026, 10, 1)] * 5:
+        db_session.add(GameHistory(player1_id=alice.id, player2_id=bob.id, player1_choice='rock',
+                                   player2_choice='paper', winner_id=bob.id, bet_amount=10, played_at=played_at))
+    db_session.commit()
+
+def read_archive(path):
+    with gzip.open(path, 'rt', newline='') as f:
+        return list(csv.reader(f))
+
+def test_add_months():
+    assert add_months(datetime(2026, 10, 1), -12) == datetime(2025, 10, 1)
+    assert add_months(datetime(2026, 12, 1), 1) == datetime(2027, 1, 1)
+    assert add_months(datetime(2025, 1, 1), -1) == datetime(2024, 12, 1)
+
+def test_old_months_are_archived_then_deleted_in_batches(history, tmp_path):
+    retention = HistoryRetention(str(tmp_path), keep_months=12, batch_size=2, now=lambda: NOW)
+
+    planned = retention.run(dry_run=True)
+    assert planned == [{'month': '2025-01', 'rows': 5, 'path': None}, {'month': '2025-03', 'rows': 5, 'path': None}]
+    assert GameHistory.query.count() == 15 and not list(tmp_path.iterdir())
+
+    done = retention.run()
+    assert [(month['month'], month['rows']) for month in done] == [('2025-01', 5), ('2025-03', 5)]
+    rows = read_archive(done[0]['path'])
+    assert done[0]['path'].endswith('game_history_2025_01.csv.gz')
+    assert rows[0] == ARCHIVE_COLUMNS
+    assert [int(row[0]) for row in rows[1:]] == [1, 2, 3, 4, 5]
+    assert rows[1][6] == '2025-01-31 23:59:00'
+    assert [game.played_at for game in GameHistory.query.all()] == [datetime(2026, 10, 1)] * 5
+
+    assert retention.run() == []
+
+def test_a_rerun_writes_a_new_part_file(history, tmp_path):
+    retention = HistoryRetention(str(tmp_path), now=lambda: NOW)
+    (tmp_path / 'game_history_2025_01.csv.gz').write_bytes(b'from an interrupted run')
+    done = retention.run()
+    assert done[0]['path'].endswith('game_history_2025_01.1.csv.gz')
+    assert (tmp_path / 'game_history_2025_01.csv.gz').read_bytes() == b'from an interrupted run'
+
+def test_months_not_in_the_rollups_are_kept(history, db_session, tmp_path):
+    db_session.add(RollupWatermark(name='game_history', last_id=5))
+    db_session.commit()
+    retention = HistoryRetention(str(tmp_path), now=lambda: NOW)
+    assert [month['month'] for month in retention.run()] == ['2025-01']
+
+    RollupService().update()
+    assert [month['month'] for month in retention.run()] == ['2025-03']
+    assert GameHistory.query.count() == 5
+
+def test_backfills_refuse_to_recount_archived_history(flask_app, history, tmp_path):
+    RollupService(settle_seconds=0).update()
+    HeadToHead().backfill(flask_app)
+    HistoryRetention(str(tmp_path), now=lambda: NOW).run()
+    assert archived_through() == 10
+
+    for backfill in (RollupService(settle_seconds=0).backfill, HeadToHead().backfill):
+        with pytest.raises(RuntimeError, match='up to id 10 has been archived'):
+            backfill(flask_app, rebuild=True)
+    # Nothing was cleared, and an up-to-date backfill has nothing below the archive to read
+    assert RollupWatermark.query.filter_by(name='game_history').one().last_id == 15
+    assert RollupService(settle_seconds=0).backfill(flask_app) == 0
+    assert HeadToHead().backfill(flask_app) == 0
+
+    assert RollupService(settle_seconds=0).backfill(flask_app, rebuild=True, kept_only=True) == 5
+    assert HeadToHead().backfill(flask_app, rebuild=True, kept_only=True) == 1
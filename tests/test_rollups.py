@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func
+from src.models.database import db, User, GameHistory, HistoryRollup, RollupWatermark
+from src.services.rollup_service import RollupService
+
+START = datetime(2024, 3, 1, 10, 0)
+
+def add_games(session, users, count, offset=0):
+    alice, bob, carol = users
+    for i in range(offset, offset + count):
+        p2 = bob if i % 2 else carol
+        winner = [alice.id, p2.id, None][i % 3]
+        session.add(GameHistory(
+            player1_id=alice.id, player2_id=p2.id,
+            player1_choice='rock', player2_choice='paper',
+            winner_id=winner, bet_amount=10 if i % 4 else 20,
+            played_at=START + timedelta(minutes=37 * i)
+        ))
+    session.commit()
+
+def make_users(session):
+    users = [User(session_id=name, username=name) for name in ('alice', 'bob', 'carol')]
+    session.add_all(users)
+    session.commit()
+    return users
+
+def raw_daily():
+    day = func.strftime('%Y-%m-%d 00:00:00', GameHistory.played_at)
+    return {
+        datetime.fromisoformat(d): (games, stake)
+        for d, games, stake in db.session.query(day, func.count(), func.sum(GameHistory.bet_amount)).group_by(day)
+    }
+
+def rollup_daily():
+    return {r.bucket_start: (r.games, r.total_stake) for r in HistoryRollup.query.filter_by(period='day')}
+
+def test_incremental_update_matches_raw_scan(db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 60)
+
+    service = RollupService(batch_size=25)
+    assert service.update() == 60
+    assert rollup_daily() == raw_daily()
+
+    add_games(db_session, users, 30, offset=60)
+    assert service.update() == 30
+    assert service.update() == 0
+    assert rollup_daily() == raw_daily()
+
+    hours = HistoryRollup.query.filter_by(period='hour').all()
+    assert sum(h.games for h in hours) == 90
+    assert sum(h.draws + h.creator_wins + h.joiner_wins for h in hours) == 90
+
+def test_distinct_players_and_stakes(db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 2)
+    service = RollupService()
+    service.update()
+
+    day = HistoryRollup.query.filter_by(period='day').one()
+    assert day.games == 2
+    assert day.distinct_players == 3
+
+    add_games(db_session, users, 1, offset=2)
+    service.update()
+    assert HistoryRollup.query.filter_by(period='day').one().distinct_players == 3
+
+    stakes = {row['bet_amount']: row for row in service.draw_rate_by_stake(datetime(2024, 1, 1))}
+    assert stakes[20]['games'] == 1
+    assert stakes[10]['games'] == 2
+    assert stakes[10]['draws'] == 1
+
+def test_backfill_matches_incremental(flask_app, db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 50)
+
+    service = RollupService()
+    assert service.backfill(flask_app, workers=1, chunk_size=7) == 50
+    backfilled = {(r.period, r.bucket_start): r.to_dict() for r in HistoryRollup.query}
+
+    service.clear()
+    service.update()
+    assert {(r.period, r.bucket_start): r.to_dict() for r in HistoryRollup.query} == backfilled
+
+def test_backfills_planned_together_fold_each_chunk_once(flask_app, db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 50)
+
+    service = RollupService(settle_seconds=0)
+    first = service.plan_backfill(flask_app, chunk_size=7)
+    second = service.plan_backfill(flask_app, chunk_size=7)
+    assert second == first
+    assert service.run_backfill(flask_app, first, workers=1) == 50
+    assert service.run_backfill(flask_app, second, workers=1) == 0
+    assert rollup_daily() == raw_daily()
+
+def test_update_waits_for_rows_to_settle(db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 10)
+    # Played just now: a settlement with a lower id may not have committed yet
+    for game in GameHistory.query.filter(GameHistory.id > 8):
+        game.played_at = datetime.utcnow()
+    db_session.commit()
+
+    service = RollupService(settle_seconds=60)
+    assert service.update() == 8
+    assert service.get_watermark().last_id == 8
+    assert RollupService(settle_seconds=0).update() == 2
+
+def test_update_refuses_to_run_during_a_backfill(flask_app, db_session):
+    users = make_users(db_session)
+    add_games(db_session, users, 20)
+    service = RollupService()
+    # As left by a backfill that was interrupted after its first chunk
+    db_session.add_all([RollupWatermark(name='backfill_running', last_id=20),
+                        RollupWatermark(name='game_history', last_id=0)])
+    db_session.commit()
+    service.fold(0, 7)
+    db_session.merge(RollupWatermark(name='backfill:0', last_id=7))
+    db_session.commit()
+
+    with pytest.raises(RuntimeError):
+        service.update()
+    assert service.backfill(flask_app, workers=1, chunk_size=7) == 13
+    assert not service.backfilling()
+    assert sum(r.games for r in HistoryRollup.query.filter_by(period='day')) == 20
+    assert service.update() == 0
+
+def test_stats_endpoint_reads_rollups(flask_app, test_app, db_session):
+    flask_app.config['ADMIN_TOKEN'] = 'secret'
+    users = make_users(db_session)
+    add_games(db_session, users, 3)
+    db_session.query(GameHistory).update({'played_at': datetime.utcnow()})
+    db_session.commit()
+    RollupService(settle_seconds=0).update()
+
+    response = test_app.get('/api/admin/stats/daily?count=2', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    buckets = response.get_json()['buckets']
+    assert sum(b['games'] for b in buckets) == 3
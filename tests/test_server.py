@@ -0,0 +1,41 @@
+import signal
+import gevent
+import pytest
+from sqlalchemy import func
+from src.models.database import db, User
+from src.server import PreforkServer, serve
+
+def total_coins():
+    return db.session.query(func.sum(User.coins)).scalar()
+
+def test_draining_worker_refunds_waiting_matches(flask_app, match_service):
+    for session_id in ('alice', 'bob', 'carol'):
+        match_service.get_player(session_id)
+    before = total_coins()
+    waiting = match_service.create_match('alice', 10)
+    joined = match_service.create_match('bob', 5)
+    match_service.join_match(joined.id, 'carol')
+    assert total_coins() == before - 20
+
+    def app_factory():
+        # Drain as soon as the worker is up
+        gevent.spawn_later(0.05, lambda: flask_app.extensions['rps']['worker']['stop'].set())
+        return flask_app
+
+    server = PreforkServer(app_factory, '127.0.0.1', 0)
+    server.listener = server.bind(0)
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT)}
+    try:
+        server.run_worker(0)
+    finally:
+        server.listener.close()
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+    db.session.expire_all()
+    assert total_coins() == before
+    assert waiting.id not in match_service.matches and joined.id not in match_service.matches
+
+def test_several_workers_need_shard_sockets():
+    with pytest.raises(ValueError, match='shard socket directory'):
+        serve(lambda: None, '127.0.0.1', 0, workers=2, sticky_base_port=5001)
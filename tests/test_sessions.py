@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import event
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import socketio, match_service
+from src.services.session_store import MemorySessionStore
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_memory_store_expires_idle_sessions_and_evicts_least_recent():
+    clock = Clock()
+    store = MemorySessionStore(ttl=10, max_entries=2, clock=clock)
+    store.set('a', {'session_id': 'alice'})
+    store.set('b', {'session_id': 'bob'})
+
+    clock.now = 8
+    assert store.get('a') == {'session_id': 'alice'}  # used: a lives until 18, b until 10
+    clock.now = 12
+    assert store.get('b') is None
+    assert store.get('a') is not None
+
+    store.set('c', {})
+    store.set('d', {})
+    assert len(store) == 2
+    assert store.get('a') is None
+
+@pytest.fixture
+def memory_app():
+    class SessionConfig(TestConfig):
+        SESSION_STORE = 'memory'
+
+    app = create_app(SessionConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_server_side_session_caches_user_id(memory_app):
+    client = memory_app.test_client()
+    response = client.get('/api/state')
+    assert response.status_code == 200
+    sid = client.get_cookie('session').value
+    data = memory_app.session_interface.store.get(sid)
+    assert set(data) == {'session_id', 'user_id'}
+    assert sid not in (data['session_id'], str(data['user_id']))
+
+    # Unchanged sessions are not written or re-sent
+    assert 'Set-Cookie' not in client.get('/api/state').headers
+
+    # A worker that has not seen the player resolves it by primary key
+    match_service.players.clear()
+    statements = []
+    event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    db.session.remove()
+    assert client.get('/api/state').get_json()['coins'] == 100
+    assert len(statements) == 1
+    assert 'WHERE users.id = ?' in statements[0]
+
+def test_socket_handlers_read_server_side_session(memory_app):
+    client = memory_app.test_client()
+    client.get('/api/state')
+    match_id = client.post('/api/create_match', json={'stake': 5}).get_json()['match_id']
+    session_id = memory_app.session_interface.store.get(client.get_cookie('session').value)['session_id']
+
+    socket = socketio.test_client(memory_app, flask_test_client=client)
+    assert socket.is_connected()
+    socket.get_received()
+    socketio.emit('ping', {'room': 'session'}, room=session_id)
+    socketio.emit('ping', {'room': 'match'}, room=match_id)
+    assert [m['args'][0]['room'] for m in socket.get_received()] == ['session', 'match']
@@ -0,0 +1,122 @@
+import json
+import os
+import stat
+import socketserver
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+import pytest
+from src.extensions import socketio, lobby
+from src.server import PreforkServer
+from src.services.shards import ShardRouter, shard_of, socket_path
+
+@pytest.fixture
+def owner(tmp_path):
+    """Shard 1 of 2, answering on its socket with what it was sent."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the workers' servers
+
+        def handle_one_request(self):
+            self.client_address = ('shard', 0)  # Unix sockets have no address to log
+            super().handle_one_request()
+
+        def reply(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received.append((self.command, self.path, self.headers.get('Cookie'), body))
+            if self.path == '/internal/lobby':
+                status, payload = 200, {'matches': [{'id': 'r1', 'stake': 5, 'creator': 'remote'}]}
+            elif self.path.startswith('/internal/events/'):
+                status, payload = 200, {'success': True}
+            else:
+                status, payload = 201, {'owner': 1}
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Set-Cookie', 'owner=1; Path=/')
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = reply
+
+        def log_message(self, *args):
+            pass
+
+    server = socketserver.ThreadingUnixStreamServer(socket_path(str(tmp_path), 1), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield ShardRouter(0, 2, str(tmp_path)), received
+    server.shutdown()
+    server.server_close()
+
+def remote_id(router):
+    return next(f'{i:08x}' for i in range(100) if not router.is_local(f'{i:08x}'))
+
+def test_match_ids_name_their_owner():
+    routers = [ShardRouter(shard, 4, '/unused') for shard in range(4)]
+    ids = {router.shard: [router.new_match_id() for _ in range(200)] for router in routers}
+    for shard, match_ids in ids.items():
+        assert {shard_of(match_id, 4) for match_id in match_ids} == {shard}
+        assert all(routers[shard].is_local(match_id) for match_id in match_ids)
+    # Random ids spread evenly, so no shard owns much more than its share
+    spread = Counter(shard_of(f'{i:08x}', 8) for i in range(8000))
+    assert max(spread.values()) < 1.2 * 1000
+
+def test_router_reuses_connections(owner):
+    router, received = owner
+    for _ in range(3):
+        status, headers, body = router.request(1, 'POST', '/api/join_match', b'{}', {'Cookie': 'session=abc'})
+        assert status == 201 and json.loads(body) == {'owner': 1}
+    assert received[0] == ('POST', '/api/join_match', 'session=abc', b'{}')
+    assert router.forwarded == 3
+    assert len(router.idle[1]) == 1
+    assert [m['id'] for m in router.open_matches()] == ['r1']
+
+def test_requests_for_other_shards_matches_are_forwarded(flask_app, test_app, owner):
+    router, received = owner
+    flask_app.extensions['rps']['shard_router'] = router
+    test_app.get('/')
+    match_id = remote_id(router)
+
+    response = test_app.post('/api/join_match', json={'match_id': match_id})
+    assert response.status_code == 201 and response.get_json() == {'owner': 1}
+    assert 'owner=1' in response.headers['Set-Cookie']
+    assert json.loads(received[-1][3]) == {'match_id': match_id}
+
+    # Creating stays local, with an id this shard owns; later moves follow the session
+    local = test_app.post('/api/create_match', json={'stake': 5}).get_json()['match_id']
+    assert router.is_local(local)
+    with test_app.session_transaction() as sess:
+        sess['match_id'] = match_id
+    assert test_app.post('/api/move', json={'move': 'rock'}).status_code == 201
+    assert received[-1][1] == '/api/move?'
+
+    # The lobby lists the other shard's matches next to this one's
+    assert [m['id'] for m in json.loads(lobby.open_matches_json('someone', 100))] == [local, 'r1']
+
+def test_events_for_other_shards_matches_run_there(flask_app, test_app, owner):
+    router, received = owner
+    flask_app.extensions['rps']['shard_router'] = router
+    test_app.get('/')
+    with test_app.session_transaction() as sess:
+        session_id = sess['session_id']
+    match_id = remote_id(router)
+
+    socketio.test_client(flask_app, flask_test_client=test_app).emit('ready_for_match', {'match_id': match_id})
+    method, path, _, body = received[-1]
+    assert (method, path) == ('POST', '/internal/events/ready_for_match')
+    assert json.loads(body) == {'session_id': session_id, 'data': {'match_id': match_id}}
+
+def test_internal_endpoints_are_only_reachable_through_the_shard_socket(test_app):
+    assert test_app.get('/internal/lobby').status_code == 404
+    assert test_app.post('/internal/events/ready_for_match', json={}).status_code == 404
+    response = test_app.get('/internal/lobby', environ_overrides={'rps.forwarded': True})
+    assert response.get_json() == {'matches': []}
+
+def test_shard_sockets_are_only_open_to_their_user(tmp_path):
+    server = PreforkServer(None, '127.0.0.1', 0, shard_socket_dir=str(tmp_path))
+    path = socket_path(str(tmp_path), 0)
+    server.bind_unix(path).close()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
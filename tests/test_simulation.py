@@ -0,0 +1,23 @@
+import pytest
+from src.models.database import User
+from src.services.simulation import Simulation, InvariantViolation, run_shard
+
+def test_simulation_is_deterministic():
+    first = run_shard(7, 30, players=20, concurrency=5)
+    second = run_shard(7, 30, players=20, concurrency=5)
+    assert first['error'] is None
+    assert first['sequences'] == 30
+    assert first['actions'] == second['actions']
+    assert first['steps'] == second['steps']
+
+def test_rematch_keeps_players_in_new_match(flask_app, db_session):
+    simulation = Simulation(1, players=10, concurrency=3, rematch_rate=0.5)
+    simulation.run(10)
+    assert simulation.actions['rematch'] > 0
+
+def test_coin_leak_is_reported(flask_app, db_session):
+    simulation = Simulation(3, players=10, concurrency=3)
+    simulation.run(5)
+    User.query.filter_by(session_id='sim-3-0').update({'coins': User.coins + 1})
+    with pytest.raises(InvariantViolation, match='coins not conserved'):
+        simulation.check()
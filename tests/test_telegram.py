@@ -0,0 +1,98 @@
+import pytest
+from src.app import create_app, db
+from src.config import TestConfig
+from src.extensions import telegram_bot, match_service
+from src.models.database import User, GameHistory
+from fake_telegram import FakeTelegramServer, update
+
+ALICE, BOB = 1001, 1002
+
+@pytest.fixture
+def fake_api():
+    with FakeTelegramServer() as server:
+        yield server
+
+@pytest.fixture
+def telegram_app(fake_api):
+    class TelegramConfig(TestConfig):
+        TELEGRAM_BOT_TOKEN = fake_api.token
+        TELEGRAM_API_URL = fake_api.url
+        TELEGRAM_WEBHOOK_SECRET = 'hook-secret'
+        TELEGRAM_QUEUE_SIZE = 3
+        RATE_LIMIT_ENABLED = False
+
+    app = create_app(TelegramConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def send(bot, *updates):
+    for u in updates:
+        assert bot.enqueue(u)
+    bot.tick()
+
+def test_match_over_telegram(telegram_app, fake_api):
+    bot = telegram_bot._get_current_object()
+    send(bot, update(1, ALICE, '/start', 'alice'), update(2, BOB, '/start'))
+    assert User.query.filter_by(telegram_id=ALICE).one().telegram_username == 'alice'
+    assert 'You have 100 coins' in fake_api.messages(ALICE)[-1]
+
+    send(bot, update(3, ALICE, '/create 10'))
+    match_id = next(iter(match_service.matches))
+    send(bot, update(4, BOB, '/open'))
+    assert f'/join {match_id}' in fake_api.messages(BOB)[-1]
+
+    send(bot, update(5, BOB, f'/join {match_id}'))
+    assert 'started' in fake_api.messages(ALICE)[-1]
+    assert 'started' in fake_api.messages(BOB)[-1]
+
+    send(bot, update(6, ALICE, '/rock'), update(7, BOB, '/scissors'))
+    assert 'You won 10 coins. You have 110 coins' in fake_api.messages(ALICE)[-1]
+    assert 'You lost 10 coins. You have 90 coins' in fake_api.messages(BOB)[-1]
+    assert GameHistory.query.count() == 1
+    assert match_id not in match_service.matches
+
+def test_replies_to_one_chat_are_batched(telegram_app, fake_api):
+    bot = telegram_bot._get_current_object()
+    send(bot, update(1, ALICE, '/balance'), update(2, ALICE, '/create 500'), update(3, ALICE, '/cancel'))
+    assert len(fake_api.messages(ALICE)) == 1
+    assert fake_api.messages(ALICE)[0].count('\n\n') == 2
+
+def test_timeout_is_announced(telegram_app, fake_api):
+    bot = telegram_bot._get_current_object()
+    send(bot, update(1, ALICE, '/create 5'))
+    match_id = next(iter(match_service.matches))
+    send(bot, update(2, BOB, f'/join {match_id}'))
+    match_service.get_match(match_id).cancel_timer()
+    match_service.handle_match_timeout(match_id)
+    bot.tick()
+    assert ' vs ' in fake_api.messages(ALICE)[-1]
+    assert ' vs ' in fake_api.messages(BOB)[-1]
+
+def test_webhook_checks_secret_and_bounds_queue(telegram_app, fake_api):
+    client = telegram_app.test_client()
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'hook-secret'}
+    assert client.post('/telegram/webhook', json=update(1, ALICE, '/start')).status_code == 403
+    for i in range(3):
+        assert client.post('/telegram/webhook', json=update(i, ALICE, '/start'), headers=headers).status_code == 200
+    response = client.post('/telegram/webhook', json=update(4, ALICE, '/start'), headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+    telegram_bot.tick()
+    assert len(fake_api.messages(ALICE)) == 1
+
+    # Without a secret anyone could send updates as any user
+    telegram_app.config['TELEGRAM_WEBHOOK_SECRET'] = None
+    assert client.post('/telegram/webhook', json=update(5, ALICE, '/start')).status_code == 404
+
+def test_known_senders_are_bounded(telegram_app, fake_api):
+    bot = telegram_bot._get_current_object()
+    bot.max_known = 2
+    send(bot, update(1, ALICE, '/start'), update(2, BOB, '/start'), update(3, 1003, '/start'))
+    assert list(bot.known) == [BOB, 1003]
+    send(bot, update(4, ALICE, '/balance'))
+    assert list(bot.known) == [1003, ALICE]
+    assert User.query.filter_by(telegram_id=ALICE).count() == 1
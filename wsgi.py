@@ -1,10 +1,35 @@
 from gevent import monkey
 monkey.patch_all()
 
-from gevent.pywsgi import WSGIServer
-from geventwebsocket.handler import WebSocketHandler
-from src.app import app, socketio
+import argparse
+
+from src.app import create_app
+from src.config import Config
+from src.server import serve
 
 if __name__ == '__main__':
-    http_server = WSGIServer(('0.0.0.0', 5000), app, handler_class=WebSocketHandler)
-    http_server.serve_forever()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default=Config.HOST)
+    parser.add_argument('--port', type=int, default=Config.PORT)
+    parser.add_argument('--workers', type=int, default=Config.WORKERS)
+    parser.add_argument('--max-requests', type=int, default=Config.MAX_REQUESTS)
+    parser.add_argument('--max-requests-jitter', type=int, default=Config.MAX_REQUESTS_JITTER)
+    parser.add_argument('--graceful-timeout', type=float, default=Config.GRACEFUL_TIMEOUT)
+    parser.add_argument('--drain-delay', type=float, default=Config.DRAIN_DELAY)
+    parser.add_argument('--sticky-base-port', type=int, default=Config.STICKY_BASE_PORT)
+    parser.add_argument('--shard-socket-dir', type=str, default=Config.SHARD_SOCKET_DIR)
+    args = parser.parse_args()
+    if args.workers > 1 and not args.shard_socket_dir:
+        parser.error('--workers above 1 needs --shard-socket-dir, or requests reach workers without their matches')
+
+    # Workers build their own app after the fork
+    serve(create_app, args.host, args.port,
+          workers=args.workers,
+          max_requests=args.max_requests,
+          max_requests_jitter=args.max_requests_jitter,
+          graceful_timeout=args.graceful_timeout,
+          drain_delay=args.drain_delay,
+          sticky_base_port=args.sticky_base_port,
+          shard_socket_dir=args.shard_socket_dir)
+else:
+    app = create_app()